@@ -0,0 +1,92 @@
+"""Ansible callback which records play, task and per-host timing spans.
+
+Spans are written with python/tvm_ci/trace.py to the file named by $TVM_CI_TRACE_FILE, so
+`python -m tvm_ci.trace report` can show where time went during provisioning.
+"""
+
+import pathlib
+import sys
+import zlib
+
+from ansible.plugins.callback import CallbackBase
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[2] / "python"))
+from tvm_ci import trace  # pylint: disable=wrong-import-position
+
+
+DOCUMENTATION = """
+    name: chrome_trace
+    type: aggregate
+    short_description: Record Chrome trace spans for plays, tasks and hosts
+    description:
+      - Appends spans to the file named by the TVM_CI_TRACE_FILE environment variable.
+    requirements:
+      - enable in configuration
+"""
+
+
+class CallbackModule(CallbackBase):
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = "aggregate"
+    CALLBACK_NAME = "chrome_trace"
+    CALLBACK_NEEDS_WHITELIST = True
+    CALLBACK_NEEDS_ENABLED = True
+
+    def __init__(self):
+        super().__init__()
+        self._play = None
+        self._task = None
+        self._host_starts = {}
+
+    def _close_task(self):
+        if self._task is not None:
+            name, start_us = self._task
+            trace.record_span(f"task: {name}", start_us, trace.now_us(), category="ansible")
+            self._task = None
+
+    def _close_play(self):
+        self._close_task()
+        if self._play is not None:
+            name, start_us = self._play
+            trace.record_span(f"play: {name}", start_us, trace.now_us(), category="ansible")
+            self._play = None
+
+    def v2_playbook_on_play_start(self, play):
+        self._close_play()
+        self._play = (play.get_name().strip(), trace.now_us())
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self._close_task()
+        self._task = (task.get_name().strip(), trace.now_us())
+
+    def v2_playbook_on_handler_task_start(self, task):
+        self.v2_playbook_on_task_start(task, False)
+
+    def v2_runner_on_start(self, host, task):
+        self._host_starts[(host.get_name(), task._uuid)] = trace.now_us()
+
+    def _record_host(self, result, status):
+        host = result._host.get_name()
+        start_us = self._host_starts.pop((host, result._task._uuid), None)
+        if start_us is None:
+            return
+
+        # One row per host, so that slow hosts stand out in the trace viewer.
+        trace.record_span(f"{host}: {result._task.get_name().strip()}", start_us, trace.now_us(),
+                          category="ansible-host", args={"host": host, "status": status},
+                          tid=zlib.crc32(bytes(host, "utf-8")) % (1 << 31))
+
+    def v2_runner_on_ok(self, result):
+        self._record_host(result, "ok")
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._record_host(result, "failed")
+
+    def v2_runner_on_skipped(self, result):
+        self._record_host(result, "skipped")
+
+    def v2_runner_on_unreachable(self, result):
+        self._record_host(result, "unreachable")
+
+    def v2_playbook_on_stats(self, stats):
+        self._close_play()
@@ -0,0 +1,93 @@
+"""Ansible callback which records the progress of each play on each host.
+
+When $TVM_CI_PROVISION_RESULTS_FILE is set, a JSON object is written there after every task
+result, mapping each play name to a map from host to {"status": ..., "started": ...}. "started" is
+when the host began its first task of the play. "status" is "running" until the host finishes:
+"ok" once it runs the play's final COMPLETE_TASK_NAME task, or "failed" or "unreachable" as soon
+as a task fails. The file is replaced atomically, so tvm_ci.provision can poll it to enforce a
+per-host deadline, and the outcomes of finished hosts survive ansible-playbook being killed.
+"""
+
+import json
+import os
+import time
+
+from ansible.plugins.callback import CallbackBase
+
+
+DOCUMENTATION = """
+    name: provision_state
+    type: aggregate
+    short_description: Record per-play, per-host progress for tvm_ci.provision
+    description:
+      - Writes per-play host progress to the file named by TVM_CI_PROVISION_RESULTS_FILE.
+    requirements:
+      - enable in configuration
+"""
+
+
+# Name of the task tvm_ci.provision appends to each play; a host which runs it finished the play.
+# Match tvm_ci.provision.COMPLETE_TASK_NAME.
+COMPLETE_TASK_NAME = "tvm_ci.provision: play complete"
+
+
+class CallbackModule(CallbackBase):
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = "aggregate"
+    CALLBACK_NAME = "provision_state"
+    CALLBACK_NEEDS_WHITELIST = True
+    CALLBACK_NEEDS_ENABLED = True
+
+    def __init__(self):
+        super().__init__()
+        self._play = None
+        self._results = {}
+        self._path = os.environ.get("TVM_CI_PROVISION_RESULTS_FILE")
+
+    def _write(self):
+        if not self._path:
+            return
+
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, "w") as results_f:
+            json.dump(self._results, results_f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self._path)
+
+    def _host(self, host):
+        return self._results.setdefault(self._play, {}).setdefault(
+            host.get_name(), {"status": "running", "started": time.time()})
+
+    def v2_playbook_on_play_start(self, play):
+        self._play = play.get_name().strip()
+        self._results.setdefault(self._play, {})
+
+    def v2_runner_on_start(self, host, task):
+        self._host(host)
+        self._write()
+
+    def _record(self, result, status):
+        host = self._host(result._host)
+        # A failure is final: the host runs no further tasks in the play.
+        if host["status"] != "running":
+            return
+
+        if status != "ok":
+            host["status"] = status
+        elif result._task.get_name().strip() == COMPLETE_TASK_NAME:
+            host["status"] = "ok"
+        self._write()
+
+    def v2_runner_on_ok(self, result):
+        self._record(result, "ok")
+
+    def v2_runner_on_skipped(self, result):
+        self._record(result, "ok")
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._record(result, "ok" if ignore_errors else "failed")
+
+    def v2_runner_on_unreachable(self, result):
+        self._record(result, "unreachable")
+
+    def v2_playbook_on_stats(self, stats):
+        self._write()
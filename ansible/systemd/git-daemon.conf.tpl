@@ -0,0 +1,12 @@
+[Unit]
+Description=Serve the TVM CI git mirror to executors
+After=network.target
+StartLimitIntervalSec=0
+[Service]
+Type=simple
+Restart=always
+RestartSec=1
+User=jenkins
+ExecStart=/usr/bin/git daemon --reuseaddr --export-all --base-path={{ git_mirror_dir | dirname }} {{ git_mirror_dir | dirname }}
+[Install]
+WantedBy=multi-user.target
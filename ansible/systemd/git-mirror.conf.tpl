@@ -0,0 +1,16 @@
+[Unit]
+Description=TVM CI git mirror refresh
+After=network.target
+StartLimitIntervalSec=0
+[Service]
+Type=simple
+Restart=always
+RestartSec=5
+User=jenkins
+{% if 'jenkins-head-node' in group_names %}
+ExecStart=/usr/bin/python3 /opt/tvm-ci/git_mirror.py --mirror-dir={{ git_mirror_dir }} watch{% for upstream in git_mirror_upstreams %} --upstream={{ upstream }}{% endfor %} --interval-sec={{ git_mirror_refresh_interval_sec }}
+{% else %}
+ExecStart=/usr/bin/python3 /opt/tvm-ci/git_mirror.py --mirror-dir={{ git_mirror_dir }} watch --replica-of={{ git_mirror_replica_url }} --interval-sec={{ git_mirror_refresh_interval_sec }}
+{% endif %}
+[Install]
+WantedBy=multi-user.target
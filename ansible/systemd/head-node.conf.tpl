@@ -7,6 +7,6 @@ Type=simple
 Restart=always
 RestartSec=1
 User=jenkins
-ExecStart=docker run -v /home/jenkins/jenkins-homedir:/var/jenkins_home -p 8080:8080 {{ jenkins_master_container_tag }}
+ExecStart=docker run -v /home/jenkins/jenkins-homedir:/var/jenkins_home -p 8080:8080{% for host in jenkins_extra_hosts | default([]) %} --add-host={{ host }}{% endfor %} {{ jenkins_master_container_tag }}
 [Install]
 WantedBy=multi-user.target
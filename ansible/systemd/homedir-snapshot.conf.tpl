@@ -0,0 +1,15 @@
+[Unit]
+Description=TVM CI Jenkins homedir snapshots
+After=network.target jenkins.service
+StartLimitIntervalSec=0
+[Service]
+Type=simple
+Restart=always
+RestartSec=60
+# Root, to read the files the Jenkins container owns.
+User=root
+Environment=AWS_SHARED_CREDENTIALS_FILE=/etc/tvm-ci/homedir-snapshot-credentials
+Environment=AWS_DEFAULT_REGION={{ homedir_snapshot_region }}
+ExecStart=/usr/bin/python3 /opt/tvm-ci/homedir_snapshot.py --store={{ homedir_snapshot_store }}{% if homedir_snapshot_endpoint_url is defined %} --endpoint-url={{ homedir_snapshot_endpoint_url }}{% endif %}{% if homedir_snapshot_kms_key_id is defined %} --kms-key-id={{ homedir_snapshot_kms_key_id }}{% endif %} watch /home/jenkins/jenkins-homedir --interval-sec={{ homedir_snapshot_interval_sec }} --keep={{ homedir_snapshot_keep }}
+[Install]
+WantedBy=multi-user.target
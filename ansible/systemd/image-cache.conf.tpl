@@ -0,0 +1,11 @@
+[Unit]
+Description=TVM CI executor Docker image cache agent
+After=network.target docker.service
+StartLimitIntervalSec=0
+[Service]
+Type=simple
+Restart=always
+RestartSec=5
+ExecStart=/usr/bin/python3 /opt/tvm-ci/image_cache.py --images-file=/etc/tvm-ci/image-cache-prefetch.txt watch --high-watermark-pct={{ image_cache_high_watermark_pct }} --low-watermark-pct={{ image_cache_low_watermark_pct }}
+[Install]
+WantedBy=multi-user.target
@@ -0,0 +1,12 @@
+[Unit]
+Description=Jenkins Prometheus metrics exporter
+After=network.target jenkins.service
+StartLimitIntervalSec=0
+[Service]
+Type=simple
+Restart=always
+RestartSec=5
+User=jenkins
+ExecStart=/usr/bin/python3 /opt/tvm-ci/metrics_exporter.py --jenkins-url=http://localhost:8080 --listen-address={{ metrics_exporter_listen_address | default('0.0.0.0') }} --listen-port={{ metrics_exporter_port | default(9118) }}
+[Install]
+WantedBy=multi-user.target
@@ -0,0 +1,8 @@
+[Unit]
+Description=Empty the Docker Hub pull-through cache when it outgrows its size limit
+After=registry-mirror.service
+[Service]
+Type=oneshot
+# Everything in the cache can be pulled from Docker Hub again, so dropping it all is safe; Docker
+# falls back to Docker Hub while the mirror restarts.
+ExecStart=/bin/sh -c 'if [ "$(du -s --block-size=1G /var/lib/registry-mirror | cut -f1)" -gt {{ registry_mirror_max_size_gib }} ]; then systemctl stop registry-mirror && rm -rf /var/lib/registry-mirror/docker && systemctl start registry-mirror; fi'
@@ -0,0 +1,7 @@
+[Unit]
+Description=Check the Docker Hub pull-through cache's size hourly
+[Timer]
+OnBootSec=15min
+OnUnitActiveSec=1h
+[Install]
+WantedBy=timers.target
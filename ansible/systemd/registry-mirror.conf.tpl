@@ -0,0 +1,13 @@
+[Unit]
+Description=Docker Hub pull-through cache for executors
+After=network.target docker.service
+StartLimitIntervalSec=0
+[Service]
+Type=simple
+Restart=always
+RestartSec=1
+User=jenkins
+ExecStartPre=-docker rm -f registry-mirror
+ExecStart=docker run --rm --name registry-mirror -v /var/lib/registry-mirror:/var/lib/registry -e REGISTRY_PROXY_REMOTEURL=https://registry-1.docker.io -p {{ registry_mirror_port }}:5000 registry:2
+[Install]
+WantedBy=multi-user.target
@@ -5,5 +5,12 @@ set -xe -o pipefail
 log="$1"
 shift
 
+# When tracing is enabled (see stage-scripts/util.sh), record the step's runtime as a span.
+trace=( )
+if [ -n "${TVM_CI_TRACE_FILE}" ]; then
+    trace=( env "PYTHONPATH=$(git rev-parse --show-toplevel)/python"
+            python3 -m tvm_ci.trace run "--name=$(basename "${log}" .log)" -- )
+fi
+
 rm -f "${log}" "${log}.wip" "${log}.error"
-(("$@" 2>&1 </dev/null | tee "${log}.wip") && mv "${log}.wip" "${log}") || mv "${log}.wip" "${log}.error"
+(("${trace[@]}" "$@" 2>&1 </dev/null | tee "${log}.wip") && mv "${log}.wip" "${log}") || mv "${log}.wip" "${log}.error"
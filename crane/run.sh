@@ -49,13 +49,30 @@ echo "Running '${COMMAND[@]}' inside ${DOCKER_IMAGE_NAME}..."
 
 # When running from a git worktree, also mount the original git dir.
 EXTRA_MOUNTS=( )
+SESSION_MOUNTS=( )
 if [ -f "${WORKSPACE}/.git" ]; then
     git_dir="$(cd "${WORKSPACE}" && git rev-parse --git-common-dir)"
     if [ "${git_dir}" != "${WORKSPACE}/.git" ]; then
         EXTRA_MOUNTS=( "${EXTRA_MOUNTS[@]}" -v "${git_dir}:${git_dir}" )
+        SESSION_MOUNTS=( "${SESSION_MOUNTS[@]}" "--mount=${git_dir}:${git_dir}" )
     fi
 fi
 
+# By default, run the command in a long-lived crane container shared by all commands in this
+# workspace (see python/tvm_ci/jenkins_builder/crane_session.py). Set CRANE_NO_SESSION=1 to use a
+# fresh container instead, as below. Stop the session with:
+#   PYTHONPATH=python python3 -m tvm_ci.jenkins_builder.crane_session --workspace=. stop
+if [ "${CRANE_NO_SESSION:-0}" != "1" ]; then
+    exec env "PYTHONPATH=${WORKSPACE}/python" python3 -m tvm_ci.jenkins_builder.crane_session \
+         "--workspace=${WORKSPACE}" exec \
+         "--image=${DOCKER_IMAGE_NAME}" \
+         "--network-id-file=${SCRIPT_DIR}/../build/crane/network-id.txt" \
+         "${SESSION_MOUNTS[@]}" \
+         "--idle-timeout-min=${CRANE_SESSION_IDLE_TIMEOUT_MIN:-30}" \
+         "--cwd=$(pwd)" \
+         -- "${COMMAND[@]}"
+fi
+
 INTERACTIVE=
 if [ -t 0 ]; then
     INTERACTIVE=-it
@@ -78,6 +95,14 @@ docker run --privileged --rm --pid=host \
     -e "CI_BUILD_GROUP=$(id -g -n)" \
     -e "CI_BUILD_GID=$(id -g)" \
     -e "CI_IMAGE_NAME=${DOCKER_IMAGE_NAME}" \
+    -e "TVM_CI_TRACE_FILE=${TVM_CI_TRACE_FILE}" \
+    -e "TVM_CI_CHANGED_ARTIFACTS_FILE=${TVM_CI_CHANGED_ARTIFACTS_FILE}" \
+    -e "LOAD_TEST_LOCAL_PORT=${LOAD_TEST_LOCAL_PORT}" \
+    -e "LOAD_TEST_JENKINS_USER=${LOAD_TEST_JENKINS_USER}" \
+    -e "LOAD_TEST_BUILDS_PER_LABEL=${LOAD_TEST_BUILDS_PER_LABEL}" \
+    -e "RECONFIGURE_JENKINS_USER=${RECONFIGURE_JENKINS_USER}" \
+    -e "FORCE_PROVISION=${FORCE_PROVISION}" \
+    -e "TERRAFORM_PLAN_MAX_AGE_MIN=${TERRAFORM_PLAN_MAX_AGE_MIN}" \
     ${INTERACTIVE} \
     ${DOCKER_IMAGE_NAME} \
     bash --login /docker/with_the_same_user \
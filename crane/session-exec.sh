@@ -0,0 +1,11 @@
+#!/usr/bin/env bash
+
+# Runs one command in a crane session, marking the session busy while it runs so that
+# session-main.sh does not stop the container underneath it.
+
+STATE_DIR=/tmp/crane-session
+
+touch "${STATE_DIR}/active/$$" "${STATE_DIR}/last-activity"
+trap 'rm -f "${STATE_DIR}/active/$$"; touch "${STATE_DIR}/last-activity"' EXIT
+
+"$@"
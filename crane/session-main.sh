@@ -0,0 +1,35 @@
+#!/usr/bin/env bash
+
+# Main process of a long-lived crane session container, run as the build user by
+# with_the_same_user. Exits (removing the container) once no command has run in the session for
+# $1 seconds. See python/tvm_ci/jenkins_builder/crane_session.py.
+
+set -e
+
+IDLE_TIMEOUT_SEC="$1"
+STATE_DIR=/tmp/crane-session
+
+mkdir -p "${STATE_DIR}/active"
+touch "${STATE_DIR}/last-activity"
+touch "${STATE_DIR}/ready"
+
+trap 'exit 0' TERM INT
+
+while true; do
+    sleep 15 &
+    wait $!
+
+    # Forget commands whose session-exec.sh was killed without running its EXIT trap.
+    for active in "${STATE_DIR}"/active/*; do
+        [ -e "${active}" ] || continue
+        kill -0 "$(basename "${active}")" 2>/dev/null || rm -f "${active}"
+    done
+
+    if [ -z "$(ls -A "${STATE_DIR}/active")" ]; then
+        idle_sec=$(( $(date +%s) - $(stat -c %Y "${STATE_DIR}/last-activity") ))
+        if [ "${idle_sec}" -ge "${IDLE_TIMEOUT_SEC}" ]; then
+            echo "Crane session idle for ${idle_sec}s; exiting."
+            exit 0
+        fi
+    fi
+done
@@ -0,0 +1,50 @@
+# Controllers other than the head node, one per name in var.jenkins_controllers. Each runs Jenkins
+# with its own homedir and a subset of the jobs and executors; see python/tvm_ci/controllers.py.
+resource "aws_instance" "jenkins-controller" {
+  for_each = toset(var.jenkins_controllers)
+
+  ami              = "ami-0996d3051b72b5b2c"  # ubuntu/images/hvm-ssd/ubuntu-focal-20.04-amd64-server-20210129
+  instance_type    = var.jenkins_master_ec2_instance_type
+  subnet_id        = aws_subnet.tvm-ci-public.id
+  vpc_security_group_ids  = [aws_security_group.all-nodes.id]
+  key_name         = aws_key_pair.provisioner_ssh_key.key_name
+  associate_public_ip_address = true
+  root_block_device {
+    volume_size = var.jenkins_master_root_ebs_volume_size_gb
+  }
+  timeouts {
+    create = "60m"
+    update = "60m"
+  }
+
+  tags = {
+    Name         = "${var.name_prefix}jenkins-${each.key}-controller"
+    Application  = "jenkins-head-node"
+    Environment  = local.env
+    Project      = "ML/SYS"
+    OS           = "Ubuntu"
+  }
+}
+
+resource "aws_route53_record" "jenkins-controller" {
+  for_each = aws_instance.jenkins-controller
+
+  zone_id = data.aws_route53_zone.primary.zone_id
+  name    = "${var.name_prefix}jenkins-${each.key}.${var.tvm_ci_dns_zone_name}"
+  type    = "A"
+  ttl     = "300"
+  records = [each.value.public_ip]
+}
+
+# Keyed by controller name.
+output "jenkins_controller_fqdn" {
+  value = { for name, record in aws_route53_record.jenkins-controller : name => record.fqdn }
+}
+
+output "jenkins_controller_public_ip" {
+  value = { for name, instance in aws_instance.jenkins-controller : name => instance.public_ip }
+}
+
+output "jenkins_controller_private_ip" {
+  value = { for name, instance in aws_instance.jenkins-controller : name => instance.private_ip }
+}
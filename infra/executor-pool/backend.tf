@@ -0,0 +1,5 @@
+# The key is given per node type by create_backend_config, in the shard's backend config.
+terraform {
+    backend "s3" {
+  }
+}
@@ -0,0 +1,46 @@
+# One node type's executors, kept in a Terraform state of their own so that resizing the pool
+# plans only its instances. The network, DNS zone, key pair and security group come from the
+# shared shard (infra/). See python/tvm_ci/terraform_shards.py.
+
+data "terraform_remote_state" "shared" {
+  backend = "s3"
+  config = {
+    bucket = var.shared_state_bucket
+    key = var.shared_state_key
+    region = var.aws_region
+    profile = var.aws_credentials_profile
+    shared_credentials_file = var.aws_credentials_file
+  }
+}
+
+module "executor" {
+  source = "../modules/executor"
+
+  ami_id = var.ami_id
+  name_prefix = var.name_prefix
+  environment = data.terraform_remote_state.shared.outputs.environment
+  instance_count = var.instance_count
+  instance_type = var.instance_type
+  label = var.label
+  root_block_device_size_gib = var.root_block_device_size_gib
+  route53_zone_id = data.terraform_remote_state.shared.outputs.route53_zone_id
+  route53_zone_fqdn = data.terraform_remote_state.shared.outputs.route53_zone_fqdn
+  route53_ttl = 300
+  ssh_key_name = data.terraform_remote_state.shared.outputs.provisioner_ssh_key_name
+  subnet_id_by_availability_zone = data.terraform_remote_state.shared.outputs.subnet_id_by_availability_zone
+  tvm_ci_config_path = var.tvm_ci_config_path
+  vpc_security_group_ids = [data.terraform_remote_state.shared.outputs.executor_security_group_id]
+}
+
+# terraform_shards renames these to <label>_executor_*, as output by infra/extra-instances.tf.
+output "executor_fqdn" {
+  value = module.executor.fqdn
+}
+
+output "executor_public_ip" {
+  value = module.executor.public_ip
+}
+
+output "executor_private_ip" {
+  value = module.executor.private_ip
+}
@@ -0,0 +1,59 @@
+##### AWS Provider Configuration --->
+
+variable "aws_region" {
+}
+
+variable "aws_credentials_file" {
+}
+
+variable "aws_credentials_profile" {
+}
+
+##### Shared Shard --->
+
+variable "shared_state_bucket" {
+  description = "S3 bucket holding the Terraform state of the shared shard (infra/)."
+}
+
+variable "shared_state_key" {
+  description = "Key of the shared shard's Terraform state in shared_state_bucket."
+}
+
+##### <--- Shared Shard
+
+##### Executor Pool Configuration --->
+
+variable "name_prefix" {
+  description = "A prefix applied to all names of AWS resources created by this TF logic."
+}
+
+variable "label" {
+  description = "Node type of the pool, used to form the FQDN and in instance labels."
+}
+
+variable "ami_id" {
+  description = "ID of the AMI to use"
+  type = string
+}
+
+variable "instance_type" {
+  description = "AWS instance type"
+  type = string
+}
+
+variable "instance_count" {
+  description = "Number of instances in the pool"
+  type = number
+}
+
+variable "root_block_device_size_gib" {
+  description = "Size of each instance's root_block_device, in GiB"
+  type = number
+}
+
+variable "tvm_ci_config_path" {
+  description = "Path to the ci-config yaml file, used for sub-utilities"
+  type = string
+}
+
+##### <--- Executor Pool Configuration
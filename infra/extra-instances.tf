@@ -27,12 +27,38 @@ resource "aws_security_group" "all-nodes" {
     to_port = 22
     cidr_blocks = var.ssh_allowed_cidr
   }
+
+  # Docker registry mirror on the head node, from within the VPC, when cluster.registry_mirror
+  # is set
+  dynamic "ingress" {
+    for_each = var.registry_mirror_port == null ? [] : [var.registry_mirror_port]
+    content {
+      from_port = ingress.value
+      protocol = "tcp"
+      to_port = ingress.value
+      cidr_blocks = [aws_vpc.tvm-ci.cidr_block]
+    }
+  }
+
+  # git-daemon serving the git mirror on the head node, from within the VPC, when
+  # cluster.git_mirror is set
+  dynamic "ingress" {
+    for_each = var.git_mirror_port == null ? [] : [var.git_mirror_port]
+    content {
+      from_port = ingress.value
+      protocol = "tcp"
+      to_port = ingress.value
+      cidr_blocks = [aws_vpc.tvm-ci.cidr_block]
+    }
+  }
   depends_on = [aws_internet_gateway.tvm-ci-gateway]
   tags = {
     Environment = local.env
   }
 }
 
+# With cluster.terraform_state_sharding set in the CI config, *_instances_count are 0 here and
+# each node type's executors live in their own state instead; see infra/executor-pool.
 module "cpu_executor" {
   source = "./modules/executor"
 
@@ -56,6 +82,14 @@ output "cpu_executor_fqdn" {
   value = module.cpu_executor.fqdn
 }
 
+output "cpu_executor_public_ip" {
+  value = module.cpu_executor.public_ip
+}
+
+output "cpu_executor_private_ip" {
+  value = module.cpu_executor.private_ip
+}
+
 module "gpu_executor" {
   source = "./modules/executor"
 
@@ -79,6 +113,14 @@ output "gpu_executor_fqdn" {
   value = module.gpu_executor.fqdn
 }
 
+output "gpu_executor_public_ip" {
+  value = module.gpu_executor.public_ip
+}
+
+output "gpu_executor_private_ip" {
+  value = module.gpu_executor.private_ip
+}
+
 module "arm_executor" {
   source = "./modules/executor"
 
@@ -101,3 +143,11 @@ module "arm_executor" {
 output "arm_executor_fqdn" {
   value = module.arm_executor.fqdn
 }
+
+output "arm_executor_public_ip" {
+  value = module.arm_executor.public_ip
+}
+
+output "arm_executor_private_ip" {
+  value = module.arm_executor.private_ip
+}
@@ -40,4 +40,13 @@ resource "aws_route53_record" "executor" {
 
 output "fqdn" {
   value = [for e in aws_route53_record.executor: e.name]
-}
\ No newline at end of file
+}
+
+# In the same order as fqdn. Provisioning connects by IP so it needn't wait for DNS to propagate.
+output "public_ip" {
+  value = aws_instance.executor[*].public_ip
+}
+
+output "private_ip" {
+  value = aws_instance.executor[*].private_ip
+}
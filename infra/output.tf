@@ -5,3 +5,24 @@ output "jenkins_head_node_public_ip" {
 output "zone_ns_output" {
   value = data.aws_route53_zone.primary.name_servers
 }
+
+# Read by the executor pools (infra/executor-pool) when the state is sharded.
+output "environment" {
+  value = local.env
+}
+
+output "route53_zone_id" {
+  value = data.aws_route53_zone.primary.zone_id
+}
+
+output "route53_zone_fqdn" {
+  value = data.aws_route53_zone.primary.name
+}
+
+output "provisioner_ssh_key_name" {
+  value = aws_key_pair.provisioner_ssh_key.key_name
+}
+
+output "executor_security_group_id" {
+  value = aws_security_group.all-nodes.id
+}
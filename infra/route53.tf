@@ -14,3 +14,8 @@ resource "aws_route53_record" "jenkins-head-node" {
 output "jenkins_head_node_fqdn" {
   value = aws_route53_record.jenkins-head-node.fqdn
 }
+
+# Executors reach services on the head node (e.g. the registry mirror) within the VPC.
+output "jenkins_head_node_private_ip" {
+  value = aws_instance.jenkins-head-node.private_ip
+}
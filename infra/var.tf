@@ -35,6 +35,24 @@ variable "tvm_ci_dns_zone_name" {
   default = "tvm.octoml.ai"
 }
 
+variable "registry_mirror_port" {
+  description = "Port of the Docker Hub pull-through cache on the head node, reachable within the VPC. null when the cache is disabled."
+  type    = number
+  default = null
+}
+
+variable "git_mirror_port" {
+  description = "Port of git-daemon serving the git mirror on the head node, reachable within the VPC. null when the mirror is disabled."
+  type    = number
+  default = null
+}
+
+variable "jenkins_controllers" {
+  description = "Names of the Jenkins controllers which run on their own instances, besides the head node."
+  type    = list(string)
+  default = []
+}
+
 ##### <-- Jenkins Master Configuration
 
 ##### SSH Configuration --->
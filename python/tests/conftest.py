@@ -0,0 +1,25 @@
+import copy
+
+import pytest
+
+
+CI_CONFIG = {
+    "cluster": {
+        "name_prefix": "test-",
+        "dns_suffix": "ci.example.com",
+        "aws_region": "us-east-2",
+        "nodes": {
+            "cpu": {"num_nodes": 2, "num_executors": 2, "labels": ["CPU"]},
+            "gpu": {"num_nodes": 1, "num_executors": 1, "labels": ["GPU", "doc"]},
+        },
+    },
+    "jenkins": {
+        "admin_github_usernames": ["admin"],
+    },
+}
+
+
+@pytest.fixture
+def tvm_ci_config():
+    """A small CI config; tests add the sections they exercise."""
+    return copy.deepcopy(CI_CONFIG)
@@ -0,0 +1,39 @@
+from tvm_ci import artifact_manager
+
+
+def test_manager_settings(tvm_ci_config):
+    assert artifact_manager.manager_settings(tvm_ci_config) is None
+    tvm_ci_config["jenkins"]["artifact_manager"] = {"bucket": "artifacts"}
+    assert artifact_manager.manager_settings(tvm_ci_config) == {
+        "bucket": "artifacts", "prefix": artifact_manager.DEFAULT_PREFIX, "region": "us-east-2",
+        "endpoint": None, "aws_profile_name": "default"}
+
+
+def test_casc_sections_s3(tvm_ci_config):
+    tvm_ci_config["jenkins"]["artifact_manager"] = {"bucket": "artifacts", "prefix": "jenkins/"}
+    sections = artifact_manager.casc_sections(artifact_manager.manager_settings(tvm_ci_config))
+    assert sections == {
+        "aws": {
+            "awsCredentials": {"credentialsId": artifact_manager.CREDENTIALS_ID,
+                               "region": "us-east-2"},
+            "s3": {"container": "artifacts", "prefix": "jenkins/"},
+        },
+        "unclassified": {
+            "artifactManager": {"artifactManagerFactories": [{"jclouds": {"provider": "s3"}}]},
+        },
+    }
+
+
+def test_casc_sections_endpoint(tvm_ci_config):
+    tvm_ci_config["jenkins"]["artifact_manager"] = {
+        "bucket": "artifacts", "endpoint": "http://10.0.0.5:9000", "region": "local"}
+    s3 = artifact_manager.casc_sections(artifact_manager.manager_settings(tvm_ci_config))["aws"]["s3"]
+    assert s3 == {
+        "container": "artifacts", "prefix": artifact_manager.DEFAULT_PREFIX,
+        "customEndpoint": "10.0.0.5:9000", "customSigningRegion": "local", "useHttp": True,
+        "usePathStyleUrl": True, "disableSessionToken": True,
+    }
+
+    tvm_ci_config["jenkins"]["artifact_manager"]["endpoint"] = "https://minio.example.com"
+    s3 = artifact_manager.casc_sections(artifact_manager.manager_settings(tvm_ci_config))["aws"]["s3"]
+    assert (s3["customEndpoint"], s3["useHttp"]) == ("minio.example.com", False)
@@ -0,0 +1,77 @@
+from tvm_ci import artifact_store
+
+
+def test_digest_inputs(tmp_path):
+    (tmp_path / "dir" / "__pycache__").mkdir(parents=True)
+    (tmp_path / "dir" / "a.py").write_text("a")
+    (tmp_path / "file.txt").write_text("file")
+
+    digests = artifact_store.digest_inputs({
+        "dir": tmp_path / "dir", "file": tmp_path / "file.txt",
+        "missing": tmp_path / "missing", "tag": "tag:1"})
+    assert digests["missing"] == "missing"
+    assert digests["tag"] == artifact_store.digest_inputs({"tag": b"tag:1"})["tag"]
+
+    # Bytecode caches don't change a directory's digest; sources do.
+    (tmp_path / "dir" / "__pycache__" / "a.pyc").write_bytes(b"\0")
+    assert artifact_store.digest_inputs({"dir": tmp_path / "dir"})["dir"] == digests["dir"]
+    (tmp_path / "dir" / "a.py").write_text("b")
+    assert artifact_store.digest_inputs({"dir": tmp_path / "dir"})["dir"] != digests["dir"]
+
+
+def test_input_key():
+    key = artifact_store.input_key("producer", {"a": "1"})
+    assert key == artifact_store.input_key("producer", {"a": "1"})
+    assert key != artifact_store.input_key("other", {"a": "1"})
+    assert key != artifact_store.input_key("producer", {"a": "2"})
+
+
+def test_save_and_restore(tmp_path):
+    store = artifact_store.ArtifactStore(tmp_path / "store")
+    output = tmp_path / "out.tar.gz"
+    output.write_bytes(b"archive")
+    key = artifact_store.input_key("producer", {"a": "1"})
+
+    assert not store.restore(key, {"archive": output})
+    store.save(key, "producer", {"a": "1"}, {"archive": output})
+
+    output.unlink()
+    assert store.restore(key, {"archive": output})
+    assert output.read_bytes() == b"archive"
+    assert output.stat().st_mode & 0o777 == 0o600
+    assert not store.restore(key, {"other": output})
+
+
+def test_blobs_are_deduplicated(tmp_path):
+    store = artifact_store.ArtifactStore(tmp_path / "store")
+    output = tmp_path / "out"
+    output.write_bytes(b"same")
+    store.save("key1", "producer", {}, {"out": output})
+    store.save("key2", "producer", {}, {"out": output})
+
+    index = store.entries()
+    assert set(index["entries"]) == {"key1", "key2"}
+    assert len(index["blobs"]) == 1
+    assert len(list((tmp_path / "store" / "blobs").glob("*/*"))) == 1
+
+
+def test_lru_eviction(tmp_path):
+    store = artifact_store.ArtifactStore(tmp_path / "store", max_bytes=10)
+    for key, contents in (("old", b"0123456"), ("new", b"abcdefg")):
+        output = tmp_path / key
+        output.write_bytes(contents)
+        store.save(key, "producer", {}, {"out": output})
+
+    # Both blobs don't fit; the older one and its entry are evicted.
+    assert set(store.entries()["entries"]) == {"new"}
+    assert not store.restore("old", {"out": tmp_path / "restored"})
+    assert store.restore("new", {"out": tmp_path / "restored"})
+
+
+def test_gc_removes_unindexed_blobs(tmp_path):
+    store = artifact_store.ArtifactStore(tmp_path / "store")
+    stray = store.blob_path("ab" * 32)
+    stray.parent.mkdir(parents=True)
+    stray.write_bytes(b"stray")
+    store.gc()
+    assert not stray.exists()
@@ -0,0 +1,40 @@
+from tvm_ci import build_cache
+
+
+# `ccache -s` from ccache 3.4, as on the executors.
+CCACHE_STATS = """\
+cache directory                     /var/cache/tvm-ci/ccache
+primary config                      /var/cache/tvm-ci/ccache/ccache.conf
+secondary config      (readonly)    /etc/ccache.conf
+stats updated                       Tue Oct 18 10:12:01 2022
+cache hit (direct)                   120
+cache hit (preprocessed)              30
+cache miss                            50
+cache hit rate                     75.00 %
+called for link                       12
+cleanups performed                     0
+files in cache                       400
+cache size                           1.5 GB
+max cache size                      50.0 GB
+"""
+
+
+def test_parse_stats():
+    assert build_cache.parse_stats(CCACHE_STATS) == {
+        "hits_direct": 120,
+        "hits_preprocessed": 30,
+        "misses": 50,
+        "cache_size_bytes": 1500000000,
+        "max_cache_size_bytes": 50000000000,
+    }
+
+
+def test_parse_stats_empty_cache():
+    # A cache no build has used yet reports neither counters nor sizes.
+    stats = build_cache.parse_stats("cache directory /var/cache/tvm-ci/ccache\n")
+    assert stats == {"hits_direct": 0, "hits_preprocessed": 0, "misses": 0}
+    assert build_cache._hit_rate(stats) is None
+
+
+def test_hit_rate():
+    assert build_cache._hit_rate(build_cache.parse_stats(CCACHE_STATS)) == 0.75
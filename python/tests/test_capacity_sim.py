@@ -0,0 +1,82 @@
+import pytest
+
+from tvm_ci import capacity_sim
+
+
+SHAPE = {
+    "cpu": {"labels": ["CPU"], "num_nodes": 1, "num_executors": 1},
+    "gpu": {"labels": ["GPU", "CPU"], "num_nodes": 1, "num_executors": 1},
+}
+
+
+def _builds(label, count, duration_sec, interval_sec=0):
+    return [capacity_sim.Build(f"job-{i}", label, duration_sec, i * interval_sec)
+            for i in range(count)]
+
+
+def test_simulate_queue_wait():
+    result = capacity_sim.simulate(_builds("GPU", 3, 100), SHAPE)
+    # One GPU executor: builds wait 0, 100 and 200s.
+    assert result["labels"]["GPU"]["queue_wait_sec"] == {"p50": 100, "p95": 200, "p99": 200,
+                                                         "max": 200}
+    assert result["node_types"]["cpu"]["utilization"] == 0
+
+
+def test_simulate_prefers_first_node_type():
+    result = capacity_sim.simulate(_builds("CPU", 2, 100), SHAPE)
+    # Both executors carry CPU, so neither build waits.
+    assert result["labels"]["CPU"]["queue_wait_sec"]["max"] == 0
+    assert result["node_types"]["cpu"]["utilization"] == result["node_types"]["gpu"]["utilization"]
+
+
+def test_simulate_finishes_before_arrivals():
+    # The cpu executor frees up as the second build arrives, so it runs there, not on the gpu node.
+    builds = [capacity_sim.Build("job-0", "CPU", 100, 0),
+              capacity_sim.Build("job-1", "CPU", 100, 100)]
+    result = capacity_sim.simulate(builds, SHAPE)
+    assert result["labels"]["CPU"]["queue_wait_sec"]["max"] == 0
+    assert result["node_types"]["gpu"]["utilization"] == 0
+
+
+def test_simulate_no_executors():
+    with pytest.raises(capacity_sim.HistoryError, match="No executors carry label ARM"):
+        capacity_sim.simulate(_builds("ARM", 1, 100), SHAPE)
+
+
+def test_search_meets_target():
+    builds = _builds("CPU", 8, 100) + _builds("GPU", 2, 100)
+    shape, result = capacity_sim.search(builds, SHAPE, {"cpu": 1.0, "gpu": 5.0},
+                                        target_p95_wait_sec=0, max_nodes_per_type=20)
+    assert result == capacity_sim.simulate(builds, shape)
+    assert all(r["queue_wait_sec"]["p95"] == 0 for r in result["labels"].values())
+    assert shape["gpu"]["num_nodes"] >= 2
+    # No node can be removed without missing the target.
+    for node_type in (t for t, n in shape.items() if n["num_nodes"]):
+        smaller = {t: dict(n) for t, n in shape.items()}
+        smaller[node_type]["num_nodes"] -= 1
+        assert any(r["queue_wait_sec"]["p95"] > 0
+                   for r in capacity_sim.simulate(builds, smaller)["labels"].values())
+
+
+def test_search_removes_unneeded_nodes():
+    # Spread-out builds: one node of the cheapest type suffices.
+    builds = _builds("CPU", 10, 10, interval_sec=100)
+    shape, _ = capacity_sim.search(builds, SHAPE, {"cpu": 1.0, "gpu": 5.0},
+                                   target_p95_wait_sec=0, max_nodes_per_type=20)
+    assert {t: n["num_nodes"] for t, n in shape.items()} == {"cpu": 1, "gpu": 0}
+
+
+def test_search_limit():
+    with pytest.raises(capacity_sim.HistoryError, match="needs more than 2 nodes"):
+        capacity_sim.search(_builds("GPU", 5, 100), SHAPE, {}, target_p95_wait_sec=0,
+                            max_nodes_per_type=2)
+
+
+def test_load_history(tmp_path):
+    jsonl = tmp_path / "builds.jsonl"
+    jsonl.write_text('{"job": "tvm/main", "label": "CPU", "duration_sec": 60, '
+                     '"arrival_time": "2022-01-01T00:00:00Z"}\n')
+    csv = tmp_path / "builds.csv"
+    csv.write_text("job,label,duration_sec,arrival_time\ntvm/main,CPU,60,1640995200\n")
+    assert capacity_sim.load_history(jsonl) == capacity_sim.load_history(csv) == [
+        capacity_sim.Build("tvm/main", "CPU", 60, 1640995200)]
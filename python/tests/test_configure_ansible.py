@@ -0,0 +1,139 @@
+import argparse
+
+import pytest
+import yaml
+
+from tvm_ci import configure_ansible
+
+
+def _value(v):
+    return {"sensitive": False, "value": v}
+
+
+TERRAFORM_OUTPUT = {
+    "jenkins_head_node_fqdn": _value("test-jenkins.ci.example.com"),
+    "jenkins_head_node_public_ip": _value("3.0.0.1"),
+    "jenkins_head_node_private_ip": _value("10.0.0.1"),
+    "cpu_executor_fqdn": _value(["test-jenkins-cpu-executor-0.ci.example.com",
+                                 "test-jenkins-cpu-executor-1.ci.example.com"]),
+    "cpu_executor_public_ip": _value(["3.0.1.1", "3.0.1.2"]),
+    "cpu_executor_private_ip": _value(["10.0.1.1", "10.0.1.2"]),
+    "gpu_executor_fqdn": _value(["test-jenkins-gpu-executor-0.ci.example.com"]),
+    "gpu_executor_public_ip": _value(["3.0.2.1"]),
+    "gpu_executor_private_ip": _value(["10.0.2.1"]),
+}
+
+
+CONTROLLER_OUTPUT = {
+    "jenkins_controller_fqdn": _value({"docs": "test-jenkins-docs.ci.example.com"}),
+    "jenkins_controller_public_ip": _value({"docs": "3.0.3.1"}),
+    "jenkins_controller_private_ip": _value({"docs": "10.0.3.1"}),
+}
+
+
+def _args(tmp_path, **kw):
+    return argparse.Namespace(**{
+        "executor_ssh_public_key": tmp_path / "executor-ssh-key.pub",
+        "jenkins_master_container_tag": "jenkins:test",
+        "jenkins_homedir_tar_gz": tmp_path / "jenkins-homedir.tar.gz",
+        "ansible_inventory_path": tmp_path / "inventory.yml",
+        "connect_by": "ip",
+        "add_jenkins_hosts": False,
+        **kw})
+
+
+def _inventory(terraform_output, args, tvm_ci_config):
+    configure_ansible.write_ansible_inventory(terraform_output, args, tvm_ci_config)
+    return yaml.safe_load(args.ansible_inventory_path.read_text())
+
+
+def test_node_addresses():
+    addresses = configure_ansible.node_addresses(TERRAFORM_OUTPUT)
+    assert addresses["test-jenkins.ci.example.com"] == {"public_ip": "3.0.0.1",
+                                                        "private_ip": "10.0.0.1"}
+    assert addresses["test-jenkins-cpu-executor-1.ci.example.com"] == {"public_ip": "3.0.1.2",
+                                                                       "private_ip": "10.0.1.2"}
+    assert len(addresses) == 4
+
+    # Outputs from before the IP outputs existed.
+    assert configure_ansible.node_addresses(
+        {k: v for k, v in TERRAFORM_OUTPUT.items() if k.endswith("_fqdn")}) == {}
+
+
+def test_inventory(tmp_path, tvm_ci_config):
+    inventory = _inventory(TERRAFORM_OUTPUT, _args(tmp_path), tvm_ci_config)
+    children = inventory["all"]["children"]
+    assert children["jenkins-head-node"]["hosts"] == {"test-jenkins.ci.example.com": {
+        "ansible_host": "3.0.0.1", "public_ip": "3.0.0.1", "private_ip": "10.0.0.1"}}
+    assert sorted(children["executors"]["hosts"]) == [
+        "test-jenkins-cpu-executor-0.ci.example.com", "test-jenkins-cpu-executor-1.ci.example.com",
+        "test-jenkins-gpu-executor-0.ci.example.com"]
+    assert children["executors"]["hosts"]["test-jenkins-gpu-executor-0.ci.example.com"] == {
+        "ansible_host": "3.0.2.1", "public_ip": "3.0.2.1", "private_ip": "10.0.2.1",
+        "image_cache_prefetch": []}
+    assert "jenkins-controllers" not in children
+
+    all_vars = inventory["all"]["vars"]
+    assert all_vars["jenkins_master_container_tag"] == "jenkins:test"
+    assert all_vars["jenkins_homedir_tar_gz"] == str((tmp_path / "jenkins-homedir.tar.gz").resolve())
+    assert "jenkins_extra_hosts" not in all_vars
+
+
+def test_inventory_connect_by_fqdn(tmp_path, tvm_ci_config):
+    inventory = _inventory(TERRAFORM_OUTPUT, _args(tmp_path, connect_by="fqdn"), tvm_ci_config)
+    head_node = inventory["all"]["children"]["jenkins-head-node"]["hosts"]["test-jenkins.ci.example.com"]
+    assert "ansible_host" not in head_node
+
+
+def test_image_cache_prefetch(tmp_path, tvm_ci_config):
+    tvm_ci_config["cluster"]["image_cache"] = {"prefetch": {"GPU": ["tlcpack/ci-gpu:v1"]}}
+    inventory = _inventory(TERRAFORM_OUTPUT, _args(tmp_path), tvm_ci_config)
+    executors = inventory["all"]["children"]["executors"]["hosts"]
+    assert executors["test-jenkins-gpu-executor-0.ci.example.com"]["image_cache_prefetch"] == [
+        "tlcpack/ci-gpu:v1"]
+    assert executors["test-jenkins-cpu-executor-0.ci.example.com"]["image_cache_prefetch"] == []
+
+
+@pytest.fixture
+def controllers_config(tvm_ci_config):
+    tvm_ci_config["jenkins"]["controllers"] = {
+        "main": {"job_files": ["tvm.yaml"], "labels": ["CPU"]},
+        "docs": {"job_files": ["docs.yaml"], "labels": ["GPU", "doc"]},
+    }
+    tvm_ci_config["jenkins"]["homedir_snapshot"] = {"store": "s3://snapshots/head-node/"}
+    return tvm_ci_config
+
+
+def test_inventory_controllers(tmp_path, controllers_config):
+    inventory = _inventory(dict(TERRAFORM_OUTPUT, **CONTROLLER_OUTPUT),
+                           _args(tmp_path), controllers_config)
+    assert inventory["all"]["children"]["jenkins-controllers"]["hosts"] == {
+        "test-jenkins-docs.ci.example.com": {
+            "ansible_host": "3.0.3.1", "public_ip": "3.0.3.1", "private_ip": "10.0.3.1",
+            "jenkins_controller": "docs",
+            "jenkins_homedir_tar_gz": str(
+                (tmp_path / "controllers" / "docs" / "jenkins-homedir.tar.gz").resolve()),
+            "homedir_snapshot_store": "s3://snapshots/head-node/controllers/docs",
+        }}
+
+
+def test_inventory_controllers_missing_output(tmp_path, controllers_config):
+    with pytest.raises(configure_ansible.MissingTerraformOutputError, match="docs"):
+        configure_ansible.write_ansible_inventory(TERRAFORM_OUTPUT, _args(tmp_path),
+                                                  controllers_config)
+
+
+def test_inventory_add_jenkins_hosts(tmp_path, tvm_ci_config):
+    inventory = _inventory(TERRAFORM_OUTPUT, _args(tmp_path, add_jenkins_hosts=True), tvm_ci_config)
+    assert inventory["all"]["vars"]["jenkins_extra_hosts"] == [
+        "test-jenkins-cpu-executor-0.ci.example.com:10.0.1.1",
+        "test-jenkins-cpu-executor-1.ci.example.com:10.0.1.2",
+        "test-jenkins-gpu-executor-0.ci.example.com:10.0.2.1",
+        "test-jenkins.ci.example.com:10.0.0.1",
+    ]
+
+
+def test_inventory_add_jenkins_hosts_controllers(tmp_path, controllers_config):
+    inventory = _inventory(dict(TERRAFORM_OUTPUT, **CONTROLLER_OUTPUT),
+                           _args(tmp_path, add_jenkins_hosts=True), controllers_config)
+    assert "test-jenkins-docs.ci.example.com:10.0.3.1" in inventory["all"]["vars"]["jenkins_extra_hosts"]
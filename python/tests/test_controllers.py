@@ -0,0 +1,82 @@
+import pathlib
+
+import pytest
+
+from tvm_ci import controllers
+
+
+@pytest.fixture
+def controllers_config(tvm_ci_config):
+    tvm_ci_config["jenkins"]["controllers"] = {
+        "main": {"job_files": ["tvm.yaml"], "labels": ["CPU"]},
+        "docs": {"job_files": ["docs.yaml"], "labels": ["GPU", "doc"],
+                 "url": "https://docs-ci.example.com/"},
+    }
+    return tvm_ci_config
+
+
+def test_controller_settings_disabled(tvm_ci_config):
+    assert controllers.controller_settings(tvm_ci_config) is None
+    assert controllers.extra_controllers(None) == []
+    assert controllers.controller_node_types(tvm_ci_config) == ["cpu", "gpu"]
+
+
+def test_controller_settings(controllers_config):
+    settings = controllers.controller_settings(controllers_config)
+    assert list(settings) == ["main", "docs"]
+    assert settings["main"]["node_types"] == ["cpu"]
+    assert settings["docs"] == {"job_files": ["docs.yaml"], "labels": ["GPU", "doc"],
+                                "node_types": ["gpu"], "url": "https://docs-ci.example.com/"}
+    assert controllers.primary_controller(settings) == "main"
+    assert controllers.extra_controllers(settings) == ["docs"]
+    assert controllers.controller_node_types(controllers_config) == ["cpu"]
+    assert controllers.controller_node_types(controllers_config, "docs") == ["gpu"]
+
+
+@pytest.mark.parametrize("controllers_section,error", [
+    ({}, "no controllers configured"),
+    ({"Main": {"job_files": [], "labels": ["CPU", "GPU", "doc"]}}, "names may only contain"),
+    ({"main": {"job_files": ["tvm.yaml"], "labels": ["CPU", "GPU"]},
+      "docs": {"job_files": ["docs.yaml"], "labels": ["GPU", "doc"]}},
+     "label GPU is owned by both main and docs"),
+    ({"main": {"job_files": ["tvm.yaml"], "labels": ["CPU"]},
+      "docs": {"job_files": ["tvm.yaml"], "labels": ["GPU", "doc"]}},
+     "job file tvm.yaml is owned by both main and docs"),
+    # The gpu node type carries labels of two controllers.
+    ({"main": {"job_files": ["tvm.yaml"], "labels": ["CPU", "GPU"]},
+      "docs": {"job_files": ["docs.yaml"], "labels": ["doc"]}},
+     r"cluster.nodes.gpu: .* exactly one controller, not \['docs', 'main'\]"),
+    # No controller owns the gpu node type's labels.
+    ({"main": {"job_files": ["tvm.yaml"], "labels": ["CPU"]}},
+     "cluster.nodes.gpu: .* exactly one controller, not none"),
+])
+def test_controller_settings_errors(tvm_ci_config, controllers_section, error):
+    tvm_ci_config["jenkins"]["controllers"] = controllers_section
+    with pytest.raises(controllers.ControllerConfigError, match=error):
+        controllers.controller_settings(tvm_ci_config)
+
+
+def test_controller_path(controllers_config):
+    settings = controllers.controller_settings(controllers_config)
+    path = pathlib.Path("build/jenkins-homedir.tar.gz")
+    assert controllers.controller_path(path, None, None) == path
+    assert controllers.controller_path(path, settings, "main") == path
+    assert (controllers.controller_path(path, settings, "docs") ==
+            pathlib.Path("build/controllers/docs/jenkins-homedir.tar.gz"))
+
+
+def test_select_job_files(tmp_path):
+    (tmp_path / "jobs").mkdir()
+    (tmp_path / "jobs" / "tvm.yaml").write_text("")
+    (tmp_path / "jobs" / "docs.yaml").write_text("")
+    (tmp_path / "extra.yaml").write_text("")
+    jenkins_jobs_files = [str(tmp_path / "jobs"), str(tmp_path / "extra.yaml")]
+
+    assert controllers.select_job_files(jenkins_jobs_files, ["docs.yaml", "extra.yaml"]) == [
+        str(tmp_path / "jobs" / "docs.yaml"), str(tmp_path / "extra.yaml")]
+    with pytest.raises(controllers.ControllerConfigError, match="missing.yaml"):
+        controllers.select_job_files(jenkins_jobs_files, ["missing.yaml"])
+
+    settings = {"main": {"job_files": ["tvm.yaml"]}, "docs": {"job_files": ["docs.yaml"]}}
+    assert controllers.unowned_job_files(jenkins_jobs_files, settings) == [
+        str(tmp_path / "extra.yaml")]
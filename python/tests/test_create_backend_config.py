@@ -0,0 +1,109 @@
+import argparse
+
+import pytest
+
+from tvm_ci import create_backend_config
+
+
+@pytest.fixture
+def terraform_config(tmp_path, tvm_ci_config):
+    tvm_ci_config["cluster"].update(terraform_s3_state_bucket_name="tfstate",
+                                    aws_profile_name="default")
+    tvm_ci_config["cluster"]["nodes"]["arm"] = {"num_nodes": 0, "num_executors": 1,
+                                                "labels": ["ARM"]}
+    tvm_ci_config_path = tmp_path / "ci.yaml"
+    tvm_ci_config_path.write_text("")
+    args = argparse.Namespace(backend_config=tmp_path / "backend-config.txt",
+                              provider_config=tmp_path / "provider-config.txt",
+                              tf_var_file=tmp_path / "vars.txt")
+
+    def write():
+        create_backend_config.write_terraform_config(
+            tvm_ci_config_path, tvm_ci_config, tmp_path / "provisioner-id_ed25519", args)
+        return args.tf_var_file.read_text()
+
+    return tvm_ci_config, write
+
+
+def test_mirror_ports(terraform_config):
+    tvm_ci_config, write = terraform_config
+    # Disabled mirrors leave their ports null, so their ingress rules aren't created.
+    tf_vars = write()
+    assert "registry_mirror_port" not in tf_vars
+    assert "git_mirror_port" not in tf_vars
+
+    tvm_ci_config["cluster"]["registry_mirror"] = {}
+    tvm_ci_config["cluster"]["git_mirror"] = {"repos": {"tvm": "https://github.com/apache/tvm"}}
+    tf_vars = write()
+    assert "registry_mirror_port = 5000\n" in tf_vars
+    assert "git_mirror_port = 9418\n" in tf_vars
+
+
+@pytest.fixture
+def infra_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(create_backend_config.utils, "get_repo_root", lambda: tmp_path)
+    infra = tmp_path / "infra"
+    for path in ("main.tf", "var.tf", "prod.tfvars", "modules/executor/main.tf",
+                 "executor-pool/main.tf", ".terraform/modules/executor/main.tf",
+                 ".terraform.lock.hcl", "main.tf~", "terraform.tfstate.backup"):
+        (infra / path).parent.mkdir(parents=True, exist_ok=True)
+        (infra / path).write_text(path)
+    return infra
+
+
+def test_infra_sources(infra_dir):
+    def sources(**kw):
+        return [str(p.relative_to(infra_dir)) for p in create_backend_config._infra_sources(**kw)]
+
+    # Only configuration and variable files are plan inputs.
+    assert sources() == ["executor-pool/main.tf", "main.tf", "modules/executor/main.tf",
+                         "prod.tfvars", "var.tf"]
+    assert sources(exclude=("executor-pool",)) == ["main.tf", "modules/executor/main.tf",
+                                                   "prod.tfvars", "var.tf"]
+    assert sources(include=("executor-pool", "modules")) == ["executor-pool/main.tf",
+                                                             "modules/executor/main.tf"]
+
+
+def test_compute_plan_fingerprint(tmp_path):
+    a = tmp_path / "a.tf"
+    b = tmp_path / "b.tf"
+    a.write_text("resource")
+    b.write_text("variable")
+    fingerprint = create_backend_config.compute_plan_fingerprint([a, b])
+    assert create_backend_config.compute_plan_fingerprint([a, b]) == fingerprint
+
+    # Contents, names and order are all part of the fingerprint.
+    b.write_text("variable 2")
+    assert create_backend_config.compute_plan_fingerprint([a, b]) != fingerprint
+    b.write_text("variable")
+    c = tmp_path / "c.tf"
+    b.rename(c)
+    assert create_backend_config.compute_plan_fingerprint([a, c]) != fingerprint
+    assert create_backend_config.compute_plan_fingerprint([c, a]) != \
+        create_backend_config.compute_plan_fingerprint([a, c])
+
+
+def test_fingerprint_tracks_plan_inputs(infra_dir, terraform_config, tmp_path):
+    tvm_ci_config, write = terraform_config
+    write()
+    args = argparse.Namespace(backend_config=tmp_path / "backend-config.txt",
+                              provider_config=tmp_path / "provider-config.txt",
+                              tf_var_file=tmp_path / "vars.txt")
+    (tmp_path / "provisioner-id_ed25519.pub").write_text("ssh-ed25519 AAAA\n")
+    lookup = tmp_path / "python" / "tvm_ci" / "lookup_availability_zones.py"
+    lookup.parent.mkdir(parents=True)
+    lookup.write_text("")
+
+    def fingerprint():
+        return create_backend_config.compute_plan_fingerprint(create_backend_config.fingerprint_inputs(
+            tmp_path / "ci.yaml", tmp_path / "provisioner-id_ed25519", args))
+
+    unchanged = fingerprint()
+    # Editing a file only the executor pools use leaves the shared plan reusable.
+    (infra_dir / "executor-pool" / "main.tf").write_text("changed")
+    (infra_dir / ".terraform.lock.hcl").write_text("changed")
+    assert fingerprint() == unchanged
+
+    tvm_ci_config["cluster"]["nodes"]["cpu"]["num_nodes"] = 3
+    write()
+    assert fingerprint() != unchanged
@@ -0,0 +1,75 @@
+import pytest
+
+from tvm_ci import dns_check
+
+
+def _value(v):
+    return {"sensitive": False, "value": v}
+
+
+TERRAFORM_OUTPUT = {
+    "jenkins_head_node_fqdn": _value("test-jenkins.ci.example.com"),
+    "jenkins_head_node_public_ip": _value("3.0.0.1"),
+    "jenkins_head_node_private_ip": _value("10.0.0.1"),
+    "cpu_executor_fqdn": _value(["test-jenkins-cpu-executor-0.ci.example.com",
+                                 "test-jenkins-cpu-executor-1.ci.example.com"]),
+    "cpu_executor_public_ip": _value(["3.0.1.1", "3.0.1.2"]),
+    "cpu_executor_private_ip": _value(["10.0.1.1", "10.0.1.2"]),
+    "jenkins_controller_fqdn": _value({"docs": "test-jenkins-docs.ci.example.com"}),
+    "jenkins_controller_public_ip": _value({"docs": "3.0.3.1"}),
+    "jenkins_controller_private_ip": _value({"docs": "10.0.3.1"}),
+}
+
+
+def test_expected_records():
+    assert dns_check.expected_records(TERRAFORM_OUTPUT) == {
+        "test-jenkins.ci.example.com": "3.0.0.1",
+        "test-jenkins-docs.ci.example.com": "3.0.3.1",
+        "test-jenkins-cpu-executor-0.ci.example.com": "3.0.1.1",
+        "test-jenkins-cpu-executor-1.ci.example.com": "3.0.1.2",
+    }
+
+
+def test_expected_records_without_ips():
+    output = {k: v for k, v in TERRAFORM_OUTPUT.items() if not k.endswith("_ip")}
+    assert set(dns_check.expected_records(output).values()) == {None}
+
+
+@pytest.fixture
+def fake_dns(monkeypatch):
+    """Resolve each name to its successive `answers`, repeating the last; nothing if it has none."""
+    answers = {}
+    lookups = []
+
+    def resolve(fqdn):
+        lookups.append(fqdn)
+        pending = answers.get(fqdn, [])
+        return pending.pop(0) if len(pending) > 1 else (pending[0] if pending else set())
+
+    monkeypatch.setattr(dns_check, "resolve", resolve)
+    return answers, lookups
+
+
+def test_wait_for_records(fake_dns):
+    answers, lookups = fake_dns
+    # The first lookup still finds the old record, then the new one propagates.
+    answers["a.example.com"] = [{"1.1.1.1"}, {"3.0.0.1"}]
+    answers["b.example.com"] = [{"3.0.0.2"}]
+    answers["c.example.com"] = [{"5.5.5.5"}]
+    unresolved = dns_check.wait_for_records(
+        {"a.example.com": "3.0.0.1", "b.example.com": "3.0.0.2", "c.example.com": None},
+        timeout_sec=10, interval_sec=0.01, max_workers=4)
+    assert unresolved == {}
+    # Correct records aren't resolved again.
+    assert lookups.count("a.example.com") == 2
+    assert lookups.count("b.example.com") == 1
+
+
+def test_wait_for_records_timeout(fake_dns):
+    answers, lookups = fake_dns
+    answers["a.example.com"] = [{"1.1.1.1"}]
+    unresolved = dns_check.wait_for_records(
+        {"a.example.com": "3.0.0.1", "missing.example.com": None},
+        timeout_sec=0.1, interval_sec=0.02, max_workers=4)
+    assert unresolved == {"a.example.com": {"1.1.1.1"}, "missing.example.com": set()}
+    assert lookups.count("a.example.com") > 1
@@ -0,0 +1,155 @@
+import os
+import random
+
+import pytest
+
+from tvm_ci import homedir_snapshot
+
+
+def _random_bytes(seed, size):
+    return random.Random(seed).getrandbits(8 * size).to_bytes(size, "little")
+
+
+def _tree(root):
+    """Map each path under `root` to its contents, link target or None (directories)."""
+    tree = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            rel = os.path.relpath(path, root)
+            if os.path.islink(path):
+                tree[rel] = ("link", os.readlink(path))
+            elif os.path.isdir(path):
+                tree[rel] = None
+            else:
+                with open(path, "rb") as f:
+                    tree[rel] = (f.read(), os.stat(path).st_mtime_ns, os.stat(path).st_mode & 0o777)
+    return tree
+
+
+def _make_homedir(root):
+    (root / "jobs" / "tvm" / "builds" / "1").mkdir(parents=True)
+    (root / "jobs" / "tvm" / "builds" / "1" / "log").write_bytes(_random_bytes(1, 3 << 20))
+    (root / "config.xml").write_text("<hudson/>\n")
+    (root / "secret.key").write_text("key")
+    os.chmod(root / "secret.key", 0o600)
+    (root / "lastBuild").symlink_to("jobs/tvm/builds/1")
+    (root / "workspace").mkdir()
+    (root / "workspace" / "scratch").write_text("excluded")
+
+
+def test_round_trip(tmp_path):
+    homedir = tmp_path / "homedir"
+    homedir.mkdir()
+    _make_homedir(homedir)
+    store = homedir_snapshot.open_store(str(tmp_path / "store"))
+
+    stats = homedir_snapshot.snapshot(store, str(homedir), homedir_snapshot.DEFAULT_EXCLUDES, 4)
+    assert stats["files"] == 3
+    assert homedir_snapshot.list_snapshots(store) == [stats["id"]]
+
+    restored = tmp_path / "restored"
+    homedir_snapshot.restore(store, stats["id"], str(restored), 4)
+    expected = {rel: entry for rel, entry in _tree(homedir).items()
+                if not rel.startswith("workspace")}
+    expected[homedir_snapshot.RESTORED_MARKER] = (
+        bytes(stats["id"] + "\n", "utf-8"),
+        os.stat(restored / homedir_snapshot.RESTORED_MARKER).st_mtime_ns,
+        os.stat(restored / homedir_snapshot.RESTORED_MARKER).st_mode & 0o777)
+    assert _tree(restored) == expected
+
+
+def test_unchanged_files_are_not_reread(tmp_path):
+    homedir = tmp_path / "homedir"
+    homedir.mkdir()
+    _make_homedir(homedir)
+    store = homedir_snapshot.open_store(str(tmp_path / "store"))
+    homedir_snapshot.snapshot(store, str(homedir), homedir_snapshot.DEFAULT_EXCLUDES, 1)
+
+    stats = homedir_snapshot.snapshot(store, str(homedir), homedir_snapshot.DEFAULT_EXCLUDES, 1)
+    assert stats["files_read"] == 0
+    assert stats["chunks_uploaded"] == 0
+
+
+def test_append_uploads_only_new_chunks(tmp_path):
+    homedir = tmp_path / "homedir"
+    homedir.mkdir()
+    log = homedir / "log"
+    log.write_bytes(_random_bytes(2, 8 << 20))
+    store = homedir_snapshot.open_store(str(tmp_path / "store"))
+    first = homedir_snapshot.snapshot(store, str(homedir), [], 1)
+    assert first["chunks_uploaded"] > 2
+
+    with open(log, "ab") as log_f:
+        log_f.write(_random_bytes(3, 1024))
+    second = homedir_snapshot.snapshot(store, str(homedir), [], 1)
+    assert second["files_read"] == 1
+    # Content-defined boundaries: only the chunk holding the end of the file changes.
+    assert second["chunks_uploaded"] == 1
+
+
+def test_identical_chunks_are_stored_once(tmp_path):
+    homedir = tmp_path / "homedir"
+    homedir.mkdir()
+    contents = _random_bytes(4, 2 << 20)
+    (homedir / "a").write_bytes(contents)
+    (homedir / "b").write_bytes(contents)
+    store = homedir_snapshot.open_store(str(tmp_path / "store"))
+
+    stats = homedir_snapshot.snapshot(store, str(homedir), [], 2)
+    manifest = homedir_snapshot.load_manifest(store, stats["id"])
+    chunks = {e["path"]: e["chunks"] for e in manifest["entries"]}
+    assert chunks["a"] == chunks["b"]
+    assert stats["chunks_uploaded"] == len(chunks["a"])
+    assert len(list(store.list("chunks/"))) == len(chunks["a"])
+
+
+def test_chunk_file(tmp_path):
+    data = _random_bytes(5, 20 << 20) + b"".join(b"line %d\n" % i for i in range(500000))
+    path = tmp_path / "data"
+    path.write_bytes(data)
+
+    chunks = list(homedir_snapshot.chunk_file(str(path)))
+    assert b"".join(chunks) == data
+    assert all(len(c) <= homedir_snapshot.MAX_CHUNK_BYTES for c in chunks)
+    assert all(len(c) >= homedir_snapshot.MIN_CHUNK_BYTES for c in chunks[:-1])
+
+
+def test_prune(tmp_path):
+    homedir = tmp_path / "homedir"
+    homedir.mkdir()
+    store = homedir_snapshot.open_store(str(tmp_path / "store"))
+    for i in range(3):
+        (homedir / "file").write_bytes(_random_bytes(10 + i, 1024))
+        os.utime(homedir / "file", ns=(i, i))
+        homedir_snapshot.snapshot(store, str(homedir), [], 1)
+    snapshot_ids = homedir_snapshot.list_snapshots(store)
+
+    stats = homedir_snapshot.prune(store, keep=1)
+    assert stats == {"snapshots_deleted": 2, "chunks_deleted": 2}
+    assert homedir_snapshot.list_snapshots(store) == snapshot_ids[-1:]
+    restored = tmp_path / "restored"
+    homedir_snapshot.restore(store, snapshot_ids[-1], str(restored), 1)
+    assert (restored / "file").read_bytes() == (homedir / "file").read_bytes()
+
+
+class _RecordingS3Client:
+    def __init__(self):
+        self.puts = []
+
+    def put_object(self, **kwargs):
+        self.puts.append(kwargs)
+
+
+@pytest.mark.parametrize("kms_key_id,encryption_args", [
+    (None, {"ServerSideEncryption": "AES256"}),
+    ("alias/snapshots", {"ServerSideEncryption": "aws:kms", "SSEKMSKeyId": "alias/snapshots"}),
+])
+def test_s3_store_encrypts(kms_key_id, encryption_args):
+    pytest.importorskip("boto3")
+    store = homedir_snapshot.open_store("s3://bucket/head-node/", "http://localhost:9000",
+                                        kms_key_id=kms_key_id)
+    store.client = _RecordingS3Client()
+    store.put("chunks/ab/abcd", b"data")
+    assert store.client.puts == [
+        {"Bucket": "bucket", "Key": "head-node/chunks/ab/abcd", "Body": b"data", **encryption_args}]
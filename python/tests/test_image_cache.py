@@ -0,0 +1,126 @@
+import collections
+import json
+import subprocess
+
+import pytest
+
+from tvm_ci import image_cache
+
+
+DiskUsage = collections.namedtuple("DiskUsage", ["total", "used", "free"])
+
+
+class FakeDocker:
+    """Answers the docker commands image_cache runs from `images`, each ref's id and size in %."""
+
+    def __init__(self, images, base_pct=0, in_use=()):
+        self.images = dict(images)
+        self.base_pct = base_pct
+        self.in_use = set(in_use)
+        self.removed = []
+
+    def usage_pct(self):
+        return self.base_pct + sum(size for _, size in self.images.values())
+
+    def disk_usage(self, path):
+        used = int(self.usage_pct() * 1000)
+        return DiskUsage(100000, used, 100000 - used)
+
+    def docker(self, *args, check=True):
+        stdout = ""
+        if args[:2] == ("images", "--no-trunc"):
+            stdout = "".join(f"{ref} {image_id}\n" for ref, (image_id, _) in self.images.items())
+        elif args[0] == "ps":
+            stdout = "\n".join(f"container-{i}" for i in range(len(self.in_use)))
+        elif args[0] == "inspect":
+            stdout = "\n".join(sorted(self.in_use))
+        elif args[:2] == ("image", "inspect"):
+            if args[-1] not in self.images:
+                return subprocess.CompletedProcess(["docker"] + list(args), 1, "", "No such image")
+            stdout = self.images[args[-1]][0]
+        elif args[:2] == ("image", "rm"):
+            self.removed.append(args[2])
+            del self.images[args[2]]
+        return subprocess.CompletedProcess(["docker"] + list(args), 0, stdout, "")
+
+
+@pytest.fixture
+def fake_docker(monkeypatch):
+    def make(*args, **kw):
+        fake = FakeDocker(*args, **kw)
+        monkeypatch.setattr(image_cache, "_docker", fake.docker)
+        monkeypatch.setattr(image_cache, "disk_usage_pct", lambda path: fake.usage_pct())
+        monkeypatch.setattr(image_cache.shutil, "disk_usage", fake.disk_usage)
+        return fake
+    return make
+
+
+def _last_used(state, **refs):
+    with state.locked() as s:
+        for ref, last_used in refs.items():
+            s["images"][ref] = {"hits": 0, "misses": 0, "last_used": last_used}
+
+
+def test_evict_lru(tmp_path, fake_docker):
+    fake = fake_docker({"old:1": ("sha256:1", 10), "new:1": ("sha256:2", 10),
+                        "unseen:1": ("sha256:3", 10), "newest:1": ("sha256:4", 10)},
+                       base_pct=50)
+    state = image_cache.ImageCacheState(tmp_path)
+    _last_used(state, **{"old:1": 1, "new:1": 2, "newest:1": 3})
+
+    # 90% full: evicting the two least recently used images gets below 75%.
+    assert image_cache.evict(state, tmp_path, set(), 85, 75) == 2
+    assert fake.removed == ["unseen:1", "old:1"]
+    with state.locked(write=False) as s:
+        assert set(s["images"]) == {"new:1", "newest:1"}
+        assert s["evictions"] == 2
+        assert s["evicted_bytes"] == 20000
+
+
+def test_evict_below_high_watermark(tmp_path, fake_docker):
+    fake = fake_docker({"old:1": ("sha256:1", 10)}, base_pct=70)
+    assert image_cache.evict(image_cache.ImageCacheState(tmp_path), tmp_path, set(), 85, 75) == 0
+    assert fake.removed == []
+
+
+def test_evict_skips_pinned_and_in_use(tmp_path, fake_docker):
+    fake = fake_docker({"pinned:latest": ("sha256:1", 20), "running:1": ("sha256:2", 20),
+                        "other:1": ("sha256:3", 10)},
+                       base_pct=40, in_use={"sha256:2"})
+    # Neither the pinned image (named without its tag) nor the running one goes, even though
+    # usage stays above the low watermark.
+    state = image_cache.ImageCacheState(tmp_path)
+    assert image_cache.evict(state, tmp_path, {"pinned"}, 85, 50) == 1
+    assert fake.removed == ["other:1"]
+    assert set(fake.images) == {"pinned:latest", "running:1"}
+
+
+def test_watch_counts_pull_once(tmp_path, fake_docker, monkeypatch):
+    fake = fake_docker({"present:1": ("sha256:1", 10)})
+    events = [
+        # A miss: pulled before it was present. The build's container create is part of it.
+        {"Type": "image", "id": "pulled:1"},
+        {"Type": "container", "from": "pulled:1"},
+        # A hit: started without a pull.
+        {"Type": "container", "from": "present:1"},
+    ]
+
+    class FakeEvents:
+        def __init__(self, *args, **kw):
+            fake.images["pulled:1"] = ("sha256:2", 10)
+            self.stdout = iter(json.dumps(e) + "\n" for e in events)
+
+        def wait(self):
+            return 0
+
+    monkeypatch.setattr(image_cache.subprocess, "Popen", FakeEvents)
+    state = image_cache.ImageCacheState(tmp_path)
+    with pytest.raises(SystemExit, match="docker events exited with 0"):
+        image_cache.watch(state, tmp_path, set(), 85, 75, evict_interval_sec=3600)
+
+    with state.locked(write=False) as s:
+        images = s["images"]
+    assert (images["pulled:1"]["hits"], images["pulled:1"]["misses"]) == (0, 1)
+    assert images["pulled:1"]["id"] == "sha256:2"
+    assert (images["present:1"]["hits"], images["present:1"]["misses"]) == (1, 0)
+    assert image_cache.report(state, tmp_path)["hit_rate"] == 0.5
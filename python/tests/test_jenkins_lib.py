@@ -0,0 +1,37 @@
+import argparse
+import re
+
+import pytest
+
+from tvm_ci.jenkins_builder import jenkins_lib
+
+
+@pytest.mark.parametrize("docker_port_output,port", [
+    (b"0.0.0.0:49153\n[::]:49153\n", 49153),
+    (b"[::]:49154\n", 49154),
+])
+def test_published_port(monkeypatch, docker_port_output, port):
+    calls = []
+
+    def check_output(cmd):
+        calls.append(cmd)
+        return docker_port_output
+
+    monkeypatch.setattr(jenkins_lib.subprocess, "check_output", check_output)
+    assert jenkins_lib.published_port("abc123") == port
+    assert calls == [["docker", "port", "abc123", "8080/tcp"]]
+
+
+def test_unique_container_name():
+    names = {jenkins_lib.unique_container_name() for _ in range(100)}
+    assert len(names) == 100
+    # Valid as a Docker container name, and as a host name on a Docker network.
+    assert all(re.fullmatch(r"[a-z0-9][a-z0-9-]*", name) for name in names)
+
+
+@pytest.mark.parametrize("jenkins_port,publish", [(None, "8080"), (18080, "18080:8080")])
+def test_add_jenkins_args_port(tmp_path, jenkins_port, publish):
+    docker_args = []
+    jenkins_lib.add_jenkins_args(
+        argparse.Namespace(jenkins_homedir=tmp_path, jenkins_port=jenkins_port), docker_args)
+    assert docker_args[-2:] == ["-p", publish]
@@ -0,0 +1,95 @@
+import argparse
+
+import pytest
+
+from tvm_ci import jenkins_stub
+from tvm_ci import load_test
+
+
+def _args(**kw):
+    return argparse.Namespace(**{
+        "controller": None,
+        "node_type": None,
+        "builds_per_label": 2,
+        "checkout_repo": "https://github.com/apache/tvm",
+        "checkout_branch": "main",
+        "work_sec": 1,
+        "timeout_sec": 30,
+        "poll_interval_sec": 0.05,
+        "max_p95_queue_wait_sec": None,
+        "max_p95_pickup_sec": None,
+        "max_p95_checkout_sec": None,
+        "min_throughput_per_min": None,
+        **kw})
+
+
+@pytest.fixture
+def jenkins(tvm_ci_config):
+    stub = jenkins_stub.StubJenkins.from_tvm_ci_config(
+        tvm_ci_config, controller_delay_sec=0.05, pickup_sec=0.1, checkout_sec=0.2, build_sec=0.2)
+    server = jenkins_stub.serve(stub)
+    yield stub, load_test.JenkinsClient("http://{}:{}".format(*server.server_address[:2]))
+    server.shutdown()
+    stub.stop()
+
+
+def test_run_load_test(jenkins, tvm_ci_config):
+    stub, client = jenkins
+    report = load_test.run_load_test(client, tvm_ci_config, _args())
+
+    assert report["passed"]
+    assert report["violations"] == []
+    assert set(report["node_types"]) == {"cpu", "gpu"}
+    assert stub.has_job(f"{load_test.JOB_NAME_PREFIX}cpu")
+    for node_type, label in (("cpu", "CPU"), ("gpu", "GPU")):
+        result = report["node_types"][node_type]
+        assert result["label"] == label
+        assert (result["builds"], result["completed"], result["failed"]) == (2, 2, 0)
+        assert result["queue_wait_sec"]["count"] == 2
+        # Pickup includes time spent waiting for a free executor.
+        assert result["pickup_sec"]["p95"] >= 0.1
+        assert result["checkout_sec"]["p95"] == pytest.approx(0.2)
+        assert result["throughput_per_min"] > 0
+    # The single gpu executor runs its two builds one after the other.
+    assert (report["node_types"]["gpu"]["pickup_sec"]["max"] >
+            report["node_types"]["cpu"]["pickup_sec"]["max"] + 0.2)
+
+
+def test_run_load_test_node_type(jenkins, tvm_ci_config):
+    _, client = jenkins
+    report = load_test.run_load_test(client, tvm_ci_config, _args(node_type=["gpu"]))
+    assert list(report["node_types"]) == ["gpu"]
+
+
+@pytest.mark.parametrize("controller,node_types", [(None, ["cpu"]), ("main", ["cpu"]),
+                                                   ("docs", ["gpu"])])
+def test_run_load_test_controller(jenkins, tvm_ci_config, controller, node_types):
+    _, client = jenkins
+    tvm_ci_config["jenkins"]["controllers"] = {
+        "main": {"job_files": ["tvm.yaml"], "labels": ["CPU"]},
+        "docs": {"job_files": ["docs.yaml"], "labels": ["GPU", "doc"]},
+    }
+    # Each controller only has its own node types' executors.
+    report = load_test.run_load_test(client, tvm_ci_config, _args(controller=controller))
+    assert report["controller"] == controller
+    assert list(report["node_types"]) == node_types
+
+
+def test_run_load_test_thresholds(jenkins, tvm_ci_config):
+    _, client = jenkins
+    report = load_test.run_load_test(client, tvm_ci_config, _args(
+        max_p95_checkout_sec=0.1, min_throughput_per_min=1000))
+
+    assert not report["passed"]
+    assert report["thresholds"]["max_p95_checkout_sec"] == 0.1
+    assert sorted(v.split(" ")[0] + " " + v.split(" ")[1] for v in report["violations"]) == [
+        "cpu: p95", "cpu: throughput", "gpu: p95", "gpu: throughput"]
+
+
+def test_run_load_test_timeout(jenkins, tvm_ci_config):
+    _, client = jenkins
+    # No executor carries the label, so the builds never leave the queue.
+    tvm_ci_config["cluster"]["nodes"]["cpu"]["labels"] = ["ARM"]
+    with pytest.raises(load_test.LoadTestTimeoutError, match="2 builds"):
+        load_test.run_load_test(client, tvm_ci_config,
+                                _args(node_type=["cpu"], timeout_sec=0.5))
@@ -0,0 +1,61 @@
+import argparse
+
+import yaml
+
+from tvm_ci import configure_ansible
+from tvm_ci import local_cluster
+
+
+def _ips(nodes):
+    fqdns = ([nodes["head_node"]] + list(nodes["controllers"].values()) +
+             [f for executors in nodes["executors"].values() for f in executors])
+    return {fqdn: f"172.18.0.{i + 2}" for i, fqdn in enumerate(fqdns)}
+
+
+def test_planned_nodes(tvm_ci_config):
+    assert local_cluster.planned_nodes(tvm_ci_config) == {
+        "head_node": "test-jenkins.ci.example.com",
+        "executors": {
+            "cpu": ["test-jenkins-cpu-executor-0.ci.example.com",
+                    "test-jenkins-cpu-executor-1.ci.example.com"],
+            "gpu": ["test-jenkins-gpu-executor-0.ci.example.com"],
+        },
+        "controllers": {},
+    }
+
+
+def test_terraform_output_addresses(tvm_ci_config):
+    nodes = local_cluster.planned_nodes(tvm_ci_config)
+    ips = _ips(nodes)
+    output = local_cluster.terraform_output(nodes, ips)
+    assert configure_ansible.node_addresses(output) == {
+        fqdn: {"public_ip": ip, "private_ip": ip} for fqdn, ip in ips.items()}
+
+
+def test_terraform_output_controllers(tmp_path, tvm_ci_config):
+    tvm_ci_config["jenkins"]["controllers"] = {
+        "main": {"job_files": ["tvm.yaml"], "labels": ["CPU"]},
+        "docs": {"job_files": ["docs.yaml"], "labels": ["GPU", "doc"]},
+    }
+    nodes = local_cluster.planned_nodes(tvm_ci_config)
+    assert nodes["controllers"] == {"docs": "test-jenkins-docs.ci.example.com"}
+    ips = _ips(nodes)
+    output = local_cluster.terraform_output(nodes, ips)
+    assert configure_ansible.node_addresses(output) == {
+        fqdn: {"public_ip": ip, "private_ip": ip} for fqdn, ip in ips.items()}
+
+    # The inventory configure_ansible writes from it reaches every node by its container's IP.
+    args = argparse.Namespace(
+        executor_ssh_public_key=tmp_path / "executor-ssh-key.pub",
+        jenkins_master_container_tag="jenkins:test",
+        jenkins_homedir_tar_gz=tmp_path / "jenkins-homedir.tar.gz",
+        ansible_inventory_path=tmp_path / "inventory.yml", connect_by="ip",
+        add_jenkins_hosts=True)
+    configure_ansible.write_ansible_inventory(output, args, tvm_ci_config)
+    inventory = yaml.safe_load(args.ansible_inventory_path.read_text())
+    children = inventory["all"]["children"]
+    hosts = {**children["jenkins-head-node"]["hosts"], **children["executors"]["hosts"],
+             **children["jenkins-controllers"]["hosts"]}
+    assert {fqdn: host["ansible_host"] for fqdn, host in hosts.items()} == ips
+    assert sorted(inventory["all"]["vars"]["jenkins_extra_hosts"]) == sorted(
+        f"{fqdn}:{ip}" for fqdn, ip in ips.items())
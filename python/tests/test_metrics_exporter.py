@@ -0,0 +1,99 @@
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from tvm_ci import jenkins_stub
+from tvm_ci import metrics_exporter
+
+
+def _samples(text):
+    """Map each sample in Prometheus text format, name and labels, to its value."""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+@pytest.fixture
+def jenkins():
+    stub = jenkins_stub.StubJenkins(
+        [{"name": "cpu-0", "labels": ["CPU"], "num_executors": 1},
+         {"name": "gpu-0", "labels": ["GPU"], "num_executors": 2, "offline": True}],
+        controller_delay_sec=0.05, pickup_sec=0.05, checkout_sec=0.05, build_sec=0.3)
+    stub.create_job("tvm", "<flow-definition>node('CPU') { sh 'make' }</flow-definition>")
+    server = jenkins_stub.serve(stub)
+    yield stub, "http://{}:{}".format(*server.server_address[:2])
+    server.shutdown()
+    stub.stop()
+
+
+def test_executors(jenkins):
+    _, url = jenkins
+    metrics = metrics_exporter.JenkinsMetrics(url)
+    metrics.poll()
+    samples = _samples(metrics.render())
+    assert samples["jenkins_up"] == 1
+    assert samples['jenkins_executors{label="CPU",state="idle"}'] == 1
+    assert samples['jenkins_executors{label="CPU",state="busy"}'] == 0
+    assert samples['jenkins_executors{label="GPU",state="offline"}'] == 2
+    assert samples['jenkins_agent_offline{agent="gpu-0"}'] == 1
+    assert samples['jenkins_agent_offline{agent="cpu-0"}'] == 0
+
+
+def test_queue_and_builds(jenkins):
+    stub, url = jenkins
+    metrics = metrics_exporter.JenkinsMetrics(url)
+    # Builds completed before the first poll are not counted.
+    metrics.poll()
+
+    stub.enqueue("tvm", {})
+    stub.enqueue("tvm", {})
+    max_queue_length = 0
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        metrics.poll()
+        samples = _samples(metrics.render())
+        max_queue_length = max(max_queue_length,
+                               samples.get('jenkins_queue_length{label="CPU"}', 0))
+        if samples.get('jenkins_builds_total{job="tvm",result="SUCCESS"}') == 2:
+            break
+        time.sleep(0.05)
+
+    # The second build waited for the only CPU executor.
+    assert max_queue_length == 1
+    assert samples['jenkins_builds_total{job="tvm",result="SUCCESS"}'] == 2
+    assert samples['jenkins_build_duration_seconds_count{job="tvm"}'] == 2
+    assert samples['jenkins_queue_wait_seconds_count{label="CPU"}'] == 1
+    assert samples['jenkins_queue_wait_seconds_sum{label="CPU"}'] > 0
+
+    # Polling again counts no build twice.
+    metrics.poll()
+    assert _samples(metrics.render())['jenkins_builds_total{job="tvm",result="SUCCESS"}'] == 2
+
+
+def test_poll_failure():
+    metrics = metrics_exporter.JenkinsMetrics("http://localhost:1", timeout_sec=1)
+    metrics.poll()
+    samples = _samples(metrics.render())
+    assert samples["jenkins_up"] == 0
+    assert samples["jenkins_exporter_poll_errors_total"] == 1
+
+
+def test_serve(jenkins):
+    _, url = jenkins
+    metrics = metrics_exporter.JenkinsMetrics(url)
+    metrics.poll()
+    server = metrics_exporter.serve(metrics, "localhost", 0)
+    try:
+        base_url = "http://{}:{}".format(*server.server_address[:2])
+        with urllib.request.urlopen(f"{base_url}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert _samples(str(response.read(), "utf-8"))["jenkins_up"] == 1
+        with pytest.raises(urllib.error.HTTPError, match="404"):
+            urllib.request.urlopen(f"{base_url}/other")
+    finally:
+        server.shutdown()
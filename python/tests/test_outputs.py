@@ -0,0 +1,72 @@
+import json
+import os
+
+from tvm_ci import outputs
+
+
+def test_write_if_changed_writes_new_file(tmp_path):
+    path = tmp_path / "sub" / "out.txt"
+    assert outputs.write_if_changed(path, "contents\n")
+    assert path.read_text() == "contents\n"
+
+
+def test_write_if_changed_keeps_unchanged_file(tmp_path):
+    path = tmp_path / "out.txt"
+    outputs.write_if_changed(path, b"contents")
+    os.utime(path, ns=(1, 1))
+    assert not outputs.write_if_changed(path, "contents")
+    assert path.stat().st_mtime_ns == 1
+
+
+def test_write_if_changed_replaces_changed_file(tmp_path):
+    path = tmp_path / "out.txt"
+    outputs.write_if_changed(path, "old")
+    assert outputs.write_if_changed(path, "new")
+    assert path.read_text() == "new"
+    assert [p.name for p in tmp_path.iterdir()] == ["out.txt"]
+
+
+def test_write_if_changed_mode(tmp_path):
+    path = tmp_path / "secret.txt"
+    outputs.write_if_changed(path, "secret", mode=0o600)
+    assert path.stat().st_mode & 0o777 == 0o600
+
+    # Same contents, different mode: rewritten.
+    assert outputs.write_if_changed(path, "secret", mode=0o640)
+    assert path.stat().st_mode & 0o777 == 0o640
+
+    # Without a mode, an existing file's is kept.
+    outputs.write_if_changed(path, "changed")
+    assert path.stat().st_mode & 0o777 == 0o640
+
+
+def test_write_if_changed_report(tmp_path, monkeypatch):
+    report = tmp_path / "report.jsonl"
+    monkeypatch.setenv(outputs.REPORT_FILE_ENV_VAR, str(report))
+    path = tmp_path / "out.txt"
+    outputs.write_if_changed(path, "contents")
+    outputs.write_if_changed(path, "contents")
+
+    records = [json.loads(line) for line in report.read_text().splitlines()]
+    assert [r["changed"] for r in records] == [True, False]
+    assert records[0]["path"] == str(path.resolve())
+    assert outputs.latest_records(report)[str(path.resolve())] == records[1]
+
+
+def test_current_digests_uses_report(tmp_path, monkeypatch):
+    report = tmp_path / "report.jsonl"
+    monkeypatch.setenv(outputs.REPORT_FILE_ENV_VAR, str(report))
+    path = tmp_path / "out.txt"
+    outputs.write_if_changed(path, "contents")
+    missing = tmp_path / "missing.txt"
+
+    digests = outputs.current_digests([path, missing], report)
+    assert digests == {str(path.resolve()): outputs._sha256_file(path),
+                       str(missing.resolve()): None}
+    assert outputs.combined_digest(digests) == outputs.combined_digest(dict(digests))
+
+    # A file modified behind the report's back is re-hashed.
+    path.write_text("modified")
+    os.utime(path, ns=(1, 1))
+    assert (outputs.current_digests([path], report)[str(path.resolve())] ==
+            outputs._sha256_file(path))
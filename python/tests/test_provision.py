@@ -0,0 +1,120 @@
+import json
+import os
+import sys
+import time
+import types
+
+import pytest
+
+from tvm_ci import provision
+
+
+INVENTORY = {
+    "_meta": {"hostvars": {"head": {}, "cpu-0": {}, "cpu-1": {}, "docs": {}}},
+    "all": {"children": ["ungrouped", "jenkins-head-node", "executors", "jenkins-controllers"]},
+    "jenkins-head-node": {"hosts": ["head"]},
+    "executors": {"hosts": ["cpu-0", "cpu-1"]},
+    "jenkins-controllers": {"hosts": ["docs"]},
+}
+
+
+@pytest.mark.parametrize("pattern,hosts", [
+    ("all", ["cpu-0", "cpu-1", "docs", "head"]),
+    ("executors", ["cpu-0", "cpu-1"]),
+    ("jenkins-head-node:jenkins-controllers", ["docs", "head"]),
+    ("jenkins-head-node, executors", ["cpu-0", "cpu-1", "head"]),
+    ("missing", []),
+])
+def test_resolve_hosts(pattern, hosts):
+    assert provision.resolve_hosts(pattern, INVENTORY) == hosts
+
+
+# Stands in for ansible-playbook: writes $FAKE_RESULTS to the results file the way the
+# provision_state callback would, then sleeps for $FAKE_SLEEP_SEC.
+FAKE_ANSIBLE_PLAYBOOK = """\
+import json, os, sys, time
+results = json.loads(os.environ["FAKE_RESULTS"])
+for host in results.values():
+    host["started"] = time.time() - host.pop("age_sec", 0)
+with open(os.environ["TVM_CI_PROVISION_RESULTS_FILE"], "w") as f:
+    json.dump({"play": results}, f)
+time.sleep(float(os.environ.get("FAKE_SLEEP_SEC", "0")))
+"""
+
+
+@pytest.fixture
+def fake_ansible(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    script = bin_dir / "ansible-playbook"
+    script.write_text(f"#!{sys.executable}\n{FAKE_ANSIBLE_PLAYBOOK}")
+    script.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(provision, "PROGRESS_POLL_SEC", 0.05)
+
+    playbook = tmp_path / "ansible" / "playbook.yml"
+    playbook.parent.mkdir()
+    playbook.write_text("")
+    inventory = tmp_path / "inventory.yml"
+    inventory.write_text("")
+
+    def run(results, hosts, timeout_sec=60, forks=8, sleep_sec=0):
+        monkeypatch.setenv("FAKE_RESULTS", json.dumps(results))
+        monkeypatch.setenv("FAKE_SLEEP_SEC", str(sleep_sec))
+        return provision.run_play({"name": "play", "hosts": "all", "tasks": []}, playbook,
+                                  inventory, hosts, timeout_sec, forks)
+
+    return run
+
+
+def test_run_play_outcomes(fake_ansible):
+    outcomes = fake_ansible({"a": {"status": "ok"}, "b": {"status": "unreachable"},
+                             "c": {"status": "failed"}, "d": {"status": "running"}},
+                            ["a", "b", "c", "d", "e"])
+    # Hosts which never finished, or never started, failed.
+    assert outcomes == {"a": "ok", "b": "unreachable", "c": "failed", "d": "failed", "e": "failed"}
+
+
+def test_run_play_stops_at_host_timeout(fake_ansible):
+    start = time.monotonic()
+    outcomes = fake_ansible({"a": {"status": "ok"}, "b": {"status": "running", "age_sec": 120}},
+                            ["a", "b"], timeout_sec=60, sleep_sec=60)
+    assert time.monotonic() - start < 30
+    assert outcomes == {"a": "ok", "b": "failed"}
+
+
+def test_provision_state_callback(tmp_path, monkeypatch):
+    pytest.importorskip("ansible.plugins.callback")
+    sys.path.insert(0, str(provision.utils.get_repo_root() / "ansible" / "callback_plugins"))
+    try:
+        import provision_state
+    finally:
+        sys.path.pop(0)
+
+    results_path = tmp_path / "results.json"
+    monkeypatch.setenv("TVM_CI_PROVISION_RESULTS_FILE", str(results_path))
+    callback = provision_state.CallbackModule()
+
+    def host(name):
+        return types.SimpleNamespace(get_name=lambda: name)
+
+    def result(name, task):
+        return types.SimpleNamespace(_host=host(name),
+                                     _task=types.SimpleNamespace(get_name=lambda: task))
+
+    callback.v2_playbook_on_play_start(types.SimpleNamespace(get_name=lambda: "play"))
+    for name in ("a", "b", "c"):
+        callback.v2_runner_on_start(host(name), None)
+    callback.v2_runner_on_ok(result("a", "install docker"))
+    assert json.loads(results_path.read_text())["play"]["a"]["status"] == "running"
+
+    callback.v2_runner_on_ok(result("a", provision.COMPLETE_TASK_NAME))
+    callback.v2_runner_on_failed(result("b", "install docker"))
+    callback.v2_runner_on_failed(result("c", "optional"), ignore_errors=True)
+    callback.v2_runner_on_unreachable(result("c", "install docker"))
+    # Failures are final.
+    callback.v2_runner_on_ok(result("b", provision.COMPLETE_TASK_NAME))
+
+    results = json.loads(results_path.read_text())["play"]
+    assert {h: r["status"] for h, r in results.items()} == {
+        "a": "ok", "b": "failed", "c": "unreachable"}
@@ -0,0 +1,60 @@
+import pytest
+
+from tvm_ci.jenkins_builder import reconfigure
+
+
+def _casc(nodes=("cpu-0",), admins=("admin",), url="https://ci.example.com/"):
+    return {
+        "jenkins": {
+            "nodes": [{"permanent": {"name": n, "numExecutors": 2}} for n in nodes],
+            "authorizationStrategy": {"globalMatrix": {"permissions": list(admins)}},
+            "numExecutors": 0,
+        },
+        "credentials": {"system": {"domainCredentials": []}},
+        "unclassified": {"location": {"url": url}},
+    }
+
+
+def test_diff_casc_unchanged():
+    assert reconfigure.diff_casc(_casc(), _casc()) == []
+
+
+def test_diff_casc_reloadable_sections():
+    assert reconfigure.diff_casc(_casc(), _casc(nodes=("cpu-0", "cpu-1"))) == ["nodes"]
+    assert reconfigure.diff_casc(_casc(), _casc(admins=("other",))) == ["authorization"]
+
+    generated = _casc(nodes=())
+    generated["credentials"] = {"system": {"domainCredentials": [{"id": "new"}]}}
+    assert reconfigure.diff_casc(_casc(), generated) == ["nodes", "credentials"]
+
+
+def test_diff_casc_not_reloadable():
+    with pytest.raises(reconfigure.NotReloadableError, match="unclassified.location.url"):
+        reconfigure.diff_casc(_casc(), _casc(url="https://other.example.com/"))
+
+    generated = _casc()
+    del generated["jenkins"]["numExecutors"]
+    with pytest.raises(reconfigure.NotReloadableError, match="jenkins.numExecutors"):
+        reconfigure.diff_casc(_casc(), generated)
+
+
+def test_partial_casc():
+    generated = _casc(nodes=("cpu-1",))
+    assert reconfigure.partial_casc(generated, ["nodes", "credentials"]) == {
+        "jenkins": {"nodes": generated["jenkins"]["nodes"]},
+        "credentials": generated["credentials"],
+    }
+
+
+def test_removed_nodes():
+    assert reconfigure.removed_nodes(_casc(nodes=("a", "b", "c")), _casc(nodes=("b", "d"))) == ["a", "c"]
+
+
+def test_controller_host():
+    settings = {"main": {}, "docs": {}}
+    inventory = {"all": {"children": {"jenkins-controllers": {"hosts": {
+        "test-jenkins-docs.ci.example.com": {"jenkins_controller": "docs"}}}}}}
+    assert reconfigure.controller_host(inventory, None, None) == "jenkins-head-node"
+    assert reconfigure.controller_host(inventory, settings, "main") == "jenkins-head-node"
+    assert (reconfigure.controller_host(inventory, settings, "docs") ==
+            "test-jenkins-docs.ci.example.com")
@@ -0,0 +1,85 @@
+import subprocess
+
+import pytest
+
+from tvm_ci import terraform_shards
+
+
+class FakeTerraform:
+    """Records terraform commands and answers `state list` and `state pull` from `states`."""
+
+    def __init__(self, states):
+        self.states = states
+        self.calls = []
+        self.moves = []
+
+    def terraform(self, shard, *args, capture=True):
+        self.calls.append((shard.name,) + args)
+        stdout = ""
+        if args[:2] == ("state", "list"):
+            stdout = "\n".join(self.states[shard.name])
+        elif args[:2] == ("state", "pull"):
+            stdout = '{"version": 4}' if self.states[shard.name] else ""
+        return subprocess.CompletedProcess(["terraform"] + list(args), 0, stdout)
+
+    def check_call(self, cmd, cwd):
+        self.moves.append(cmd[-2:])
+
+
+@pytest.fixture
+def fake_terraform(monkeypatch):
+    def make(states):
+        fake = FakeTerraform(states)
+        monkeypatch.setattr(terraform_shards, "_terraform", fake.terraform)
+        monkeypatch.setattr(terraform_shards.subprocess, "check_call", fake.check_call)
+        return fake
+    return make
+
+
+def _shard(tmp_path, name, node_type=None):
+    return terraform_shards.Shard(name, tmp_path, tmp_path / f"{name}-backend.txt",
+                                  tmp_path / f"{name}-vars.txt", tmp_path / f"{name}-plan.txt",
+                                  None, node_type)
+
+
+def test_migrate_executors(tmp_path, fake_terraform):
+    fake = fake_terraform({
+        "shared": ["aws_vpc.vpc", "module.cpu_executor.aws_instance.executor[0]",
+                   "module.cpu_executor.aws_route53_record.executor[0]"],
+        "executor-cpu": [],
+        "executor-gpu": [],
+    })
+    shared = _shard(tmp_path, "shared")
+    pools = [_shard(tmp_path, "executor-cpu", "cpu"), _shard(tmp_path, "executor-gpu", "gpu")]
+    terraform_shards.migrate_executors(shared, pools)
+
+    assert fake.moves == [["module.cpu_executor", "module.executor"]]
+    pushes = [call[0] for call in fake.calls if call[1:3] == ("state", "push")]
+    # The pool's state is pushed before the shared state loses the executors.
+    assert pushes == ["executor-cpu", "shared"]
+    assert not any(call[0] == "executor-gpu" and call[1] == "state" and call[2] != "list"
+                   for call in fake.calls)
+
+
+def test_migrate_executors_already_migrated(tmp_path, fake_terraform):
+    fake = fake_terraform({"shared": ["aws_vpc.vpc"],
+                           "executor-cpu": ["module.executor.aws_instance.executor[0]"]})
+    terraform_shards.migrate_executors(_shard(tmp_path, "shared"),
+                                       [_shard(tmp_path, "executor-cpu", "cpu")])
+    assert fake.moves == []
+
+
+def test_migrate_executors_in_both_states(tmp_path, fake_terraform):
+    fake_terraform({"shared": ["module.cpu_executor.aws_instance.executor[0]"],
+                    "executor-cpu": ["module.executor.aws_instance.executor[0]"]})
+    with pytest.raises(terraform_shards.StateMigrationError, match="terraform state rm"):
+        terraform_shards.migrate_executors(_shard(tmp_path, "shared"),
+                                           [_shard(tmp_path, "executor-cpu", "cpu")])
+
+
+def test_migrate_executors_without_pool(tmp_path, fake_terraform):
+    fake_terraform({"shared": ["module.arm_executor.aws_instance.executor[0]"],
+                    "executor-cpu": []})
+    with pytest.raises(terraform_shards.StateMigrationError, match="arm executors"):
+        terraform_shards.migrate_executors(_shard(tmp_path, "shared"),
+                                           [_shard(tmp_path, "executor-cpu", "cpu")])
@@ -0,0 +1,191 @@
+"""Store Jenkins artifacts and stashes in S3-compatible storage instead of on the head node.
+
+When jenkins.artifact_manager is set in the CI config:
+
+    jenkins:
+        artifact_manager:
+            bucket: tvm-ci-artifacts
+            prefix: jenkins/                    # optional
+            region: us-east-2                   # optional; defaults to cluster.aws_region
+            endpoint: http://10.0.0.5:9000      # optional; for S3-compatible stores such as MinIO
+            aws_profile_name: artifacts         # optional; defaults to cluster.aws_profile_name
+
+build_container installs the artifact-manager-s3 plugin and generate_casc() configures it, with
+the keys of aws_profile_name in config/secrets/aws-credentials as a Jenkins credential. Executors
+then upload archived artifacts and stashes straight to the bucket, and download them from it,
+through URLs the head node signs. Only metadata passes through the head node, so its disk and
+network load no longer grow with the number of executors.
+
+The bucket is not created by Terraform. To try the configuration without AWS, run a local MinIO
+and point `endpoint` at it (executors must be able to reach it, too):
+
+    python -m tvm_ci.artifact_manager --tvm-ci-config=config/dev.yaml minio
+    python -m tvm_ci.artifact_manager --tvm-ci-config=config/dev.yaml check
+"""
+
+import argparse
+import logging
+import subprocess
+import sys
+import time
+import typing
+import urllib.parse
+import uuid
+
+import boto3
+import botocore.exceptions
+
+from . import utils
+
+
+_LOG = logging.getLogger(__name__)
+
+
+# Plugins build_container installs in addition to config/plugins.txt when enabled.
+REQUIRED_PLUGINS = ["artifact-manager-s3", "aws-credentials"]
+
+
+DEFAULT_PREFIX = "jenkins-artifacts/"
+
+
+CREDENTIALS_ID = "artifact-manager-s3"
+
+
+MINIO_CONTAINER_NAME = "tvm-ci-minio"
+
+
+def manager_settings(tvm_ci_config : dict) -> typing.Optional[dict]:
+    """Return the bucket, prefix, region, endpoint and AWS profile, or None if disabled."""
+    artifact_manager = tvm_ci_config["jenkins"].get("artifact_manager")
+    if artifact_manager is None:
+        return None
+
+    return {
+        "bucket": artifact_manager["bucket"],
+        "prefix": artifact_manager.get("prefix", DEFAULT_PREFIX),
+        "region": artifact_manager.get("region", tvm_ci_config["cluster"].get("aws_region")),
+        "endpoint": artifact_manager.get("endpoint"),
+        "aws_profile_name": artifact_manager.get(
+            "aws_profile_name", tvm_ci_config["cluster"].get("aws_profile_name", "default")),
+    }
+
+
+def casc_sections(settings : dict) -> dict:
+    """Return the CasC top-level sections which configure artifact-manager-s3."""
+    s3 = {"container": settings["bucket"], "prefix": settings["prefix"]}
+    if settings["endpoint"] is not None:
+        endpoint = urllib.parse.urlsplit(settings["endpoint"])
+        s3.update({
+            "customEndpoint": endpoint.netloc,
+            "customSigningRegion": settings["region"],
+            "useHttp": endpoint.scheme == "http",
+            # S3-compatible stores generally neither serve virtual-hosted buckets nor issue STS
+            # session tokens.
+            "usePathStyleUrl": True,
+            "disableSessionToken": True,
+        })
+
+    return {
+        "aws": {
+            "awsCredentials": {"credentialsId": CREDENTIALS_ID, "region": settings["region"]},
+            "s3": s3,
+        },
+        "unclassified": {
+            "artifactManager": {"artifactManagerFactories": [{"jclouds": {"provider": "s3"}}]},
+        },
+    }
+
+
+def credential(settings : dict) -> typing.Tuple[dict, dict]:
+    """Return the CasC credential holding the bucket's keys, and the env vars it references."""
+    credentials = utils.parse_aws_credentials(settings["aws_profile_name"])
+    return (
+        {
+            "aws": {
+                "id": CREDENTIALS_ID,
+                "accessKey": credentials.aws_access_key_id,
+                "secretKey": "${ARTIFACT_MANAGER_S3_SECRET_KEY}",
+                "description": "Credentials used by artifact-manager-s3",
+                "scope": "GLOBAL",
+            },
+        },
+        {"ARTIFACT_MANAGER_S3_SECRET_KEY": credentials.aws_secret_access_key},
+    )
+
+
+def _s3_client(settings : dict):
+    credentials = utils.parse_aws_credentials(settings["aws_profile_name"])
+    return boto3.client("s3", **credentials._asdict(), region_name=settings["region"],
+                        endpoint_url=settings["endpoint"])
+
+
+def check(settings : dict):
+    """Write, read back and delete an object under the configured prefix."""
+    client = _s3_client(settings)
+    key = f"{settings['prefix']}tvm-ci-check-{uuid.uuid4().hex}"
+    body = b"tvm-ci artifact manager check\n"
+    client.put_object(Bucket=settings["bucket"], Key=key, Body=body)
+    try:
+        if client.get_object(Bucket=settings["bucket"], Key=key)["Body"].read() != body:
+            sys.exit(f"s3://{settings['bucket']}/{key}: read back different contents")
+    finally:
+        client.delete_object(Bucket=settings["bucket"], Key=key)
+    _LOG.info("s3://%s/%s is writable", settings["bucket"], settings["prefix"])
+
+
+def run_minio(settings : dict, port : int, data_dir : str):
+    """Start a MinIO container serving the configured bucket, using the configured keys."""
+    credentials = utils.parse_aws_credentials(settings["aws_profile_name"])
+    subprocess.run(["docker", "rm", "-f", MINIO_CONTAINER_NAME],
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    subprocess.check_call([
+        "docker", "run", "-d", "--name", MINIO_CONTAINER_NAME, "-p", f"{port}:9000",
+        "-v", f"{data_dir}:/data",
+        "-e", f"MINIO_ROOT_USER={credentials.aws_access_key_id}",
+        "-e", f"MINIO_ROOT_PASSWORD={credentials.aws_secret_access_key}",
+        "minio/minio", "server", "/data"])
+
+    client = _s3_client({**settings, "endpoint": f"http://localhost:{port}"})
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            client.create_bucket(Bucket=settings["bucket"])
+            break
+        except client.exceptions.BucketAlreadyOwnedByYou:
+            break
+        except botocore.exceptions.EndpointConnectionError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(1)
+    _LOG.info("MinIO serving bucket %s on port %d", settings["bucket"], port)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    utils.add_tvm_ci_config_arg(parser)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("check", help="Verify the bucket is reachable and writable")
+    minio_parser = subparsers.add_parser("minio", help="Run a local MinIO stand-in for the bucket")
+    minio_parser.add_argument("--port", type=int, default=9000,
+                              help="Port on the local machine on which MinIO listens")
+    minio_parser.add_argument("--data-dir", default=str(utils.get_repo_root() / "build" / "minio"),
+                              help="Directory holding MinIO's data")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level="INFO")
+
+    settings = manager_settings(utils.parse_tvm_ci_config(args))
+    if settings is None:
+        sys.exit("jenkins.artifact_manager is not set in the CI config")
+
+    if args.command == "check":
+        check(settings)
+    elif args.command == "minio":
+        run_minio(settings, args.port, args.data_dir)
+
+
+if __name__ == "__main__":
+    main()
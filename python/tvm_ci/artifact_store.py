@@ -0,0 +1,288 @@
+"""A local content-addressed store for build artifacts.
+
+Each stored artifact set is indexed by an input key: a digest over the name of the step which
+produced it and the digests of everything it was produced from. Steps compute the key before
+doing any work and, when the store already holds outputs for it, restore those instead of
+recomputing them:
+
+    store = artifact_store.ArtifactStore(path)
+    input_digests = artifact_store.digest_inputs({"config": config_path, "tag": container_tag})
+    key = artifact_store.input_key("configure_jenkins", input_digests)
+    if not store.restore(key, {"homedir": homedir_tar_gz}):
+        ...  # build homedir_tar_gz
+        store.save(key, "configure_jenkins", input_digests, {"homedir": homedir_tar_gz})
+
+Blobs are stored once per content digest (identical outputs of different steps or inputs are
+deduplicated) as <root>/blobs/<xx>/<sha256>. <root>/index.json records, per key, the producer,
+input digests and output blobs, and, per blob, its size and when it was last used. After each
+save, least-recently-used blobs are evicted until the store fits in its size cap.
+
+Inspect or trim the store with:
+
+    python -m tvm_ci.artifact_store list|gc
+"""
+
+import argparse
+import contextlib
+import datetime
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import shutil
+import time
+import typing
+
+from . import outputs
+from . import utils
+
+
+_LOG = logging.getLogger(__name__)
+
+
+DEFAULT_MAX_BYTES = 20 * 1024 * 1024 * 1024
+
+
+def default_store_path() -> pathlib.Path:
+    return utils.get_repo_root() / "build" / "cas"
+
+
+def _sha256_file(path : pathlib.Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _digest_input(value : typing.Union[pathlib.Path, str, bytes]) -> str:
+    if isinstance(value, str):
+        value = bytes(value, "utf-8")
+    if isinstance(value, bytes):
+        return hashlib.sha256(value).hexdigest()
+
+    if not value.exists():
+        return "missing"
+    if value.is_file():
+        return _sha256_file(value)
+
+    # Directories: the relative path and contents of every file beneath them. Python bytecode
+    # caches are rewritten by merely importing the sources, so they are left out.
+    digest = hashlib.sha256()
+    for path in sorted(p for p in value.rglob("*") if p.is_file() and "__pycache__" not in p.parts):
+        digest.update(bytes(str(path.relative_to(value)), "utf-8"))
+        digest.update(b"\0")
+        digest.update(bytes(_sha256_file(path), "ascii"))
+    return digest.hexdigest()
+
+
+def digest_inputs(inputs : typing.Dict[str, typing.Union[pathlib.Path, str, bytes]]) -> typing.Dict[str, str]:
+    """Return the digest of each input.
+
+    Parameters
+    ----------
+    inputs : Dict[str, Union[pathlib.Path, str, bytes]]
+        Maps an input name to its value. pathlib.Path values are files or directories, whose
+        contents are digested (or "missing"); str and bytes values are digested directly.
+
+    Returns
+    -------
+    Dict[str, str] :
+        Maps each input name to its sha256.
+    """
+    return {name: _digest_input(value) for name, value in inputs.items()}
+
+
+def input_key(producer : str, input_digests : typing.Dict[str, str]) -> str:
+    """Return the key under which `producer`'s outputs for `input_digests` are stored."""
+    return hashlib.sha256(
+        bytes(json.dumps({"producer": producer, "inputs": input_digests}, sort_keys=True),
+              "utf-8")).hexdigest()
+
+
+class ArtifactStore:
+    """A content-addressed artifact store rooted at a local directory.
+
+    Parameters
+    ----------
+    root : pathlib.Path
+        Directory holding the store. Created, owner-accessible only, if it does not exist.
+    max_bytes : int
+        Total size of the blobs in the store is kept below this by LRU eviction.
+    """
+
+    def __init__(self, root : pathlib.Path, max_bytes : int = DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        # Outputs such as the Jenkins homedir contain credentials.
+        self.root.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+    @property
+    def _index_path(self) -> pathlib.Path:
+        return self.root / "index.json"
+
+    def blob_path(self, sha256 : str) -> pathlib.Path:
+        return self.root / "blobs" / sha256[:2] / sha256
+
+    @contextlib.contextmanager
+    def _locked_index(self, write : bool = True):
+        with open(self.root / "index.lock", "w") as lock_f:
+            fcntl.flock(lock_f, fcntl.LOCK_EX)
+            try:
+                index = {"entries": {}, "blobs": {}}
+                if self._index_path.exists():
+                    with open(self._index_path) as index_f:
+                        index = json.load(index_f)
+                yield index
+                if write:
+                    outputs.write_if_changed(
+                        self._index_path, json.dumps(index, indent=2, sort_keys=True) + "\n")
+            finally:
+                fcntl.flock(lock_f, fcntl.LOCK_UN)
+
+    def restore(self, key : str, dests : typing.Dict[str, pathlib.Path]) -> bool:
+        """Copy the outputs stored under `key` to `dests`, which maps output name to path.
+
+        Returns
+        -------
+        bool :
+            True if every output in `dests` was restored. When False, no file was written.
+        """
+        with self._locked_index() as index:
+            entry = index["entries"].get(key)
+            if entry is None or not all(
+                    name in entry["outputs"] and self.blob_path(entry["outputs"][name]).exists()
+                    for name in dests):
+                _LOG.info("Artifact store miss: %s", key[:12])
+                return False
+
+            now = time.time()
+            entry["last_used"] = now
+            for name, dest in dests.items():
+                sha256 = entry["outputs"][name]
+                index["blobs"][sha256]["last_used"] = now
+                self._materialize(sha256, dest)
+
+        _LOG.info("Artifact store hit: %s (%s, produced %s)", key[:12], entry["producer"],
+                  datetime.datetime.fromtimestamp(entry["created"]).isoformat(timespec="seconds"))
+        return True
+
+    def _materialize(self, sha256 : str, dest : pathlib.Path):
+        blob = self.blob_path(sha256)
+        if (dest.exists() and dest.stat().st_size == blob.stat().st_size and
+            _sha256_file(dest) == sha256):
+            return
+
+        # Copied rather than linked: some producers rewrite their outputs in place. Created
+        # owner-only, since the store does not record which outputs hold secrets.
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = dest.with_name(f".{dest.name}.{os.getpid()}.tmp")
+        with open(blob, "rb") as blob_f, \
+             os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as tmp_f:
+            shutil.copyfileobj(blob_f, tmp_f, 1 << 20)
+        os.replace(tmp_path, dest)
+
+    def _add_blob(self, path : pathlib.Path, index : dict) -> str:
+        sha256 = _sha256_file(path)
+        blob = self.blob_path(sha256)
+        if not blob.exists():
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = blob.with_name(f".{sha256}.{os.getpid()}.tmp")
+            shutil.copyfile(path, tmp_path)
+            os.chmod(tmp_path, 0o400)
+            os.replace(tmp_path, blob)
+        else:
+            _LOG.debug("Deduplicated %s: %s", path, sha256[:12])
+        index["blobs"][sha256] = {"size": blob.stat().st_size, "last_used": time.time()}
+        return sha256
+
+    def save(self, key : str, producer : str, input_digests : typing.Dict[str, str],
+             output_paths : typing.Dict[str, pathlib.Path]):
+        """Store `output_paths` (output name to path) as `producer`'s outputs for `key`."""
+        with self._locked_index() as index:
+            now = time.time()
+            index["entries"][key] = {
+                "producer": producer,
+                "inputs": input_digests,
+                "outputs": {name: self._add_blob(path, index) for name, path in output_paths.items()},
+                "created": now,
+                "last_used": now,
+            }
+            self._evict(index, keep=set(index["entries"][key]["outputs"].values()))
+        _LOG.info("Stored %s outputs: %s", producer, key[:12])
+
+    def _evict(self, index : dict, keep : typing.Set[str] = frozenset()):
+        total = sum(b["size"] for b in index["blobs"].values())
+        for sha256, blob in sorted(index["blobs"].items(), key=lambda item: item[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if sha256 in keep:
+                continue
+            _LOG.info("Evicting blob %s (%d bytes)", sha256[:12], blob["size"])
+            self.blob_path(sha256).unlink(missing_ok=True)
+            del index["blobs"][sha256]
+            total -= blob["size"]
+
+        # An entry is only useful while all of its outputs are present.
+        for key in [k for k, e in index["entries"].items()
+                    if not all(s in index["blobs"] for s in e["outputs"].values())]:
+            del index["entries"][key]
+
+    def gc(self):
+        """Evict blobs down to the size cap and remove blobs no longer in the index."""
+        with self._locked_index() as index:
+            self._evict(index)
+            for blob in (self.root / "blobs").glob("*/*"):
+                if blob.name not in index["blobs"]:
+                    blob.unlink()
+
+    def entries(self) -> typing.Dict[str, dict]:
+        with self._locked_index(write=False) as index:
+            return {"entries": index["entries"], "blobs": index["blobs"]}
+
+
+def add_arguments(parser : argparse.ArgumentParser):
+    """Add the options tools use to enable the artifact store."""
+    parser.add_argument("--artifact-store", type=pathlib.Path,
+                        help=("Path to a content-addressed artifact store. When given, outputs "
+                              "are restored from it when their inputs are unchanged, and saved "
+                              "to it otherwise."))
+    parser.add_argument("--artifact-store-max-bytes", type=int, default=DEFAULT_MAX_BYTES,
+                        help="Size cap of the artifact store; least-recently-used blobs are evicted")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--root", type=pathlib.Path, default=default_store_path(),
+                        help="Path to the artifact store")
+    parser.add_argument("--max-bytes", type=int, default=DEFAULT_MAX_BYTES,
+                        help="Size cap to evict down to")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="List stored artifacts, most recently used first")
+    subparsers.add_parser("gc", help="Evict least-recently-used blobs down to --max-bytes")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level="INFO")
+    store = ArtifactStore(args.root, args.max_bytes)
+
+    if args.command == "gc":
+        store.gc()
+        return
+
+    index = store.entries()
+    for key, entry in sorted(index["entries"].items(), key=lambda item: -item[1]["last_used"]):
+        last_used = datetime.datetime.fromtimestamp(entry["last_used"]).isoformat(timespec="seconds")
+        print(f"{key[:12]}  {entry['producer']:<20} last used {last_used}")
+        for name, sha256 in sorted(entry["outputs"].items()):
+            print(f"    {name}: {sha256[:12]} ({index['blobs'][sha256]['size']} bytes)")
+    print(f"Total: {sum(b['size'] for b in index['blobs'].values())} bytes in "
+          f"{len(index['blobs'])} blobs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""Benchmark the tvm_ci generators against synthetic, production-scale fixtures.
+
+Each benchmark builds its fixture in a temporary directory (not timed), then runs the function
+under test --repeat times and records the fastest runtime. One further run under tracemalloc
+records peak Python memory. Results are compared against the baseline stored in
+benchmarks/baseline-<scale>.json; the process exits non-zero if any benchmark regressed beyond the
+tolerances. Pass --update-baseline to record new baselines after an intentional change.
+
+Runtimes are compared relative to the machine: a fixed calibration workload is timed alongside
+the benchmarks and stored in the baseline, and baseline runtimes are scaled by the ratio of the
+two calibration times before the tolerances are applied. A baseline recorded on a faster or slower
+machine therefore still holds, to within --runtime-tolerance (25% by default).
+
+Scales:
+ - small: quick enough to run on every change.
+ - production: thousands of stage scripts, executor nodes and .gitlab-ci.yml jobs, and a
+   multi-GB Jenkins homedir.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import pathlib
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing
+import zlib
+
+from . import configure_ansible
+from . import generate_makefile
+from . import homedir_snapshot
+from . import utils
+from .jenkins_builder import configure_jenkins
+
+
+_LOG = logging.getLogger(__name__)
+
+
+SCALES = {
+    "small": {
+        "stages": 10,
+        "steps_per_stage": 10,
+        "node_types": 10,
+        "nodes_per_type": 10,
+        "homedir_files": 200,
+        "homedir_bytes": 16 * 1024 * 1024,
+    },
+    "production": {
+        "stages": 100,
+        "steps_per_stage": 50,
+        "node_types": 200,
+        "nodes_per_type": 25,
+        "homedir_files": 20000,
+        "homedir_bytes": 2 * 1024 * 1024 * 1024,
+    },
+}
+
+
+def _write_stage_scripts(root : pathlib.Path, scale : dict) -> pathlib.Path:
+    scripts_dir = root / "stage-scripts"
+    scripts_dir.mkdir()
+    for stage in range(scale["stages"]):
+        for step in range(scale["steps_per_stage"]):
+            (scripts_dir / f"stage_{stage:04d}-{step:03d}-step_{step}.sh").write_text("#!/bin/bash\n")
+    return scripts_dir
+
+
+def _write_gitlab_ci_yml(root : pathlib.Path, scale : dict) -> pathlib.Path:
+    stage_names = [f"stage_{stage:04d}" for stage in range(scale["stages"])]
+    lines = ["stages:"] + [f"  - {s}" for s in stage_names] + [""]
+    for s in stage_names:
+        lines.extend([f"{s}:", f"  stage: {s}", "  script:", "    - placeholder.sh", ""])
+    path = root / ".gitlab-ci.yml"
+    path.write_text("\n".join(lines))
+    return path
+
+
+def _tvm_ci_config(scale : dict) -> dict:
+    nodes = {}
+    for i in range(scale["node_types"]):
+        nodes[f"type{i}"] = {
+            "num_nodes": scale["nodes_per_type"],
+            "num_executors": 2,
+            "labels": [f"LABEL{i}", f"GROUP{i % 10}"],
+        }
+    return {
+        "mode": "dev",
+        "cluster": {"name_prefix": "bench-", "dns_suffix": "bench.example.com", "nodes": nodes},
+        "jenkins": {"review_bot_github_username": "bench", "admin_github_usernames": ["bench"]},
+    }
+
+
+def _terraform_output(scale : dict) -> dict:
+    output = {"jenkins_head_node_fqdn": {"value": "bench-jenkins.bench.example.com"}}
+    for i in range(scale["node_types"]):
+        output[f"type{i}_executor_fqdn"] = {"value": [
+            f"bench-jenkins-type{i}-executor-{n}.bench.example.com"
+            for n in range(scale["nodes_per_type"])]}
+    return output
+
+
+def _write_homedir(root : pathlib.Path, scale : dict) -> pathlib.Path:
+    homedir = root / "jenkins-homedir"
+    file_bytes = scale["homedir_bytes"] // scale["homedir_files"]
+    # Half random (incompressible, like build artifacts) and half repetitive (like XML and logs).
+    rand = random.Random(0)
+    for i in range(scale["homedir_files"]):
+        path = homedir / "jobs" / f"job{i % 100}" / "builds" / f"{i}.dat"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if i % 2:
+            path.write_bytes(rand.getrandbits(8 * file_bytes).to_bytes(file_bytes, "little"))
+        else:
+            path.write_bytes((b"<build><result>SUCCESS</result></build>\n" * (file_bytes // 40 + 1))[:file_bytes])
+    return homedir
+
+
+def bench_build_stages(root, scale):
+    scripts_dir = _write_stage_scripts(root, scale)
+    return lambda: generate_makefile.build_stages(scripts_dir)
+
+
+def bench_process_gitlab_ci(root, scale):
+    stages_by_name = generate_makefile.build_stages(_write_stage_scripts(root, scale))
+    gitlab_ci_yml = _write_gitlab_ci_yml(root, scale)
+    return lambda: generate_makefile.process_gitlab_ci(stages_by_name, gitlab_ci_yml)
+
+
+def bench_generate_makefile(root, scale):
+    stages_by_name = generate_makefile.build_stages(_write_stage_scripts(root, scale))
+    template = root / "template.mk"
+    template.write_text("BUILD_DIR=build\n\n{STAGE_RULES}\n")
+    return lambda: generate_makefile.generate_makefile(
+        stages_by_name, sorted(stages_by_name), template, root / "Makefile")
+
+
+def bench_generate_casc(root, scale):
+    base_casc = root / "base-jenkins.yaml"
+    base_casc.write_text((utils.get_repo_root() / "config" / "base-jenkins.yaml").read_text())
+    token = root / "github-token"
+    token.write_text("token\n")
+    token.chmod(0o600)
+    homedir = root / "homedir"
+    homedir.mkdir()
+    args = argparse.Namespace(base_casc_config=base_casc, github_personal_access_token=token,
+                              jenkins_homedir=homedir)
+    tvm_ci_config = _tvm_ci_config(scale)
+    return lambda: configure_jenkins.generate_casc(args, tvm_ci_config, "PRIVATE KEY")
+
+
+def bench_write_ansible_inventory(root, scale):
+    (root / "key.pub").write_text("ssh-ed25519 AAAA bench\n")
+    args = argparse.Namespace(executor_ssh_public_key=root / "key.pub",
+                              jenkins_master_container_tag="bench/jenkins:v0.1",
+                              jenkins_homedir_tar_gz=root / "homedir.tar.gz",
+                              ansible_inventory_path=root / "inventory.yml",
+                              connect_by="ip", add_jenkins_hosts=False)
+    terraform_output = _terraform_output(scale)
+    return lambda: configure_ansible.write_ansible_inventory(terraform_output, args)
+
+
+def bench_archive_homedir(root, scale):
+    homedir = _write_homedir(root, scale)
+    return lambda: configure_jenkins.archive_homedir(homedir, root / "jenkins-homedir.tar.gz")
+
+
+def bench_homedir_snapshot(root, scale):
+    homedir = _write_homedir(root, scale)
+    store = root / "store"
+
+    # A full snapshot: each run starts with an empty store, which is removed afterwards.
+    def run():
+        try:
+            homedir_snapshot.snapshot(homedir_snapshot.LocalStore(str(store)), str(homedir), [],
+                                      parallel=8)
+        finally:
+            shutil.rmtree(store, ignore_errors=True)
+
+    return run
+
+
+BENCHMARKS = {
+    "generate_makefile.build_stages": bench_build_stages,
+    "generate_makefile.process_gitlab_ci": bench_process_gitlab_ci,
+    "generate_makefile.generate_makefile": bench_generate_makefile,
+    "configure_jenkins.generate_casc": bench_generate_casc,
+    "configure_ansible.write_ansible_inventory": bench_write_ansible_inventory,
+    "configure_jenkins.archive_homedir": bench_archive_homedir,
+    "homedir_snapshot.snapshot": bench_homedir_snapshot,
+}
+
+
+# Baseline entry holding the calibration runtime of the machine which recorded it.
+CALIBRATION = "calibration"
+
+
+def _calibration_workload():
+    # A little of what the generators do: string formatting, dict building, hashing, compression.
+    rand = random.Random(0)
+    data = rand.getrandbits(8 * 1024 * 1024).to_bytes(1024 * 1024, "little")
+    lines = {f"node-{i}": f"bench-jenkins-{i % 200}-executor-{i}.bench.example.com" for i in range(100000)}
+    text = "\n".join(f"{k}: {v}" for k, v in sorted(lines.items())).encode()
+    for _ in range(4):
+        hashlib.sha256(data).hexdigest()
+        zlib.compress(data + text, 6)
+
+
+def calibrate(repeat : int) -> float:
+    """Time the calibration workload, which stands in for this machine's speed."""
+    runtimes = []
+    for _ in range(max(repeat, 5)):
+        start = time.perf_counter()
+        _calibration_workload()
+        runtimes.append(time.perf_counter() - start)
+    return min(runtimes)
+
+
+def run_benchmark(name : str, scale : dict, repeat : int) -> dict:
+    with tempfile.TemporaryDirectory(prefix="tvm-ci-bench-") as tmp:
+        fn = BENCHMARKS[name](pathlib.Path(tmp), scale)
+
+        runtimes = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            runtimes.append(time.perf_counter() - start)
+
+        # Measured separately: tracemalloc slows down the code under test.
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {"runtime_sec": min(runtimes), "peak_mem_bytes": peak}
+
+
+def compare(results : dict, baseline : dict, runtime_tolerance : float, memory_tolerance : float,
+            min_runtime_delta_sec : float,
+            calibration_sec : typing.Optional[float] = None) -> typing.List[str]:
+    """Return a description of each result which regressed from `baseline`.
+
+    When both `calibration_sec` and the baseline's calibration are known, baseline runtimes are
+    scaled by their ratio, so the comparison is relative to the machine's speed.
+    """
+    machine_scale = 1.0
+    if calibration_sec is not None and CALIBRATION in baseline:
+        machine_scale = calibration_sec / baseline[CALIBRATION]["runtime_sec"]
+        _LOG.info("This machine runs the calibration workload %.2fx as long as the baseline's",
+                  machine_scale)
+    else:
+        _LOG.warning("No calibration recorded; comparing absolute runtimes")
+
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            _LOG.warning("%s: no baseline recorded", name)
+            continue
+
+        base_runtime = base["runtime_sec"] * machine_scale
+        runtime_limit = max(base_runtime * (1 + runtime_tolerance),
+                            base_runtime + min_runtime_delta_sec)
+        if result["runtime_sec"] > runtime_limit:
+            regressions.append(f"{name}: runtime {result['runtime_sec']:.3f}s > "
+                               f"baseline {base_runtime:.3f}s (+{runtime_tolerance:.0%})")
+        memory_limit = base["peak_mem_bytes"] * (1 + memory_tolerance)
+        if result["peak_mem_bytes"] > memory_limit:
+            regressions.append(f"{name}: peak memory {result['peak_mem_bytes']} B > "
+                               f"baseline {base['peak_mem_bytes']} B (+{memory_tolerance:.0%})")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small",
+                        help="Size of the synthetic fixtures")
+    parser.add_argument("--benchmark", action="append", choices=sorted(BENCHMARKS),
+                        help="Run only this benchmark. May be repeated.")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Number of timed runs per benchmark; the fastest is recorded")
+    parser.add_argument("--baseline", type=pathlib.Path,
+                        help="Baseline file. Defaults to benchmarks/baseline-<scale>.json.")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="Write the results to --baseline instead of comparing against it")
+    parser.add_argument("--runtime-tolerance", type=float, default=0.25,
+                        help="Allowed fractional runtime increase over the baseline")
+    parser.add_argument("--memory-tolerance", type=float, default=0.10,
+                        help="Allowed fractional peak memory increase over the baseline")
+    parser.add_argument("--min-runtime-delta-sec", type=float, default=0.05,
+                        help="Runtime increases smaller than this are never regressions")
+    parser.add_argument("--results", type=pathlib.Path,
+                        help="If given, also write the results as JSON to this path")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level="INFO")
+    # The generators log per-script and per-node; keep benchmark output readable.
+    logging.getLogger("tvm_ci").setLevel(logging.WARNING)
+
+    baseline_path = args.baseline or (
+        utils.get_repo_root() / "benchmarks" / f"baseline-{args.scale}.json")
+    # Calibrated both before and after the benchmarks, so that a burst of load from elsewhere on
+    # the machine during one of them doesn't skew the scale.
+    calibration_sec = calibrate(args.repeat)
+    results = {}
+    for name in args.benchmark or BENCHMARKS:
+        results[name] = run_benchmark(name, SCALES[args.scale], args.repeat)
+        _LOG.info("%-45s %9.3fs %12d B peak", name, results[name]["runtime_sec"],
+                  results[name]["peak_mem_bytes"])
+    calibration_sec = min(calibration_sec, calibrate(args.repeat))
+    _LOG.info("%-45s %9.3fs", CALIBRATION, calibration_sec)
+
+    if args.results is not None:
+        with open(args.results, "w") as results_f:
+            json.dump(results, results_f, indent=2, sort_keys=True)
+
+    if args.update_baseline:
+        baseline = {}
+        if baseline_path.exists():
+            with open(baseline_path) as baseline_f:
+                baseline = json.load(baseline_f)
+        baseline.update(results)
+        baseline[CALIBRATION] = {"runtime_sec": calibration_sec}
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(baseline_path, "w") as baseline_f:
+            json.dump(baseline, baseline_f, indent=2, sort_keys=True)
+            baseline_f.write("\n")
+        _LOG.info("Wrote baseline: %s", baseline_path)
+        return
+
+    if not baseline_path.exists():
+        sys.exit(f"No baseline at {baseline_path}; run with --update-baseline to record one")
+
+    with open(baseline_path) as baseline_f:
+        baseline = json.load(baseline_f)
+
+    regressions = compare(results, baseline, args.runtime_tolerance, args.memory_tolerance,
+                          args.min_runtime_delta_sec, calibration_sec)
+    for regression in regressions:
+        _LOG.error("Regression: %s", regression)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
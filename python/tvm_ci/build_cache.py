@@ -0,0 +1,171 @@
+"""Compiler cache shared by the builds on each executor, and its hit-rate report.
+
+When cluster.build_cache is set in the CI config:
+
+    cluster:
+        build_cache:
+            max_size_gb: 50                  # per executor node
+            dir: /var/cache/tvm-ci/ccache    # optional
+
+ansible/playbook.yml creates the directory on every executor, owned by jenkins, with a ccache.conf
+which enforces the size limit. generate_casc() exposes it to jobs as the node environment
+variables CCACHE_DIR and CCACHE_MAXSIZE, so a build which mounts $CCACHE_DIR into its container and
+compiles through ccache reuses objects from every earlier build on that node, whichever executor
+ran it.
+
+Nothing here mounts the cache into a build: TVM's Jenkinsfile starts the build containers, and
+until it passes $CCACHE_DIR through to them and compiles through ccache, the cache stays empty.
+
+Report cache hit rates across the cluster with:
+
+    python -m tvm_ci.build_cache report --tvm-ci-config=config/dev.yaml
+"""
+
+import argparse
+import json
+import logging
+import pathlib
+import re
+import subprocess
+import sys
+import typing
+
+import yaml
+
+from . import utils
+
+
+_LOG = logging.getLogger(__name__)
+
+
+DEFAULT_BUILD_CACHE_DIR = "/var/cache/tvm-ci/ccache"
+
+
+def cache_settings(tvm_ci_config : dict) -> typing.Optional[dict]:
+    """Return the build cache's dir and max_size_gb, or None if the cache is disabled."""
+    build_cache = tvm_ci_config["cluster"].get("build_cache")
+    if build_cache is None:
+        return None
+
+    return {
+        "dir": build_cache.get("dir", DEFAULT_BUILD_CACHE_DIR),
+        "max_size_gb": build_cache["max_size_gb"],
+    }
+
+
+def node_env(settings : dict) -> typing.List[dict]:
+    """Return the CasC node envVars which point jobs at the cache."""
+    return [
+        {"key": "CCACHE_DIR", "value": settings["dir"]},
+        {"key": "CCACHE_MAXSIZE", "value": f"{settings['max_size_gb']}G"},
+    ]
+
+
+# Lines of `ccache -s` which are counted, mapped to report keys. ccache 3.x names them this way.
+_STATS_LINES = {
+    "cache hit (direct)": "hits_direct",
+    "cache hit (preprocessed)": "hits_preprocessed",
+    "cache miss": "misses",
+}
+
+
+_SIZE_RE = re.compile(r"^(?P<key>cache size|max cache size)\s+(?P<value>[0-9.]+) (?P<unit>[kMGT]?B)$")
+
+
+_SIZE_UNITS = {"B": 1, "kB": 1e3, "MB": 1e6, "GB": 1e9, "TB": 1e12}
+
+
+def parse_stats(stats : str) -> dict:
+    """Parse the output of `ccache -s`."""
+    parsed = {key: 0 for key in _STATS_LINES.values()}
+    for line in stats.splitlines():
+        line = line.strip()
+        m = _SIZE_RE.match(line)
+        if m:
+            parsed[m.group("key").replace(" ", "_") + "_bytes"] = int(
+                float(m.group("value")) * _SIZE_UNITS[m.group("unit")])
+            continue
+        for prefix, key in _STATS_LINES.items():
+            if line.startswith(prefix) and line[len(prefix):].strip().isdigit():
+                parsed[key] = int(line[len(prefix):].strip())
+    return parsed
+
+
+def _hit_rate(stats : dict) -> typing.Optional[float]:
+    hits = stats["hits_direct"] + stats["hits_preprocessed"]
+    total = hits + stats["misses"]
+    return hits / total if total else None
+
+
+def collect(hosts : typing.List[str], settings : dict, ssh_key : typing.Optional[pathlib.Path]) -> dict:
+    """SSH to each of `hosts` and collect its cache statistics."""
+    nodes = {}
+    for host in hosts:
+        ssh_args = ["ssh", "-o", "StrictHostKeyChecking=no", "-o", "UserKnownHostsFile=/dev/null"]
+        if ssh_key is not None:
+            ssh_args.extend(["-i", str(ssh_key)])
+        proc = subprocess.run(
+            ssh_args + [f"ubuntu@{host}", "sudo", "-u", "jenkins", "env",
+                        f"CCACHE_DIR={settings['dir']}", "ccache", "-s"],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding="utf-8")
+        if proc.returncode != 0:
+            _LOG.error("%s: could not read cache stats: %s", host, proc.stderr.strip())
+            nodes[host] = None
+            continue
+        stats = parse_stats(proc.stdout)
+        stats["hit_rate"] = _hit_rate(stats)
+        nodes[host] = stats
+
+    totals = {key: sum(n[key] for n in nodes.values() if n is not None)
+              for key in _STATS_LINES.values()}
+    totals["hit_rate"] = _hit_rate(totals)
+    return {"nodes": nodes, "total": totals}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    utils.add_tvm_ci_config_arg(parser)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser("report", help="Report per-node and total cache hit rates")
+    report_parser.add_argument("--ansible-inventory-path", type=pathlib.Path,
+                               default=utils.get_repo_root() / "build" / "ansible-inventory.yml",
+                               help="Ansible inventory written by configure_ansible")
+    report_parser.add_argument("--ssh-key", type=pathlib.Path,
+                               default=utils.get_repo_root() / "build" / "artifact" / "secret" / "provisioner-id_ed25519",
+                               help="SSH key used to reach the executors")
+    report_parser.add_argument("--report", type=pathlib.Path,
+                               help="Also write the report as JSON to this path")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level="INFO")
+
+    settings = cache_settings(utils.parse_tvm_ci_config(args))
+    if settings is None:
+        sys.exit("cluster.build_cache is not set in the CI config")
+
+    with open(args.ansible_inventory_path) as inventory_f:
+        inventory = yaml.safe_load(inventory_f)
+    hosts = sorted(inventory["all"]["children"]["executors"]["hosts"])
+
+    report = collect(hosts, settings, args.ssh_key if args.ssh_key.exists() else None)
+    for host, stats in sorted(report["nodes"].items()):
+        if stats is None:
+            print(f"{host}: unavailable")
+            continue
+        hit_rate = "-" if stats["hit_rate"] is None else f"{stats['hit_rate']:.1%}"
+        print(f"{host}: hit rate {hit_rate}, {stats.get('cache_size_bytes', 0) / 1e9:.1f} of "
+              f"{stats.get('max_cache_size_bytes', 0) / 1e9:.1f} GB")
+    total_rate = report["total"]["hit_rate"]
+    print(f"Total: hit rate {'-' if total_rate is None else f'{total_rate:.1%}'}")
+
+    if args.report is not None:
+        args.report.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.report, "w") as report_f:
+            json.dump(report, report_f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
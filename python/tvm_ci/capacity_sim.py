@@ -0,0 +1,305 @@
+"""Simulate a build history against candidate cluster shapes, to size the node types.
+
+The history is a local export with one build per record. Either JSON lines:
+
+    {"job": "tvm/PR-123", "label": "CPU", "duration_sec": 1830, "arrival_time": 1650000000}
+
+or CSV with the same column names. arrival_time is when the build entered the queue, in epoch
+seconds or ISO 8601. Builds are replayed in a discrete-event simulation of the Jenkins queue: each
+waits until an executor is free on some node type carrying its label, taking the free executor of
+the first such node type in CI config order. Items further back in the queue start as soon as an
+executor for their own label frees up, as Jenkins does.
+
+`simulate` replays the history against the shape in --tvm-ci-config (num_nodes and num_executors
+per node type) and reports, per label, queue-wait percentiles and executor utilization.
+
+`search` looks for the cheapest shape, varying num_nodes per node type, in which every label's p95
+queue wait is at most --target-p95-wait-sec. Node cost is cluster.nodes.<type>.hourly_cost in the
+CI config, or --node-cost TYPE=COST, or 1 (so the cheapest shape has the fewest nodes). The search
+is greedy: it adds a node of the cheapest type which serves the label with the worst p95 wait
+until every label meets the target, then removes nodes, most expensive first, while the target
+is still met.
+
+Everything runs offline; no cloud or Jenkins access is needed.
+"""
+
+import argparse
+import collections
+import csv
+import datetime
+import heapq
+import json
+import logging
+import math
+import pathlib
+import sys
+import typing
+
+from . import trace
+from . import utils
+
+
+_LOG = logging.getLogger(__name__)
+
+
+Build = collections.namedtuple("Build", ("job", "label", "duration_sec", "arrival_sec"))
+
+
+class HistoryError(Exception):
+    """Raised when a build history record can't be parsed or can't run on any node type."""
+
+
+def _parse_time(value) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+
+
+def load_history(path : pathlib.Path) -> typing.List[Build]:
+    """Load a build history export, in JSON lines or (for a .csv file) CSV format."""
+    with open(path, newline="") as history_f:
+        if path.suffix == ".csv":
+            records = list(csv.DictReader(history_f))
+        else:
+            records = [json.loads(line) for line in history_f if line.strip()]
+
+    builds = []
+    for i, record in enumerate(records):
+        try:
+            builds.append(Build(record["job"], record["label"], float(record["duration_sec"]),
+                                _parse_time(record["arrival_time"])))
+        except (KeyError, ValueError) as e:
+            raise HistoryError(f"{path}: record {i + 1}: {e!r}: {record}")
+    builds.sort(key=lambda b: b.arrival_sec)
+    return builds
+
+
+def shape_from_config(tvm_ci_config : dict) -> typing.Dict[str, dict]:
+    """Return the cluster shape in the CI config: labels, num_nodes, num_executors per node type."""
+    return {
+        node_type: {"labels": list(node["labels"]), "num_nodes": node["num_nodes"],
+                    "num_executors": node["num_executors"]}
+        for node_type, node in tvm_ci_config["cluster"]["nodes"].items()}
+
+
+def percentile(sorted_values : typing.List[float], p : float) -> typing.Optional[float]:
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(p / 100 * len(sorted_values)) - 1))]
+
+
+def simulate(builds : typing.List[Build], shape : typing.Dict[str, dict]) -> dict:
+    """Replay `builds` against `shape`.
+
+    Returns
+    -------
+    dict :
+        "labels" maps each label to its build count, queue-wait p50/p95/p99/max (seconds) and
+        utilization (busy executor time over available executor time during the history).
+        "node_types" maps each node type to its utilization.
+    """
+    types_by_label = collections.defaultdict(list)
+    for node_type, node in shape.items():
+        for label in node["labels"]:
+            types_by_label[label].append(node_type)
+    for build in builds:
+        if not any(shape[t]["num_nodes"] * shape[t]["num_executors"] for t in types_by_label[build.label]):
+            raise HistoryError(f"No executors carry label {build.label} (job {build.job})")
+
+    free = {t: node["num_nodes"] * node["num_executors"] for t, node in shape.items()}
+    busy_sec = collections.Counter()
+    waits = collections.defaultdict(list)
+    # Builds waiting for an executor, per label, in arrival order.
+    queued = collections.defaultdict(collections.deque)
+    # (time, kind, sequence, payload); kind 0 finishes a build before same-time arrivals.
+    events = [(b.arrival_sec, 1, i, b) for i, b in enumerate(builds)]
+    heapq.heapify(events)
+    sequence = len(builds)
+
+    def start(build, now, node_type):
+        nonlocal sequence
+        free[node_type] -= 1
+        busy_sec[node_type] += build.duration_sec
+        waits[build.label].append(now - build.arrival_sec)
+        heapq.heappush(events, (now + build.duration_sec, 0, sequence, node_type))
+        sequence += 1
+
+    def free_type(label):
+        return next((t for t in types_by_label[label] if free[t] > 0), None)
+
+    now = builds[0].arrival_sec if builds else 0
+    while events:
+        now, kind, _, payload = heapq.heappop(events)
+        if kind == 1:
+            node_type = None if queued[payload.label] else free_type(payload.label)
+            if node_type is None:
+                queued[payload.label].append(payload)
+            else:
+                start(payload, now, node_type)
+            continue
+
+        free[payload] += 1
+        # Start the longest-waiting build which can use the freed executor.
+        candidates = [queued[l][0] for l in shape[payload]["labels"] if queued[l]]
+        if candidates:
+            build = min(candidates, key=lambda b: b.arrival_sec)
+            queued[build.label].popleft()
+            start(build, now, payload)
+
+    span_sec = max(now - builds[0].arrival_sec, 1) if builds else 1
+    labels = {}
+    for label in sorted({b.label for b in builds}):
+        label_waits = sorted(waits[label])
+        capacity = sum(shape[t]["num_nodes"] * shape[t]["num_executors"] for t in types_by_label[label])
+        labels[label] = {
+            "builds": len(label_waits),
+            "queue_wait_sec": {"p50": percentile(label_waits, 50), "p95": percentile(label_waits, 95),
+                               "p99": percentile(label_waits, 99), "max": label_waits[-1]},
+            "utilization": sum(b.duration_sec for b in builds if b.label == label) / (capacity * span_sec),
+        }
+    node_types = {
+        t: {"utilization": (busy_sec[t] / (node["num_nodes"] * node["num_executors"] * span_sec)
+                            if node["num_nodes"] * node["num_executors"] else 0.0)}
+        for t, node in shape.items()}
+    return {"labels": labels, "node_types": node_types, "span_sec": span_sec}
+
+
+def shape_cost(shape : typing.Dict[str, dict], node_costs : typing.Dict[str, float]) -> float:
+    return sum(node["num_nodes"] * node_costs.get(t, 1.0) for t, node in shape.items())
+
+
+def _violations(result : dict, target_p95_wait_sec : float) -> typing.Dict[str, float]:
+    return {label: r["queue_wait_sec"]["p95"] for label, r in result["labels"].items()
+            if r["queue_wait_sec"]["p95"] > target_p95_wait_sec}
+
+
+def search(builds : typing.List[Build], shape : typing.Dict[str, dict],
+           node_costs : typing.Dict[str, float], target_p95_wait_sec : float,
+           max_nodes_per_type : int) -> typing.Tuple[typing.Dict[str, dict], dict]:
+    """Find the cheapest num_nodes per node type meeting `target_p95_wait_sec` for every label.
+
+    Returns
+    -------
+    Tuple[Dict[str, dict], dict] :
+        The shape found and its simulation result.
+
+    Raises
+    ------
+    HistoryError :
+        When the target can't be met within `max_nodes_per_type`.
+    """
+    needed_labels = {b.label for b in builds}
+    shape = {t: dict(node, num_nodes=0) for t, node in shape.items()}
+    # Start from one node of the cheapest type for each label.
+    for label in sorted(needed_labels):
+        types = [t for t, node in shape.items() if label in node["labels"]]
+        if not types:
+            raise HistoryError(f"No node type carries label {label}")
+        if not any(shape[t]["num_nodes"] for t in types):
+            shape[min(types, key=lambda t: node_costs.get(t, 1.0))]["num_nodes"] = 1
+
+    def run(candidate):
+        with trace.span("capacity_sim.simulate",
+                        shape=",".join(f"{t}={n['num_nodes']}" for t, n in sorted(candidate.items()))):
+            return simulate(builds, candidate)
+
+    result = run(shape)
+    while True:
+        violations = _violations(result, target_p95_wait_sec)
+        if not violations:
+            break
+        worst = max(violations, key=violations.get)
+        types = [t for t, node in shape.items()
+                 if worst in node["labels"] and node["num_nodes"] < max_nodes_per_type]
+        if not types:
+            raise HistoryError(f"Label {worst} needs more than {max_nodes_per_type} nodes per type "
+                               f"to reach a p95 queue wait of {target_p95_wait_sec}s")
+        shape[min(types, key=lambda t: node_costs.get(t, 1.0))]["num_nodes"] += 1
+        result = run(shape)
+
+    for node_type in sorted(shape, key=lambda t: -node_costs.get(t, 1.0)):
+        while shape[node_type]["num_nodes"] > 0:
+            candidate = {t: dict(node) for t, node in shape.items()}
+            candidate[node_type]["num_nodes"] -= 1
+            try:
+                candidate_result = run(candidate)
+            except HistoryError:
+                break
+            if _violations(candidate_result, target_p95_wait_sec):
+                break
+            shape, result = candidate, candidate_result
+
+    return shape, result
+
+
+def _node_costs(tvm_ci_config : dict, overrides : typing.List[str]) -> typing.Dict[str, float]:
+    costs = {t: float(node.get("hourly_cost", 1.0))
+             for t, node in tvm_ci_config["cluster"]["nodes"].items()}
+    for override in overrides:
+        node_type, _, cost = override.partition("=")
+        costs[node_type] = float(cost)
+    return costs
+
+
+def _log_result(shape : typing.Dict[str, dict], result : dict):
+    for node_type, node in sorted(shape.items()):
+        _LOG.info("%-8s %3d nodes x %d executors, utilization %5.1f%%", node_type, node["num_nodes"],
+                  node["num_executors"], 100 * result["node_types"][node_type]["utilization"])
+    for label, r in sorted(result["labels"].items()):
+        wait = r["queue_wait_sec"]
+        _LOG.info("%-12s %5d builds, queue wait p50 %7.0fs p95 %7.0fs p99 %7.0fs, utilization %5.1f%%",
+                  label, r["builds"], wait["p50"], wait["p95"], wait["p99"], 100 * r["utilization"])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    utils.add_tvm_ci_config_arg(parser)
+    parser.add_argument("--history", type=pathlib.Path, required=True,
+                        help="Build history export (.jsonl, or .csv)")
+    parser.add_argument("--report", type=pathlib.Path, help="Also write the result as JSON here")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("simulate", help="Replay the history against the shape in the CI config")
+    search_parser = subparsers.add_parser(
+        "search", help="Find the cheapest shape meeting --target-p95-wait-sec")
+    search_parser.add_argument("--target-p95-wait-sec", type=float, required=True,
+                               help="Maximum p95 queue wait for every label")
+    search_parser.add_argument("--node-cost", action="append", default=[],
+                               help="TYPE=COST, overriding cluster.nodes.<type>.hourly_cost. May be repeated.")
+    search_parser.add_argument("--max-nodes-per-type", type=int, default=64,
+                               help="Give up rather than use more nodes of one type than this")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level="INFO")
+    tvm_ci_config = utils.parse_tvm_ci_config(args)
+
+    try:
+        builds = load_history(args.history)
+        shape = shape_from_config(tvm_ci_config)
+        if args.command == "simulate":
+            result = simulate(builds, shape)
+            report = {"shape": shape, "result": result}
+        else:
+            node_costs = _node_costs(tvm_ci_config, args.node_cost)
+            shape, result = search(builds, shape, node_costs, args.target_p95_wait_sec,
+                                   args.max_nodes_per_type)
+            report = {"shape": shape, "result": result, "cost": shape_cost(shape, node_costs)}
+    except HistoryError as e:
+        sys.exit(str(e))
+
+    _LOG.info("Replayed %d builds over %.1f hours", len(builds), result["span_sec"] / 3600)
+    _log_result(shape, result)
+    if "cost" in report:
+        _LOG.info("Cost: %.2f/hour", report["cost"])
+
+    if args.report is not None:
+        args.report.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.report, "w") as report_f:
+            json.dump(report, report_f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
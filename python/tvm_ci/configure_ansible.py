@@ -1,23 +1,271 @@
 import argparse
 import logging
 import json
+import os
 import pathlib
 import subprocess
+import typing
 
 import yaml
 
+from . import build_cache
+from . import controllers
+from . import git_mirror
+from . import homedir_snapshot
+from . import outputs
+from . import trace
+from . import utils
+
 
 _LOG = logging.getLogger()
 
 
-def write_ansible_inventory(terraform_output, args):
+DEFAULT_REGISTRY_MIRROR_PORT = 5000
+
+
+# Size of the registry mirror's storage beyond which it is emptied, hourly.
+DEFAULT_REGISTRY_MIRROR_MAX_SIZE_GIB = 100
+
+
+# Disk usage of an executor's Docker root at which the image cache agent starts, and stops,
+# evicting images. Match tvm_ci.image_cache, which executors run as a standalone file.
+DEFAULT_IMAGE_CACHE_HIGH_WATERMARK_PCT = 85
+
+
+DEFAULT_IMAGE_CACHE_LOW_WATERMARK_PCT = 70
+
+
+class MissingTerraformOutputError(Exception):
+    """Raised when the Terraform output predates an option enabled in the CI config."""
+
+
+def registry_mirror_vars(terraform_output : dict, registry_mirror : typing.Optional[dict]) -> dict:
+    """Return the inventory vars which deploy the Docker Hub pull-through cache, if enabled.
+
+    Parameters
+    ----------
+    terraform_output : dict
+        Terraform output, formatted as JSON.
+    registry_mirror : Optional[dict]
+        The cluster.registry_mirror section of the CI config. None disables the mirror.
+
+    Returns
+    -------
+    dict :
+        registry_mirror_port, registry_mirror_url (reached over the head node's private IP) and
+        registry_mirror_max_size_gib, or an empty dict.
+    """
+    if registry_mirror is None:
+        return {}
+
+    if "jenkins_head_node_private_ip" not in terraform_output:
+        raise MissingTerraformOutputError(
+            "cluster.registry_mirror is set, but the Terraform output has no "
+            "jenkins_head_node_private_ip; re-run stage-scripts/2-apply-plan.sh")
+
+    port = registry_mirror.get("port", DEFAULT_REGISTRY_MIRROR_PORT)
+    private_ip = terraform_output["jenkins_head_node_private_ip"]["value"]
+    return {
+        "registry_mirror_port": port,
+        "registry_mirror_url": f"http://{private_ip}:{port}",
+        "registry_mirror_max_size_gib": registry_mirror.get(
+            "max_size_gib", DEFAULT_REGISTRY_MIRROR_MAX_SIZE_GIB),
+    }
+
+
+def image_cache_vars(image_cache : typing.Optional[dict]) -> dict:
+    """Return the inventory vars which configure the executor image cache agent.
+
+    Parameters
+    ----------
+    image_cache : Optional[dict]
+        The cluster.image_cache section of the CI config, or None to use the defaults.
+    """
+    image_cache = image_cache or {}
+    return {
+        "image_cache_high_watermark_pct": image_cache.get(
+            "high_watermark_pct", DEFAULT_IMAGE_CACHE_HIGH_WATERMARK_PCT),
+        "image_cache_low_watermark_pct": image_cache.get(
+            "low_watermark_pct", DEFAULT_IMAGE_CACHE_LOW_WATERMARK_PCT),
+    }
+
+
+def image_cache_prefetch(image_cache : typing.Optional[dict], labels : typing.List[str]) -> typing.List[str]:
+    """Return the images to prefetch on an executor with `labels`: those listed for any of them."""
+    prefetch = (image_cache or {}).get("prefetch", {})
+    images = []
+    for label in labels:
+        images.extend(i for i in prefetch.get(label, []) if i not in images)
+    return images
+
+
+def build_cache_vars(tvm_ci_config : typing.Optional[dict]) -> dict:
+    """Return the inventory vars which provision the executor build cache, if enabled."""
+    settings = build_cache.cache_settings(tvm_ci_config) if tvm_ci_config is not None else None
+    if settings is None:
+        return {}
+
+    return {
+        "build_cache_dir": settings["dir"],
+        "build_cache_max_size_gb": settings["max_size_gb"],
+    }
+
+
+def git_mirror_vars(terraform_output : dict, tvm_ci_config : typing.Optional[dict]) -> dict:
+    """Return the inventory vars which deploy the git mirror, if enabled.
+
+    The head node mirrors the upstream repos and serves the mirror with git-daemon; executors
+    replicate it over the head node's private IP.
+    """
+    settings = git_mirror.mirror_settings(tvm_ci_config) if tvm_ci_config is not None else None
+    if settings is None:
+        return {}
+
+    if "jenkins_head_node_private_ip" not in terraform_output:
+        raise MissingTerraformOutputError(
+            "cluster.git_mirror is set, but the Terraform output has no "
+            "jenkins_head_node_private_ip; re-run stage-scripts/2-apply-plan.sh")
+
+    private_ip = terraform_output["jenkins_head_node_private_ip"]["value"]
+    return {
+        "git_mirror_dir": settings["dir"],
+        "git_mirror_upstreams": [f"{name}={url}" for name, url in sorted(settings["repos"].items())],
+        "git_mirror_refresh_interval_sec": settings["refresh_interval_min"] * 60,
+        "git_mirror_replica_url": f"git://{private_ip}/{os.path.basename(settings['dir'])}",
+    }
+
+
+def homedir_snapshot_vars(tvm_ci_config : typing.Optional[dict]) -> dict:
+    """Return the inventory vars which snapshot and restore the head node's homedir, if enabled.
+
+    The playbook writes the keys of aws_profile_name, read from config/secrets/aws-credentials on
+    the machine running Ansible, to the head node.
+    """
+    settings = homedir_snapshot.snapshot_settings(tvm_ci_config) if tvm_ci_config is not None else None
+    if settings is None:
+        return {}
+
+    snapshot_vars = {
+        "homedir_snapshot_store": settings["store"],
+        "homedir_snapshot_aws_credentials_file": str(utils.get_aws_credentials_path()),
+        "homedir_snapshot_aws_profile": settings["aws_profile_name"],
+        "homedir_snapshot_region": settings["region"],
+        "homedir_snapshot_interval_sec": int(settings["interval_hours"] * 60 * 60),
+        "homedir_snapshot_keep": settings["keep"],
+        "homedir_snapshot_restore": settings["restore_on_provision"],
+    }
+    if settings["endpoint"] is not None:
+        snapshot_vars["homedir_snapshot_endpoint_url"] = settings["endpoint"]
+    if settings["kms_key_id"] is not None:
+        snapshot_vars["homedir_snapshot_kms_key_id"] = settings["kms_key_id"]
+    return snapshot_vars
+
+
+def controller_hosts(terraform_output : dict, args : argparse.Namespace,
+                     tvm_ci_config : typing.Optional[dict]) -> typing.Dict[str, dict]:
+    """Return the host vars of each controller besides the head node, keyed by FQDN.
+
+    Each controller is deployed from its own homedir archive (see
+    tvm_ci.jenkins_builder.configure_jenkins) and snapshots its homedir under its own prefix.
+    """
+    settings = controllers.controller_settings(tvm_ci_config) if tvm_ci_config is not None else None
+    names = controllers.extra_controllers(settings)
+    if not names:
+        return {}
+
+    fqdns = terraform_output.get("jenkins_controller_fqdn", {}).get("value", {})
+    missing = [name for name in names if name not in fqdns]
+    if missing:
+        raise MissingTerraformOutputError(
+            f"jenkins.controllers has {', '.join(missing)}, but the Terraform output has no "
+            "jenkins_controller_fqdn for them; re-run stage-scripts/2-apply-plan.sh")
+
+    addresses = node_addresses(terraform_output)
+    snapshot_settings = homedir_snapshot.snapshot_settings(tvm_ci_config)
+    hosts = {}
+    for name in names:
+        host_vars = _host_vars(addresses.get(fqdns[name]), args.connect_by)
+        host_vars["jenkins_controller"] = name
+        host_vars["jenkins_homedir_tar_gz"] = str(
+            controllers.controller_path(args.jenkins_homedir_tar_gz, settings, name).resolve())
+        if snapshot_settings is not None:
+            host_vars["homedir_snapshot_store"] = (
+                f'{snapshot_settings["store"].rstrip("/")}/controllers/{name}')
+        hosts[fqdns[name]] = host_vars
+    return hosts
+
+
+def node_addresses(terraform_output : dict) -> typing.Dict[str, dict]:
+    """Return the public_ip and private_ip of each node, keyed by FQDN.
+
+    Nodes are omitted when the Terraform output predates the IP outputs.
+    """
+    addresses = {}
+    head_node_fqdn = terraform_output["jenkins_head_node_fqdn"]["value"]
+    if "jenkins_head_node_public_ip" in terraform_output:
+        addresses[head_node_fqdn] = {
+            "public_ip": terraform_output["jenkins_head_node_public_ip"]["value"],
+            "private_ip": terraform_output.get("jenkins_head_node_private_ip", {}).get("value"),
+        }
+
+    controller_public_ips = terraform_output.get("jenkins_controller_public_ip", {}).get("value", {})
+    controller_private_ips = terraform_output.get("jenkins_controller_private_ip", {}).get("value", {})
+    for name, fqdn in terraform_output.get("jenkins_controller_fqdn", {}).get("value", {}).items():
+        if name in controller_public_ips:
+            addresses[fqdn] = {
+                "public_ip": controller_public_ips[name],
+                "private_ip": controller_private_ips.get(name),
+            }
+
+    for key, value in terraform_output.items():
+        if not key.endswith("_executor_fqdn"):
+            continue
+        node_type = key[:-len("_executor_fqdn")]
+        if f"{node_type}_executor_public_ip" not in terraform_output:
+            continue
+        public_ips = terraform_output[f"{node_type}_executor_public_ip"]["value"]
+        private_ips = terraform_output.get(f"{node_type}_executor_private_ip", {}).get("value", [])
+        for i, fqdn in enumerate(value["value"]):
+            addresses[fqdn] = {
+                "public_ip": public_ips[i],
+                "private_ip": private_ips[i] if i < len(private_ips) else None,
+            }
+    return addresses
+
+
+def _host_vars(addresses : typing.Optional[dict], connect_by : str) -> dict:
+    if addresses is None:
+        return {}
+
+    host_vars = {k: v for k, v in addresses.items() if v is not None}
+    if connect_by == "ip":
+        host_vars["ansible_host"] = addresses["public_ip"]
+    return host_vars
+
+
+def jenkins_extra_hosts(terraform_output : dict) -> typing.List[str]:
+    """Return "<fqdn>:<ip>" for each node, to resolve node names inside the Jenkins container.
+
+    For clusters without DNS records, such as tvm_ci.local_cluster's.
+    """
+    return [f"{fqdn}:{addresses['private_ip'] or addresses['public_ip']}"
+            for fqdn, addresses in sorted(node_addresses(terraform_output).items())]
+
+
+def write_ansible_inventory(terraform_output, args, tvm_ci_config=None):
     jenkins_head_node_fqdn = terraform_output["jenkins_head_node_fqdn"]["value"]
+    cluster = tvm_ci_config["cluster"] if tvm_ci_config is not None else {}
+    addresses = node_addresses(terraform_output)
 
     executors = {}
     for key, value in terraform_output.items():
       if key.endswith("_executor_fqdn"):
+        node_type = key[:-len("_executor_fqdn")]
+        labels = cluster.get("nodes", {}).get(node_type, {}).get("labels", [])
+        prefetch = image_cache_prefetch(cluster.get("image_cache"), labels)
         for v in value["value"]:
-          executors[v] = {}
+          executors[v] = _host_vars(addresses.get(v), args.connect_by)
+          executors[v]["image_cache_prefetch"] = list(prefetch)
 
     inventory = {
       "all": {
@@ -30,22 +278,34 @@ def write_ansible_inventory(terraform_output, args):
           "executor_ssh_public_key": str(args.executor_ssh_public_key.resolve()),
           "jenkins_master_container_tag": args.jenkins_master_container_tag,
           "jenkins_homedir_tar_gz": str(args.jenkins_homedir_tar_gz.resolve()),
+          **registry_mirror_vars(terraform_output, cluster.get("registry_mirror")),
+          **image_cache_vars(cluster.get("image_cache")),
+          **build_cache_vars(tvm_ci_config),
+          **git_mirror_vars(terraform_output, tvm_ci_config),
+          **homedir_snapshot_vars(tvm_ci_config),
         },
         "children": {
           "jenkins-head-node": {
-            "hosts": {jenkins_head_node_fqdn: {}},
+            "hosts": {
+              jenkins_head_node_fqdn: _host_vars(addresses.get(jenkins_head_node_fqdn), args.connect_by),
+            },
           },
           "executors": {"hosts": executors},
         },
       },
     }
-    with open(args.ansible_inventory_path, "w") as inventory_f:
-      inventory_f.write(yaml.dump(inventory))
+    if args.add_jenkins_hosts:
+        inventory["all"]["vars"]["jenkins_extra_hosts"] = jenkins_extra_hosts(terraform_output)
+    extra_controllers = controller_hosts(terraform_output, args, tvm_ci_config)
+    if extra_controllers:
+        inventory["all"]["children"]["jenkins-controllers"] = {"hosts": extra_controllers}
+    outputs.write_if_changed(args.ansible_inventory_path, yaml.dump(inventory))
 
 
 
 def parse_args():
     parser = argparse.ArgumentParser()
+    utils.add_tvm_ci_config_arg(parser)
     parser.add_argument("--executor-ssh-public-key", required=True, type=pathlib.Path,
                         help="Public key to use when connecting to executors")
     parser.add_argument("--jenkins-master-container-tag", required=True,
@@ -56,6 +316,13 @@ def parse_args():
                         help="Path to the Terraform output, formatted as JSON.")
     parser.add_argument("--ansible-inventory-path", required=True, type=pathlib.Path,
                         help="Path to the Ansible inventory file to write.")
+    parser.add_argument("--connect-by", choices=("ip", "fqdn"), default="ip",
+                        help=("Address Ansible uses to reach each node. Connecting by IP doesn't "
+                              "wait for new DNS records to propagate after terraform apply; see "
+                              "tvm_ci.dns_check."))
+    parser.add_argument("--add-jenkins-hosts", action="store_true",
+                        help=("Resolve node FQDNs to their IPs inside the Jenkins container, for "
+                              "clusters without DNS records (see tvm_ci.local_cluster)."))
 
     return parser.parse_args()
 
@@ -67,7 +334,15 @@ def main():
     with open(args.terraform_output_json) as json_f:
         terraform_output = json.load(json_f)
 
-    write_ansible_inventory(terraform_output, args)
+    tvm_ci_config = utils.parse_tvm_ci_config(args)
+    with trace.span("configure_ansible.write_ansible_inventory"):
+        write_ansible_inventory(terraform_output, args, tvm_ci_config)
+    addresses = node_addresses(terraform_output)
+    if args.connect_by == "ip" and any(fqdn not in addresses
+                                       for key, value in terraform_output.items()
+                                       if key.endswith("_executor_fqdn") for fqdn in value["value"]):
+        _LOG.warning("Terraform output has no executor IPs; connecting to executors by FQDN. "
+                     "Re-run stage-scripts/2-apply-plan.sh to add them.")
 
     _LOG.info("Jenkins Head Node FQDN: %s", terraform_output["jenkins_head_node_fqdn"])
 
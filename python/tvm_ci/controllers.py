@@ -0,0 +1,163 @@
+"""Split the cluster's jobs and executors between several Jenkins controllers.
+
+When jenkins.controllers is set in the CI config:
+
+    jenkins:
+        controllers:
+            main:                        # the first controller runs on the existing head node
+                job_files: [tvm.yaml]    # names of files in config/jenkins-jobs
+                labels: [CPU, GPU, GPUBUILD, TensorCore, ARM]
+            docs:
+                job_files: [docs.yaml]
+                labels: [doc]
+                url: https://docs-ci.tlcpack.ai/   # optional; Jenkins location and webhook URL
+
+each controller owns a disjoint set of job files and executor labels. A node type belongs to the
+controller owning its labels, and is an agent of that controller only. configure_jenkins builds
+one homedir and CasC config per controller, and configure_ansible puts each controller in the
+inventory, so controller load (branch indexing, pipeline execution, UI traffic) is spread across
+instances rather than needing an ever larger head node.
+
+The first controller keeps the unsuffixed build paths and the jenkins_head_node_* Terraform
+outputs; the others each get an instance created from infra/controllers.tf and their build
+outputs under a controllers/<name> directory (see controller_path).
+"""
+
+import pathlib
+import re
+import typing
+
+
+CONTROLLER_NAME_RE = re.compile(r"^[a-z0-9]([a-z0-9-]*[a-z0-9])?$")
+
+
+class ControllerConfigError(Exception):
+    """Raised when jenkins.controllers doesn't divide the jobs and executors between controllers."""
+
+
+def controller_settings(tvm_ci_config : dict) -> typing.Optional[typing.Dict[str, dict]]:
+    """Return the job_files, labels, node_types and url of each controller, or None if disabled.
+
+    Controllers are returned in the order they are configured; the first is the primary.
+    """
+    controllers = tvm_ci_config["jenkins"].get("controllers")
+    if controllers is None:
+        return None
+
+    if not controllers:
+        raise ControllerConfigError("jenkins.controllers: no controllers configured")
+
+    label_owners = {}
+    job_file_owners = {}
+    settings = {}
+    for name, controller in controllers.items():
+        if not CONTROLLER_NAME_RE.match(name):
+            raise ControllerConfigError(
+                f"jenkins.controllers.{name}: names may only contain a-z, 0-9 and -")
+        for label in controller["labels"]:
+            if label in label_owners:
+                raise ControllerConfigError(
+                    f"jenkins.controllers: label {label} is owned by both {label_owners[label]} "
+                    f"and {name}")
+            label_owners[label] = name
+        for job_file in controller["job_files"]:
+            if job_file in job_file_owners:
+                raise ControllerConfigError(
+                    f"jenkins.controllers: job file {job_file} is owned by both "
+                    f"{job_file_owners[job_file]} and {name}")
+            job_file_owners[job_file] = name
+        settings[name] = {
+            "job_files": list(controller["job_files"]),
+            "labels": list(controller["labels"]),
+            "node_types": [],
+            "url": controller.get("url"),
+        }
+
+    for node_type, node_config in tvm_ci_config["cluster"]["nodes"].items():
+        owners = sorted({label_owners[l] for l in node_config["labels"] if l in label_owners})
+        if len(owners) != 1:
+            raise ControllerConfigError(
+                f"cluster.nodes.{node_type}: labels {node_config['labels']} must be owned by "
+                f"exactly one controller, not {owners or 'none'}")
+        settings[owners[0]]["node_types"].append(node_type)
+
+    return settings
+
+
+def primary_controller(settings : typing.Dict[str, dict]) -> str:
+    """Name of the controller which runs on the head node."""
+    return next(iter(settings))
+
+
+def extra_controllers(settings : typing.Optional[typing.Dict[str, dict]]) -> typing.List[str]:
+    """Names of the controllers which need their own instances: all but the primary."""
+    if settings is None:
+        return []
+
+    return list(settings)[1:]
+
+
+def controller_node_types(tvm_ci_config : dict,
+                          controller : typing.Optional[str] = None) -> typing.List[str]:
+    """Return the node types whose executors are agents of `controller`.
+
+    Without jenkins.controllers, every node type belongs to the single controller. Otherwise,
+    `controller` defaults to the primary.
+    """
+    settings = controller_settings(tvm_ci_config)
+    if settings is None:
+        return list(tvm_ci_config["cluster"]["nodes"])
+
+    return settings[controller or primary_controller(settings)]["node_types"]
+
+
+def controller_path(path : pathlib.Path, settings : typing.Optional[typing.Dict[str, dict]],
+                    controller : str) -> pathlib.Path:
+    """Return where `controller`'s copy of the build output `path` goes.
+
+    The primary controller uses `path` itself, so a single-controller cluster's paths don't change;
+    the others use <path's dir>/controllers/<controller>/<path's name>.
+    """
+    if settings is None or controller == primary_controller(settings):
+        return path
+
+    return path.parent / "controllers" / controller / path.name
+
+
+def select_job_files(jenkins_jobs_files : typing.List[str],
+                     job_files : typing.List[str]) -> typing.List[str]:
+    """Return the entries of `jenkins_jobs_files` which hold the controller's `job_files`.
+
+    Directories given in `jenkins_jobs_files` are searched for the named files; files given
+    directly are kept when their name is listed.
+
+    Raises
+    ------
+    ControllerConfigError :
+        When one of `job_files` is not found.
+    """
+    selected = []
+    for name in job_files:
+        found = []
+        for entry in (pathlib.Path(p) for p in jenkins_jobs_files):
+            if entry.is_dir() and (entry / name).is_file():
+                found.append(str(entry / name))
+            elif entry.is_file() and entry.name == name:
+                found.append(str(entry))
+        if not found:
+            raise ControllerConfigError(
+                f"job file {name} is not in --jenkins-jobs-files {jenkins_jobs_files}")
+        selected.extend(found)
+    return selected
+
+
+def unowned_job_files(jenkins_jobs_files : typing.List[str],
+                      settings : typing.Dict[str, dict]) -> typing.List[str]:
+    """Return the job files in `jenkins_jobs_files` which no controller owns."""
+    owned = {name for controller in settings.values() for name in controller["job_files"]}
+    unowned = []
+    for entry in (pathlib.Path(p) for p in jenkins_jobs_files):
+        sources = (sorted(p for p in entry.iterdir() if p.suffix in (".yaml", ".yml"))
+                   if entry.is_dir() else [entry])
+        unowned.extend(str(p) for p in sources if p.name not in owned)
+    return unowned
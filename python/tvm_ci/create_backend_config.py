@@ -1,11 +1,20 @@
 import argparse
+import hashlib
+import json
 import logging
 import pathlib
 import sys
+import typing
 
 import boto3
 import yaml
 
+from . import configure_ansible
+from . import controllers
+from . import git_mirror
+from . import outputs
+from . import ssh_keys
+from . import trace
 from . import utils
 
 
@@ -47,36 +56,191 @@ def verify_bucket_exists(tvm_ci_config):
     sys.exit(2)
 
 
-def write_terraform_config(tvm_ci_config_path, tvm_ci_config : dict, provisioner_id_rsa : str, args : argparse.Namespace):
-    with open(args.backend_config, "w") as config_f:
-        config_f.write(
-            ('bucket="{terraform_s3_state_bucket_name}"\n'
-             'shared_credentials_file="{aws_credentials_file}"\n'
-             'region="{aws_region}"\n'
-             'profile="{aws_profile_name}"\n').format(
-                aws_credentials_file=utils.get_aws_credentials_path(),
-                **tvm_ci_config["cluster"])
-        )
-
-    with open(args.provider_config, "w") as config_f:
-        config_f.write(
-            ('aws_credentials_file="{aws_credentials_file}"\n'
-             'aws_region="{aws_region}"\n'
-             'aws_credentials_profile="{aws_profile_name}"\n').format(
-                aws_credentials_file=utils.get_aws_credentials_path(),
+# Clusters which share a state bucket must each set cluster.terraform_state_key.
+DEFAULT_TERRAFORM_STATE_KEY = "state/terraform.tfstate"
+
+
+# Instances of each node type unless cluster.nodes.<type> overrides them. Match
+# infra/extra-instances.tf, which creates these types when the state isn't sharded.
+EXECUTOR_POOL_DEFAULTS = {
+    "arm": {"ami_id": "ami-044db9359bb5a43b6", "instance_type": "m6g.xlarge",
+            "root_block_device_size_gib": 400},
+    "cpu": {"ami_id": "ami-0db9c72b57c9c81e4", "instance_type": "g4dn.xlarge",
+            "root_block_device_size_gib": 400},
+    "gpu": {"ami_id": "ami-0db9c72b57c9c81e4", "instance_type": "g4dn.xlarge",
+            "root_block_device_size_gib": 400},
+}
+
+
+def sharding_enabled(tvm_ci_config : dict) -> bool:
+    """True when each node type's executors have a Terraform state of their own."""
+    return bool(tvm_ci_config["cluster"].get("terraform_state_sharding", False))
+
+
+def terraform_state_key(tvm_ci_config : dict) -> str:
+    """Return the state key of the shared shard (the whole cluster, if not sharded)."""
+    return tvm_ci_config["cluster"].get("terraform_state_key", DEFAULT_TERRAFORM_STATE_KEY)
+
+
+def executor_pool_state_key(state_key : str, node_type : str) -> str:
+    """Return the state key of `node_type`'s executor pool, beside the shared shard's key."""
+    if state_key.endswith(".tfstate"):
+        state_key = state_key[:-len(".tfstate")]
+    return f"{state_key}-executor-{node_type}.tfstate"
+
+
+def executor_pool_dir(artifact_dir : pathlib.Path, node_type : str) -> pathlib.Path:
+    """Directory holding the backend config, var-file and plan of `node_type`'s executor pool."""
+    return pathlib.Path(artifact_dir) / "terraform-shards" / f"executor-{node_type}"
+
+
+class MissingExecutorPoolSettingError(Exception):
+    """Raised when a node type without defaults doesn't set its AMI or instance type."""
+
+
+def _backend_config(tvm_ci_config : dict, state_key : str) -> str:
+    return ('bucket="{terraform_s3_state_bucket_name}"\n'
+            'key="{key}"\n'
+            'shared_credentials_file="{aws_credentials_file}"\n'
+            'region="{aws_region}"\n'
+            'profile="{aws_profile_name}"\n').format(
+                aws_credentials_file=utils.get_aws_credentials_path(), key=state_key,
                 **tvm_ci_config["cluster"])
-        )
 
-    with open(args.tf_var_file, "w") as config_f:
-        config_f.write(
-            (f'name_prefix = "{tvm_ci_config["cluster"]["name_prefix"]}"\n'
-             f'arm_instances_count = {tvm_ci_config["cluster"]["nodes"]["arm"]["num_nodes"]}\n'
-             f'cpu_instances_count = {tvm_ci_config["cluster"]["nodes"]["cpu"]["num_nodes"]}\n'
-             f'gpu_instances_count = {tvm_ci_config["cluster"]["nodes"]["gpu"]["num_nodes"]}\n'
-             f'provisioner_ssh_pubkey_file = "{provisioner_id_rsa}.pub"\n'
-             f'provisioner_ssh_private_key_file = "{provisioner_id_rsa}"\n'
-             f'tvm_ci_config_path = "{tvm_ci_config_path.resolve()}"\n'
-            ))
+
+def write_executor_pool_config(tvm_ci_config_path, tvm_ci_config : dict, node_type : str,
+                               artifact_dir : pathlib.Path):
+    """Write the backend config and var-file of `node_type`'s executor pool (infra/executor-pool)."""
+    node = tvm_ci_config["cluster"]["nodes"][node_type]
+    settings = {**EXECUTOR_POOL_DEFAULTS.get(node_type, {}),
+                **{k: node[k] for k in ("ami_id", "instance_type", "root_block_device_size_gib")
+                   if k in node}}
+    for required in ("ami_id", "instance_type", "root_block_device_size_gib"):
+        if required not in settings:
+            raise MissingExecutorPoolSettingError(
+                f"cluster.nodes.{node_type}.{required} must be set to shard its Terraform state")
+
+    pool_dir = executor_pool_dir(artifact_dir, node_type)
+    state_key = terraform_state_key(tvm_ci_config)
+    outputs.write_if_changed(pool_dir / "backend-config.txt",
+                             _backend_config(tvm_ci_config, executor_pool_state_key(state_key, node_type)))
+    outputs.write_if_changed(
+        pool_dir / "vars.txt",
+        (f'name_prefix = "{tvm_ci_config["cluster"]["name_prefix"]}"\n'
+         f'label = "{node_type}"\n'
+         f'ami_id = "{settings["ami_id"]}"\n'
+         f'instance_type = "{settings["instance_type"]}"\n'
+         f'instance_count = {node["num_nodes"]}\n'
+         f'root_block_device_size_gib = {settings["root_block_device_size_gib"]}\n'
+         f'tvm_ci_config_path = "{tvm_ci_config_path.resolve()}"\n'
+         f'shared_state_bucket = "{tvm_ci_config["cluster"]["terraform_s3_state_bucket_name"]}"\n'
+         f'shared_state_key = "{state_key}"\n'))
+
+
+def write_terraform_config(tvm_ci_config_path, tvm_ci_config : dict, provisioner_ssh_key : str, args : argparse.Namespace):
+    registry_mirror = tvm_ci_config["cluster"].get("registry_mirror")
+    sharded = sharding_enabled(tvm_ci_config)
+    controller_settings = controllers.controller_settings(tvm_ci_config)
+    outputs.write_if_changed(args.backend_config,
+                             _backend_config(tvm_ci_config, terraform_state_key(tvm_ci_config)))
+
+    outputs.write_if_changed(
+        args.provider_config,
+        ('aws_credentials_file="{aws_credentials_file}"\n'
+         'aws_region="{aws_region}"\n'
+         'aws_credentials_profile="{aws_profile_name}"\n').format(
+            aws_credentials_file=utils.get_aws_credentials_path(),
+            **tvm_ci_config["cluster"]))
+
+    outputs.write_if_changed(
+        args.tf_var_file,
+        (f'name_prefix = "{tvm_ci_config["cluster"]["name_prefix"]}"\n'
+         # When sharded, the executor pools create every node type's instances instead.
+         f'arm_instances_count = {0 if sharded else tvm_ci_config["cluster"]["nodes"]["arm"]["num_nodes"]}\n'
+         f'cpu_instances_count = {0 if sharded else tvm_ci_config["cluster"]["nodes"]["cpu"]["num_nodes"]}\n'
+         f'gpu_instances_count = {0 if sharded else tvm_ci_config["cluster"]["nodes"]["gpu"]["num_nodes"]}\n'
+         f'provisioner_ssh_pubkey_file = "{provisioner_ssh_key}.pub"\n'
+         f'provisioner_ssh_private_key_file = "{provisioner_ssh_key}"\n'
+         f'tvm_ci_config_path = "{tvm_ci_config_path.resolve()}"\n' +
+         (f'jenkins_controllers = {json.dumps(controllers.extra_controllers(controller_settings))}\n'
+          if controller_settings is not None else "") +
+         (f'registry_mirror_port = {registry_mirror.get("port", configure_ansible.DEFAULT_REGISTRY_MIRROR_PORT)}\n'
+          if registry_mirror is not None else "") +
+         (f'git_mirror_port = {git_mirror.GIT_DAEMON_PORT}\n'
+          if git_mirror.mirror_settings(tvm_ci_config) is not None else "")))
+
+    if sharded:
+        for node_type in sorted(tvm_ci_config["cluster"]["nodes"]):
+            write_executor_pool_config(tvm_ci_config_path, tvm_ci_config, node_type,
+                                       pathlib.Path(args.tf_var_file).parent)
+
+
+# Files under infra/ which are inputs to terraform plan.
+TERRAFORM_SOURCE_SUFFIXES = (".tf", ".tfvars")
+
+
+def _infra_sources(include : typing.Optional[typing.Tuple[str, ...]] = None,
+                   exclude : typing.Tuple[str, ...] = ()) -> typing.List[pathlib.Path]:
+    """Return the Terraform sources under infra/, optionally only in the top-level entries `include`.
+
+    Only configuration and variable files count: .terraform.lock.hcl, tfstate backups, editor
+    files and the like don't change the plan.
+    """
+    infra_dir = utils.get_repo_root() / "infra"
+    sources = []
+    for suffix in TERRAFORM_SOURCE_SUFFIXES:
+        for p in infra_dir.rglob(f"*{suffix}"):
+            parts = p.relative_to(infra_dir).parts
+            # .terraform/ holds provider binaries and cached module copies, not inputs.
+            if (p.is_file() and ".terraform" not in parts and parts[0] not in exclude and
+                    (include is None or parts[0] in include)):
+                sources.append(p)
+    return sorted(sources)
+
+
+def fingerprint_inputs(tvm_ci_config_path : pathlib.Path, provisioner_ssh_key : pathlib.Path,
+                       args : argparse.Namespace) -> typing.List[pathlib.Path]:
+    """Return the inputs to the plan of infra/ (the shared shard, when sharded).
+
+    The CI config is an input even when sharded: the executor module's external data source
+    reads it.
+    """
+    return _infra_sources(exclude=("executor-pool",)) + [
+        # Invoked by the executor module's external data source.
+        utils.get_repo_root() / "python" / "tvm_ci" / "lookup_availability_zones.py",
+        tvm_ci_config_path,
+        pathlib.Path(args.backend_config),
+        pathlib.Path(args.provider_config),
+        pathlib.Path(args.tf_var_file),
+        pathlib.Path(f"{provisioner_ssh_key}.pub"),
+    ]
+
+
+def executor_pool_fingerprint_inputs(pool_dir : pathlib.Path, provider_config : pathlib.Path,
+                                     shared_output_json : pathlib.Path) -> typing.List[pathlib.Path]:
+    """Return the inputs to the plan of one executor pool.
+
+    The pool reads the shared shard's outputs from its state, so they are an input too, as
+    written to `shared_output_json` after the shared shard was last applied.
+    """
+    return _infra_sources(include=("executor-pool", "modules")) + [
+        utils.get_repo_root() / "python" / "tvm_ci" / "lookup_availability_zones.py",
+        pool_dir / "backend-config.txt",
+        pool_dir / "vars.txt",
+        pathlib.Path(provider_config),
+        pathlib.Path(shared_output_json),
+    ]
+
+
+def compute_plan_fingerprint(input_paths : typing.List[pathlib.Path]) -> str:
+    """Return a digest over the names and contents of all inputs to terraform plan."""
+    digest = hashlib.sha256()
+    for path in input_paths:
+        digest.update(bytes(str(path), "utf-8"))
+        digest.update(b"\0")
+        with open(path, "rb") as input_f:
+            digest.update(hashlib.sha256(input_f.read()).digest())
+    return digest.hexdigest()
 
 
 def main():
@@ -86,10 +250,12 @@ def main():
 
     tvm_ci_config = utils.parse_tvm_ci_config(args)
 
-    verify_bucket_exists(tvm_ci_config)
-    provisioner_id_rsa = utils.get_repo_root() / "build" / "artifact" / "secret" / "provisioner-id_rsa"
-    utils.generate_ssh_key(provisioner_id_rsa)
-    write_terraform_config(args.tvm_ci_config, tvm_ci_config, provisioner_id_rsa, args)
+    with trace.span("create_backend_config.verify_bucket_exists"):
+        verify_bucket_exists(tvm_ci_config)
+    provisioner_ssh_key = utils.get_repo_root() / "build" / "artifact" / "secret" / "provisioner-id_ed25519"
+    with trace.span("create_backend_config.ensure_ssh_key"):
+        ssh_keys.ensure_key(provisioner_ssh_key)
+    write_terraform_config(args.tvm_ci_config, tvm_ci_config, provisioner_ssh_key, args)
 
 
 if __name__ == "__main__":
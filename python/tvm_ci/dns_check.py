@@ -0,0 +1,108 @@
+"""Wait until the DNS records of every node in the cluster resolve to the node's public IP.
+
+Ansible connects to nodes by IP (see configure_ansible --connect-by), so provisioning can begin as
+soon as terraform apply returns. Jenkins, however, reaches its agents by FQDN, and operators reach
+the head node by FQDN. This tool resolves all the records concurrently, re-resolving the ones
+not yet correct every --interval-sec, and fails when any is still wrong after --timeout-sec.
+"""
+
+import argparse
+import concurrent.futures
+import json
+import logging
+import pathlib
+import socket
+import sys
+import time
+import typing
+
+from . import configure_ansible
+from . import trace
+
+
+_LOG = logging.getLogger(__name__)
+
+
+def expected_records(terraform_output : dict) -> typing.Dict[str, typing.Optional[str]]:
+    """Return each node's FQDN mapped to the public IP it should resolve to.
+
+    The IP is None when the Terraform output predates the IP outputs; such names need only resolve.
+    """
+    addresses = configure_ansible.node_addresses(terraform_output)
+    fqdns = [terraform_output["jenkins_head_node_fqdn"]["value"]]
+    fqdns.extend(terraform_output.get("jenkins_controller_fqdn", {}).get("value", {}).values())
+    for key, value in terraform_output.items():
+        if key.endswith("_executor_fqdn"):
+            fqdns.extend(value["value"])
+    return {fqdn: addresses.get(fqdn, {}).get("public_ip") for fqdn in fqdns}
+
+
+def resolve(fqdn : str) -> typing.Set[str]:
+    """Return the IPv4 addresses `fqdn` currently resolves to; empty if it doesn't resolve."""
+    try:
+        return {info[4][0] for info in socket.getaddrinfo(fqdn, None, family=socket.AF_INET)}
+    except socket.gaierror:
+        return set()
+
+
+def wait_for_records(records : typing.Dict[str, typing.Optional[str]], timeout_sec : float,
+                     interval_sec : float, max_workers : int) -> typing.Dict[str, typing.Set[str]]:
+    """Resolve `records` concurrently until each resolves to its expected IP, or `timeout_sec`.
+
+    Returns
+    -------
+    Dict[str, Set[str]] :
+        The records which never resolved as expected, mapped to the addresses they last
+        resolved to. Empty when all of them did.
+    """
+    deadline = time.monotonic() + timeout_sec
+    pending = dict(records)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            resolved = dict(zip(pending, executor.map(resolve, pending)))
+            for fqdn, addresses in resolved.items():
+                expected = pending[fqdn]
+                if addresses and (expected is None or expected in addresses):
+                    _LOG.info("%s: resolves to %s", fqdn, ", ".join(sorted(addresses)))
+                    del pending[fqdn]
+
+            if not pending or time.monotonic() + interval_sec > deadline:
+                return {fqdn: resolved[fqdn] for fqdn in pending}
+
+            _LOG.info("Waiting for %d of %d records", len(pending), len(records))
+            time.sleep(interval_sec)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--terraform-output-json", required=True, type=pathlib.Path,
+                        help="Path to the Terraform output, formatted as JSON.")
+    parser.add_argument("--timeout-sec", type=float, default=15 * 60,
+                        help="Give up on records which don't resolve correctly within this time")
+    parser.add_argument("--interval-sec", type=float, default=10,
+                        help="Time between attempts to resolve the remaining records")
+    parser.add_argument("--max-workers", type=int, default=32,
+                        help="Number of records resolved in parallel")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level="INFO")
+
+    with open(args.terraform_output_json) as json_f:
+        records = expected_records(json.load(json_f))
+
+    with trace.span("dns_check.wait_for_records", records=len(records)):
+        unresolved = wait_for_records(records, args.timeout_sec, args.interval_sec, args.max_workers)
+
+    for fqdn, addresses in sorted(unresolved.items()):
+        _LOG.error("%s: resolves to %s, expected %s", fqdn,
+                   ", ".join(sorted(addresses)) or "nothing", records[fqdn] or "any address")
+    if unresolved:
+        sys.exit(f"{len(unresolved)} of {len(records)} DNS records did not resolve in time")
+    _LOG.info("All %d DNS records resolve", len(records))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ import typing
 
 import yaml
 
+from . import outputs
 from . import utils
 
 
@@ -25,8 +26,7 @@ STAGE_SCRIPT_RE = re.compile(r"^(?P<stage_name>[a-z0-9_]+)-(?P<step_number>[0-9]
 def _check_script_name(expected_step_number_digits : int, m : re.Match) -> bool:
     step_number = int(m.group("step_number"))
     step_number_digits = len(m.group("step_number"))
-    formatted_step_number = (
-        "0" * (expected_step_number_digits - step_number_digits) + str(step_number))
+    formatted_step_number = str(step_number).zfill(expected_step_number_digits)
 
     if formatted_step_number == m.group("step_number"):
         return False
@@ -130,8 +130,18 @@ def _done_path(script_name):
     return pathlib.Path(f"$(BUILD_DIR)/{os.path.splitext(script_name)[0]}.log.done")
 
 
-def generate_makefile(stages_by_name, stage_order):
-    with open(utils.get_repo_root() / "template.mk") as makefile_f:
+def generate_makefile(stages_by_name, stage_order, template_path=None, makefile_path=None):
+    """Write the Makefile, with one rule per stage script.
+
+    template_path and makefile_path default to template.mk and Makefile in the repo root, and are
+    parameterizable for benchmarking.
+    """
+    if template_path is None:
+        template_path = utils.get_repo_root() / "template.mk"
+    if makefile_path is None:
+        makefile_path = utils.get_repo_root() / "Makefile"
+
+    with open(template_path) as makefile_f:
         template = makefile_f.read()
 
     stage_rules = []
@@ -155,12 +165,12 @@ def generate_makefile(stages_by_name, stage_order):
 
         stage_deps.append(stage_name)
 
-    with open(utils.get_repo_root() / "Makefile", "w") as makefile_f:
-        makefile_f.write("# AUTOGENERATED DO NOT EDIT\n")
-        makefile_f.write(f"# See template.mk and/or {__file__} for more details.\n")
-        makefile_f.write("\n")
-
-        makefile_f.write(template.format(STAGE_RULES="\n".join(stage_rules)))
+    outputs.write_if_changed(
+        makefile_path,
+        ("# AUTOGENERATED DO NOT EDIT\n"
+         f"# See template.mk and/or {__file__} for more details.\n"
+         "\n" +
+         template.format(STAGE_RULES="\n".join(stage_rules))))
 
 
 # See https://docs.gitlab.com/ee/ci/yaml/README.html#unavailable-names-for-jobs
@@ -318,9 +328,13 @@ def _update_job_scripts(job_name, old_lines, i, scripts, new_lines):
     return i
 
 
-def process_gitlab_ci(stages_by_name):
-    """Read .gitlab-ci.yml to deduce stage ordering, and update job "scripts" keywords."""
-    gitlab_ci_yml_path = utils.get_repo_root() / ".gitlab-ci.yml"
+def process_gitlab_ci(stages_by_name, gitlab_ci_yml_path=None):
+    """Read .gitlab-ci.yml to deduce stage ordering, and update job "scripts" keywords.
+
+    gitlab_ci_yml_path defaults to .gitlab-ci.yml in the repo root.
+    """
+    if gitlab_ci_yml_path is None:
+        gitlab_ci_yml_path = utils.get_repo_root() / ".gitlab-ci.yml"
     with open(gitlab_ci_yml_path) as gitlab_ci_yml_f:
         gitlab_ci_yml_contents = gitlab_ci_yml_f.read()
 
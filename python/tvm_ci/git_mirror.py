@@ -0,0 +1,174 @@
+"""Keep a bare git mirror of the repositories CI checks out, for jobs to clone with --reference.
+
+When cluster.git_mirror is set in the CI config:
+
+    cluster:
+        git_mirror:
+            repos:                              # mirrored on the head node
+                tvm: https://github.com/apache/tvm
+                dmlc-core: https://github.com/dmlc/dmlc-core
+            refresh_interval_min: 5             # optional
+            shallow_clone_depth: 50             # optional; full clones by default
+
+the head node fetches each repo into one bare repository every refresh_interval_min and serves it
+read-only with git-daemon within the VPC. Each executor replicates the head node's mirror to the
+same path, so only the head node talks to GitHub. Job generation (configure_jenkins) adds the
+mirror as the reference repo of every git checkout, and jobs see its path as the node environment
+variable GIT_MIRROR_DIR (e.g. for `git submodule update --reference "$GIT_MIRROR_DIR"`). A checkout
+on a fresh executor then fetches only the objects newer than the last refresh.
+
+Checkouts made with --reference keep borrowing objects from the mirror, so it is never pruned.
+
+ansible/playbook.yml copies this file to each node and runs it as a standalone script:
+
+    python3 git_mirror.py --mirror-dir=DIR sync --upstream=tvm=https://github.com/apache/tvm
+    python3 git_mirror.py --mirror-dir=DIR watch --replica-of=git://HEAD_NODE/mirror.git
+"""
+
+import argparse
+import contextlib
+import fcntl
+import logging
+import os
+import subprocess
+import time
+import typing
+
+
+_LOG = logging.getLogger(__name__)
+
+
+DEFAULT_GIT_MIRROR_DIR = "/var/lib/tvm-ci/git-mirror/mirror.git"
+
+
+DEFAULT_REFRESH_INTERVAL_MIN = 5
+
+
+# git-daemon's default port, on which the head node serves the mirror to executors.
+GIT_DAEMON_PORT = 9418
+
+
+def mirror_settings(tvm_ci_config : dict) -> typing.Optional[dict]:
+    """Return the mirror's repos, dir, refresh interval and clone depth, or None if disabled."""
+    git_mirror = tvm_ci_config["cluster"].get("git_mirror")
+    if git_mirror is None:
+        return None
+
+    return {
+        "repos": git_mirror["repos"],
+        "dir": DEFAULT_GIT_MIRROR_DIR,
+        "refresh_interval_min": git_mirror.get("refresh_interval_min", DEFAULT_REFRESH_INTERVAL_MIN),
+        "shallow_clone_depth": git_mirror.get("shallow_clone_depth"),
+    }
+
+
+def node_env(settings : dict) -> typing.List[dict]:
+    """Return the CasC node envVars which point jobs at the mirror."""
+    return [{"key": "GIT_MIRROR_DIR", "value": settings["dir"]}]
+
+
+def scm_options(settings : dict) -> dict:
+    """Return the jenkins-job-builder git/github SCM options which clone using the mirror."""
+    options = {"reference-repo": settings["dir"]}
+    if settings["shallow_clone_depth"] is not None:
+        options["shallow-clone"] = True
+        options["depth"] = settings["shallow_clone_depth"]
+    return options
+
+
+def _git(mirror_dir : str, *args):
+    subprocess.run(["git", "-C", mirror_dir] + list(args), check=True)
+
+
+@contextlib.contextmanager
+def _locked(mirror_dir : str):
+    with open(mirror_dir.rstrip("/") + ".lock", "w") as lock_f:
+        fcntl.flock(lock_f, fcntl.LOCK_EX)
+        yield
+
+
+def sync(mirror_dir : str, remotes : typing.Dict[str, typing.Tuple[str, typing.List[str]]]):
+    """Create the mirror if needed and fetch each of `remotes` into it.
+
+    Parameters
+    ----------
+    mirror_dir : str
+        Path to the bare repository.
+    remotes : Dict[str, Tuple[str, List[str]]]
+        Maps each remote's name to its URL and the refspecs fetched from it.
+    """
+    os.makedirs(os.path.dirname(mirror_dir.rstrip("/")), exist_ok=True)
+    with _locked(mirror_dir):
+        if not os.path.exists(os.path.join(mirror_dir, "HEAD")):
+            subprocess.run(["git", "init", "--bare", "--quiet", mirror_dir], check=True)
+            # Clones made with --reference depend on objects no ref reaches once a branch is
+            # deleted or force-pushed.
+            _git(mirror_dir, "config", "gc.pruneExpire", "never")
+
+        for name, (url, refspecs) in sorted(remotes.items()):
+            _git(mirror_dir, "config", "remote.{}.url".format(name), url)
+            subprocess.run(["git", "-C", mirror_dir, "config", "--unset-all", "remote.{}.fetch".format(name)],
+                           stderr=subprocess.DEVNULL)
+            for refspec in refspecs:
+                _git(mirror_dir, "config", "--add", "remote.{}.fetch".format(name), refspec)
+            _git(mirror_dir, "config", "remote.{}.tagOpt".format(name), "--no-tags")
+
+        started = time.monotonic()
+        _git(mirror_dir, "remote", "update", "--prune")
+        _git(mirror_dir, "gc", "--auto", "--quiet")
+        _LOG.info("Synced %d remotes in %.1fs", len(remotes), time.monotonic() - started)
+
+
+def _remotes(args : argparse.Namespace) -> typing.Dict[str, typing.Tuple[str, typing.List[str]]]:
+    if args.replica_of is not None:
+        return {"replica": (args.replica_of, ["+refs/*:refs/*"])}
+
+    remotes = {}
+    for upstream in args.upstream:
+        name, url = upstream.split("=", 1)
+        remotes[name] = (url, ["+refs/heads/*:refs/mirror/{}/heads/*".format(name),
+                               "+refs/tags/*:refs/mirror/{}/tags/*".format(name)])
+    return remotes
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--mirror-dir", default=DEFAULT_GIT_MIRROR_DIR,
+                        help="Path to the bare repository holding the mirror")
+    sources = argparse.ArgumentParser(add_help=False)
+    source = sources.add_mutually_exclusive_group(required=True)
+    source.add_argument("--upstream", action="append",
+                        help="NAME=URL of a repository to mirror. May be repeated.")
+    source.add_argument("--replica-of",
+                        help="URL of another mirror to replicate in full (e.g. the head node's)")
+
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+    subparsers.add_parser("sync", parents=[sources], help="Fetch the upstreams into the mirror once")
+    watch_parser = subparsers.add_parser("watch", parents=[sources],
+                                         help="Fetch the upstreams into the mirror periodically")
+    watch_parser.add_argument("--interval-sec", type=float, default=DEFAULT_REFRESH_INTERVAL_MIN * 60,
+                              help="Time between refreshes")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level="INFO")
+
+    remotes = _remotes(args)
+    if args.command == "sync":
+        sync(args.mirror_dir, remotes)
+        return
+
+    while True:
+        try:
+            sync(args.mirror_dir, remotes)
+        except subprocess.CalledProcessError as e:
+            # Serve the last good copy; the next refresh may succeed.
+            _LOG.error("Refresh failed: %s", e)
+        time.sleep(args.interval_sec)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,539 @@
+"""Snapshot a running Jenkins head node's JENKINS_HOME incrementally, and restore it in parallel.
+
+configure_jenkins builds a fresh homedir, so build history, job state and credentials accumulated
+by a production head node are lost when it is replaced. This tool captures them:
+
+    python3 homedir_snapshot.py --store=s3://BUCKET/PREFIX snapshot /home/jenkins/jenkins-homedir
+    python3 homedir_snapshot.py --store=s3://BUCKET/PREFIX restore /home/jenkins/jenkins-homedir
+    python3 homedir_snapshot.py --store=s3://BUCKET/PREFIX list
+    python3 homedir_snapshot.py --store=s3://BUCKET/PREFIX prune --keep=14
+
+Files are split into chunks at content-defined boundaries, so an append to a build log or an
+edit within a large file changes only the chunks around it. Chunks are stored once per sha256 under
+chunks/ and shared by every snapshot; a snapshot uploads only the chunks the store lacks, and
+doesn't even read files whose size and mtime match the previous snapshot. Each snapshot is a
+manifest under snapshots/ listing every file's chunks.
+
+Restore fetches each distinct chunk once, --parallel at a time, and writes it at its offset in
+every file which contains it, so a rebuilt head node reaches the snapshot's state in the time it
+takes to download its unique chunks.
+
+--store is a local directory or s3://BUCKET/PREFIX; pass --endpoint-url for S3-compatible stores
+such as MinIO. S3 credentials come from the usual boto3 sources (AWS_PROFILE,
+AWS_SHARED_CREDENTIALS_FILE, instance profile). This file runs standalone on the head node;
+boto3 is only needed for s3:// stores.
+
+Snapshots hold the homedir's secrets/ and credentials.xml, which together decrypt every credential
+Jenkins stores: anyone who can read the store can read all of them. Objects written to S3 are
+encrypted at rest (SSE-S3, or SSE-KMS with --kms-key-id), which guards against leaked disks but not
+against leaked read access; restrict the bucket policy, and with a KMS key, its key policy, to the
+head node's credentials and to administrators.
+
+When jenkins.homedir_snapshot is set in the CI config:
+
+    jenkins:
+        homedir_snapshot:
+            store: s3://tvm-ci-snapshots/head-node/
+            endpoint: http://10.0.0.5:9000      # optional; for S3-compatible stores such as MinIO
+            region: us-east-2                   # optional; defaults to cluster.aws_region
+            aws_profile_name: snapshots         # optional; defaults to cluster.aws_profile_name
+            kms_key_id: alias/tvm-ci-snapshots  # optional; SSE-KMS key. Defaults to SSE-S3.
+            interval_hours: 6                   # optional
+            keep: 28                            # optional; 0 keeps every snapshot
+            restore_on_provision: true          # optional
+
+ansible/playbook.yml runs `watch` on the head node as a service and, when it provisions a head
+node with no homedir yet, restores the latest snapshot before unpacking the configure_jenkins
+archive over it. The archive's configuration then wins, while build history, job state and
+credentials come from the snapshot.
+
+Snapshots of a running Jenkins are crash-consistent per file, not across files.
+"""
+
+import argparse
+import concurrent.futures
+import datetime
+import fnmatch
+import gzip
+import hashlib
+import json
+import logging
+import os
+import random
+import stat
+import sys
+import threading
+import time
+import typing
+import zlib
+
+
+_LOG = logging.getLogger(__name__)
+
+
+# Chunks are at least MIN_CHUNK_BYTES (except at the end of a file) and at most MAX_CHUNK_BYTES.
+MIN_CHUNK_BYTES = 256 * 1024
+
+
+MAX_CHUNK_BYTES = 4 * 1024 * 1024
+
+
+# A boundary follows ANCHOR_LEN consecutive bytes from a fixed, pseudo-random quarter of all byte
+# values (about every 1 MiB past MIN_CHUNK_BYTES in binary data). Found with bytes.translate() and
+# bytes.find(), so chunking runs at hundreds of MB/s.
+ANCHOR_LEN = 10
+
+
+def _anchor_table() -> bytes:
+    values = list(range(256))
+    random.Random(0x7c1).shuffle(values)
+    anchor_values = set(values[:64])
+    return bytes(0 if b in anchor_values else 1 for b in range(256))
+
+
+_ANCHOR_TABLE = _anchor_table()
+
+
+_ANCHOR = b"\0" * ANCHOR_LEN
+
+
+# Text rarely contains an anchor, so there a boundary follows a line whose crc32 has these bits
+# clear (about one line in 4096).
+LINE_ANCHOR_MASK = 0xfff
+
+
+# Relative to the homedir. Plugins and the unpacked war come from the Jenkins container.
+DEFAULT_EXCLUDES = ["plugins", "war", "workspace", "caches", ".cache", "*.tmp", ".tvm-ci-restored"]
+
+
+# Written to the homedir by restore, holding the snapshot's id.
+RESTORED_MARKER = ".tvm-ci-restored"
+
+
+DEFAULT_INTERVAL_HOURS = 6
+
+
+DEFAULT_KEEP = 28
+
+
+def snapshot_settings(tvm_ci_config : dict) -> typing.Optional[dict]:
+    """Return the store, how to reach and encrypt it, and the schedule, or None if disabled."""
+    homedir_snapshot = tvm_ci_config["jenkins"].get("homedir_snapshot")
+    if homedir_snapshot is None:
+        return None
+
+    return {
+        "store": homedir_snapshot["store"],
+        "endpoint": homedir_snapshot.get("endpoint"),
+        "region": homedir_snapshot.get(
+            "region", tvm_ci_config["cluster"].get("aws_region", "us-east-1")),
+        "aws_profile_name": homedir_snapshot.get(
+            "aws_profile_name", tvm_ci_config["cluster"].get("aws_profile_name", "default")),
+        "kms_key_id": homedir_snapshot.get("kms_key_id"),
+        "interval_hours": homedir_snapshot.get("interval_hours", DEFAULT_INTERVAL_HOURS),
+        "keep": homedir_snapshot.get("keep", DEFAULT_KEEP),
+        "restore_on_provision": homedir_snapshot.get("restore_on_provision", True),
+    }
+
+
+def _cut(data : bytes, translated : bytes, start : int, eof : bool) -> int:
+    """Return the end of the chunk starting at `start`, or -1 if more data is needed."""
+    limit = min(start + MAX_CHUNK_BYTES, len(data))
+    if limit - start < MAX_CHUNK_BYTES and not eof:
+        return -1
+    if limit - start <= MIN_CHUNK_BYTES:
+        return limit
+
+    i = translated.find(_ANCHOR, start + MIN_CHUNK_BYTES - ANCHOR_LEN, limit)
+    if i >= 0:
+        return i + ANCHOR_LEN
+
+    line_start = data.find(b"\n", start + MIN_CHUNK_BYTES, limit) + 1
+    while 0 < line_start < limit:
+        line_end = data.find(b"\n", line_start, limit)
+        if line_end < 0:
+            break
+        if not zlib.crc32(data[line_start:line_end]) & LINE_ANCHOR_MASK:
+            return line_end + 1
+        line_start = line_end + 1
+    return limit
+
+
+def chunk_file(path : str) -> typing.Iterator[bytes]:
+    """Yield the content-defined chunks of the file at `path`."""
+    with open(path, "rb") as f:
+        data = b""
+        eof = False
+        while data or not eof:
+            if not eof:
+                block = f.read(2 * MAX_CHUNK_BYTES)
+                eof = not block
+                data += block
+            translated = data.translate(_ANCHOR_TABLE)
+            start = 0
+            while start < len(data):
+                end = _cut(data, translated, start, eof)
+                if end < 0:
+                    break
+                yield data[start:end]
+                start = end
+            data = data[start:]
+
+
+class CorruptChunkError(Exception):
+    """Raised when a chunk read from the store doesn't match its digest."""
+
+
+class LocalStore:
+    """A store in a local (or shared) directory."""
+
+    def __init__(self, root : str):
+        self.root = root
+
+    def put(self, key : str, data : bytes):
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+    def get(self, key : str) -> bytes:
+        with open(os.path.join(self.root, key), "rb") as f:
+            return f.read()
+
+    def list(self, prefix : str) -> typing.Iterator[str]:
+        top = os.path.join(self.root, prefix)
+        for dirpath, _, filenames in os.walk(top):
+            for name in filenames:
+                if not name.endswith(".tmp"):
+                    yield os.path.relpath(os.path.join(dirpath, name), self.root).replace(os.sep, "/")
+
+    def delete(self, key : str):
+        os.unlink(os.path.join(self.root, key))
+
+
+class S3Store:
+    """A store under a prefix of an S3 (or S3-compatible) bucket.
+
+    Objects are written with server-side encryption: under `kms_key_id` if given, else SSE-S3.
+    """
+
+    def __init__(self, url : str, endpoint_url : typing.Optional[str], max_connections : int,
+                 kms_key_id : typing.Optional[str] = None):
+        import boto3
+        import botocore.config
+
+        self.bucket, _, prefix = url[len("s3://"):].partition("/")
+        self.prefix = prefix.rstrip("/") + "/" if prefix else ""
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, config=botocore.config.Config(
+            max_pool_connections=max_connections, retries={"max_attempts": 10, "mode": "adaptive"}))
+        self.encryption_args = {"ServerSideEncryption": "AES256"}
+        if kms_key_id is not None:
+            self.encryption_args = {"ServerSideEncryption": "aws:kms", "SSEKMSKeyId": kms_key_id}
+
+    def put(self, key : str, data : bytes):
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data,
+                               **self.encryption_args)
+
+    def get(self, key : str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)["Body"].read()
+
+    def list(self, prefix : str) -> typing.Iterator[str]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix):
+            for obj in page.get("Contents", []):
+                yield obj["Key"][len(self.prefix):]
+
+    def delete(self, key : str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+
+def open_store(url : str, endpoint_url : typing.Optional[str] = None, max_connections : int = 16,
+               kms_key_id : typing.Optional[str] = None):
+    if url.startswith("s3://"):
+        return S3Store(url, endpoint_url, max_connections, kms_key_id)
+    return LocalStore(url)
+
+
+def _chunk_key(digest : str) -> str:
+    return "chunks/{}/{}".format(digest[:2], digest)
+
+
+def _manifest_key(snapshot_id : str) -> str:
+    return "snapshots/{}.json.gz".format(snapshot_id)
+
+
+def list_snapshots(store) -> typing.List[str]:
+    """Return the ids of the snapshots in `store`, oldest first."""
+    return sorted(k[len("snapshots/"):-len(".json.gz")] for k in store.list("snapshots/")
+                  if k.endswith(".json.gz"))
+
+
+def load_manifest(store, snapshot_id : str) -> dict:
+    return json.loads(gzip.decompress(store.get(_manifest_key(snapshot_id))).decode("utf-8"))
+
+
+def _walk(homedir : str, excludes : typing.List[str]) -> typing.Iterator[typing.Tuple[str, os.stat_result]]:
+    def excluded(rel):
+        return any(fnmatch.fnmatch(rel, pattern) or fnmatch.fnmatch(os.path.basename(rel), pattern)
+                   for pattern in excludes)
+
+    for dirpath, dirnames, filenames in os.walk(homedir):
+        rel_dir = os.path.relpath(dirpath, homedir)
+        for name in sorted(dirnames):
+            rel = os.path.normpath(os.path.join(rel_dir, name))
+            if excluded(rel):
+                dirnames.remove(name)
+                continue
+            st = os.lstat(os.path.join(dirpath, name))
+            if stat.S_ISLNK(st.st_mode):
+                filenames.append(name)  # os.walk doesn't descend into links; record them as such.
+            else:
+                yield rel, st
+        for name in sorted(filenames):
+            rel = os.path.normpath(os.path.join(rel_dir, name))
+            if not excluded(rel):
+                yield rel, os.lstat(os.path.join(dirpath, name))
+
+
+def snapshot(store, homedir : str, excludes : typing.List[str], parallel : int) -> dict:
+    """Snapshot `homedir` into `store`, uploading only chunks the store lacks. Returns stats."""
+    snapshot_ids = list_snapshots(store)
+    previous = {}
+    if snapshot_ids:
+        previous = {e["path"]: e for e in load_manifest(store, snapshot_ids[-1])["entries"]}
+    stored = {k.rsplit("/", 1)[1] for k in store.list("chunks/")}
+
+    stats = {"files": 0, "bytes": 0, "files_read": 0, "chunks_uploaded": 0, "bytes_uploaded": 0}
+    stats_lock = threading.Lock()
+    # Bounds the chunks held in memory while waiting to be uploaded.
+    in_flight = threading.BoundedSemaphore(2 * parallel)
+
+    def upload(digest, chunk):
+        try:
+            compressed = zlib.compress(chunk, 1)
+            store.put(_chunk_key(digest), compressed)
+            with stats_lock:
+                stats["chunks_uploaded"] += 1
+                stats["bytes_uploaded"] += len(compressed)
+        finally:
+            in_flight.release()
+
+    entries = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=parallel) as executor:
+        uploads = []
+        for rel, st in _walk(homedir, excludes):
+            entry = {"path": rel, "mode": stat.S_IMODE(st.st_mode), "mtime_ns": st.st_mtime_ns}
+            if stat.S_ISDIR(st.st_mode):
+                entry["type"] = "dir"
+            elif stat.S_ISLNK(st.st_mode):
+                entry.update(type="symlink", target=os.readlink(os.path.join(homedir, rel)))
+            elif stat.S_ISREG(st.st_mode):
+                entry.update(type="file", size=st.st_size)
+                stats["files"] += 1
+                stats["bytes"] += st.st_size
+                prev = previous.get(rel)
+                if (prev is not None and prev["type"] == "file" and prev["size"] == st.st_size and
+                        prev["mtime_ns"] == st.st_mtime_ns and
+                        all(digest in stored for digest, _ in prev["chunks"])):
+                    entry["chunks"] = prev["chunks"]
+                else:
+                    stats["files_read"] += 1
+                    entry["chunks"] = []
+                    for chunk in chunk_file(os.path.join(homedir, rel)):
+                        digest = hashlib.sha256(chunk).hexdigest()
+                        entry["chunks"].append([digest, len(chunk)])
+                        if digest not in stored:
+                            stored.add(digest)
+                            in_flight.acquire()
+                            uploads.append(executor.submit(upload, digest, chunk))
+            else:
+                continue
+            entries.append(entry)
+
+        for future in uploads:
+            future.result()
+
+    snapshot_id = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S.%fZ")
+    store.put(_manifest_key(snapshot_id), gzip.compress(bytes(json.dumps(
+        {"id": snapshot_id, "homedir": homedir, "entries": entries}), "utf-8")))
+    stats["id"] = snapshot_id
+    return stats
+
+
+def restore(store, snapshot_id : str, homedir : str, parallel : int) -> dict:
+    """Recreate `homedir` as of `snapshot_id`, fetching `parallel` chunks at a time.
+
+    Files are created at their final size first; each distinct chunk is then downloaded once and
+    written at every offset it occupies, in whichever order the downloads complete.
+    """
+    manifest = load_manifest(store, snapshot_id)
+    os.makedirs(homedir, exist_ok=True)
+
+    # Every (path, offset) at which each distinct chunk is written.
+    locations = {}
+    for entry in manifest["entries"]:
+        path = os.path.join(homedir, entry["path"])
+        if entry["type"] == "dir":
+            os.makedirs(path, exist_ok=True)
+        elif entry["type"] == "symlink":
+            if os.path.lexists(path):
+                os.unlink(path)
+            os.symlink(entry["target"], path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.truncate(entry["size"])
+            offset = 0
+            for digest, size in entry["chunks"]:
+                locations.setdefault(digest, []).append((path, offset))
+                offset += size
+
+    stats = {"files": sum(1 for e in manifest["entries"] if e["type"] == "file"),
+             "chunks_downloaded": 0, "bytes_downloaded": 0}
+    stats_lock = threading.Lock()
+
+    def fetch(digest):
+        compressed = store.get(_chunk_key(digest))
+        chunk = zlib.decompress(compressed)
+        if hashlib.sha256(chunk).hexdigest() != digest:
+            raise CorruptChunkError("{}: contents don't match its digest".format(_chunk_key(digest)))
+        for path, offset in locations[digest]:
+            fd = os.open(path, os.O_WRONLY)
+            try:
+                os.pwrite(fd, chunk, offset)
+            finally:
+                os.close(fd)
+        with stats_lock:
+            stats["chunks_downloaded"] += 1
+            stats["bytes_downloaded"] += len(compressed)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=parallel) as executor:
+        for future in concurrent.futures.as_completed(
+                [executor.submit(fetch, digest) for digest in locations]):
+            future.result()
+
+    # Directory mtimes last, since creating their contents changes them.
+    for entry in sorted(manifest["entries"], key=lambda e: e["type"] == "dir"):
+        path = os.path.join(homedir, entry["path"])
+        if entry["type"] != "symlink":
+            os.chmod(path, entry["mode"])
+        os.utime(path, ns=(entry["mtime_ns"], entry["mtime_ns"]), follow_symlinks=False)
+
+    with open(os.path.join(homedir, RESTORED_MARKER), "w") as marker_f:
+        marker_f.write(snapshot_id + "\n")
+    stats["id"] = snapshot_id
+    return stats
+
+
+def prune(store, keep : int) -> dict:
+    """Delete all but the newest `keep` snapshots, and the chunks none of the remaining use."""
+    snapshot_ids = list_snapshots(store)
+    kept = snapshot_ids[-keep:] if keep > 0 else []
+    used = set()
+    for snapshot_id in kept:
+        used.update(digest for e in load_manifest(store, snapshot_id)["entries"]
+                    for digest, _ in e.get("chunks", []))
+
+    # Manifests first, so a concurrent restore never finds a manifest whose chunks are gone.
+    deleted_snapshots = [s for s in snapshot_ids if s not in kept]
+    for snapshot_id in deleted_snapshots:
+        store.delete(_manifest_key(snapshot_id))
+    deleted_chunks = 0
+    for key in list(store.list("chunks/")):
+        if key.rsplit("/", 1)[1] not in used:
+            store.delete(key)
+            deleted_chunks += 1
+    return {"snapshots_deleted": len(deleted_snapshots), "chunks_deleted": deleted_chunks}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--store", required=True,
+                        help="Local directory or s3://BUCKET/PREFIX holding snapshots and chunks")
+    parser.add_argument("--endpoint-url", help="Endpoint of an S3-compatible store, e.g. MinIO")
+    parser.add_argument("--kms-key-id",
+                        help="KMS key to encrypt uploads to an s3:// store with, instead of SSE-S3")
+    parser.add_argument("--parallel", type=int, default=16,
+                        help="Number of chunks uploaded or downloaded at once")
+
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+    for name, help_text in (("snapshot", "Snapshot the homedir once"),
+                            ("watch", "Snapshot the homedir periodically")):
+        snapshot_parser = subparsers.add_parser(name, help=help_text)
+        snapshot_parser.add_argument("homedir", help="Path to JENKINS_HOME")
+        snapshot_parser.add_argument("--exclude", action="append", default=list(DEFAULT_EXCLUDES),
+                                     help="Glob (relative to the homedir, or a basename) to skip. "
+                                          "May be repeated.")
+        snapshot_parser.add_argument("--keep", type=int, default=0,
+                                     help="After each snapshot, prune all but this many (0: keep all)")
+        if name == "watch":
+            snapshot_parser.add_argument("--interval-sec", type=float, default=6 * 60 * 60,
+                                         help="Time between snapshots")
+
+    restore_parser = subparsers.add_parser("restore", help="Recreate the homedir from a snapshot")
+    restore_parser.add_argument("homedir", help="Path to JENKINS_HOME")
+    restore_parser.add_argument("--snapshot", help="Id of the snapshot to restore; the latest by default")
+    restore_parser.add_argument("--if-not-restored", action="store_true",
+                                help="Do nothing if the homedir was already restored by this tool")
+    subparsers.add_parser("list", help="List snapshots, oldest first")
+    prune_parser = subparsers.add_parser("prune", help="Delete old snapshots and unused chunks")
+    prune_parser.add_argument("--keep", type=int, required=True, help="Number of newest snapshots to keep")
+    return parser.parse_args()
+
+
+def _snapshot_and_prune(store, args : argparse.Namespace):
+    started = time.monotonic()
+    stats = snapshot(store, args.homedir, args.exclude, args.parallel)
+    _LOG.info("Snapshot %s: %d files (%d read), %d bytes; uploaded %d chunks, %d bytes in %.1fs",
+              stats["id"], stats["files"], stats["files_read"], stats["bytes"],
+              stats["chunks_uploaded"], stats["bytes_uploaded"], time.monotonic() - started)
+    if args.keep > 0:
+        _LOG.info("Pruned %(snapshots_deleted)d snapshots, %(chunks_deleted)d chunks",
+                  prune(store, args.keep))
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level="INFO")
+
+    store = open_store(args.store, args.endpoint_url, args.parallel, args.kms_key_id)
+    if args.command == "snapshot":
+        _snapshot_and_prune(store, args)
+
+    elif args.command == "watch":
+        while True:
+            try:
+                _snapshot_and_prune(store, args)
+            except Exception:  # Keep snapshotting; the store or a file may be briefly unavailable.
+                _LOG.exception("Snapshot failed")
+            time.sleep(args.interval_sec)
+
+    elif args.command == "restore":
+        if args.if_not_restored and os.path.exists(os.path.join(args.homedir, RESTORED_MARKER)):
+            _LOG.info("%s was already restored; not restoring", args.homedir)
+            return
+        snapshot_ids = list_snapshots(store)
+        if not snapshot_ids:
+            if args.if_not_restored:
+                _LOG.info("%s holds no snapshots; not restoring", args.store)
+                return
+            sys.exit("{} holds no snapshots".format(args.store))
+        started = time.monotonic()
+        stats = restore(store, args.snapshot or snapshot_ids[-1], args.homedir, args.parallel)
+        _LOG.info("Restored snapshot %s: %d files from %d chunks, %d bytes in %.1fs", stats["id"],
+                  stats["files"], stats["chunks_downloaded"], stats["bytes_downloaded"],
+                  time.monotonic() - started)
+
+    elif args.command == "list":
+        for snapshot_id in list_snapshots(store):
+            print(snapshot_id)
+
+    elif args.command == "prune":
+        _LOG.info("Pruned %(snapshots_deleted)d snapshots, %(chunks_deleted)d chunks",
+                  prune(store, args.keep))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""Manage the Docker images cached on a Jenkins executor.
+
+Executors have a fixed-size root volume and TVM builds pull multi-GB CI images onto it. This
+agent, installed on each executor by ansible/playbook.yml, keeps that cache useful:
+
+ - `prefetch` pulls the images listed for the executor's labels (cluster.image_cache.prefetch in
+   the CI config) in parallel at provision time, so the first build doesn't pay for them.
+ - `watch` runs as a service. It follows `docker events` to record when each image was last used
+   and whether a build found it already present (a hit) or had to download it (a miss). When disk
+   usage of the Docker root exceeds --high-watermark-pct, it removes dangling images and then
+   least-recently-used images until usage is below --low-watermark-pct. Images used by any
+   container and prefetched images are never evicted, so hot images stay resident.
+ - `report` prints the per-image hit/miss counts, hit rate, evictions and current disk usage.
+
+State is kept in --state-dir/state.json. A `docker pull` which downloads nothing counts as a hit,
+as does starting a container from a present image without pulling it first.
+
+This runs on executors from a single copied file with the system python3 (3.6 on the Ubuntu 18.04
+executor AMIs), so only the standard library is used here.
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import typing
+
+
+_LOG = logging.getLogger(__name__)
+
+
+DEFAULT_STATE_DIR = pathlib.Path("/var/lib/tvm-ci-image-cache")
+
+
+DEFAULT_HIGH_WATERMARK_PCT = 85
+
+
+DEFAULT_LOW_WATERMARK_PCT = 70
+
+
+# A container create within this long after a pull of its image is counted with the pull.
+PULL_USE_WINDOW_SEC = 300
+
+
+def _docker(*args, check=True) -> subprocess.CompletedProcess:
+    return subprocess.run(["docker"] + list(args), check=check, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, universal_newlines=True)
+
+
+def _image_id(ref : str) -> typing.Optional[str]:
+    proc = _docker("image", "inspect", "--format={{.Id}}", ref, check=False)
+    return proc.stdout.strip() if proc.returncode == 0 else None
+
+
+def _local_images() -> typing.Dict[str, str]:
+    """Return a map from each tagged image ref present locally to its image id."""
+    proc = _docker("images", "--no-trunc", "--format={{.Repository}}:{{.Tag}} {{.ID}}")
+    images = {}
+    for line in proc.stdout.splitlines():
+        ref, image_id = line.split(" ")
+        if not ref.endswith(":<none>"):
+            images[ref] = image_id
+    return images
+
+
+def _image_ids_in_use() -> typing.Set[str]:
+    proc = _docker("ps", "--all", "--quiet", "--no-trunc")
+    container_ids = proc.stdout.split()
+    if not container_ids:
+        return set()
+    proc = _docker("inspect", "--format={{.Image}}", *container_ids, check=False)
+    return set(proc.stdout.split())
+
+
+def _normalize_ref(ref : str) -> str:
+    # `docker events` and `docker images` name images the way they were pulled; add the default
+    # tag so "foo" and "foo:latest" are the same image.
+    last = ref.rsplit("/", 1)[-1]
+    return ref if ":" in last or "@" in last else f"{ref}:latest"
+
+
+class ImageCacheState:
+    """Per-image usage records, shared between the watcher and other subcommands by a lock file."""
+
+    def __init__(self, state_dir : pathlib.Path):
+        self.state_dir = state_dir
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def _path(self) -> pathlib.Path:
+        return self.state_dir / "state.json"
+
+    @contextlib.contextmanager
+    def locked(self, write : bool = True):
+        with open(self.state_dir / "state.lock", "w") as lock_f:
+            fcntl.flock(lock_f, fcntl.LOCK_EX)
+            try:
+                state = {"images": {}, "evictions": 0, "evicted_bytes": 0}
+                if self._path.exists():
+                    with open(self._path) as state_f:
+                        state = json.load(state_f)
+                yield state
+                if write:
+                    tmp_path = self._path.with_name(f".state.json.{os.getpid()}.tmp")
+                    with open(tmp_path, "w") as tmp_f:
+                        json.dump(state, tmp_f, indent=2, sort_keys=True)
+                    os.replace(str(tmp_path), str(self._path))
+            finally:
+                fcntl.flock(lock_f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def record(state : dict, ref : str, image_id : typing.Optional[str], hit : typing.Optional[bool]):
+        """Record a use of `ref`. `hit` is None for uses which are not builds (prefetch)."""
+        image = state["images"].setdefault(ref, {"hits": 0, "misses": 0})
+        image["last_used"] = time.time()
+        if image_id is not None:
+            image["id"] = image_id
+        if hit is True:
+            image["hits"] += 1
+        elif hit is False:
+            image["misses"] += 1
+
+
+def prefetch(state : ImageCacheState, refs : typing.List[str], jobs : int) -> typing.List[str]:
+    """Pull `refs` in parallel. Returns the refs which failed to pull."""
+
+    def pull(ref):
+        started = time.monotonic()
+        proc = _docker("pull", "--quiet", ref, check=False)
+        if proc.returncode != 0:
+            _LOG.error("Pulling %s failed: %s", ref, proc.stderr.strip())
+            return False
+        _LOG.info("Pulled %s in %.1fs", ref, time.monotonic() - started)
+        return True
+
+    failed = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        for ref, ok in zip(refs, executor.map(pull, refs)):
+            if not ok:
+                failed.append(ref)
+
+    with state.locked() as s:
+        for ref in refs:
+            if ref not in failed:
+                ImageCacheState.record(s, _normalize_ref(ref), _image_id(ref), None)
+    return failed
+
+
+def disk_usage_pct(path : pathlib.Path) -> float:
+    usage = shutil.disk_usage(str(path))
+    return 100 * usage.used / usage.total
+
+
+def evict(state : ImageCacheState, docker_root : pathlib.Path, pinned : typing.Set[str],
+          high_watermark_pct : float, low_watermark_pct : float) -> int:
+    """Remove images until usage of `docker_root` is below `low_watermark_pct`.
+
+    Does nothing unless usage exceeds `high_watermark_pct`. Dangling images are removed first, then
+    tagged images in least-recently-used order, skipping `pinned` refs and images used by any
+    container.
+
+    Returns
+    -------
+    int :
+        The number of images removed.
+    """
+    if disk_usage_pct(docker_root) <= high_watermark_pct:
+        return 0
+
+    _LOG.info("%s is %.1f%% full; evicting images down to %.1f%%", docker_root,
+              disk_usage_pct(docker_root), low_watermark_pct)
+    _docker("image", "prune", "--force", check=False)
+
+    with state.locked(write=False) as s:
+        last_used = {ref: image.get("last_used", 0) for ref, image in s["images"].items()}
+
+    pinned = {_normalize_ref(ref) for ref in pinned}
+    in_use = _image_ids_in_use()
+    candidates = sorted(
+        ((ref, image_id) for ref, image_id in _local_images().items()
+         if ref not in pinned and image_id not in in_use),
+        # Images the agent has not seen used (e.g. pulled before it started) go first.
+        key=lambda item: last_used.get(item[0], 0))
+
+    removed = 0
+    for ref, image_id in candidates:
+        if disk_usage_pct(docker_root) <= low_watermark_pct:
+            break
+        free_before = shutil.disk_usage(str(docker_root)).free
+        proc = _docker("image", "rm", ref, check=False)
+        if proc.returncode != 0:
+            _LOG.warning("Could not remove %s: %s", ref, proc.stderr.strip())
+            continue
+        freed = max(0, shutil.disk_usage(str(docker_root)).free - free_before)
+        _LOG.info("Evicted %s (%d MiB)", ref, freed // (1 << 20))
+        removed += 1
+        with state.locked() as s:
+            s["images"].pop(ref, None)
+            s["evictions"] += 1
+            s["evicted_bytes"] += freed
+
+    if disk_usage_pct(docker_root) > low_watermark_pct:
+        _LOG.warning("%s is still %.1f%% full; remaining images are pinned or in use",
+                     docker_root, disk_usage_pct(docker_root))
+    return removed
+
+
+def watch(state : ImageCacheState, docker_root : pathlib.Path, pinned : typing.Set[str],
+          high_watermark_pct : float, low_watermark_pct : float, evict_interval_sec : float):
+    """Follow `docker events`, recording image use and evicting when the disk fills. Never returns."""
+    known = _local_images()
+    last_pull = {}
+    evict_lock = threading.Lock()
+
+    def evict_now():
+        with evict_lock:
+            evict(state, docker_root, pinned, high_watermark_pct, low_watermark_pct)
+
+    def evict_periodically():
+        while True:
+            time.sleep(evict_interval_sec)
+            try:
+                evict_now()
+            except Exception:
+                _LOG.exception("Eviction failed")
+
+    threading.Thread(target=evict_periodically, daemon=True).start()
+    evict_now()
+
+    events = subprocess.Popen(
+        ["docker", "events", "--format={{json .}}",
+         "--filter=type=image", "--filter=event=pull",
+         "--filter=type=container", "--filter=event=create"],
+        stdout=subprocess.PIPE, universal_newlines=True)
+    for line in events.stdout:
+        event = json.loads(line)
+        if event.get("Type") == "image":
+            ref = _normalize_ref(event["id"])
+            image_id = _image_id(ref)
+            hit = known.get(ref) == image_id
+            last_pull[ref] = time.monotonic()
+        elif event.get("Type") == "container":
+            ref = _normalize_ref(event["from"])
+            if time.monotonic() - last_pull.get(ref, float("-inf")) < PULL_USE_WINDOW_SEC:
+                hit = None  # Already counted with the pull.
+            else:
+                hit = ref in known
+            image_id = _image_id(ref)
+        else:
+            continue
+
+        with state.locked() as s:
+            ImageCacheState.record(s, ref, image_id, hit)
+        if image_id is not None:
+            known[ref] = image_id
+        if event.get("Type") == "image":
+            evict_now()
+
+    sys.exit(f"docker events exited with {events.wait()}")
+
+
+def report(state : ImageCacheState, docker_root : pathlib.Path) -> dict:
+    with state.locked(write=False) as s:
+        images = dict(s["images"])
+        hits = sum(i["hits"] for i in images.values())
+        misses = sum(i["misses"] for i in images.values())
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else None,
+            "evictions": s["evictions"],
+            "evicted_bytes": s["evicted_bytes"],
+            "disk_usage_pct": round(disk_usage_pct(docker_root), 1),
+            "images": images,
+        }
+
+
+def _read_images_file(path : typing.Optional[pathlib.Path]) -> typing.List[str]:
+    if path is None or not path.exists():
+        return []
+    return [line.strip() for line in path.read_text().splitlines()
+            if line.strip() and not line.startswith("#")]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--state-dir", type=pathlib.Path, default=DEFAULT_STATE_DIR,
+                        help="Directory holding the usage records")
+    parser.add_argument("--docker-root", type=pathlib.Path,
+                        help="Docker's data directory, whose disk usage is managed. Default: ask docker")
+    parser.add_argument("--images-file", type=pathlib.Path,
+                        help="File listing the images to prefetch and keep resident, one per line")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    prefetch_parser = subparsers.add_parser("prefetch", help="Pull --images-file in parallel")
+    prefetch_parser.add_argument("--jobs", type=int, default=4, help="Number of concurrent pulls")
+
+    for command, help in (("watch", "Record image use and evict images as the disk fills"),
+                          ("evict", "Evict images once, if the disk is over the high watermark")):
+        subparser = subparsers.add_parser(command, help=help)
+        subparser.add_argument("--high-watermark-pct", type=float, default=DEFAULT_HIGH_WATERMARK_PCT,
+                               help="Start evicting when the Docker root's disk is this full")
+        subparser.add_argument("--low-watermark-pct", type=float, default=DEFAULT_LOW_WATERMARK_PCT,
+                               help="Stop evicting when the Docker root's disk is this full")
+    subparsers.choices["watch"].add_argument(
+        "--evict-interval-sec", type=float, default=60,
+        help="Also check the disk this often, in addition to after every pull")
+
+    subparsers.add_parser("report", help="Print cache hit rate and evictions as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level="INFO")
+    state = ImageCacheState(args.state_dir)
+    docker_root = args.docker_root or pathlib.Path(
+        _docker("info", "--format={{.DockerRootDir}}").stdout.strip())
+    images = _read_images_file(args.images_file)
+
+    if args.command == "prefetch":
+        failed = prefetch(state, images, args.jobs)
+        if failed:
+            sys.exit(f"Failed to pull: {', '.join(failed)}")
+    elif args.command == "evict":
+        evict(state, docker_root, set(images), args.high_watermark_pct, args.low_watermark_pct)
+    elif args.command == "watch":
+        watch(state, docker_root, set(images), args.high_watermark_pct, args.low_watermark_pct,
+              args.evict_interval_sec)
+    elif args.command == "report":
+        json.dump(report(state, docker_root), sys.stdout, indent=2, sort_keys=True)
+        print()
+
+
+if __name__ == "__main__":
+    main()
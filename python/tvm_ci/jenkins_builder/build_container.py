@@ -7,6 +7,11 @@ import subprocess
 
 import requests
 
+from .. import artifact_manager
+from .. import artifact_store
+from .. import log_pipeline
+from .. import outputs
+from .. import trace
 from .. import utils
 from . import jenkins_lib
 
@@ -39,12 +44,47 @@ def _determine_publish_version(container_name):
     return f"v{last[0]}.{last[1] + 1}"
 
 
-def build(args : argparse.Namespace, container_tag) -> list:
+class _InstalledPluginsCollector:
+    """Collects the plugin list printed by install-plugins.sh after "Installed plugins:"."""
+
+    def __init__(self, pipeline : log_pipeline.LogPipeline):
+        self.installed_plugins = []
+        self._state = "waiting"
+        pipeline.on_line(self._on_line)
+        pipeline.on_match(r"Installed plugins:$", self._on_start)
+
+    def _on_start(self, match, line):
+        if self._state == "waiting":
+            _LOG.info("--> capturing")
+            self._state = "capturing"
+
+    def _on_line(self, line):
+        # NOTE: runs before _on_start() for the "Installed plugins:" line itself.
+        if self._state != "capturing":
+            return
+
+        if ":" not in line:
+            _LOG.info("<-- captured")
+            self._state = "done"
+        else:
+            self.installed_plugins.append(line)
+
+
+def required_plugins(args : argparse.Namespace, tvm_ci_config : dict) -> str:
+    """Return the contents of --required-plugins, plus the plugins the CI config calls for."""
+    with open(args.required_plugins) as plugins_f:
+        plugins = plugins_f.read()
+    if artifact_manager.manager_settings(tvm_ci_config) is not None:
+        plugins += "".join(f"{p}\n" for p in artifact_manager.REQUIRED_PLUGINS)
+    return plugins
+
+
+def build(args : argparse.Namespace, container_tag, tvm_ci_config : dict) -> list:
     jenkins_builder = utils.get_repo_root() / "jenkins-builder"
     build_dir = jenkins_builder / "build"
     if not build_dir.exists():
         build_dir.mkdir(parents=True)
-    shutil.copy2(args.required_plugins, build_dir / "required-plugins.txt")
+    (build_dir / "required-plugins.txt").write_text(required_plugins(args, tvm_ci_config))
     shutil.copy2(utils.get_repo_root() / "config" / "Dockerfile",
                  jenkins_builder / "Dockerfile")
     docker_args = ["docker", "build", "--no-cache", "-t", container_tag, "."]
@@ -52,29 +92,16 @@ def build(args : argparse.Namespace, container_tag) -> list:
     proc = subprocess.Popen(docker_args, cwd=jenkins_builder,
                             stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
                             encoding="UTF-8")
-    is_capturing_to_plugins = False
-    did_finish_capturing_to_plugins = False
-    installed_plugins = []
-    for line in proc.stdout:
-        if line[-1] == "\n":
-            line = line[:-1]
-        _LOG.info("docker build: %s", line)
-        if (not is_capturing_to_plugins and
-            not did_finish_capturing_to_plugins and
-            line.endswith("Installed plugins:")):
-            _LOG.info("--> capturing")
-            is_capturing_to_plugins = True
-            continue
-        elif is_capturing_to_plugins and not did_finish_capturing_to_plugins and ":" not in line:
-            _LOG.info("<-- captured")
-            did_finish_capturing_to_plugins = True
-        elif is_capturing_to_plugins and not did_finish_capturing_to_plugins:
-            installed_plugins.append(line)
-
-    proc.wait()
+    with log_pipeline.LogPipeline("docker build", logger=_LOG,
+                                  spool_path=args.build_log_spool) as pipeline:
+        collector = _InstalledPluginsCollector(pipeline)
+        pipeline.consume(proc.stdout)
+        proc.wait()
+        if proc.returncode != 0:
+            pipeline.dump_tail()
     assert proc.returncode == 0, f"command exited with code {proc.returncode}: {' '.join(docker_args)}"
 
-    return installed_plugins
+    return collector.installed_plugins
 
 
 def parse_args() -> argparse.Namespace:
@@ -90,12 +117,20 @@ def parse_args() -> argparse.Namespace:
                         help=("Path to a file which will be filled with a list of the installed "
                               "plugins and their versions. This list includes dependencies of the "
                               "plugins listed in --required-plugins."))
+    parser.add_argument("--build-log-spool", type=pathlib.Path,
+                        help="If given, write the full docker build output to this .gz file.")
     parser.add_argument("--required-plugins", required=True,
                         help=("Path to a text file listing the required plugins to be installed. "
                               "Should be readable by install-plugins.sh in jenkins/jenkins:lts"))
+    artifact_store.add_arguments(parser)
     return parser.parse_args()
 
 
+def _image_exists(container_tag : str) -> bool:
+    return subprocess.run(["docker", "image", "inspect", container_tag],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+
+
 def main():
     args = parse_args()
     logging.basicConfig(level="INFO")
@@ -103,25 +138,43 @@ def main():
     tvm_ci_config = utils.parse_tvm_ci_config(args)
     container_name = tvm_ci_config['docker']['jenkins_container_name']
 
+    # The tag is needed to check that the image built for a stored entry still exists.
+    store = None
+    if args.artifact_store is not None and args.container_filename:
+        store = artifact_store.ArtifactStore(args.artifact_store, args.artifact_store_max_bytes)
+        store_outputs = {"installed-plugins.txt": args.installed_plugins,
+                         "container-tag.txt": args.container_filename}
+        input_digests = artifact_store.digest_inputs({
+            "generator": pathlib.Path(__file__),
+            "required_plugins": required_plugins(args, tvm_ci_config),
+            "dockerfile": utils.get_repo_root() / "config" / "Dockerfile",
+            "container_name": container_name,
+        })
+        key = artifact_store.input_key("build_container", input_digests)
+        if (store.restore(key, store_outputs) and
+            _image_exists(args.container_filename.read_text().strip())):
+            _LOG.info("Reused %s, built from the same inputs",
+                      args.container_filename.read_text().strip())
+            return
+
     publish_version = _determine_publish_version(container_name)
     container_tag = f"{container_name}:{publish_version}"
     _LOG.info("Will tag as %s", container_tag)
 
-    installed_plugins = build(args, publish_version)
+    with trace.span("build_container.docker_build", container_tag=container_tag):
+        installed_plugins = build(args, publish_version, tvm_ci_config)
 
-    args.installed_plugins.parent.mkdir(parents=True, exist_ok=True)
-    with open(args.installed_plugins, "w") as installed_f:
-        for plugin in installed_plugins:
-            installed_f.write(plugin)
-            installed_f.write("\n")
+    outputs.write_if_changed(args.installed_plugins,
+                             "".join(f"{plugin}\n" for plugin in installed_plugins))
 
     _LOG.info("Tagging and publishing...")
     subprocess.check_output(["docker", "tag", "tvm_ci.jenkins:latest", container_tag])
 
     if args.container_filename:
-        args.container_filename.parent.mkdir(parents=True, exist_ok=True)
-        with open(args.container_filename, "w") as container_f:
-            container_f.write(container_tag)
+        outputs.write_if_changed(args.container_filename, container_tag)
+
+    if store is not None:
+        store.save(key, "build_container", input_digests, store_outputs)
 
 
 if __name__ == "__main__":
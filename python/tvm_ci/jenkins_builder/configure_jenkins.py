@@ -1,5 +1,6 @@
 import argparse
 import atexit
+import configparser
 import contextlib
 import logging
 import pathlib
@@ -12,10 +13,19 @@ import tarfile
 import tempfile
 import threading
 import time
+import typing
 
 import requests
 import yaml
 
+from .. import artifact_manager
+from .. import artifact_store
+from .. import build_cache
+from .. import controllers
+from .. import git_mirror
+from .. import outputs
+from .. import ssh_keys
+from .. import trace
 from .. import utils
 from . import jenkins_lib
 
@@ -40,13 +50,12 @@ def parse_args():
     parser.add_argument("--jenkins-executor-private-key",
                         type=pathlib.Path,
                         required=True,
-                        help=("Path to a file which will be created using ssh-keygen. This file will "
-                              "hold the executor private key."))
+                        help=("Path to the executor private key. Created if it does not exist, "
+                              "otherwise reused. See tvm_ci.ssh_keys to rotate it."))
     parser.add_argument("--jenkins-executor-public-key",
                         type=pathlib.Path,
                         required=True,
-                        help=("Path to a file which will be created using ssh-keygen. This file will "
-                              "hold the executor public key."))
+                        help=("Path to a file which will hold a copy of the executor public key."))
 
     jenkins_lib.add_arguments(parser)
 
@@ -55,9 +64,19 @@ def parse_args():
                         help="Path to a tar archive which will be created containing the Jenkins homedir")
     parser.add_argument("--jenkins-jobs-files", action='append', default=[],
                         help="Job configuration file to load. May be repeated.")
-    parser.add_argument("--jenkins-container-network-id", required=True,
-                        help="Docker network to place Jenkins container on")
+    parser.add_argument("--jenkins-jobs-xml-dir", type=pathlib.Path,
+                        help=("Directory of job XML already rendered by render_jobs (e.g. by "
+                              "tvm_ci.multi_cluster). When given, it is uploaded instead of running "
+                              "jenkins-jobs update on --jenkins-jobs-files."))
+    parser.add_argument("--jenkins-container-network-id",
+                        help=("Docker network to place Jenkins container on. This process must be "
+                              "on it too (e.g. in crane); Jenkins is then reached by container "
+                              "name rather than through a published port."))
     parser.add_argument("--log-level", default="INFO", help="Log level to use")
+    parser.add_argument("--casc-snapshot", type=pathlib.Path,
+                        help=("If given, write the final CasC config, with secrets resolved, to this "
+                              "path (mode 0600). Once deployed, reconfigure diffs against it."))
+    artifact_store.add_arguments(parser)
     return parser.parse_args()
 
 
@@ -65,21 +84,37 @@ class UnprotectedCredentialsError(Exception):
     """Raised when credentials are not adequately protected on-disk."""
 
 
+class NoCredentialsError(Exception):
+    """Raised when credentials required by the CI config are not present."""
+
+
 def generate_ssh_keys(args : argparse.Namespace):
-    args.jenkins_executor_private_key.unlink(missing_ok=True)
-    pathlib.Path(str(args.jenkins_executor_private_key) + ".pub").unlink(missing_ok=True)
-    utils.generate_ssh_key(args.jenkins_executor_private_key, args.jenkins_executor_public_key)
-    with open(args.jenkins_executor_private_key) as key_f:
-        return key_f.read()
+    return ssh_keys.ensure_key(args.jenkins_executor_private_key, args.jenkins_executor_public_key)
 
 
-def generate_casc(args : argparse.Namespace, tvm_ci_config : dict, executor_private_key: str) -> dict:
+def generate_casc(args : argparse.Namespace, tvm_ci_config : dict, executor_private_key: str,
+                  controller : typing.Optional[str] = None) -> dict:
+    """Write the CasC config of `controller` (by default the head node's) to the homedir.
+
+    Only the executors of the controller's node types are configured as its agents; see
+    tvm_ci.controllers.
+    """
     # Extra environment vars to inject. The return value of this function.
     extra_env = {}
 
     with open(args.base_casc_config) as base_config_f:
         config = yaml.safe_load(base_config_f.read())
 
+    controller_settings = controllers.controller_settings(tvm_ci_config)
+    controller_url = None
+    if controller_settings is not None:
+        controller = controller or controllers.primary_controller(controller_settings)
+        controller_url = controller_settings[controller]["url"]
+    if controller_url is not None:
+        controller_url = controller_url.rstrip("/") + "/"
+        config["unclassified"]["location"]["url"] = controller_url
+        config["unclassified"]["gitHubPluginConfig"]["hookUrl"] = f"{controller_url}github-webhook/"
+
     # Prod auth strategy will be configured later on. Use unsecured here to allow jobs to be
     # configured.
     config["jenkins"]["authorizationStrategy"] = "unsecured"
@@ -126,15 +161,35 @@ def generate_casc(args : argparse.Namespace, tvm_ci_config : dict, executor_priv
         }
 
     else:
-        if tvm_ci_config["mode"] == "prod":
+        if tvm_ci_config.get("mode") == "prod":
             raise NoCredentialsError("No GitHub credentials found and building for prod")
         _LOG.warn("No GitHub credentials found, Jenkins will not poll for changes")
 
+    artifact_manager_settings = artifact_manager.manager_settings(tvm_ci_config)
+    if artifact_manager_settings is not None:
+        s3_credential, s3_env = artifact_manager.credential(artifact_manager_settings)
+        extra_env.update(s3_env)
+        config.setdefault("credentials", {"system": {"domainCredentials": [{"credentials": []}]}})
+        config["credentials"]["system"]["domainCredentials"][0]["credentials"].append(s3_credential)
+        for section, values in artifact_manager.casc_sections(artifact_manager_settings).items():
+            config.setdefault(section, {}).update(values)
+
+    build_cache_settings = build_cache.cache_settings(tvm_ci_config)
+    git_mirror_settings = git_mirror.mirror_settings(tvm_ci_config)
     config["jenkins"]["nodes"] = []
-    for node_type, node_config in tvm_ci_config["cluster"]["nodes"].items():
+    for node_type in controllers.controller_node_types(tvm_ci_config, controller):
+        node_config = tvm_ci_config["cluster"]["nodes"][node_type]
         for i in range(node_config["num_nodes"]):
             node_name = f'{tvm_ci_config["cluster"]["name_prefix"]}jenkins-{node_type}-executor-{i}'
             node_fqdn = f'{node_name}.{tvm_ci_config["cluster"]["dns_suffix"]}'
+            node_properties = []
+            node_env = []
+            if build_cache_settings is not None:
+                node_env.extend(build_cache.node_env(build_cache_settings))
+            if git_mirror_settings is not None:
+                node_env.extend(git_mirror.node_env(git_mirror_settings))
+            if node_env:
+                node_properties.append({"envVars": {"env": node_env}})
             config["jenkins"]["nodes"].append({
                 "permanent": {
                     "labelString": " ".join(node_config["labels"]),
@@ -151,12 +206,12 @@ def generate_casc(args : argparse.Namespace, tvm_ci_config : dict, executor_priv
                     "numExecutors": node_config["num_executors"],
                     "remoteFS": "/home/jenkins",
                     "retentionStrategy": "always",
+                    **({"nodeProperties": node_properties} if node_properties else {}),
               }
           })
 
     jenkins_yaml_path = args.jenkins_homedir / "jenkins.yaml"
-    with open(jenkins_yaml_path, "w") as jenkins_yaml_f:
-        jenkins_yaml_f.write(yaml.dump(config))
+    outputs.write_if_changed(jenkins_yaml_path, yaml.dump(config))
 
     return extra_env
 
@@ -166,25 +221,129 @@ def configure_jenkins(args : argparse.Namespace, tvm_ci_config : dict, executor_
         sys.exit(f"--jenkins-homedir: file exists: {args.jenkins_homedir}")
 
     os.makedirs(args.jenkins_homedir)
-    return generate_casc(args, tvm_ci_config, executor_private_key)
-
+    return generate_casc(args, tvm_ci_config, executor_private_key, args.controller)
+
+
+def add_git_mirror_options(jobs : list, git_mirror_settings : dict) -> list:
+    """Make the git checkouts of jenkins-job-builder `jobs` borrow objects from the git mirror."""
+    for entry in jobs:
+        job = entry.get("job", entry.get("job-template")) if isinstance(entry, dict) else None
+        if job is None:
+            continue
+        for scm in job.get("scm", []):
+            for scm_type, options in scm.items():
+                if scm_type in ("git", "github"):
+                    options.update(git_mirror.scm_options(git_mirror_settings))
+    return jobs
+
+
+@contextlib.contextmanager
+def _jobs_with_git_mirror(jenkins_jobs_files : typing.List[str],
+                          git_mirror_settings : typing.Optional[dict]) -> typing.Iterator[typing.List[str]]:
+    """Yield the job files to pass to jenkins-jobs, with git mirror options when it's enabled."""
+    if git_mirror_settings is None:
+        yield jenkins_jobs_files
+        return
+
+    with tempfile.TemporaryDirectory(prefix="jenkins-jobs-") as jobs_dir:
+        jobs_files = []
+        for path in (pathlib.Path(p) for p in jenkins_jobs_files):
+            # jenkins-jobs reads the YAML files directly inside a directory.
+            sources = (sorted(p for p in path.iterdir() if p.suffix in (".yaml", ".yml"))
+                       if path.is_dir() else [path])
+            for source in sources:
+                with open(source) as source_f:
+                    jobs = yaml.safe_load(source_f)
+                jobs_files.append(str(pathlib.Path(jobs_dir) / f"{len(jobs_files)}-{source.name}"))
+                with open(jobs_files[-1], "w") as jobs_f:
+                    yaml.dump(add_git_mirror_options(jobs, git_mirror_settings), jobs_f)
+        yield jobs_files
+
+
+def render_jobs(jenkins_jobs_config_ini : str, jenkins_jobs_files : typing.List[str],
+                output_dir : pathlib.Path, git_mirror_settings : typing.Optional[dict] = None):
+    """Render job XML without a Jenkins server, as <output_dir>/<job path>/config.xml.
+
+    The XML depends only on the job files and the git mirror settings, so one rendering can be
+    uploaded to any number of clusters which share them with upload_jobs.
+    """
+    with trace.span("configure_jenkins.render_jobs"):
+        if output_dir.exists():
+            shutil.rmtree(output_dir)
+        with _jobs_with_git_mirror(jenkins_jobs_files, git_mirror_settings) as jobs_files:
+            subprocess.check_output([sys.executable, "-m", "jenkins_jobs",
+                                     "--conf", jenkins_jobs_config_ini,
+                                     "test", "--config-xml", "-o", str(output_dir),
+                                     ":".join(jobs_files)])
+
+
+@contextlib.contextmanager
+def _jobs_config_ini_for(jenkins_jobs_config_ini : str, jenkins_url : str):
+    """Yield the path to a copy of `jenkins_jobs_config_ini` which points at `jenkins_url`."""
+    config = configparser.ConfigParser()
+    config.read(jenkins_jobs_config_ini)
+    config["jenkins"]["url"] = jenkins_url
+    with tempfile.NamedTemporaryFile(mode="w", suffix=".ini") as ini_f:
+        config.write(ini_f)
+        ini_f.flush()
+        yield ini_f.name
+
+
+def upload_jobs(jenkins_url : str, xml_dir : pathlib.Path):
+    """Create or update each job rendered by render_jobs on the Jenkins at `jenkins_url`."""
+    sess = requests.Session()
+    crumb = sess.get(f"{jenkins_url}/crumbIssuer/api/json")
+    if crumb.status_code == 200:
+        sess.headers["Jenkins-Crumb"] = crumb.json()["crumb"]
+
+    # Shallowest first, so that folders exist before the jobs inside them.
+    for config_xml in sorted(xml_dir.rglob("config.xml"), key=lambda p: (len(p.parts), p)):
+        job_path = config_xml.parent.relative_to(xml_dir).parts
+        parent_url = jenkins_url + "".join(f"/job/{part}" for part in job_path[:-1])
+        job_url = f"{parent_url}/job/{job_path[-1]}"
+        headers = {"Content-Type": "application/xml"}
+        if sess.get(f"{job_url}/api/json").status_code == 404:
+            _LOG.info("Creating job %s", "/".join(job_path))
+            r = sess.post(f"{parent_url}/createItem", params={"name": job_path[-1]},
+                          data=config_xml.read_bytes(), headers=headers)
+        else:
+            _LOG.info("Updating job %s", "/".join(job_path))
+            r = sess.post(f"{job_url}/config.xml", data=config_xml.read_bytes(), headers=headers)
+        r.raise_for_status()
+
+
+def configure_jobs(args : argparse.Namespace, tvm_ci_config : dict, jenkins_url : str):
+    if args.jenkins_jobs_xml_dir is not None:
+        with trace.span("configure_jenkins.job_sync", jobs=str(args.jenkins_jobs_xml_dir)):
+            upload_jobs(jenkins_url, args.jenkins_jobs_xml_dir)
+        return
 
-def configure_jobs(args : argparse.Namespace):
     config_str = ":".join(args.jenkins_jobs_files)
 
-    subprocess.check_output([sys.executable, "-m", "jenkins_jobs",
-                             "--conf", args.jenkins_jobs_config_ini,
-                             "update", config_str])
+    with trace.span("configure_jenkins.job_sync", jobs=config_str), \
+         _jobs_config_ini_for(args.jenkins_jobs_config_ini, jenkins_url) as jenkins_jobs_config_ini, \
+         _jobs_with_git_mirror(args.jenkins_jobs_files,
+                               git_mirror.mirror_settings(tvm_ci_config)) as jobs_files:
+        subprocess.check_output([sys.executable, "-m", "jenkins_jobs",
+                                 "--conf", jenkins_jobs_config_ini,
+                                 "update", ":".join(jobs_files)])
 
 
-def set_prod_auth_strategy(args : argparse.Namespace, tvm_ci_config : dict):
-    jenkins_yaml_path = args.jenkins_homedir / "jenkins.yaml"
-    with open(jenkins_yaml_path) as jenkins_yaml_f:
-        config = yaml.safe_load(jenkins_yaml_f)
+def resolve_casc_env(config, env : dict):
+    """Return `config` with each "${VAR}" string value replaced by env["VAR"], when present."""
+    if isinstance(config, dict):
+        return {k: resolve_casc_env(v, env) for k, v in config.items()}
+    if isinstance(config, list):
+        return [resolve_casc_env(v, env) for v in config]
+    if isinstance(config, str) and config.startswith("${") and config.endswith("}"):
+        return env.get(config[2:-1], config)
+    return config
 
-    config["jenkins"]["authorizationStrategy"] = {
+
+def prod_authorization_strategy(tvm_ci_config : dict) -> dict:
+    return {
         "github": {
-            "adminUserNames": ", ".join(cluster["admin_github_usernames"]),
+            "adminUserNames": ", ".join(tvm_ci_config["jenkins"]["admin_github_usernames"]),
             "organizationNames": "",
             "allowAnonymousJobStatusPermission": True,
             "allowAnonymousReadPermission": True,
@@ -196,54 +355,157 @@ def set_prod_auth_strategy(args : argparse.Namespace, tvm_ci_config : dict):
         },
     }
 
-    with open(jenkins_yaml_path, "w") as jenkins_yaml_f:
-        jenkins_yaml_f.write(yaml.dump(config))
 
-#    _LOG.info("updating config-as-code: %r", requests.post("http://localhost:8080/configuration-as-code/reload"))
+def set_prod_auth_strategy(args : argparse.Namespace, tvm_ci_config : dict, jenkins_url : str):
+    jenkins_yaml_path = args.jenkins_homedir / "jenkins.yaml"
+    with open(jenkins_yaml_path) as jenkins_yaml_f:
+        config = yaml.safe_load(jenkins_yaml_f)
+
+    config["jenkins"]["authorizationStrategy"] = prod_authorization_strategy(tvm_ci_config)
+
+    outputs.write_if_changed(jenkins_yaml_path, yaml.dump(config))
 
     sess = requests.Session()
-    r = sess.get("http://localhost:8080/crumbIssuer/api/json")  # NOTE: no username/password needed.
+    r = sess.get(f"{jenkins_url}/crumbIssuer/api/json")  # NOTE: no username/password needed.
     r.raise_for_status()
 
-    r = sess.post("http://localhost:8080/configuration-as-code/reload",
+    r = sess.post(f"{jenkins_url}/configuration-as-code/reload",
                   headers={"Jenkins-Crumb": r.json()["crumb"]})
     r.raise_for_status()
 
 
-JENKINS_CONTAINER_NAME = 'tvm-ci-embryonic-jenkins'
+def archive_homedir(jenkins_homedir : pathlib.Path, jenkins_homedir_tar_gz : pathlib.Path):
+    """Archive the Jenkins homedir, owned by root, for the head node play to unpack."""
+    with tarfile.open(jenkins_homedir_tar_gz, "w:gz") as tf:
+        def reset(tarinfo):
+            tarinfo.uid = tarinfo.gid = 0
+            tarinfo.uname = tarinfo.gname = "root"
+            return tarinfo
+
+        tf.add(jenkins_homedir, arcname="jenkins-homedir", filter=reset)
 
 
 def main():
     args = parse_args()
     logging.basicConfig(level=args.log_level)
 
-    executor_private_key = generate_ssh_keys(args)
+    with trace.span("configure_jenkins"):
+        _main(args)
+
+
+def _homedir_inputs(args : argparse.Namespace, tvm_ci_config : dict) -> dict:
+    """Everything the homedir archive is built from, for the artifact store."""
+    inputs = {
+        # The whole tvm_ci package: generate_casc() draws on many of its modules.
+        "generator": pathlib.Path(__file__).resolve().parents[1],
+        "tvm_ci_config": args.tvm_ci_config,
+        "base_casc_config": args.base_casc_config,
+        "github_personal_access_token": args.github_personal_access_token,
+        "jenkins_executor_public_key": args.jenkins_executor_public_key,
+        "jenkins_container": args.jenkins_container,
+        "enable_prod_auth": str(args.enable_prod_auth),
+    }
+    if args.controller is not None:
+        inputs["controller"] = args.controller
+    if args.jenkins_jobs_xml_dir is not None:
+        inputs["jenkins_jobs_xml_dir"] = args.jenkins_jobs_xml_dir
+    if artifact_manager.manager_settings(tvm_ci_config) is not None:
+        # The homedir holds the bucket's keys, as a credential.
+        inputs["aws_credentials"] = utils.get_aws_credentials_path()
+    for i, jobs_file in enumerate(args.jenkins_jobs_files):
+        inputs[f"jenkins_jobs_files.{i}"] = pathlib.Path(jobs_file)
+    return inputs
+
+
+def controller_args(args : argparse.Namespace, tvm_ci_config : dict) -> typing.List[argparse.Namespace]:
+    """Return the args with which to build each controller's homedir.
+
+    Without jenkins.controllers, this is just `args`. Otherwise, each controller gets the job
+    files it owns and its own homedir, archive and CasC snapshot paths; see tvm_ci.controllers.
+    """
+    settings = controllers.controller_settings(tvm_ci_config)
+    if settings is None:
+        return [argparse.Namespace(**vars(args), controller=None)]
+
+    if args.jenkins_jobs_xml_dir is not None:
+        raise controllers.ControllerConfigError(
+            "--jenkins-jobs-xml-dir holds every job, so it can't be split between "
+            "jenkins.controllers; pass --jenkins-jobs-files instead")
+    unowned = controllers.unowned_job_files(args.jenkins_jobs_files, settings)
+    if unowned:
+        raise controllers.ControllerConfigError(
+            f"jenkins.controllers: no controller owns job files {unowned}")
+
+    def path(p, name):
+        return controllers.controller_path(pathlib.Path(p), settings, name) if p is not None else None
+
+    return [
+        argparse.Namespace(**{
+            **vars(args),
+            "controller": name,
+            "jenkins_homedir": path(args.jenkins_homedir, name),
+            "jenkins_homedir_tar_gz": path(args.jenkins_homedir_tar_gz, name),
+            "casc_snapshot": path(args.casc_snapshot, name),
+            "jenkins_jobs_files": controllers.select_job_files(args.jenkins_jobs_files,
+                                                               controller["job_files"]),
+        })
+        for name, controller in settings.items()]
+
+
+def _main(args : argparse.Namespace):
+    with trace.span("configure_jenkins.generate_ssh_keys"):
+        executor_private_key = generate_ssh_keys(args)
 
     tvm_ci_config = utils.parse_tvm_ci_config(args)
 
-    extra_env = configure_jenkins(args, tvm_ci_config, executor_private_key)
+    for homedir_args in controller_args(args, tvm_ci_config):
+        if homedir_args.controller is not None:
+            _LOG.info("Building homedir of controller %s", homedir_args.controller)
+        build_homedir(homedir_args, tvm_ci_config, executor_private_key)
+
+
+def build_homedir(args : argparse.Namespace, tvm_ci_config : dict, executor_private_key : str):
+    """Build the homedir archive and CasC snapshot of one controller, or reuse stored ones."""
+    homedir_outputs = {"jenkins-homedir.tar.gz": pathlib.Path(args.jenkins_homedir_tar_gz)}
+    if args.casc_snapshot is not None:
+        homedir_outputs["casc-snapshot.yaml"] = args.casc_snapshot
+    store = None
+    if args.artifact_store is not None:
+        store = artifact_store.ArtifactStore(args.artifact_store, args.artifact_store_max_bytes)
+        input_digests = artifact_store.digest_inputs(_homedir_inputs(args, tvm_ci_config))
+        store_key = artifact_store.input_key("configure_jenkins", input_digests)
+        if store.restore(store_key, homedir_outputs):
+            _LOG.info("Reused Jenkins homedir built from the same inputs")
+            return
+
+    with trace.span("configure_jenkins.generate_casc"):
+        extra_env = configure_jenkins(args, tvm_ci_config, executor_private_key)
     with tempfile.NamedTemporaryFile() as tf:
         for key, val in extra_env.items():
             tf.write(bytes(f"{key}={val}\n", "utf-8"))
         tf.flush()
 
-        extra_docker_opts = ["--env-file", tf.name, "--name", JENKINS_CONTAINER_NAME]
-        if args.jenkins_container_network_id:
-            extra_docker_opts.extend(["--network", args.jenkins_container_network_id])
-        with jenkins_lib.launch_jenkins(args, [], extra_docker_opts=extra_docker_opts) as container_id:
+        with jenkins_lib.launch_jenkins(args, [], extra_docker_opts=["--env-file", tf.name],
+                                        network=args.jenkins_container_network_id or None) as jenkins:
             time.sleep(5)
-            configure_jobs(args)
+            configure_jobs(args, tvm_ci_config, jenkins.url)
             if args.enable_prod_auth:
-                set_prod_auth_strategy(args, tvm_ci_config)
+                with trace.span("configure_jenkins.set_prod_auth_strategy"):
+                    set_prod_auth_strategy(args, tvm_ci_config, jenkins.url)
 
-    (args.jenkins_homedir / "jenkins.yaml").unlink()
-    with tarfile.open(args.jenkins_homedir_tar_gz, "w:gz") as tf:
-        def reset(tarinfo):
-            tarinfo.uid = tarinfo.gid = 0
-            tarinfo.uname = tarinfo.gname = "root"
-            return tarinfo
-
-        tf.add(args.jenkins_homedir, arcname="jenkins-homedir", filter=reset)
+    jenkins_yaml_path = args.jenkins_homedir / "jenkins.yaml"
+    if args.casc_snapshot is not None:
+        with open(jenkins_yaml_path) as jenkins_yaml_f:
+            final_casc = yaml.safe_load(jenkins_yaml_f)
+        outputs.write_if_changed(args.casc_snapshot,
+                                 yaml.dump(resolve_casc_env(final_casc, extra_env)), mode=0o600)
+    jenkins_yaml_path.unlink()
+    with trace.span("configure_jenkins.archive"):
+        pathlib.Path(args.jenkins_homedir_tar_gz).parent.mkdir(parents=True, exist_ok=True)
+        archive_homedir(args.jenkins_homedir, args.jenkins_homedir_tar_gz)
+
+    if store is not None:
+        store.save(store_key, "configure_jenkins", input_digests, homedir_outputs)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,248 @@
+"""Run stage commands in one long-lived crane container per workspace.
+
+crane/run.sh used to `docker run --rm` the crane image for every command, paying for container
+creation, mounts and the user setup in with_the_same_user each time. A session starts the
+container once (named after the workspace path) and runs each command with `docker exec` as the
+build user. The container's main process (crane/session-main.sh) exits, removing the container,
+after it has been idle for --idle-timeout-min. A session is restarted when the crane image or
+network is rebuilt, or when it fails its health check.
+
+Runs on the host, outside crane, so only the standard library is used here.
+"""
+
+import argparse
+import contextlib
+import fcntl
+import getpass
+import grp
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import subprocess
+import sys
+import time
+import typing
+
+
+_LOG = logging.getLogger(__name__)
+
+
+# State kept inside the session container; see crane/session-main.sh.
+SESSION_STATE_DIR = "/tmp/crane-session"
+
+
+# Seconds to wait for a new session to finish user setup.
+SESSION_START_TIMEOUT_SEC = 60
+
+
+# Environment passed to each command, in addition to the session's own environment.
+PASSTHROUGH_ENV_VARS = ("TVM_CI_TRACE_FILE", "TVM_CI_CHANGED_ARTIFACTS_FILE",
+                        "LOAD_TEST_LOCAL_PORT", "LOAD_TEST_JENKINS_USER",
+                        "LOAD_TEST_BUILDS_PER_LABEL", "RECONFIGURE_JENKINS_USER",
+                        "FORCE_PROVISION", "TERRAFORM_PLAN_MAX_AGE_MIN")
+
+
+class CraneSessionStartError(Exception):
+    """Raised when a crane session container does not become ready."""
+
+
+def session_name(workspace : pathlib.Path) -> str:
+    digest = hashlib.sha256(bytes(str(workspace.resolve()), "utf-8")).hexdigest()
+    return f"tvm-ci-crane-{digest[:12]}"
+
+
+def _docker(*args, check=True) -> subprocess.CompletedProcess:
+    return subprocess.run(["docker"] + list(args), check=check, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, encoding="utf-8")
+
+
+def _inspect(name : str) -> typing.Optional[dict]:
+    proc = _docker("inspect", "--type=container", name, check=False)
+    if proc.returncode != 0:
+        return None
+    return json.loads(proc.stdout)[0]
+
+
+def _image_id(image : str) -> str:
+    return _docker("image", "inspect", "--format={{.Id}}", image).stdout.strip()
+
+
+def _network_id(network_id_file : typing.Optional[pathlib.Path]) -> typing.Optional[str]:
+    if network_id_file is None or not network_id_file.exists():
+        return None
+    return network_id_file.read_text().strip() or None
+
+
+def is_healthy(name : str) -> bool:
+    """Return True if the session accepts commands.
+
+    The check also refreshes the session's idle timer, so a session which passes it stays up long
+    enough for the command which follows.
+    """
+    proc = _docker("exec", "--user", f"{os.getuid()}:{os.getgid()}", name, "sh", "-c",
+                   f"test -e {SESSION_STATE_DIR}/ready && touch {SESSION_STATE_DIR}/last-activity",
+                   check=False)
+    return proc.returncode == 0
+
+
+def _is_current(info : dict, image : str, network_id : typing.Optional[str]) -> bool:
+    if not info["State"]["Running"]:
+        return False
+    if info["Image"] != _image_id(image):
+        _LOG.info("Crane image was rebuilt since the session started")
+        return False
+    attached = [n["NetworkID"] for n in info["NetworkSettings"]["Networks"].values()]
+    if network_id is not None and not any(n.startswith(network_id) for n in attached):
+        _LOG.info("Crane network was recreated since the session started")
+        return False
+    return True
+
+
+def _run_session_container(name : str, workspace : pathlib.Path, image : str,
+                           network_id : typing.Optional[str], mounts : typing.List[str],
+                           idle_timeout_sec : int):
+    crane_dir = workspace / "crane"
+    docker_args = ["run", "--detach", "--rm", "--privileged", "--pid=host", "--name", name,
+                   "--label", f"tvm-ci.crane-session.workspace={workspace}",
+                   "-v", "/var/run/docker.sock:/var/run/docker.sock:rw",
+                   "-v", f"{workspace}:{workspace}",
+                   "-v", f"{crane_dir}:/docker",
+                   "-w", str(workspace),
+                   "-e", f"CI_BUILD_HOME={workspace}",
+                   "-e", f"CI_BUILD_USER={getpass.getuser()}",
+                   "-e", f"CI_BUILD_UID={os.getuid()}",
+                   "-e", f"CI_BUILD_GROUP={grp.getgrgid(os.getgid()).gr_name}",
+                   "-e", f"CI_BUILD_GID={os.getgid()}",
+                   "-e", f"CI_IMAGE_NAME={image}"]
+    if network_id is not None:
+        docker_args.append(f"--network={network_id}")
+    for mount in mounts:
+        docker_args.extend(["-v", mount])
+    docker_args.extend([image, "bash", "--login", "/docker/with_the_same_user",
+                        "/docker/session-main.sh", str(idle_timeout_sec)])
+    _docker(*docker_args)
+
+
+@contextlib.contextmanager
+def _session_lock(workspace : pathlib.Path):
+    lock_path = workspace / "build" / "crane" / "session.lock"
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "w") as lock_f:
+        fcntl.flock(lock_f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_f, fcntl.LOCK_UN)
+
+
+def start(workspace : pathlib.Path, image : str, network_id_file : typing.Optional[pathlib.Path],
+          mounts : typing.List[str], idle_timeout_sec : int) -> str:
+    """Return the name of a healthy session for `workspace`, starting one if needed."""
+    name = session_name(workspace)
+    network_id = _network_id(network_id_file)
+    with _session_lock(workspace):
+        info = _inspect(name)
+        if info is not None:
+            if _is_current(info, image, network_id) and is_healthy(name):
+                _LOG.debug("Reusing crane session %s", name)
+                return name
+            _LOG.info("Replacing crane session %s", name)
+            _docker("rm", "--force", name, check=False)
+
+        _LOG.info("Starting crane session %s", name)
+        _run_session_container(name, workspace, image, network_id, mounts, idle_timeout_sec)
+        deadline = time.monotonic() + SESSION_START_TIMEOUT_SEC
+        while not is_healthy(name):
+            if time.monotonic() > deadline or _inspect(name) is None:
+                logs = _docker("logs", name, check=False)
+                _docker("rm", "--force", name, check=False)
+                raise CraneSessionStartError(
+                    f"Crane session {name} did not become ready:\n{logs.stdout}{logs.stderr}")
+            time.sleep(0.5)
+
+    return name
+
+
+def exec_command(name : str, command : typing.List[str], cwd : pathlib.Path, home : pathlib.Path):
+    """Replace this process with `command` running in session `name`."""
+    docker_args = ["docker", "exec", "--user", f"{os.getuid()}:{os.getgid()}", "-w", str(cwd),
+                   "-e", f"HOME={home}"]
+    if sys.stdin.isatty():
+        docker_args.append("-it")
+    for var in PASSTHROUGH_ENV_VARS:
+        if var in os.environ:
+            docker_args.extend(["-e", f"{var}={os.environ[var]}"])
+    docker_args.extend([name, "bash", "--login", "/docker/session-exec.sh"] + command)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.execvp("docker", docker_args)
+
+
+def stop(workspace : pathlib.Path):
+    name = session_name(workspace)
+    with _session_lock(workspace):
+        if _inspect(name) is not None:
+            _LOG.info("Stopping crane session %s", name)
+            _docker("rm", "--force", name)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--workspace", type=pathlib.Path, required=True,
+                        help="Root of the repository checkout to mount in the session")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for command, help in (("start", "Start the session if it is not already running"),
+                          ("exec", "Run a command in the session, starting it if needed")):
+        subparser = subparsers.add_parser(command, help=help)
+        subparser.add_argument("--image", default="tvm-ci-crane:latest", help="Crane image to run")
+        subparser.add_argument("--network-id-file", type=pathlib.Path,
+                               help="File containing the ID of the docker network to attach to")
+        subparser.add_argument("--mount", action="append", default=[],
+                               help="Additional SRC:DST volume to mount. May be repeated.")
+        subparser.add_argument("--idle-timeout-min", type=float, default=30,
+                               help="Stop the session after it has run no command for this long")
+
+    exec_parser = subparsers.choices["exec"]
+    exec_parser.add_argument("--cwd", type=pathlib.Path, default=pathlib.Path.cwd(),
+                             help="Working directory for the command, inside the workspace")
+    exec_parser.add_argument("exec_command", nargs=argparse.REMAINDER,
+                             help="Command to run, after --")
+
+    subparsers.add_parser("stop", help="Stop the session")
+    subparsers.add_parser("status", help="Print whether the session is running and healthy")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level="INFO")
+    workspace = args.workspace.resolve()
+
+    if args.command in ("start", "exec"):
+        name = start(workspace, args.image, args.network_id_file, args.mount,
+                     int(args.idle_timeout_min * 60))
+        if args.command == "exec":
+            command = args.exec_command
+            if command and command[0] == "--":
+                command = command[1:]
+            if not command:
+                sys.exit("exec: no command given")
+            exec_command(name, command, args.cwd.resolve(), workspace)
+    elif args.command == "stop":
+        stop(workspace)
+    elif args.command == "status":
+        name = session_name(workspace)
+        info = _inspect(name)
+        if info is None:
+            print(f"{name}: not running")
+            sys.exit(1)
+        healthy = is_healthy(name)
+        print(f"{name}: {'healthy' if healthy else 'unhealthy'} (started {info['State']['StartedAt']})")
+        sys.exit(0 if healthy else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import argparse
+import collections
 import contextlib
 import logging
 import pathlib
@@ -6,8 +7,11 @@ import subprocess
 import threading
 import time
 import typing
+import uuid
 
 
+from .. import log_pipeline
+from .. import trace
 from .. import utils
 
 
@@ -19,8 +23,13 @@ def add_arguments(parser):
                         help="Container name to run")
     parser.add_argument("--jenkins-homedir", type=pathlib.Path,
                         help="Path to a non-existent Jenkins homedir to build.")
-    parser.add_argument("--jenkins-port", type=int, default=8080,
-                        help="Port number on local machine where the Jenkins HTTP port will be published")
+    parser.add_argument("--jenkins-port", type=int,
+                        help=("Port number on local machine where the Jenkins HTTP port will be "
+                              "published. By default, Docker picks a free port."))
+    parser.add_argument("--jenkins-container-name",
+                        help="Name of the Jenkins container. By default, a unique name is chosen.")
+    parser.add_argument("--jenkins-log-spool", type=pathlib.Path,
+                        help="If given, write the full Jenkins container log to this .gz file.")
 
 
 def container_exists(container_id):
@@ -29,28 +38,58 @@ def container_exists(container_id):
     return proc.returncode == 0
 
 
-def follow_logs(container_id : str, up_and_running : threading.Condition):
+def follow_logs(container_id : str, pipeline : log_pipeline.LogPipeline):
     proc = subprocess.Popen(["docker", "logs", "-f", container_id],
                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT, encoding="UTF-8")
-    did_set_condition = False
-    for line in proc.stdout:
-        _LOG.info("build.sh: %s", line[:-1])
-        if not did_set_condition:
-            if "Jenkins is fully up and running" in line:
-                up_and_running.acquire()
-                try:
-                    up_and_running.notify()
-                finally:
-                    up_and_running.release()
-                _LOG.info("----> Jenkins healthcheck passed")
-                did_set_condition = True
+    try:
+        pipeline.consume(proc.stdout)
+    finally:
+        proc.wait()
+        pipeline.close()
 
 
+def _notify_up_and_running(up_and_running : threading.Condition):
+    did_notify = False
+
+    def _callback(match, line):
+        nonlocal did_notify
+        if did_notify:
+            return
+
+        up_and_running.acquire()
+        try:
+            up_and_running.notify()
+        finally:
+            up_and_running.release()
+        _LOG.info("----> Jenkins healthcheck passed")
+        did_notify = True
+
+    return _callback
+
 
 def add_jenkins_args(parsed_args : argparse.Namespace, docker_args : list):
     docker_args.extend(["-v", f"{utils.get_repo_root() / 'jenkins-builder'}:/jenkins-builder"])
     docker_args.extend(["-v", f"{parsed_args.jenkins_homedir.absolute()}:/var/jenkins_home"])
-    docker_args.extend(["-p", f"{parsed_args.jenkins_port}:8080"])
+    if parsed_args.jenkins_port is not None:
+        docker_args.extend(["-p", f"{parsed_args.jenkins_port}:8080"])
+    else:
+        docker_args.extend(["-p", "8080"])
+
+
+def unique_container_name() -> str:
+    """Return a container name no other Jenkins launched by launch_jenkins uses."""
+    return f"tvm-ci-jenkins-{uuid.uuid4().hex[:12]}"
+
+
+def published_port(container_id : str, container_port : int = 8080) -> int:
+    """Return the port on the local machine where `container_port` of the container is published."""
+    mappings = str(subprocess.check_output(["docker", "port", container_id, f"{container_port}/tcp"]),
+                   "utf-8").split()
+    return int(mappings[0].rsplit(":", 1)[1])
+
+
+# A Jenkins started by launch_jenkins. `url` is its HTTP endpoint, as reachable by the caller.
+JenkinsContainer = collections.namedtuple("JenkinsContainer", ["id", "name", "url"])
 
 
 class JenkinsHealthCheckTimeoutError(Exception):
@@ -64,23 +103,55 @@ JENKINS_LAUNCH_TIMEOUT_SEC = 5 * 60
 
 @contextlib.contextmanager
 def launch_jenkins(args : argparse.Namespace, cmd_line_args : list,
-                   extra_docker_opts : typing.Optional[list] = None):
-    docker_args = (["docker", "run", "--rm", "--detach"] +
+                   extra_docker_opts : typing.Optional[list] = None,
+                   network : typing.Optional[str] = None):
+    """Run the Jenkins container until the context exits, yielding a JenkinsContainer once it's up.
+
+    Each container gets a unique name (unless --jenkins-container-name is given) and, unless
+    --jenkins-port is given, a free port, so any number of them may run on one host at once.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Parsed arguments, including those from add_arguments.
+    cmd_line_args : list
+        Arguments passed to the container's entrypoint.
+    extra_docker_opts : Optional[list]
+        Further options for `docker run`.
+    network : Optional[str]
+        If given, the Docker network to attach the container to. The caller must also be on this
+        network: the yielded URL then addresses the container by name.
+    """
+    name = args.jenkins_container_name or unique_container_name()
+    docker_args = (["docker", "run", "--rm", "--detach", "--name", name] +
+                   (["--network", network] if network is not None else []) +
                    (extra_docker_opts if extra_docker_opts is not None else []))
     add_jenkins_args(args, docker_args)
     docker_args.extend([args.jenkins_container] + cmd_line_args)
-    container_id = str(subprocess.check_output(docker_args, cwd=utils.get_repo_root())[:-1], "utf-8")
+    with trace.span("jenkins_lib.container_launch", container=args.jenkins_container):
+        container_id = str(subprocess.check_output(docker_args, cwd=utils.get_repo_root())[:-1], "utf-8")
     print('container', container_id)
     up_and_running = threading.Condition(threading.Lock())
+    pipeline = log_pipeline.LogPipeline("jenkins", logger=_LOG,
+                                        spool_path=args.jenkins_log_spool)
+    pipeline.on_match(r"Jenkins is fully up and running", _notify_up_and_running(up_and_running))
     try:
-        threading.Thread(target=follow_logs, args=(container_id, up_and_running), daemon=True).start()
+        threading.Thread(target=follow_logs, args=(container_id, pipeline), daemon=True).start()
         up_and_running.acquire()
-        did_notify = up_and_running.wait(JENKINS_LAUNCH_TIMEOUT_SEC)
-        if did_notify:
-            yield container_id
-        else:
+        with trace.span("jenkins_lib.readiness_wait"):
+            did_notify = up_and_running.wait(JENKINS_LAUNCH_TIMEOUT_SEC)
+        if not did_notify:
             raise JenkinsHealthCheckTimeoutError(
                 f"Jenkins did not pass healthcheck within {JENKINS_LAUNCH_TIMEOUT_SEC} seconds")
+        if network is not None:
+            url = f"http://{name}:8080"
+        else:
+            url = f"http://localhost:{published_port(container_id)}"
+        _LOG.info("Jenkins container %s serving %s", name, url)
+        yield JenkinsContainer(container_id, name, url)
+    except Exception:
+        pipeline.dump_tail()
+        raise
     finally:
         signal = "TERM"
         if container_exists(container_id):
@@ -0,0 +1,257 @@
+"""Apply config-only changes to a running Jenkins head node without re-provisioning it.
+
+Changing executor counts, labels or admins in the CI config otherwise means rebuilding and
+re-deploying the homedir and restarting Jenkins. Instead, this tool generates the CasC config for
+the current CI config and diffs it against the one last deployed (the --casc-snapshot written by
+configure_jenkins, recorded by 3-provision as build/artifact/secret/deployed-jenkins.yaml). Only
+the sections which changed, among nodes, credentials and the authorization strategy, are pushed
+to the head node by ansible/configure-jenkins.yml, which then triggers
+configuration-as-code/reload. Jenkins is not restarted; agents removed by the new config are
+taken offline and drained first, so no running build is interrupted.
+
+With jenkins.controllers set, each controller is diffed against its own deployed config (see
+tvm_ci.controllers.controller_path) and reloaded on its own host. No controller is reloaded unless
+every controller's changes are reloadable.
+
+Changes to any other part of the CasC config still require a full 2-apply-plan and 3-provision.
+"""
+
+import argparse
+import json
+import logging
+import pathlib
+import subprocess
+import sys
+import tempfile
+import typing
+
+import yaml
+
+from .. import controllers
+from .. import outputs
+from .. import ssh_keys
+from .. import trace
+from .. import utils
+from . import configure_jenkins
+
+
+_LOG = logging.getLogger(__name__)
+
+
+# CasC sections which reload applies in place. Each is a path of keys from the document root.
+RELOADABLE_SECTIONS = {
+    "nodes": ("jenkins", "nodes"),
+    "credentials": ("credentials",),
+    "authorization": ("jenkins", "authorizationStrategy"),
+}
+
+
+class NotReloadableError(Exception):
+    """Raised when the CasC config changed outside of RELOADABLE_SECTIONS."""
+
+
+def _get(config : dict, path : typing.Tuple[str, ...]):
+    for key in path:
+        if not isinstance(config, dict) or key not in config:
+            return None
+        config = config[key]
+    return config
+
+
+def _without_sections(config : dict) -> dict:
+    config = json.loads(json.dumps(config))
+    for path in RELOADABLE_SECTIONS.values():
+        parent = _get(config, path[:-1]) if len(path) > 1 else config
+        if isinstance(parent, dict):
+            parent.pop(path[-1], None)
+    return config
+
+
+def _differing_keys(old, new, prefix="") -> typing.List[str]:
+    if isinstance(old, dict) and isinstance(new, dict):
+        keys = []
+        for key in sorted(set(old) | set(new)):
+            keys.extend(_differing_keys(old.get(key), new.get(key), f"{prefix}{key}."))
+        return keys
+    return [] if old == new else [prefix.rstrip(".")]
+
+
+def diff_casc(deployed : dict, generated : dict) -> typing.List[str]:
+    """Return the names of the RELOADABLE_SECTIONS which differ between the configs.
+
+    Raises
+    ------
+    NotReloadableError :
+        When any other part of the config differs.
+    """
+    others = _differing_keys(_without_sections(deployed), _without_sections(generated))
+    if others:
+        raise NotReloadableError(
+            f"CasC config changed outside of {', '.join(RELOADABLE_SECTIONS)}: {', '.join(others)}")
+
+    return [name for name, path in RELOADABLE_SECTIONS.items()
+            if _get(deployed, path) != _get(generated, path)]
+
+
+def partial_casc(generated : dict, sections : typing.List[str]) -> dict:
+    """Return a CasC document holding only `sections` of `generated`."""
+    partial = {}
+    for name in sections:
+        path = RELOADABLE_SECTIONS[name]
+        parent = partial
+        for key in path[:-1]:
+            parent = parent.setdefault(key, {})
+        parent[path[-1]] = _get(generated, path)
+    return partial
+
+
+def removed_nodes(deployed : dict, generated : dict) -> typing.List[str]:
+    def names(config):
+        return {n["permanent"]["name"] for n in _get(config, RELOADABLE_SECTIONS["nodes"]) or []}
+
+    return sorted(names(deployed) - names(generated))
+
+
+def generate(args : argparse.Namespace, tvm_ci_config : dict,
+             controller : typing.Optional[str] = None) -> dict:
+    """Generate the CasC config which configure_jenkins would now deploy to `controller`.
+
+    Secrets are resolved. `controller` defaults to the head node's.
+    """
+    executor_private_key = ssh_keys.ensure_key(args.jenkins_executor_private_key)
+    with tempfile.TemporaryDirectory() as tmp:
+        casc_args = argparse.Namespace(base_casc_config=args.base_casc_config,
+                                       github_personal_access_token=args.github_personal_access_token,
+                                       jenkins_homedir=pathlib.Path(tmp))
+        extra_env = configure_jenkins.generate_casc(casc_args, tvm_ci_config, executor_private_key,
+                                                    controller)
+        with open(pathlib.Path(tmp) / "jenkins.yaml") as jenkins_yaml_f:
+            config = yaml.safe_load(jenkins_yaml_f)
+
+    if args.enable_prod_auth:
+        config["jenkins"]["authorizationStrategy"] = (
+            configure_jenkins.prod_authorization_strategy(tvm_ci_config))
+    return configure_jenkins.resolve_casc_env(config, extra_env)
+
+
+def controller_host(inventory : dict, settings : typing.Optional[typing.Dict[str, dict]],
+                    controller : typing.Optional[str]) -> str:
+    """Return the host or group running `controller` in configure_ansible's `inventory`."""
+    if controller is None or controller == controllers.primary_controller(settings):
+        return "jenkins-head-node"
+
+    hosts = inventory["all"]["children"].get("jenkins-controllers", {}).get("hosts", {})
+    for fqdn, host_vars in hosts.items():
+        if host_vars.get("jenkins_controller") == controller:
+            return fqdn
+
+    sys.exit(f"Controller {controller} is not in the Ansible inventory; re-run "
+             "stage-scripts/3-provision.sh")
+
+
+def push(args : argparse.Namespace, partial : dict, nodes_to_remove : typing.List[str],
+         deployed_casc : pathlib.Path, host : str):
+    """Push `partial` to `host` and reload it, using ansible/configure-jenkins.yml."""
+    secret_dir = deployed_casc.parent
+    partial_path = secret_dir / "casc-update.yaml"
+    outputs.write_if_changed(partial_path, yaml.dump(partial), mode=0o600)
+
+    extra_vars = {
+        "jenkins_config_path": str(partial_path.resolve()),
+        "jenkins_nodes_to_remove": nodes_to_remove,
+        "jenkins_host": host,
+    }
+    if args.jenkins_user:
+        extra_vars["jenkins_api_user"] = args.jenkins_user
+        extra_vars["jenkins_api_token"] = args.jenkins_api_token_file.read_text().strip()
+    extra_vars_path = secret_dir / "casc-update-vars.json"
+    outputs.write_if_changed(extra_vars_path, json.dumps(extra_vars), mode=0o600)
+
+    with trace.span("reconfigure.ansible_playbook", host=host, sections=",".join(partial)):
+        subprocess.check_call(
+            ["ansible-playbook", "-i", str(args.ansible_inventory_path.resolve()),
+             "-e", f"@{extra_vars_path.resolve()}", "configure-jenkins.yml"],
+            cwd=utils.get_repo_root() / "ansible")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    utils.add_tvm_ci_config_arg(parser)
+    parser.add_argument("--base-casc-config", type=pathlib.Path,
+                        default=utils.get_repo_root() / "config" / "base-jenkins.yaml",
+                        help="Path to the Configuration-as-Code yaml config.")
+    parser.add_argument("--enable-prod-auth", action="store_true",
+                        help="Generate the prod authentication strategy, as configure_jenkins does")
+    parser.add_argument("--github-personal-access-token", type=pathlib.Path,
+                        default=utils.get_repo_root() / "config" / "secrets" / "github-personal-access-token",
+                        help="Path to a file containing a GitHub Personal Access Token")
+    parser.add_argument("--jenkins-executor-private-key", type=pathlib.Path,
+                        default=utils.get_repo_root() / "build" / "executor-ssh-key",
+                        help="Path to the executor private key")
+    parser.add_argument("--deployed-casc", type=pathlib.Path,
+                        default=utils.get_repo_root() / "build" / "artifact" / "secret" / "deployed-jenkins.yaml",
+                        help=("The CasC config currently deployed on the head node; updated after "
+                              "a successful reload. Other controllers' are beside it, under "
+                              "controllers/<name>"))
+    parser.add_argument("--ansible-inventory-path", type=pathlib.Path,
+                        default=utils.get_repo_root() / "build" / "ansible-inventory.yml",
+                        help="Ansible inventory written by configure_ansible")
+    parser.add_argument("--jenkins-user",
+                        help="Jenkins admin to authenticate as. Needed once prod auth is enabled.")
+    parser.add_argument("--jenkins-api-token-file", type=pathlib.Path,
+                        default=utils.get_repo_root() / "config" / "secrets" / "jenkins-api-token",
+                        help="File containing --jenkins-user's API token")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only print which sections would be pushed")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level="INFO")
+
+    tvm_ci_config = utils.parse_tvm_ci_config(args)
+    settings = controllers.controller_settings(tvm_ci_config)
+    names = list(settings) if settings is not None else [None]
+
+    updates = []
+    for name in names:
+        deployed_casc = controllers.controller_path(args.deployed_casc, settings, name)
+        label = f"Controller {name}" if settings is not None else "Head node"
+        if not deployed_casc.exists():
+            sys.exit(f"No record of the CasC config deployed at {deployed_casc}; run "
+                     "stage-scripts/2-apply-plan.sh and 3-provision.sh first.")
+
+        with open(deployed_casc) as deployed_f:
+            deployed = yaml.safe_load(deployed_f)
+        generated = generate(args, tvm_ci_config, name)
+
+        try:
+            sections = diff_casc(deployed, generated)
+        except NotReloadableError as e:
+            sys.exit(f"{label}: {e}\nThis change needs a full 2-apply-plan and 3-provision.")
+
+        if not sections:
+            _LOG.info("%s: deployed CasC config is up-to-date", label)
+            continue
+
+        nodes_to_remove = removed_nodes(deployed, generated)
+        _LOG.info("%s: changed sections: %s", label, ", ".join(sections))
+        if nodes_to_remove:
+            _LOG.info("%s: agents to drain and remove: %s", label, ", ".join(nodes_to_remove))
+        updates.append((name, label, deployed_casc, generated, sections, nodes_to_remove))
+
+    if args.dry_run or not updates:
+        return
+
+    with open(args.ansible_inventory_path) as inventory_f:
+        inventory = yaml.safe_load(inventory_f)
+    for name, label, deployed_casc, generated, sections, nodes_to_remove in updates:
+        push(args, partial_casc(generated, sections), nodes_to_remove, deployed_casc,
+             controller_host(inventory, settings, name))
+        outputs.write_if_changed(deployed_casc, yaml.dump(generated), mode=0o600)
+        _LOG.info("%s: reloaded CasC config", label)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,8 +11,8 @@ def main():
     args = parser.parse_args()
     logging.basicConfig(level="INFO")
 
-    with jenkins_lib.launch_jenkins(args, []):
-        print("Press Ctrl+C to exit Jenkins")
+    with jenkins_lib.launch_jenkins(args, []) as jenkins:
+        print(f"Jenkins is at {jenkins.url}. Press Ctrl+C to exit Jenkins")
         while True:
             time.sleep(1)
 
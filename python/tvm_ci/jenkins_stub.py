@@ -0,0 +1,423 @@
+"""A local stand-in for the parts of the Jenkins HTTP API used by the tvm_ci tools.
+
+The stub models the executor nodes described by a CI config (the same nodes generate_casc()
+produces) and simulates pipeline builds: a build leaves the controller queue, waits for a free
+executor on its label, runs a "checkout" stage and a "work" stage, then releases the executor.
+It implements just enough of the API for load_test.py and other tools to be exercised without a
+real cluster:
+
+    GET  /crumbIssuer/api/json
+    POST /createItem?name=<job>                  (pipeline config.xml; label from node('...'))
+    GET  /job/<job>/api/json
+    POST /job/<job>/config.xml
+    POST /job/<job>/build, /job/<job>/buildWithParameters
+    GET  /queue/api/json, /queue/item/<id>/api/json
+    GET  /job/<job>/<n>/api/json, /job/<job>/<n>/wfapi/describe
+    GET  /computer/api/json, /api/json
+"""
+
+import argparse
+import collections
+import http.server
+import json
+import logging
+import re
+import threading
+import time
+import typing
+import urllib.parse
+
+import yaml
+
+
+_LOG = logging.getLogger(__name__)
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class StubJenkins:
+    """Simulated Jenkins controller state. All public methods are thread-safe."""
+
+    def __init__(self, nodes : typing.List[dict], controller_delay_sec : float = 0.1,
+                 pickup_sec : float = 0.5, checkout_sec : float = 1.0, build_sec : float = 2.0):
+        """Create the stub.
+
+        Parameters
+        ----------
+        nodes : list[dict]
+            Executor nodes, each with keys "name", "labels" (list of str), "num_executors" and
+            optionally "offline".
+        controller_delay_sec : float
+            Time a build spends in the controller queue before it starts.
+        pickup_sec : float
+            Time between an executor becoming assigned and the build's first stage starting.
+        checkout_sec, build_sec : float
+            Durations of the simulated "checkout" and "work" stages.
+        """
+        self.nodes = [dict(n, busy=0, offline=n.get("offline", False)) for n in nodes]
+        self.controller_delay_sec = controller_delay_sec
+        self.pickup_sec = pickup_sec
+        self.checkout_sec = checkout_sec
+        self.build_sec = build_sec
+
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._queue = collections.OrderedDict()
+        self._next_queue_id = 1
+        self._waiting_for_node = []
+        self._running = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_tvm_ci_config(cls, tvm_ci_config : dict, **kw):
+        nodes = []
+        for node_type, node_config in tvm_ci_config["cluster"]["nodes"].items():
+            for i in range(node_config["num_nodes"]):
+                nodes.append({
+                    "name": f'{tvm_ci_config["cluster"]["name_prefix"]}jenkins-{node_type}-executor-{i}',
+                    "labels": list(node_config["labels"]),
+                    "num_executors": node_config["num_executors"],
+                })
+        return cls(nodes, **kw)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run_scheduler, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    # Jobs and builds --------------------------------------------------------------------------
+
+    def create_job(self, name : str, config_xml : str):
+        m = re.search(r"node\(\s*['\"]([^'\"]+)['\"]\s*\)", config_xml)
+        with self._lock:
+            job = self._jobs.setdefault(name, {"name": name, "next_build": 1, "builds": {}})
+            job["config_xml"] = config_xml
+            job["label"] = m.group(1) if m else None
+
+    def has_job(self, name : str) -> bool:
+        with self._lock:
+            return name in self._jobs
+
+    def enqueue(self, job_name : str, params : dict) -> int:
+        with self._lock:
+            if job_name not in self._jobs:
+                raise KeyError(job_name)
+
+            queue_id = self._next_queue_id
+            self._next_queue_id += 1
+            now = _now_ms()
+            self._queue[queue_id] = {
+                "id": queue_id,
+                "job": job_name,
+                "params": params,
+                "inQueueSince": now,
+                "buildableStartMilliseconds": now,
+                "executable": None,
+                "cancelled": False,
+            }
+            return queue_id
+
+    def _start_build(self, item : dict, now : int):
+        job = self._jobs[item["job"]]
+        number = job["next_build"]
+        job["next_build"] += 1
+        build = {
+            "number": number,
+            "job": job["name"],
+            "label": job["label"],
+            "timestamp": now,
+            "duration": 0,
+            "building": True,
+            "result": None,
+            "node": None,
+            "stages": [],
+            "waitingSince": now,
+        }
+        job["builds"][number] = build
+        item["executable"] = {"number": number,
+                              "url": f"/job/{job['name']}/{number}/"}
+        self._waiting_for_node.append(build)
+
+    def _find_free_node(self, label : typing.Optional[str]):
+        for node in self.nodes:
+            if node["offline"] or node["busy"] >= node["num_executors"]:
+                continue
+            if label is None or label in node["labels"]:
+                return node
+        return None
+
+    def _run_scheduler(self):
+        while not self._stop.wait(0.02):
+            with self._lock:
+                self._tick(_now_ms())
+
+    def _tick(self, now : int):
+        for item in list(self._queue.values()):
+            if (item["executable"] is None and
+                now - item["inQueueSince"] >= self.controller_delay_sec * 1000):
+                self._start_build(item, now)
+
+        for build in list(self._waiting_for_node):
+            node = self._find_free_node(build["label"])
+            if node is None:
+                continue
+
+            node["busy"] += 1
+            build["node"] = node["name"]
+            checkout_start = now + int(self.pickup_sec * 1000)
+            work_start = checkout_start + int(self.checkout_sec * 1000)
+            build["stages"] = [
+                {"name": "checkout", "startTimeMillis": checkout_start,
+                 "durationMillis": int(self.checkout_sec * 1000), "status": "SUCCESS"},
+                {"name": "work", "startTimeMillis": work_start,
+                 "durationMillis": int(self.build_sec * 1000), "status": "SUCCESS"},
+            ]
+            build["endsAt"] = work_start + int(self.build_sec * 1000)
+            self._waiting_for_node.remove(build)
+            self._running.append((build, node))
+
+        for build, node in list(self._running):
+            if now >= build["endsAt"]:
+                node["busy"] -= 1
+                build["building"] = False
+                build["result"] = "SUCCESS"
+                build["duration"] = build["endsAt"] - build["timestamp"]
+                self._running.remove((build, node))
+
+        # Jenkins drops queue items some time after they start; keep them for polling clients.
+        for queue_id, item in list(self._queue.items()):
+            if item["executable"] is not None and now - item["inQueueSince"] > 5 * 60 * 1000:
+                del self._queue[queue_id]
+
+    # API views ---------------------------------------------------------------------------------
+
+    def queue_item_json(self, queue_id : int) -> typing.Optional[dict]:
+        with self._lock:
+            item = self._queue.get(queue_id)
+            if item is None:
+                return None
+            return {
+                "id": item["id"],
+                "inQueueSince": item["inQueueSince"],
+                "buildableStartMilliseconds": item["buildableStartMilliseconds"],
+                "cancelled": item["cancelled"],
+                "executable": item["executable"],
+                "task": {"name": item["job"]},
+            }
+
+    def queue_json(self) -> dict:
+        with self._lock:
+            items = [
+                {"id": item["id"], "inQueueSince": item["inQueueSince"],
+                 "task": {"name": item["job"]}, "why": "In the quiet period"}
+                for item in self._queue.values() if item["executable"] is None]
+            # Pipeline node() blocks waiting for an executor show up as separate queue items.
+            items.extend(
+                {"id": -b["number"], "inQueueSince": b["waitingSince"],
+                 "task": {"name": f"part of {b['job']} #{b['number']}"},
+                 "why": f"Waiting for next available executor on {b['label']}"}
+                for b in self._waiting_for_node)
+            return {"items": items}
+
+    def _build_json(self, build : dict) -> dict:
+        return {k: build[k] for k in ("number", "timestamp", "duration", "building", "result")}
+
+    def build_json(self, job_name : str, number : int) -> typing.Optional[dict]:
+        with self._lock:
+            build = self._jobs.get(job_name, {}).get("builds", {}).get(number)
+            return None if build is None else dict(self._build_json(build),
+                                                   builtOn=build["node"] or "")
+
+    def build_describe_json(self, job_name : str, number : int) -> typing.Optional[dict]:
+        with self._lock:
+            build = self._jobs.get(job_name, {}).get("builds", {}).get(number)
+            if build is None:
+                return None
+
+            now = _now_ms()
+            return {"id": str(number),
+                    "status": "IN_PROGRESS" if build["building"] else build["result"],
+                    "stages": [s for s in build["stages"] if s["startTimeMillis"] <= now]}
+
+    def jobs_json(self) -> dict:
+        with self._lock:
+            return {"jobs": [
+                {"name": job["name"],
+                 "builds": [self._build_json(b) for b in sorted(
+                     job["builds"].values(), key=lambda b: -b["number"])]}
+                for job in self._jobs.values()]}
+
+    def computer_json(self) -> dict:
+        with self._lock:
+            computers = []
+            for node in self.nodes:
+                computers.append({
+                    "displayName": node["name"],
+                    "offline": node["offline"],
+                    "idle": node["busy"] == 0,
+                    "numExecutors": node["num_executors"],
+                    "assignedLabels": [{"name": l} for l in node["labels"] + [node["name"]]],
+                    "executors": [{"idle": i >= node["busy"]} for i in range(node["num_executors"])],
+                })
+            return {
+                "busyExecutors": sum(n["busy"] for n in self.nodes),
+                "totalExecutors": sum(n["num_executors"] for n in self.nodes),
+                "computer": computers,
+            }
+
+
+_BUILD_PATH_RE = re.compile(r"^/job/(?P<job>[^/]+)/(?P<number>[0-9]+)/(?P<api>api/json|wfapi/describe)$")
+
+
+_JOB_PATH_RE = re.compile(r"^/job/(?P<job>[^/]+)/(?P<action>build|buildWithParameters|config\.xml)$")
+
+
+_JOB_API_PATH_RE = re.compile(r"^/job/(?P<job>[^/]+)/api/json$")
+
+
+_QUEUE_ITEM_PATH_RE = re.compile(r"^/queue/item/(?P<id>[0-9]+)/api/json$")
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    # Set by serve().
+    jenkins = None
+
+    def log_message(self, format, *args):
+        _LOG.debug("%s - %s", self.address_string(), format % args)
+
+    def _send_json(self, obj, status=200):
+        body = bytes(json.dumps(obj), "utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_status(self, status, headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        path = url.path.rstrip("/")
+        if path == "/crumbIssuer/api/json":
+            return self._send_json({"crumb": "stub-crumb", "crumbRequestField": "Jenkins-Crumb"})
+        if path == "/api/json":
+            return self._send_json(self.jenkins.jobs_json())
+        if path == "/computer/api/json":
+            return self._send_json(self.jenkins.computer_json())
+        if path == "/queue/api/json":
+            return self._send_json(self.jenkins.queue_json())
+
+        m = _QUEUE_ITEM_PATH_RE.match(path)
+        if m:
+            item = self.jenkins.queue_item_json(int(m.group("id")))
+            return self._send_json(item) if item is not None else self._send_status(404)
+
+        m = _JOB_API_PATH_RE.match(path)
+        if m:
+            if not self.jenkins.has_job(m.group("job")):
+                return self._send_status(404)
+            return self._send_json({"name": m.group("job")})
+
+        m = _BUILD_PATH_RE.match(path)
+        if m:
+            if m.group("api") == "api/json":
+                build = self.jenkins.build_json(m.group("job"), int(m.group("number")))
+            else:
+                build = self.jenkins.build_describe_json(m.group("job"), int(m.group("number")))
+            return self._send_json(build) if build is not None else self._send_status(404)
+
+        self._send_status(404)
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        path = url.path.rstrip("/")
+        query = dict(urllib.parse.parse_qsl(url.query))
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        if path == "/createItem":
+            if self.jenkins.has_job(query["name"]):
+                return self._send_status(400)
+            self.jenkins.create_job(query["name"], str(body, "utf-8"))
+            return self._send_status(200)
+
+        m = _JOB_PATH_RE.match(path)
+        if m:
+            if not self.jenkins.has_job(m.group("job")):
+                return self._send_status(404)
+
+            if m.group("action") == "config.xml":
+                self.jenkins.create_job(m.group("job"), str(body, "utf-8"))
+                return self._send_status(200)
+
+            params = dict(query, **dict(urllib.parse.parse_qsl(str(body, "utf-8"))))
+            queue_id = self.jenkins.enqueue(m.group("job"), params)
+            host = self.headers.get("Host", "localhost")
+            return self._send_status(201, {"Location": f"http://{host}/queue/item/{queue_id}/"})
+
+        self._send_status(404)
+
+
+def serve(jenkins : StubJenkins, host : str = "localhost", port : int = 0) -> http.server.ThreadingHTTPServer:
+    """Start serving `jenkins` in a background thread. Returns the server; use server_address."""
+    handler = type("Handler", (_Handler,), {"jenkins": jenkins})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    jenkins.start()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run a local Jenkins API stub")
+    parser.add_argument("--tvm-ci-config", required=True,
+                        help="CI config yaml describing the executor nodes to simulate")
+    parser.add_argument("--host", default="localhost", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    parser.add_argument("--controller-delay-sec", type=float, default=0.1,
+                        help="Time each build spends in the controller queue")
+    parser.add_argument("--pickup-sec", type=float, default=0.5,
+                        help="Simulated executor pickup latency")
+    parser.add_argument("--checkout-sec", type=float, default=1.0,
+                        help="Simulated duration of the checkout stage")
+    parser.add_argument("--build-sec", type=float, default=2.0,
+                        help="Simulated duration of the work stage")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level="INFO")
+
+    with open(args.tvm_ci_config) as config_f:
+        tvm_ci_config = yaml.safe_load(config_f)
+
+    jenkins = StubJenkins.from_tvm_ci_config(
+        tvm_ci_config, controller_delay_sec=args.controller_delay_sec, pickup_sec=args.pickup_sec,
+        checkout_sec=args.checkout_sec, build_sec=args.build_sec)
+    server = serve(jenkins, args.host, args.port)
+    _LOG.info("Jenkins stub listening on http://%s:%d", *server.server_address[:2])
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        jenkins.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""Measure whether a Jenkins cluster can actually run builds, and how fast.
+
+For each node type in the CI config, this tool creates a synthetic pipeline job pinned to that
+node type's first label, submits --builds-per-label builds at once through the Jenkins API, and
+waits for them to finish. For each build it measures:
+
+ - queue wait: submission until the build leaves the controller queue;
+ - pickup latency: build start until an executor on the label runs the first stage;
+ - checkout time: duration of the "checkout" stage (a shallow clone of --checkout-repo).
+
+Throughput per node type is the number of completed builds per minute of wall time. The results
+are written as JSON to --report and compared against the given thresholds; the process exits
+non-zero when any threshold is violated.
+
+With jenkins.controllers set, each controller only has the executors of its own node types, so
+only those are tested; pass --controller with the --jenkins-url of any controller but the primary.
+
+Use `python -m tvm_ci.jenkins_stub` to run against a local stand-in for Jenkins.
+"""
+
+import argparse
+import json
+import logging
+import pathlib
+import sys
+import time
+import typing
+import xml.sax.saxutils
+
+import requests
+
+from . import controllers
+from . import trace
+from . import utils
+
+
+_LOG = logging.getLogger(__name__)
+
+
+JOB_NAME_PREFIX = "tvm-ci-loadtest-"
+
+
+JOB_CONFIG_TEMPLATE = """<?xml version='1.1' encoding='UTF-8'?>
+<flow-definition plugin="workflow-job">
+  <description>Synthetic load-test job generated by tvm_ci.load_test. Safe to delete.</description>
+  <keepDependencies>false</keepDependencies>
+  <properties>
+    <hudson.model.ParametersDefinitionProperty>
+      <parameterDefinitions>
+        <hudson.model.StringParameterDefinition>
+          <name>LOADTEST_ID</name>
+          <defaultValue></defaultValue>
+          <trim>true</trim>
+        </hudson.model.StringParameterDefinition>
+      </parameterDefinitions>
+    </hudson.model.ParametersDefinitionProperty>
+  </properties>
+  <definition class="org.jenkinsci.plugins.workflow.cps.CpsFlowDefinition" plugin="workflow-cps">
+    <script>{script}</script>
+    <sandbox>true</sandbox>
+  </definition>
+  <disabled>false</disabled>
+</flow-definition>
+"""
+
+
+PIPELINE_SCRIPT_TEMPLATE = """node('{label}') {{
+  stage('checkout') {{
+    checkout([$class: 'GitSCM', branches: [[name: '{branch}']],
+              extensions: [[$class: 'CloneOption', shallow: true, depth: 1, noTags: true]],
+              userRemoteConfigs: [[url: '{repo}']]])
+  }}
+  stage('work') {{
+    sh 'sleep {work_sec}'
+  }}
+}}
+"""
+
+
+class LoadTestTimeoutError(Exception):
+    """Raised when submitted builds do not finish within --timeout-sec."""
+
+
+class JenkinsClient:
+    """Minimal Jenkins REST client which handles crumbs and optional API token auth."""
+
+    def __init__(self, url : str, user : typing.Optional[str] = None,
+                 api_token : typing.Optional[str] = None):
+        self.url = url.rstrip("/")
+        self.session = requests.Session()
+        if user is not None:
+            self.session.auth = (user, api_token)
+        self._crumb_headers = None
+
+    def _crumb(self) -> dict:
+        if self._crumb_headers is None:
+            r = self.session.get(f"{self.url}/crumbIssuer/api/json")
+            if r.status_code == 404:
+                # CSRF protection disabled.
+                self._crumb_headers = {}
+            else:
+                r.raise_for_status()
+                self._crumb_headers = {r.json()["crumbRequestField"]: r.json()["crumb"]}
+        return self._crumb_headers
+
+    def get_json(self, path : str) -> typing.Optional[dict]:
+        r = self.session.get(f"{self.url}{path}")
+        if r.status_code == 404:
+            return None
+        r.raise_for_status()
+        return r.json()
+
+    def post(self, path : str, **kw) -> requests.Response:
+        headers = dict(kw.pop("headers", {}), **self._crumb())
+        r = self.session.post(f"{self.url}{path}", headers=headers, **kw)
+        r.raise_for_status()
+        return r
+
+
+def _percentiles(values : typing.List[float]) -> dict:
+    if not values:
+        return {"count": 0}
+
+    ordered = sorted(values)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+    return {"count": len(ordered), "p50": pct(50), "p95": pct(95), "max": ordered[-1]}
+
+
+def create_job(client : JenkinsClient, job_name : str, label : str, args : argparse.Namespace):
+    script = PIPELINE_SCRIPT_TEMPLATE.format(label=label, branch=args.checkout_branch,
+                                             repo=args.checkout_repo, work_sec=args.work_sec)
+    config_xml = JOB_CONFIG_TEMPLATE.format(script=xml.sax.saxutils.escape(script))
+    headers = {"Content-Type": "application/xml"}
+    if client.get_json(f"/job/{job_name}/api/json") is None:
+        client.post(f"/createItem?name={job_name}", data=config_xml, headers=headers)
+    else:
+        client.post(f"/job/{job_name}/config.xml", data=config_xml, headers=headers)
+
+
+def submit_builds(client : JenkinsClient, job_name : str, count : int, run_id : str) -> typing.List[dict]:
+    submissions = []
+    for i in range(count):
+        submitted_ms = int(time.time() * 1000)
+        # A distinct parameter value per build keeps Jenkins from coalescing queued builds.
+        r = client.post(f"/job/{job_name}/buildWithParameters",
+                        params={"LOADTEST_ID": f"{run_id}-{i}"})
+        queue_path = r.headers["Location"].split("/queue/", 1)[1].rstrip("/")
+        submissions.append({"job": job_name, "queue_item": f"/queue/{queue_path}/api/json",
+                            "submitted_ms": submitted_ms, "build": None, "result": None})
+    return submissions
+
+
+def _poll(client : JenkinsClient, submission : dict) -> bool:
+    """Update `submission` from Jenkins. Returns True once the build has finished."""
+    if submission["build"] is None:
+        item = client.get_json(submission["queue_item"])
+        if item is None or item.get("cancelled"):
+            submission["result"] = "CANCELLED"
+            return True
+        if not item.get("executable"):
+            return False
+        submission["build"] = item["executable"]["number"]
+
+    build_path = f"/job/{submission['job']}/{submission['build']}"
+    build = client.get_json(f"{build_path}/api/json")
+    if build is None or build["building"]:
+        return False
+
+    submission["result"] = build["result"]
+    submission["started_ms"] = build["timestamp"]
+    submission["finished_ms"] = build["timestamp"] + build["duration"]
+    describe = client.get_json(f"{build_path}/wfapi/describe") or {}
+    for stage in describe.get("stages", []):
+        if stage["name"] == "checkout":
+            submission["checkout_start_ms"] = stage["startTimeMillis"]
+            submission["checkout_ms"] = stage["durationMillis"]
+    return True
+
+
+def wait_for_builds(client : JenkinsClient, submissions : typing.List[dict], timeout_sec : float,
+                    poll_interval_sec : float):
+    deadline = time.monotonic() + timeout_sec
+    pending = list(submissions)
+    while pending:
+        pending = [s for s in pending if not _poll(client, s)]
+        if not pending:
+            break
+        if time.monotonic() > deadline:
+            raise LoadTestTimeoutError(f"{len(pending)} builds did not finish within {timeout_sec}s")
+        _LOG.info("Waiting on %d builds", len(pending))
+        time.sleep(poll_interval_sec)
+
+
+def summarize(submissions : typing.List[dict]) -> dict:
+    completed = [s for s in submissions if s["result"] == "SUCCESS"]
+    queue_wait = [(s["started_ms"] - s["submitted_ms"]) / 1000.0 for s in completed]
+    pickup = [(s["checkout_start_ms"] - s["started_ms"]) / 1000.0
+              for s in completed if "checkout_start_ms" in s]
+    checkout = [s["checkout_ms"] / 1000.0 for s in completed if "checkout_ms" in s]
+
+    throughput = 0.0
+    if completed:
+        wall_sec = (max(s["finished_ms"] for s in completed) -
+                    min(s["submitted_ms"] for s in submissions)) / 1000.0
+        throughput = 60.0 * len(completed) / max(wall_sec, 1e-3)
+
+    return {
+        "builds": len(submissions),
+        "completed": len(completed),
+        "failed": len(submissions) - len(completed),
+        "queue_wait_sec": _percentiles(queue_wait),
+        "pickup_sec": _percentiles(pickup),
+        "checkout_sec": _percentiles(checkout),
+        "throughput_per_min": throughput,
+    }
+
+
+def check_thresholds(results : dict, args : argparse.Namespace) -> typing.List[str]:
+    violations = []
+    for node_type, r in results.items():
+        if r["failed"]:
+            violations.append(f"{node_type}: {r['failed']} builds did not succeed")
+        for key, limit in (("queue_wait_sec", args.max_p95_queue_wait_sec),
+                           ("pickup_sec", args.max_p95_pickup_sec),
+                           ("checkout_sec", args.max_p95_checkout_sec)):
+            p95 = r[key].get("p95")
+            if limit is not None and p95 is not None and p95 > limit:
+                violations.append(f"{node_type}: p95 {key} {p95:.1f} > {limit:.1f}")
+        if (args.min_throughput_per_min is not None and
+            r["throughput_per_min"] < args.min_throughput_per_min):
+            violations.append(f"{node_type}: throughput {r['throughput_per_min']:.2f}/min < "
+                              f"{args.min_throughput_per_min:.2f}/min")
+    return violations
+
+
+def run_load_test(client : JenkinsClient, tvm_ci_config : dict, args : argparse.Namespace) -> dict:
+    run_id = str(int(time.time()))
+    submissions_by_type = {}
+    labels = {}
+    controller_node_types = controllers.controller_node_types(tvm_ci_config, args.controller)
+    for node_type, node_config in tvm_ci_config["cluster"]["nodes"].items():
+        if node_type not in controller_node_types or node_config["num_nodes"] == 0:
+            continue
+        if args.node_type and node_type not in args.node_type:
+            continue
+
+        labels[node_type] = node_config["labels"][0]
+        job_name = f"{JOB_NAME_PREFIX}{node_type}"
+        create_job(client, job_name, labels[node_type], args)
+
+    # Submit everything before waiting so that node types are exercised concurrently.
+    with trace.span("load_test.submit"):
+        for node_type in labels:
+            submissions_by_type[node_type] = submit_builds(
+                client, f"{JOB_NAME_PREFIX}{node_type}", args.builds_per_label, run_id)
+
+    with trace.span("load_test.wait"):
+        wait_for_builds(client, [s for subs in submissions_by_type.values() for s in subs],
+                        args.timeout_sec, args.poll_interval_sec)
+
+    results = {}
+    for node_type, submissions in submissions_by_type.items():
+        results[node_type] = dict(summarize(submissions), label=labels[node_type])
+
+    violations = check_thresholds(results, args)
+    return {
+        "jenkins_url": client.url,
+        "controller": args.controller,
+        "run_id": run_id,
+        "builds_per_label": args.builds_per_label,
+        "thresholds": {
+            "max_p95_queue_wait_sec": args.max_p95_queue_wait_sec,
+            "max_p95_pickup_sec": args.max_p95_pickup_sec,
+            "max_p95_checkout_sec": args.max_p95_checkout_sec,
+            "min_throughput_per_min": args.min_throughput_per_min,
+        },
+        "node_types": results,
+        "violations": violations,
+        "passed": not violations,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    utils.add_tvm_ci_config_arg(parser)
+    parser.add_argument("--jenkins-url", default="http://localhost:8080",
+                        help="Base URL of the Jenkins controller")
+    parser.add_argument("--jenkins-user", help="Jenkins user to authenticate as")
+    parser.add_argument("--jenkins-api-token-file", type=pathlib.Path,
+                        help="Path to a file containing the API token for --jenkins-user")
+    parser.add_argument("--controller",
+                        help="Name of the controller at --jenkins-url, among jenkins.controllers. "
+                        "Defaults to the primary.")
+    parser.add_argument("--node-type", action="append",
+                        help="Only test this node type (e.g. cpu). May be repeated.")
+    parser.add_argument("--builds-per-label", type=int, default=4,
+                        help="Number of builds to submit per node type")
+    parser.add_argument("--checkout-repo", default="https://github.com/apache/tvm",
+                        help="Repository shallow-cloned by the checkout stage")
+    parser.add_argument("--checkout-branch", default="main",
+                        help="Branch shallow-cloned by the checkout stage")
+    parser.add_argument("--work-sec", type=int, default=10,
+                        help="Duration of the synthetic work stage")
+    parser.add_argument("--timeout-sec", type=float, default=30 * 60,
+                        help="Give up if builds have not finished after this long")
+    parser.add_argument("--poll-interval-sec", type=float, default=5.0,
+                        help="Interval between polls of the Jenkins API")
+    parser.add_argument("--max-p95-queue-wait-sec", type=float, help="Fail above this p95 queue wait")
+    parser.add_argument("--max-p95-pickup-sec", type=float, help="Fail above this p95 pickup latency")
+    parser.add_argument("--max-p95-checkout-sec", type=float, help="Fail above this p95 checkout time")
+    parser.add_argument("--min-throughput-per-min", type=float,
+                        help="Fail below this many completed builds per minute, per node type")
+    parser.add_argument("--report", type=pathlib.Path, required=True,
+                        help="Path to the JSON report to write")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level="INFO")
+    tvm_ci_config = utils.parse_tvm_ci_config(args)
+    if args.controller is not None and args.controller not in (
+            controllers.controller_settings(tvm_ci_config) or {}):
+        sys.exit(f"Controller {args.controller} is not in jenkins.controllers")
+
+    api_token = None
+    if args.jenkins_api_token_file is not None:
+        with open(args.jenkins_api_token_file) as token_f:
+            api_token = token_f.read().strip()
+
+    client = JenkinsClient(args.jenkins_url, args.jenkins_user, api_token)
+    with trace.span("load_test"):
+        report = run_load_test(client, tvm_ci_config, args)
+
+    args.report.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.report, "w") as report_f:
+        json.dump(report, report_f, indent=2, sort_keys=True)
+
+    for node_type, r in report["node_types"].items():
+        _LOG.info("%s (%s): %d/%d succeeded, p95 queue wait %s, p95 pickup %s, p95 checkout %s, "
+                  "%.2f builds/min", node_type, r["label"], r["completed"], r["builds"],
+                  r["queue_wait_sec"].get("p95"), r["pickup_sec"].get("p95"),
+                  r["checkout_sec"].get("p95"), r["throughput_per_min"])
+    for violation in report["violations"]:
+        _LOG.error("Threshold violated: %s", violation)
+
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Run a cluster's head node and executors as containers on one machine, instead of on AWS.
+
+`up` turns the CI config into one privileged container per node, each running systemd, sshd and
+Docker like the Ubuntu AMIs. The containers join the crane network under the FQDNs Terraform
+would give the nodes, as network aliases, so Jenkins reaches its agents by the same names. Their
+addresses are written to a file in the format of `terraform output -json`, which configure_ansible
+reads in place of the real one. configure_jenkins, the playbook and a smoke build then run
+unchanged; stage-scripts/local-cluster.sh runs them all:
+
+    stage-scripts/local-cluster.sh up
+    stage-scripts/local-cluster.sh down
+
+The containers are privileged and share the host's cgroup hierarchy, so they have root-level
+access to the host; only run them on a machine dedicated to this.
+
+No AWS access is needed, so features which store data in S3 (jenkins.artifact_manager,
+jenkins.homedir_snapshot) should point at a local `endpoint` or be left out of the CI config.
+"""
+
+import argparse
+import concurrent.futures
+import json
+import logging
+import pathlib
+import subprocess
+import time
+import typing
+
+from . import controllers
+from . import outputs
+from . import ssh_keys
+from . import trace
+from . import utils
+
+
+_LOG = logging.getLogger(__name__)
+
+
+NODE_IMAGE = "tvm-ci-local-node:latest"
+
+
+# Label on every node container, set to the cluster's name_prefix; `down` removes by it.
+CLUSTER_LABEL = "tvm-ci.local-cluster"
+
+
+class NodeNotReadyError(Exception):
+    """Raised when a node container's Docker daemon doesn't come up in time."""
+
+
+def _docker(*args, check=True, **kwargs) -> subprocess.CompletedProcess:
+    return subprocess.run(["docker"] + list(args), check=check, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, encoding="utf-8", **kwargs)
+
+
+def planned_nodes(tvm_ci_config : dict) -> dict:
+    """Return the FQDN of each node Terraform would create for `tvm_ci_config`.
+
+    Returns
+    -------
+    dict :
+        "head_node": the head node's FQDN. "executors": the executor FQDNs of each node type, as
+        named in generate_casc(). "controllers": the FQDN of each controller besides the head
+        node; see tvm_ci.controllers.
+    """
+    cluster = tvm_ci_config["cluster"]
+    prefix, suffix = cluster["name_prefix"], cluster["dns_suffix"]
+    return {
+        "head_node": f"{prefix}jenkins.{suffix}",
+        "executors": {
+            node_type: [f"{prefix}jenkins-{node_type}-executor-{i}.{suffix}"
+                        for i in range(node_config["num_nodes"])]
+            for node_type, node_config in cluster["nodes"].items()},
+        "controllers": {
+            name: f"{prefix}jenkins-{name}.{suffix}"
+            for name in controllers.extra_controllers(controllers.controller_settings(tvm_ci_config))},
+    }
+
+
+def container_name(fqdn : str) -> str:
+    return f"tvm-ci-local-{fqdn.split('.')[0]}"
+
+
+def build_node_image():
+    context = utils.get_repo_root() / "config" / "local-cluster"
+    with trace.span("local_cluster.build_node_image"):
+        subprocess.check_call(["docker", "build", "-t", NODE_IMAGE, str(context)])
+
+
+def start_node(fqdn : str, network_id : str, cluster : str) -> str:
+    """Start the container for the node `fqdn`, unless it is already running. Returns its name."""
+    name = container_name(fqdn)
+    proc = _docker("inspect", "--type=container", name, check=False)
+    if proc.returncode == 0:
+        info = json.loads(proc.stdout)[0]
+        if info["State"]["Running"]:
+            _LOG.info("%s: already running", fqdn)
+            return name
+        _docker("rm", "--force", "--volumes", name)
+
+    _docker("run", "--detach", "--privileged", "--cgroupns=host",
+            "-v", "/sys/fs/cgroup:/sys/fs/cgroup:rw",
+            "--tmpfs", "/run", "--tmpfs", "/run/lock",
+            "--name", name, "--hostname", fqdn.split(".")[0],
+            "--label", f"{CLUSTER_LABEL}={cluster}",
+            f"--network={network_id}", f"--network-alias={fqdn}",
+            NODE_IMAGE)
+    _LOG.info("%s: started %s", fqdn, name)
+    return name
+
+
+def wait_for_node(name : str, timeout_sec : float):
+    """Wait until systemd has started the node's Docker daemon (and so, its sshd)."""
+    deadline = time.monotonic() + timeout_sec
+    while _docker("exec", name, "docker", "info", check=False).returncode != 0:
+        if time.monotonic() > deadline:
+            raise NodeNotReadyError(f"{name}: Docker didn't start within {timeout_sec:.0f}s")
+        time.sleep(1)
+
+
+def authorize_key(name : str, public_key : str):
+    """Let the provisioner SSH in as ubuntu, as the AMIs' key pair does."""
+    _docker("exec", "-i", name, "sh", "-c",
+            "install -d -o ubuntu -g ubuntu -m 0700 /home/ubuntu/.ssh && "
+            "cat >/home/ubuntu/.ssh/authorized_keys && "
+            "chown ubuntu:ubuntu /home/ubuntu/.ssh/authorized_keys && "
+            "chmod 0600 /home/ubuntu/.ssh/authorized_keys",
+            input=public_key)
+
+
+def load_image(name : str, image : str):
+    """Copy `image` from the local Docker into the node's, so the playbook needn't pull it.
+
+    The Jenkins container built by build_container is usually not pushed anywhere.
+    """
+    if _docker("exec", name, "docker", "image", "inspect", image, check=False).returncode == 0:
+        return
+
+    if _docker("image", "inspect", image, check=False).returncode != 0:
+        _LOG.warning("%s: %s is not built locally; the playbook will pull it", name, image)
+        return
+
+    with trace.span("local_cluster.load_image", node=name):
+        save = subprocess.Popen(["docker", "save", image], stdout=subprocess.PIPE)
+        subprocess.check_call(["docker", "exec", "-i", name, "docker", "load"], stdin=save.stdout)
+        save.stdout.close()
+        if save.wait() != 0:
+            raise subprocess.CalledProcessError(save.returncode, ["docker", "save", image])
+
+
+def node_ip(name : str, network_id : str) -> str:
+    info = json.loads(_docker("inspect", "--type=container", name).stdout)[0]
+    for network in info["NetworkSettings"]["Networks"].values():
+        if network["NetworkID"].startswith(network_id):
+            return network["IPAddress"]
+
+    raise KeyError(f"{name} is not on network {network_id}")
+
+
+def terraform_output(nodes : dict, ips : typing.Dict[str, str]) -> dict:
+    """Return `nodes`' addresses in the format of `terraform output -json` for infra/."""
+    def value(v):
+        return {"sensitive": False, "value": v}
+
+    output = {
+        "jenkins_head_node_fqdn": value(nodes["head_node"]),
+        "jenkins_head_node_public_ip": value(ips[nodes["head_node"]]),
+        "jenkins_head_node_private_ip": value(ips[nodes["head_node"]]),
+    }
+    for node_type, fqdns in nodes["executors"].items():
+        output[f"{node_type}_executor_fqdn"] = value(fqdns)
+        output[f"{node_type}_executor_public_ip"] = value([ips[f] for f in fqdns])
+        output[f"{node_type}_executor_private_ip"] = value([ips[f] for f in fqdns])
+    if nodes["controllers"]:
+        output["jenkins_controller_fqdn"] = value(dict(nodes["controllers"]))
+        output["jenkins_controller_public_ip"] = value(
+            {name: ips[fqdn] for name, fqdn in nodes["controllers"].items()})
+        output["jenkins_controller_private_ip"] = value(
+            {name: ips[fqdn] for name, fqdn in nodes["controllers"].items()})
+    return output
+
+
+def _warn_about_aws_features(tvm_ci_config : dict):
+    for section in ("artifact_manager", "homedir_snapshot"):
+        settings = tvm_ci_config["jenkins"].get(section)
+        if settings is not None and settings.get("endpoint") is None:
+            _LOG.warning("jenkins.%s stores data in AWS S3; set its endpoint to a local store "
+                         "or remove it from the CI config", section)
+
+
+def up(args : argparse.Namespace, tvm_ci_config : dict):
+    _warn_about_aws_features(tvm_ci_config)
+    ssh_keys.ensure_key(args.provisioner_ssh_key)
+    public_key = pathlib.Path(f"{args.provisioner_ssh_key}.pub").read_text()
+    network_id = args.network_id_file.read_text().strip()
+    cluster = tvm_ci_config["cluster"]["name_prefix"]
+
+    nodes = planned_nodes(tvm_ci_config)
+    jenkins_nodes = [nodes["head_node"]] + list(nodes["controllers"].values())
+    fqdns = jenkins_nodes + [f for executors in nodes["executors"].values() for f in executors]
+
+    if not args.skip_image_build:
+        build_node_image()
+
+    def bring_up(fqdn):
+        with trace.span("local_cluster.start_node", node=fqdn):
+            name = start_node(fqdn, network_id, cluster)
+            wait_for_node(name, args.node_timeout_sec)
+            authorize_key(name, public_key)
+            if fqdn in jenkins_nodes and args.jenkins_container_tag is not None:
+                load_image(name, args.jenkins_container_tag)
+            return node_ip(name, network_id)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(fqdns)) as executor:
+        ips = dict(zip(fqdns, executor.map(bring_up, fqdns)))
+
+    outputs.write_if_changed(args.terraform_output_json,
+                             json.dumps(terraform_output(nodes, ips), indent=2, sort_keys=True))
+    _LOG.info("Local cluster is up; Jenkins will be at http://%s:8080", ips[nodes["head_node"]])
+
+
+def down(tvm_ci_config : dict):
+    cluster = tvm_ci_config["cluster"]["name_prefix"]
+    names = _docker("ps", "--all", "--quiet", "--filter",
+                    f"label={CLUSTER_LABEL}={cluster}").stdout.split()
+    if names:
+        _docker("rm", "--force", "--volumes", *names)
+    _LOG.info("Removed %d node containers", len(names))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    utils.add_tvm_ci_config_arg(parser)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    up_parser = subparsers.add_parser("up", help="Start the node containers")
+    up_parser.add_argument("--network-id-file", type=pathlib.Path,
+                           default=utils.get_repo_root() / "build" / "crane" / "network-id.txt",
+                           help="File naming the crane network, which the nodes join")
+    up_parser.add_argument("--provisioner-ssh-key", type=pathlib.Path,
+                           default=utils.get_repo_root() / "build" / "artifact" / "secret" / "provisioner-id_ed25519",
+                           help="Private key Ansible connects with; created if it does not exist")
+    up_parser.add_argument("--jenkins-container-tag",
+                           help="Jenkins container to load into the head node and controllers")
+    up_parser.add_argument("--terraform-output-json", type=pathlib.Path, required=True,
+                           help="Where to write the nodes' addresses, for configure_ansible")
+    up_parser.add_argument("--node-timeout-sec", type=float, default=120,
+                           help="Time allowed for each node to boot")
+    up_parser.add_argument("--skip-image-build", action="store_true",
+                           help=f"Use the existing {NODE_IMAGE} image")
+
+    subparsers.add_parser("down", help="Remove the node containers and their volumes")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level="INFO")
+
+    tvm_ci_config = utils.parse_tvm_ci_config(args)
+    with trace.span(f"local_cluster.{args.command}"):
+        if args.command == "up":
+            up(args, tvm_ci_config)
+        else:
+            down(tvm_ci_config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""A streaming pipeline for subprocess output.
+
+Long-running subprocesses (docker build, the embryonic Jenkins container) produce a lot of output,
+most of which is only interesting when something fails. LogPipeline consumes such output line by
+line and:
+
+ - fires callbacks for lines matching any of a set of regexes, using a single compiled matcher as
+   a prefilter so that uninteresting lines cost one regex search;
+ - keeps a bounded tail of recent lines, which can be dumped to the log on failure;
+ - echoes lines to the log subject to a rate limit, summarizing suppressed lines;
+ - optionally spools every line to a gzip-compressed file on disk.
+"""
+
+import collections
+import gzip
+import logging
+import pathlib
+import re
+import threading
+import time
+import typing
+
+
+_LOG = logging.getLogger(__name__)
+
+
+MatchCallback = typing.Callable[[typing.Match, str], None]
+
+
+LineCallback = typing.Callable[[str], None]
+
+
+class LogPipeline:
+    """Consume lines of subprocess output. See the module docstring."""
+
+    def __init__(self, name : str, logger : logging.Logger = _LOG, tail_lines : int = 500,
+                 echo_lines_per_sec : float = 20.0, echo_burst : int = 100,
+                 spool_path : typing.Optional[pathlib.Path] = None):
+        """Create a LogPipeline.
+
+        Parameters
+        ----------
+        name : str
+            Prefix for echoed lines, typically the name of the subprocess.
+        logger : logging.Logger
+            Logger used to echo lines.
+        tail_lines : int
+            Number of recent lines retained for dump_tail().
+        echo_lines_per_sec : float
+            Sustained rate at which lines are echoed to `logger`. Lines which match a registered
+            pattern are always echoed. Set to 0 to echo only matching lines.
+        echo_burst : int
+            Number of lines which may be echoed back-to-back before the rate limit applies.
+        spool_path : Optional[pathlib.Path]
+            If given, every line is written to this gzip-compressed file.
+        """
+        self.name = name
+        self._logger = logger
+        self._tail = collections.deque(maxlen=tail_lines)
+        self._patterns = []
+        self._line_callbacks = []
+        self._matcher = None
+        self._lock = threading.Lock()
+
+        self._echo_rate = echo_lines_per_sec
+        self._echo_burst = echo_burst
+        self._echo_tokens = float(echo_burst)
+        self._echo_last = time.monotonic()
+        self._suppressed = 0
+
+        self._spool = None
+        if spool_path is not None:
+            spool_path.parent.mkdir(parents=True, exist_ok=True)
+            self._spool = gzip.open(spool_path, "wt", encoding="utf-8", compresslevel=1)
+
+    def on_match(self, pattern : str, callback : MatchCallback):
+        """Call `callback(match, line)` for each line in which `pattern` is found (re.search)."""
+        with self._lock:
+            self._patterns.append((re.compile(pattern), callback))
+            self._matcher = None
+
+    def on_line(self, callback : LineCallback):
+        """Call `callback(line)` for every line. Runs before any on_match() callbacks."""
+        with self._lock:
+            self._line_callbacks.append(callback)
+
+    def _get_matcher(self):
+        if self._matcher is None and self._patterns:
+            self._matcher = re.compile(
+                "|".join(f"(?:{p.pattern})" for p, _ in self._patterns))
+        return self._matcher
+
+    def _echo(self, line : str, force : bool):
+        now = time.monotonic()
+        self._echo_tokens = min(self._echo_burst,
+                                self._echo_tokens + (now - self._echo_last) * self._echo_rate)
+        self._echo_last = now
+        if not force and self._echo_tokens < 1:
+            self._suppressed += 1
+            return
+
+        self._flush_suppressed()
+        if not force:
+            self._echo_tokens -= 1
+        self._logger.info("%s: %s", self.name, line)
+
+    def _flush_suppressed(self):
+        if self._suppressed:
+            self._logger.info("%s: ... %d lines not echoed (rate limit); see tail or spool",
+                              self.name, self._suppressed)
+            self._suppressed = 0
+
+    def feed(self, line : str):
+        """Process one line of output. A trailing newline, if any, is stripped."""
+        if line.endswith("\n"):
+            line = line[:-1]
+
+        with self._lock:
+            self._tail.append(line)
+            if self._spool is not None:
+                self._spool.write(line)
+                self._spool.write("\n")
+
+            matcher = self._get_matcher()
+            matched = []
+            if matcher is not None and matcher.search(line):
+                # The combined matcher only finds the leftmost alternative; check each pattern so
+                # that every matching callback fires.
+                for pattern, callback in self._patterns:
+                    m = pattern.search(line)
+                    if m is not None:
+                        matched.append((m, callback))
+
+            self._echo(line, force=bool(matched))
+            line_callbacks = list(self._line_callbacks)
+
+        for callback in line_callbacks:
+            callback(line)
+        for m, callback in matched:
+            callback(m, line)
+
+    def consume(self, stream : typing.Iterable[str]):
+        """Feed every line from `stream` until it is exhausted."""
+        for line in stream:
+            self.feed(line)
+
+    def tail(self) -> typing.List[str]:
+        """Return the most recent lines, oldest first."""
+        with self._lock:
+            return list(self._tail)
+
+    def dump_tail(self, level : int = logging.ERROR):
+        """Log the retained tail of the output, e.g. after the subprocess failed."""
+        lines = self.tail()
+        self._logger.log(level, "%s: last %d lines of output:", self.name, len(lines))
+        for line in lines:
+            self._logger.log(level, "%s| %s", self.name, line)
+
+    def close(self):
+        with self._lock:
+            self._flush_suppressed()
+            if self._spool is not None:
+                self._spool.close()
+                self._spool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
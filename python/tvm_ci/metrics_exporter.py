@@ -0,0 +1,327 @@
+"""Export Jenkins executor utilization and queue latency as Prometheus metrics.
+
+The exporter polls the Jenkins computer, queue and job APIs every --poll-interval-sec and serves
+the results in the Prometheus text format at http://<listen-address>:<listen-port>/metrics:
+
+    jenkins_up                                  1 if the last poll succeeded
+    jenkins_executors{label,state}              executors per node label; state is busy, idle
+                                                or offline
+    jenkins_agent_offline{agent}                1 for each agent which is offline
+    jenkins_queue_length{label}                 items waiting in the queue, by the label they
+                                                wait for ("none" if they wait for no executor)
+    jenkins_queue_wait_seconds{label}           histogram of the time items spent queued,
+                                                observed when they leave the queue
+    jenkins_build_duration_seconds{job}         histogram of completed build durations
+    jenkins_builds_total{job,result}            completed builds
+
+Queue wait is measured to the poll in which an item was last seen, so it overestimates by up to
+one poll interval. Builds of jobs inside a folder or multibranch project, such as its branches
+and pull requests, are counted under the top-level item's name, so the number of series stays
+bounded. Builds which had completed before the exporter started are not counted.
+
+This runs on the Jenkins head node (see ansible/playbook.yml) from a single copied file, using
+the system python3, so only the standard library is used here. To try it without a cluster, run
+it against `python -m tvm_ci.jenkins_stub`.
+"""
+
+import argparse
+import base64
+import http.server
+import json
+import logging
+import pathlib
+import re
+import threading
+import time
+import typing
+import urllib.error
+import urllib.parse
+import urllib.request
+
+
+_LOG = logging.getLogger(__name__)
+
+
+QUEUE_WAIT_BUCKETS_SEC = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+
+
+BUILD_DURATION_BUCKETS_SEC = (60, 300, 600, 1200, 1800, 2700, 3600, 5400, 7200, 10800, 14400)
+
+
+# Only fetch the fields used below; the full computer and job APIs are large.
+COMPUTER_TREE = ("computer[displayName,offline,numExecutors,assignedLabels[name],"
+                 "executors[idle],oneOffExecutors[idle]]")
+
+
+QUEUE_TREE = "items[id,inQueueSince,why,task[name]]"
+
+
+_BUILDS_TREE = "builds[number,duration,building,result]{0,50}"
+
+
+# Top-level jobs, folders or multibranch projects, and their branches.
+JOBS_TREE = f"jobs[name,{_BUILDS_TREE},jobs[name,{_BUILDS_TREE},jobs[name,{_BUILDS_TREE}]]]"
+
+
+# Matches Jenkins' "Waiting for next available executor on ‘cpu’" and variants.
+_WAITING_FOR_LABEL_RE = re.compile(r"(?:available executor|executor slot|node) on [‘'\"]?([^’'\"]+?)[’'\"]?$")
+
+
+class Histogram:
+    """A Prometheus histogram with one series per label value."""
+
+    def __init__(self, name : str, help : str, label_name : str, buckets : typing.Tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.label_name = label_name
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, label_value : str, value : float):
+        series = self._series.setdefault(
+            label_value, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                series["buckets"][i] += 1
+        series["sum"] += value
+        series["count"] += 1
+
+    def render(self) -> typing.List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_value, series in sorted(self._series.items()):
+            labels = f'{self.label_name}="{_escape(label_value)}"'
+            for upper, count in zip(self.buckets, series["buckets"]):
+                lines.append(f'{self.name}_bucket{{{labels},le="{upper}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {series["count"]}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series['sum']}")
+            lines.append(f"{self.name}_count{{{labels}}} {series['count']}")
+        return lines
+
+
+def _escape(label_value : str) -> str:
+    return label_value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _gauge(name : str, help : str, samples : typing.Dict[typing.Tuple[typing.Tuple[str, str], ...], float],
+           metric_type : str = "gauge") -> typing.List[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {metric_type}"]
+    for labels, value in sorted(samples.items()):
+        label_str = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+        lines.append(f"{name}{{{label_str}}} {value}" if label_str else f"{name} {value}")
+    return lines
+
+
+def _queue_item_label(item : dict) -> str:
+    m = _WAITING_FOR_LABEL_RE.search(item.get("why") or "")
+    return m.group(1) if m else "none"
+
+
+def _flatten_jobs(jobs : typing.List[dict], project : typing.Optional[str] = None,
+                  prefix : str = ""):
+    """Yield (project, full name, job) for each job with builds, folders included."""
+    for job in jobs:
+        full_name = f"{prefix}{job['name']}"
+        yield project or job["name"], full_name, job
+        yield from _flatten_jobs(job.get("jobs") or [], project or job["name"], f"{full_name}/")
+
+
+class JenkinsMetrics:
+    """Polls Jenkins and keeps the state needed to render metrics. Thread-safe."""
+
+    def __init__(self, url : str, user : typing.Optional[str] = None,
+                 api_token : typing.Optional[str] = None, timeout_sec : float = 30):
+        self.url = url.rstrip("/")
+        self.timeout_sec = timeout_sec
+        self._headers = {}
+        if user is not None:
+            credentials = base64.b64encode(bytes(f"{user}:{api_token}", "utf-8"))
+            self._headers["Authorization"] = f"Basic {str(credentials, 'ascii')}"
+
+        self._lock = threading.Lock()
+        self._up = 0
+        self._poll_errors = 0
+        self._poll_duration_sec = 0.0
+        self._computers = []
+        self._queued = {}
+        self._seen_builds = None
+        self.queue_wait = Histogram("jenkins_queue_wait_seconds",
+                                    "Time items spent in the queue, observed when they left it",
+                                    "label", QUEUE_WAIT_BUCKETS_SEC)
+        self.build_duration = Histogram("jenkins_build_duration_seconds",
+                                        "Duration of completed builds", "job",
+                                        BUILD_DURATION_BUCKETS_SEC)
+        self._builds_total = {}
+
+    def _get_json(self, path : str, tree : str) -> dict:
+        request = urllib.request.Request(
+            f"{self.url}{path}?{urllib.parse.urlencode({'tree': tree})}", headers=self._headers)
+        with urllib.request.urlopen(request, timeout=self.timeout_sec) as response:
+            return json.load(response)
+
+    def poll(self):
+        """Fetch the current state of Jenkins and update the metrics."""
+        start = time.monotonic()
+        try:
+            computers = self._get_json("/computer/api/json", COMPUTER_TREE)["computer"]
+            queue_items = self._get_json("/queue/api/json", QUEUE_TREE)["items"]
+            jobs = self._get_json("/api/json", JOBS_TREE)["jobs"]
+        except (urllib.error.URLError, OSError, ValueError, KeyError) as e:
+            _LOG.warning("Polling %s failed: %s", self.url, e)
+            with self._lock:
+                self._up = 0
+                self._poll_errors += 1
+            return
+
+        now_ms = int(time.time() * 1000)
+        with self._lock:
+            self._computers = computers
+            self._update_queue(queue_items, now_ms)
+            self._update_builds(jobs)
+            self._up = 1
+            self._poll_duration_sec = time.monotonic() - start
+
+    def _update_queue(self, queue_items : typing.List[dict], now_ms : int):
+        queued = {}
+        for item in queue_items:
+            # Pipeline node() blocks are queued as separate items; ids alone may not be unique
+            # among stand-ins for Jenkins, so key them by task too.
+            key = (item["id"], item["task"]["name"])
+            queued[key] = {"since_ms": item["inQueueSince"], "label": _queue_item_label(item),
+                           "last_seen_ms": now_ms}
+
+        for key, item in self._queued.items():
+            if key not in queued:
+                self.queue_wait.observe(item["label"],
+                                        max(0, item["last_seen_ms"] - item["since_ms"]) / 1000)
+        self._queued = queued
+
+    def _update_builds(self, jobs : typing.List[dict]):
+        completed = {}
+        for project, full_name, job in _flatten_jobs(jobs):
+            for build in job.get("builds") or []:
+                if not build["building"]:
+                    completed[(full_name, build["number"])] = (project, build)
+
+        if self._seen_builds is not None:
+            for key in completed.keys() - self._seen_builds:
+                project, build = completed[key]
+                self.build_duration.observe(project, build["duration"] / 1000)
+                result_key = (("job", project), ("result", build["result"] or "UNKNOWN"))
+                self._builds_total[result_key] = self._builds_total.get(result_key, 0) + 1
+        # Only builds in the fetched window need remembering; older ones are not fetched again.
+        self._seen_builds = set(completed)
+
+    def render(self) -> str:
+        with self._lock:
+            executors = {}
+            offline_agents = {}
+            for computer in self._computers:
+                labels = [l["name"] for l in computer.get("assignedLabels", [])
+                          if l["name"] != computer["displayName"]] or ["none"]
+                if computer["offline"]:
+                    counts = {"offline": computer["numExecutors"]}
+                else:
+                    busy = sum(1 for e in computer.get("executors", []) if not e["idle"])
+                    counts = {"busy": busy, "idle": computer["numExecutors"] - busy}
+                for label in labels:
+                    for state in ("busy", "idle", "offline"):
+                        key = (("label", label), ("state", state))
+                        executors[key] = executors.get(key, 0) + counts.get(state, 0)
+                offline_agents[(("agent", computer["displayName"]),)] = int(computer["offline"])
+
+            queue_length = {}
+            for item in self._queued.values():
+                key = (("label", item["label"]),)
+                queue_length[key] = queue_length.get(key, 0) + 1
+
+            lines = []
+            lines += _gauge("jenkins_up", "1 if the last poll of Jenkins succeeded", {(): self._up})
+            lines += _gauge("jenkins_exporter_poll_errors_total", "Failed polls of Jenkins",
+                            {(): self._poll_errors}, "counter")
+            lines += _gauge("jenkins_exporter_poll_duration_seconds", "Duration of the last poll",
+                            {(): self._poll_duration_sec})
+            lines += _gauge("jenkins_executors", "Executors per node label, by state", executors)
+            lines += _gauge("jenkins_agent_offline", "1 if the agent is offline", offline_agents)
+            lines += _gauge("jenkins_queue_length",
+                            "Items in the queue, by the label they are waiting for", queue_length)
+            lines += self.queue_wait.render()
+            lines += self.build_duration.render()
+            lines += _gauge("jenkins_builds_total", "Completed builds", self._builds_total,
+                            "counter")
+            return "\n".join(lines) + "\n"
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    # Set by serve().
+    metrics = None
+
+    def log_message(self, format, *args):
+        _LOG.debug("%s - %s", self.address_string(), format % args)
+
+    def do_GET(self):
+        if urllib.parse.urlsplit(self.path).path != "/metrics":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        body = bytes(self.metrics.render(), "utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(metrics : JenkinsMetrics, host : str, port : int) -> http.server.ThreadingHTTPServer:
+    """Start serving `metrics` in a background thread. Returns the server; use server_address."""
+    handler = type("Handler", (_Handler,), {"metrics": metrics})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--jenkins-url", default="http://localhost:8080",
+                        help="Base URL of the Jenkins controller")
+    parser.add_argument("--jenkins-user", help="Jenkins user to authenticate as")
+    parser.add_argument("--jenkins-api-token-file", type=pathlib.Path,
+                        help="Path to a file containing the API token for --jenkins-user")
+    parser.add_argument("--listen-address", default="localhost",
+                        help="Address to serve /metrics on")
+    parser.add_argument("--listen-port", type=int, default=9118,
+                        help="Port to serve /metrics on")
+    parser.add_argument("--poll-interval-sec", type=float, default=15.0,
+                        help="Interval between polls of the Jenkins API")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level="INFO")
+
+    api_token = None
+    if args.jenkins_api_token_file is not None:
+        with open(args.jenkins_api_token_file) as token_f:
+            api_token = token_f.read().strip()
+
+    metrics = JenkinsMetrics(args.jenkins_url, args.jenkins_user, api_token)
+    metrics.poll()
+    server = serve(metrics, args.listen_address, args.listen_port)
+    _LOG.info("Serving metrics for %s on http://%s:%d/metrics", args.jenkins_url,
+              *server.server_address[:2])
+    try:
+        while True:
+            time.sleep(args.poll_interval_sec)
+            metrics.poll()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
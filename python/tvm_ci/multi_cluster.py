@@ -0,0 +1,248 @@
+"""Generate the artifacts of several clusters in one invocation, in parallel.
+
+Each --tvm-ci-config describes one cluster (prod, staging, per-developer sandboxes). Everything
+that depends on the CI config runs in a worker process per cluster and is written beneath
+build/clusters/<cluster>/, using the same file names the stage scripts use beneath build/:
+
+ - artifact/terraform-{backend-config,provider-config,vars}.txt
+ - artifact/secret/provisioner-id_ed25519 and executor-ssh-key (generated once, then reused)
+ - casc/jenkins.yaml, the Configuration-as-Code for the cluster's Jenkins head node
+ - ansible-inventory.yml, once artifact/terraform-output.json exists for the cluster
+
+Terraform is not planned here: run tvm_ci.terraform_shards against a cluster's artifact/ configs,
+which fingerprints each shard's inputs and keeps the fingerprint beside that shard's plan.
+
+Work that is the same for every cluster is done once, before the workers start: the job XML is
+rendered into build/clusters/jobs-xml (upload it with configure_jenkins --jenkins-jobs-xml-dir),
+the Jenkins container tag is read, and each distinct Terraform state bucket is verified once.
+
+With --build-homedirs, each worker then also runs configure_jenkins to build the cluster's
+jenkins-homedir.tar.gz (and artifact/secret/jenkins-casc.yaml), uploading the shared job XML. Each
+build runs its own Jenkins container under a unique name and port, so they proceed in parallel.
+"""
+
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+import typing
+
+import yaml
+
+from . import configure_ansible
+from . import create_backend_config
+from . import git_mirror
+from . import outputs
+from . import ssh_keys
+from . import trace
+from . import utils
+from .jenkins_builder import configure_jenkins
+
+
+_LOG = logging.getLogger(__name__)
+
+
+def cluster_name(tvm_ci_config : dict, tvm_ci_config_path : pathlib.Path) -> str:
+    """Name of the cluster's build directory: its name_prefix, or the config file's name."""
+    return tvm_ci_config["cluster"].get("name_prefix", "").strip("-") or tvm_ci_config_path.stem
+
+
+def generate_cluster(tvm_ci_config_path : pathlib.Path, build_dir : pathlib.Path,
+                     shared : dict) -> dict:
+    """Generate all config-dependent artifacts for one cluster. Runs in a worker process.
+
+    Returns
+    -------
+    dict :
+        Summary of the cluster: its name and build directory.
+    """
+    with open(tvm_ci_config_path) as ci_config_f:
+        tvm_ci_config = yaml.safe_load(ci_config_f)
+
+    name = build_dir.name
+    artifact_dir = build_dir / "artifact"
+    with trace.span("multi_cluster.generate_cluster", cluster=name):
+        provisioner_ssh_key = artifact_dir / "secret" / "provisioner-id_ed25519"
+        ssh_keys.ensure_key(provisioner_ssh_key)
+        terraform_args = argparse.Namespace(
+            backend_config=artifact_dir / "terraform-backend-config.txt",
+            provider_config=artifact_dir / "terraform-provider-config.txt",
+            tf_var_file=artifact_dir / "terraform-vars.txt")
+        create_backend_config.write_terraform_config(
+            tvm_ci_config_path, tvm_ci_config, provisioner_ssh_key, terraform_args)
+
+        executor_private_key = ssh_keys.ensure_key(build_dir / "executor-ssh-key",
+                                                   artifact_dir / "executor-ssh-key.pub")
+        casc_args = argparse.Namespace(
+            base_casc_config=shared["base_casc_config"],
+            github_personal_access_token=shared["github_personal_access_token"],
+            jenkins_homedir=build_dir / "casc")
+        extra_env = configure_jenkins.generate_casc(casc_args, tvm_ci_config, executor_private_key)
+        # Secrets referenced from jenkins.yaml; pass with `docker run --env-file`.
+        outputs.write_if_changed(build_dir / "casc" / "jenkins.env",
+                                 "".join(f"{k}={v}\n" for k, v in sorted(extra_env.items())),
+                                 mode=0o600)
+
+        terraform_output_json = artifact_dir / "terraform-output.json"
+        if terraform_output_json.exists() and shared["container_tag"] is not None:
+            with open(terraform_output_json) as json_f:
+                terraform_output = json.load(json_f)
+            configure_ansible.write_ansible_inventory(terraform_output, argparse.Namespace(
+                executor_ssh_public_key=artifact_dir / "executor-ssh-key.pub",
+                jenkins_master_container_tag=shared["container_tag"],
+                jenkins_homedir_tar_gz=build_dir / "jenkins-homedir.tar.gz",
+                ansible_inventory_path=build_dir / "ansible-inventory.yml",
+                connect_by="ip", add_jenkins_hosts=False),
+                tvm_ci_config)
+        else:
+            _LOG.info("%s: no Terraform output or container tag yet; not writing the inventory",
+                      name)
+
+        if shared["build_homedirs"]:
+            build_homedir(tvm_ci_config_path, build_dir, shared)
+
+    return {"cluster": name, "build_dir": str(build_dir)}
+
+
+def build_homedir(tvm_ci_config_path : pathlib.Path, build_dir : pathlib.Path, shared : dict):
+    """Build the cluster's Jenkins homedir archive with configure_jenkins."""
+    artifact_dir = build_dir / "artifact"
+    homedir = build_dir / "jenkins-homedir"
+    shutil.rmtree(homedir, ignore_errors=True)
+    cmd = [sys.executable, "-m", "tvm_ci.jenkins_builder.configure_jenkins",
+           f"--base-casc-config={shared['base_casc_config']}",
+           f"--tvm-ci-config={tvm_ci_config_path}",
+           f"--github-personal-access-token={shared['github_personal_access_token']}",
+           f"--jenkins-container={shared['container_tag']}",
+           f"--jenkins-executor-private-key={build_dir / 'executor-ssh-key'}",
+           f"--jenkins-executor-public-key={artifact_dir / 'executor-ssh-key.pub'}",
+           f"--jenkins-homedir={homedir}",
+           f"--jenkins-homedir-tar-gz={build_dir / 'jenkins-homedir.tar.gz'}",
+           f"--jenkins-jobs-config-ini={shared['jenkins_jobs_config_ini']}",
+           f"--jenkins-jobs-xml-dir={shared['jobs_xml_dir']}",
+           f"--casc-snapshot={artifact_dir / 'secret' / 'jenkins-casc.yaml'}"]
+    if shared["jenkins_container_network_id"] is not None:
+        cmd.append(f"--jenkins-container-network-id={shared['jenkins_container_network_id']}")
+    with trace.span("multi_cluster.build_homedir", cluster=build_dir.name):
+        subprocess.run(cmd, check=True)
+
+
+def verify_buckets(tvm_ci_configs : typing.List[dict]):
+    """Verify each distinct Terraform state bucket once, however many clusters share it."""
+    seen = set()
+    for tvm_ci_config in tvm_ci_configs:
+        cluster = tvm_ci_config["cluster"]
+        key = (cluster.get("aws_profile_name"), cluster["terraform_s3_state_bucket_name"],
+               cluster["aws_region"])
+        if key not in seen:
+            seen.add(key)
+            create_backend_config.verify_bucket_exists(tvm_ci_config)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--tvm-ci-config", type=pathlib.Path, action="append", required=True,
+                        help="CI config of one cluster. May be repeated.")
+    parser.add_argument("--build-root", type=pathlib.Path,
+                        default=utils.get_repo_root() / "build" / "clusters",
+                        help="Directory which will hold one build directory per cluster")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        help="Number of clusters to generate concurrently")
+    parser.add_argument("--base-casc-config", type=pathlib.Path,
+                        default=utils.get_repo_root() / "config" / "base-jenkins.yaml",
+                        help="Path to the Configuration-as-Code yaml config.")
+    parser.add_argument("--github-personal-access-token", type=pathlib.Path,
+                        default=utils.get_repo_root() / "config" / "secrets" / "github-personal-access-token",
+                        help="Path to a file containing a GitHub Personal Access Token")
+    parser.add_argument("--container-tag-file", type=pathlib.Path,
+                        default=utils.get_repo_root() / "build" / "artifact" / "container-tag.txt",
+                        help="File naming the Jenkins container, written by build_container")
+    parser.add_argument("--jenkins-jobs-config-ini",
+                        default=str(utils.get_repo_root() / "config" / "jenkins-jobs" / "jenkins_jobs.ini"),
+                        help="Path to config.ini for jenkins_jobs module")
+    parser.add_argument("--jenkins-jobs-files", action="append",
+                        help="Job configuration file to render. May be repeated.")
+    parser.add_argument("--skip-jobs", action="store_true",
+                        help="Don't render the job XML")
+    parser.add_argument("--build-homedirs", action="store_true",
+                        help="Also build each cluster's Jenkins homedir archive, in parallel")
+    parser.add_argument("--jenkins-container-network-id",
+                        help=("With --build-homedirs, the Docker network on which to run the "
+                              "Jenkins containers; see configure_jenkins"))
+    parser.add_argument("--skip-bucket-check", action="store_true",
+                        help="Don't verify the Terraform state buckets (no AWS access needed)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level="INFO")
+
+    tvm_ci_configs = []
+    build_dirs = {}
+    for path in args.tvm_ci_config:
+        with open(path) as ci_config_f:
+            tvm_ci_configs.append(yaml.safe_load(ci_config_f))
+        name = cluster_name(tvm_ci_configs[-1], path)
+        if name in build_dirs:
+            sys.exit(f"{path}: cluster {name} is also configured by {build_dirs[name][0]}")
+        build_dirs[name] = (path, args.build_root / name)
+
+    if not args.skip_bucket_check:
+        utils.strip_aws_environment_variables()
+        with trace.span("multi_cluster.verify_buckets"):
+            verify_buckets(tvm_ci_configs)
+
+    if not args.skip_jobs:
+        # Job XML embeds the git mirror's clone options; it is rendered once, so they must agree.
+        git_mirror_settings = [git_mirror.mirror_settings(c) for c in tvm_ci_configs]
+        scm_options = [git_mirror.scm_options(s) if s is not None else None for s in git_mirror_settings]
+        if any(o != scm_options[0] for o in scm_options):
+            sys.exit("cluster.git_mirror clone options differ between clusters; render their jobs "
+                     "separately (--skip-jobs)")
+        configure_jenkins.render_jobs(
+            args.jenkins_jobs_config_ini,
+            args.jenkins_jobs_files or [str(utils.get_repo_root() / "config" / "jenkins-jobs")],
+            args.build_root / "jobs-xml", git_mirror_settings[0])
+
+    shared = {
+        "base_casc_config": args.base_casc_config,
+        "github_personal_access_token": args.github_personal_access_token,
+        "container_tag": (args.container_tag_file.read_text().strip()
+                          if args.container_tag_file.exists() else None),
+        "build_homedirs": args.build_homedirs,
+        "jenkins_jobs_config_ini": args.jenkins_jobs_config_ini,
+        "jobs_xml_dir": args.build_root / "jobs-xml",
+        "jenkins_container_network_id": args.jenkins_container_network_id,
+    }
+    if args.build_homedirs:
+        if shared["container_tag"] is None:
+            sys.exit(f"--build-homedirs: {args.container_tag_file} does not exist; run build_container")
+        if not shared["jobs_xml_dir"].exists():
+            sys.exit(f"--build-homedirs: {shared['jobs_xml_dir']} does not exist; don't pass --skip-jobs")
+
+    failed = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {
+            executor.submit(generate_cluster, path, build_dir, shared): name
+            for name, (path, build_dir) in build_dirs.items()}
+        for future in concurrent.futures.as_completed(futures):
+            name = futures[future]
+            try:
+                summary = future.result()
+                _LOG.info("%s: generated in %s", name, summary["build_dir"])
+            except Exception:
+                _LOG.exception("%s: failed", name)
+                failed.append(name)
+
+    if failed:
+        sys.exit(f"Failed to generate: {', '.join(sorted(failed))}")
+
+
+if __name__ == "__main__":
+    main()
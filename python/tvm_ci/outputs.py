@@ -0,0 +1,196 @@
+"""Write generated artifacts atomically, and only when their contents change.
+
+Generators call write_if_changed() instead of open(..., "w"). When the SHA-256 of the new contents
+matches that of the file on disk, the file is left untouched, so its mtime is preserved and make targets and other
+mtime-based checks downstream don't re-run. Otherwise the contents are written to a temporary
+file in the same directory and renamed over the destination, so readers never see a partial file.
+
+Every call is recorded in the report file named by $TVM_CI_CHANGED_ARTIFACTS_FILE (one JSON object
+per line: path, sha256, changed). Downstream steps use the report to skip themselves:
+
+    python -m tvm_ci.outputs changed --stamp build/.stamps/provision PATH...  # exit 0: changed
+    python -m tvm_ci.outputs stamp --stamp build/.stamps/provision PATH...    # after success
+    python -m tvm_ci.outputs digest PATH...  # print one digest identifying all of PATHs' contents
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import sys
+import time
+import typing
+
+
+_LOG = logging.getLogger(__name__)
+
+
+REPORT_FILE_ENV_VAR = "TVM_CI_CHANGED_ARTIFACTS_FILE"
+
+
+def _sha256_file(path : pathlib.Path) -> str:
+    # Hashed in small blocks, so checking a large artifact costs next to no memory.
+    digest = hashlib.sha256()
+    block = bytearray(64 * 1024)
+    view = memoryview(block)
+    with open(path, "rb", buffering=0) as f:
+        for n in iter(lambda: f.readinto(block), 0):
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+
+def _record(path : pathlib.Path, sha256 : str, changed : bool):
+    report_path = os.environ.get(REPORT_FILE_ENV_VAR)
+    if not report_path:
+        return
+
+    line = json.dumps({"path": str(path.resolve()), "sha256": sha256, "changed": changed,
+                       "mtime_ns": path.stat().st_mtime_ns, "time": time.time()}, sort_keys=True)
+    pathlib.Path(report_path).parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(report_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, bytes(line + "\n", "utf-8"))
+    finally:
+        os.close(fd)
+
+
+def write_if_changed(path : typing.Union[str, pathlib.Path], contents : typing.Union[str, bytes],
+                     mode : typing.Optional[int] = None) -> bool:
+    """Atomically replace `path` with `contents`, unless it already holds exactly `contents`.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The file to write. Parent directories are created as needed.
+    contents : str or bytes
+        New contents. str is encoded as UTF-8.
+    mode : Optional[int]
+        Permissions of the file. By default, an existing file's mode is kept and new files are
+        created subject to the umask.
+
+    Returns
+    -------
+    bool :
+        True if the file was written, False if it was already up-to-date.
+    """
+    path = pathlib.Path(path)
+    if isinstance(contents, str):
+        contents = bytes(contents, "utf-8")
+    sha256 = hashlib.sha256(contents).hexdigest()
+
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        st = None
+
+    if (st is not None and st.st_size == len(contents) and
+        (mode is None or (st.st_mode & 0o777) == mode) and _sha256_file(path) == sha256):
+        _LOG.debug("Unchanged: %s", path)
+        _record(path, sha256, changed=False)
+        return False
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if mode is None and st is not None:
+        mode = st.st_mode & 0o777
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    # Created private, so that secrets are never briefly readable by others.
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        with os.fdopen(fd, "wb") as tmp_f:
+            tmp_f.write(contents)
+        if mode is None:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    _LOG.info("Wrote: %s", path)
+    _record(path, sha256, changed=True)
+    return True
+
+
+def latest_records(report_path : pathlib.Path) -> typing.Dict[str, dict]:
+    """Return the most recent report record for each path in the report."""
+    records = {}
+    if report_path.exists():
+        with open(report_path) as report_f:
+            for line in report_f:
+                if line.strip():
+                    record = json.loads(line)
+                    records[record["path"]] = record
+    return records
+
+
+def current_digests(paths : typing.List[pathlib.Path],
+                    report_path : typing.Optional[pathlib.Path]) -> typing.Dict[str, str]:
+    """Return the sha256 of each path (None if missing).
+
+    Digests are taken from the report when the file has not been touched since it was recorded,
+    so large artifacts are not re-hashed.
+    """
+    reported = latest_records(report_path) if report_path is not None else {}
+    digests = {}
+    for path in paths:
+        key = str(path.resolve())
+        if not path.exists():
+            digests[key] = None
+        elif key in reported and reported[key].get("mtime_ns") == path.stat().st_mtime_ns:
+            digests[key] = reported[key]["sha256"]
+        else:
+            digests[key] = _sha256_file(path)
+    return digests
+
+
+def combined_digest(digests : typing.Dict[str, str]) -> str:
+    """Return one sha256 over the paths and digests returned by current_digests()."""
+    return hashlib.sha256(bytes(json.dumps(digests, sort_keys=True), "utf-8")).hexdigest()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command, help in (("changed", "Exit 0 if any PATH changed since --stamp was written, else 1"),
+                          ("stamp", "Record the current digests of PATHs in --stamp"),
+                          ("digest", "Print a digest identifying the contents of all PATHs")):
+        subparser = subparsers.add_parser(command, help=help)
+        if command != "digest":
+            subparser.add_argument("--stamp", type=pathlib.Path, required=True,
+                                   help="Stamp file recording the digests a consumer last used")
+        subparser.add_argument("paths", type=pathlib.Path, nargs="+", metavar="PATH",
+                               help="Artifacts consumed by the step")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level="INFO")
+    report_path = os.environ.get(REPORT_FILE_ENV_VAR)
+    digests = current_digests(args.paths, pathlib.Path(report_path) if report_path else None)
+
+    if args.command == "digest":
+        print(combined_digest(digests))
+        return
+
+    if args.command == "stamp":
+        write_if_changed(args.stamp, json.dumps(digests, indent=2, sort_keys=True) + "\n")
+        return
+
+    stamped = {}
+    if args.stamp.exists():
+        with open(args.stamp) as stamp_f:
+            stamped = json.load(stamp_f)
+
+    changed = [p for p, digest in digests.items() if digest is None or stamped.get(p) != digest]
+    for path in changed:
+        _LOG.info("Changed since %s: %s", args.stamp, path)
+    sys.exit(0 if changed else 1)
+
+
+if __name__ == "__main__":
+    main()
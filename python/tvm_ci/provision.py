@@ -0,0 +1,331 @@
+"""Run the provisioning playbook one play at a time, retrying only the hosts which failed.
+
+Re-running ansible-playbook after one flaky SSH connection re-runs every play on every host. This
+runner instead runs each play of --playbook separately, limited to the hosts which have not yet
+completed it. Each play runs with the free strategy, so hosts work through it independently, and
+ansible/callback_plugins/provision_state.py records each host's outcome as soon as it finishes,
+to be kept in --state. A host which hasn't finished a play --host-timeout-sec after starting it
+counts as failed; it doesn't hold up the other hosts, and their outcomes are kept when
+ansible-playbook is stopped. Hosts which fail, are unreachable or time out are retried, alone,
+with exponential backoff, up to --max-attempts times.
+
+A host which still fails a play is left out of the plays which follow and reported at the end. The
+next invocation resumes from the recorded state: plays already completed on a host are not run
+on it again. The state is discarded when the playbook, anything else under ansible/, the
+inventory or --inputs-digest changes, and removed once every host has completed every play.
+
+--inputs-digest identifies everything the playbook reads (see `artifacts_digest` in
+stage-scripts/util.sh). The playbook's last play writes it to each host it provisioned, and
+--check exits 0 only when every host in the inventory is reachable, running Docker and holds that
+digest, so a host which was rebuilt or never finished provisioning is not mistaken for current.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+
+import yaml
+
+from . import outputs
+from . import trace
+from . import utils
+
+
+_LOG = logging.getLogger(__name__)
+
+
+# Appended to each play by run_play(); a host which runs it finished the play. Match
+# ansible/callback_plugins/provision_state.py.
+COMPLETE_TASK_NAME = "tvm_ci.provision: play complete"
+
+
+# How often run_play() checks each host's progress against its deadline.
+PROGRESS_POLL_SEC = 1
+
+
+# Written by the playbook's last play; see CHECK_PLAY.
+PROVISIONED_INPUTS_PATH = "/etc/tvm-ci/provisioned-inputs"
+
+
+# Run with --check: succeeds on a host which is up, running Docker and was last provisioned from
+# the inputs named by provision_inputs_digest.
+CHECK_PLAY = {
+    "name": "Check provisioned inputs",
+    "hosts": "all",
+    "remote_user": "ubuntu",
+    "gather_facts": False,
+    "tasks": [
+        {
+            "name": "Check Docker is running",
+            "ansible.builtin.command": "systemctl is-active docker",
+            "changed_when": False,
+        },
+        {
+            "name": "Read provisioned inputs digest",
+            "ansible.builtin.command": f"cat {PROVISIONED_INPUTS_PATH}",
+            "register": "provisioned_inputs",
+            "changed_when": False,
+            "failed_when": "provisioned_inputs.stdout | trim != provision_inputs_digest",
+        },
+    ],
+}
+
+
+def _fingerprint(playbook : pathlib.Path, inventory : pathlib.Path,
+                 inputs_digest : typing.Optional[str]) -> str:
+    digest = hashlib.sha256()
+    ansible_dir = playbook.parent
+    for path in sorted(p for p in ansible_dir.rglob("*")
+                       if p.is_file() and "__pycache__" not in p.parts and not p.name.startswith(".provision-")):
+        digest.update(bytes(str(path.relative_to(ansible_dir)), "utf-8") + b"\0")
+        digest.update(path.read_bytes())
+    digest.update(b"\0inventory\0" + inventory.read_bytes())
+    digest.update(b"\0inputs\0" + bytes(inputs_digest or "", "utf-8"))
+    return digest.hexdigest()
+
+
+def resolve_hosts(pattern : str, inventory : dict) -> typing.List[str]:
+    """Return the hosts a play's `hosts:` pattern selects: "all", or ":"/","-separated groups."""
+
+    def group_hosts(name):
+        if name == "all":
+            return set(inventory["_meta"]["hostvars"])
+        group = inventory.get(name, {})
+        hosts = set(group.get("hosts", []))
+        for child in group.get("children", []):
+            hosts |= group_hosts(child)
+        return hosts
+
+    hosts = set()
+    for name in pattern.replace(",", ":").split(":"):
+        if name.strip():
+            hosts |= group_hosts(name.strip())
+    return sorted(hosts)
+
+
+def _read_progress(results_path : pathlib.Path) -> typing.Dict[str, dict]:
+    try:
+        with open(results_path) as results_f:
+            results = json.load(results_f)
+    except FileNotFoundError:
+        return {}
+    return next(iter(results.values()), {})
+
+
+def run_play(play : dict, playbook : pathlib.Path, inventory_path : pathlib.Path,
+             hosts : typing.List[str], timeout_sec : float, forks : int,
+             extra_vars : typing.Optional[dict] = None) -> typing.Dict[str, str]:
+    """Run `play` on `hosts`. Returns each host's outcome: "ok", "failed" or "unreachable".
+
+    The play runs with the free strategy, so each host works through it at its own pace. A host
+    which hasn't finished `timeout_sec` after it started the play is "failed", as is any host
+    with no recorded outcome (ansible itself failed). ansible-playbook is stopped once every host
+    has finished or timed out, or every fork is held by a host which timed out; the outcomes of
+    the hosts which finished are kept.
+    """
+    play = dict(play, strategy="free", post_tasks=play.get("post_tasks", []) + [
+        {"name": COMPLETE_TASK_NAME, "ansible.builtin.debug": {"msg": "Play complete"}}])
+    # Relative paths in the play (templates, files) resolve against the playbook's directory.
+    with tempfile.NamedTemporaryFile("w", dir=playbook.parent, prefix=".provision-", suffix=".yml") as play_f, \
+         tempfile.TemporaryDirectory(prefix="provision-results-") as results_dir:
+        yaml.dump([play], play_f, sort_keys=False)
+        play_f.flush()
+        results_path = pathlib.Path(results_dir) / "results.json"
+        env = dict(os.environ, TVM_CI_PROVISION_RESULTS_FILE=str(results_path))
+        extra_args = ["--extra-vars", json.dumps(extra_vars)] if extra_vars else []
+        proc = subprocess.Popen(
+            ["ansible-playbook", "-i", str(inventory_path.resolve()), "--limit", ",".join(hosts),
+             "--forks", str(forks)] + extra_args + [play_f.name],
+            cwd=playbook.parent, env=env)
+        try:
+            while proc.poll() is None:
+                time.sleep(PROGRESS_POLL_SEC)
+                progress = _read_progress(results_path)
+                running = [h for h, p in progress.items() if p["status"] == "running"]
+                timed_out = [h for h in running
+                             if time.time() - progress[h]["started"] > timeout_sec]
+                unstarted = len(hosts) - len(progress)
+                # Stop once only timed-out hosts are left, or they hold every fork, so that no
+                # other host can start.
+                if (timed_out and len(timed_out) == len(running) and
+                        (not unstarted or len(timed_out) >= forks)):
+                    for host in sorted(timed_out):
+                        _LOG.error("%s: %s did not finish within %ds", play["name"], host, timeout_sec)
+                    break
+        finally:
+            if proc.poll() is None:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=10 * PROGRESS_POLL_SEC)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+                    proc.wait()
+
+        progress = _read_progress(results_path)
+    outcomes = {host: p["status"] for host, p in progress.items()}
+    return {host: outcomes.get(host) if outcomes.get(host) in ("ok", "unreachable") else "failed"
+            for host in hosts}
+
+
+class ProvisionState:
+    """Which hosts completed which plays, persisted to a JSON file."""
+
+    def __init__(self, path : pathlib.Path, fingerprint : str):
+        self.path = path
+        self.completed = {}
+        if path.exists():
+            with open(path) as state_f:
+                state = json.load(state_f)
+            if state.get("fingerprint") == fingerprint:
+                self.completed = state["completed"]
+            else:
+                _LOG.info("Playbook or inventory changed; provisioning every host from the start")
+        self.fingerprint = fingerprint
+
+    def done(self, play_key : str) -> typing.Set[str]:
+        return set(self.completed.get(play_key, []))
+
+    def mark_done(self, play_key : str, hosts : typing.Iterable[str]):
+        self.completed[play_key] = sorted(self.done(play_key) | set(hosts))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        outputs.write_if_changed(self.path, json.dumps(
+            {"fingerprint": self.fingerprint, "completed": self.completed}, indent=2, sort_keys=True))
+
+
+def _load_inventory(args : argparse.Namespace) -> dict:
+    return json.loads(subprocess.check_output(
+        ["ansible-inventory", "-i", str(args.ansible_inventory_path.resolve()), "--list"],
+        cwd=args.playbook.parent))
+
+
+def _extra_vars(args : argparse.Namespace) -> dict:
+    if args.inputs_digest is None:
+        return {}
+
+    return {"provision_inputs_digest": args.inputs_digest}
+
+
+def outdated_hosts(args : argparse.Namespace) -> typing.List[str]:
+    """Return the hosts which aren't up and provisioned from --inputs-digest; see CHECK_PLAY."""
+    hosts = resolve_hosts(CHECK_PLAY["hosts"], _load_inventory(args))
+    with trace.span("provision.check", hosts=len(hosts)):
+        outcomes = run_play(CHECK_PLAY, args.playbook, args.ansible_inventory_path, hosts,
+                            args.host_timeout_sec, args.forks, _extra_vars(args))
+    return sorted(host for host, outcome in outcomes.items() if outcome != "ok")
+
+
+def provision(args : argparse.Namespace) -> typing.Dict[str, typing.List[str]]:
+    """Run every play to completion on every host it targets, as far as retries allow.
+
+    Returns
+    -------
+    Dict[str, List[str]] :
+        Maps each play which some host did not complete to those hosts.
+    """
+    with open(args.playbook) as playbook_f:
+        plays = yaml.safe_load(playbook_f)
+    inventory = _load_inventory(args)
+    state = ProvisionState(args.state, _fingerprint(args.playbook, args.ansible_inventory_path,
+                                                    args.inputs_digest))
+
+    failed_hosts = set()
+    incomplete = {}
+    for index, play in enumerate(plays):
+        play_key = f"{index}: {play['name']}"
+        targets = set(resolve_hosts(play["hosts"], inventory))
+        pending = sorted(targets - state.done(play_key) - failed_hosts)
+        skipped = len(targets) - len(pending)
+        if not pending:
+            _LOG.info("%s: already completed on all %d hosts", play["name"], len(targets))
+            continue
+        if skipped:
+            _LOG.info("%s: resuming on %d of %d hosts", play["name"], len(pending), len(targets))
+
+        for attempt in range(1, args.max_attempts + 1):
+            with trace.span("provision.play", play=play["name"], attempt=attempt, hosts=len(pending)):
+                outcomes = run_play(play, args.playbook, args.ansible_inventory_path, pending,
+                                    args.host_timeout_sec, args.forks, _extra_vars(args))
+            state.mark_done(play_key, [h for h, outcome in outcomes.items() if outcome == "ok"])
+            pending = sorted(h for h, outcome in outcomes.items() if outcome != "ok")
+            if not pending:
+                break
+
+            for host in pending:
+                _LOG.warning("%s: %s on %s (attempt %d of %d)", play["name"], outcomes[host], host,
+                             attempt, args.max_attempts)
+            if attempt < args.max_attempts:
+                backoff_sec = min(args.initial_backoff_sec * 2 ** (attempt - 1), args.max_backoff_sec)
+                _LOG.info("Retrying %d hosts in %.0fs", len(pending), backoff_sec)
+                time.sleep(backoff_sec)
+
+        if pending:
+            incomplete[play["name"]] = pending
+            failed_hosts.update(pending)
+
+    if not incomplete:
+        args.state.unlink(missing_ok=True)
+    return incomplete
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--ansible-inventory-path", type=pathlib.Path,
+                        default=utils.get_repo_root() / "build" / "ansible-inventory.yml",
+                        help="Ansible inventory written by configure_ansible")
+    parser.add_argument("--playbook", type=pathlib.Path,
+                        default=utils.get_repo_root() / "ansible" / "playbook.yml",
+                        help="Playbook to run")
+    parser.add_argument("--state", type=pathlib.Path,
+                        default=utils.get_repo_root() / "build" / "provision-state.json",
+                        help="Where to record which hosts completed which plays")
+    parser.add_argument("--max-attempts", type=int, default=5,
+                        help="Attempts per play on each host before giving up on the host")
+    parser.add_argument("--initial-backoff-sec", type=float, default=5,
+                        help="Delay before the first retry; doubled for each retry after")
+    parser.add_argument("--max-backoff-sec", type=float, default=120,
+                        help="Longest delay between retries")
+    parser.add_argument("--host-timeout-sec", type=float, default=30 * 60,
+                        help="Time allowed each host to finish an attempt of a play; unfinished hosts are retried")
+    parser.add_argument("--forks", type=int, default=20,
+                        help="Number of hosts ansible-playbook configures in parallel")
+    parser.add_argument("--reset", action="store_true",
+                        help="Forget completed plays and provision every host from the start")
+    parser.add_argument("--inputs-digest",
+                        help="Digest of the playbook's inputs, recorded on each provisioned host")
+    parser.add_argument("--check", action="store_true",
+                        help="Don't provision; exit 0 if every host holds --inputs-digest, else 1")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level="INFO")
+    if args.check:
+        if args.inputs_digest is None:
+            sys.exit("--check requires --inputs-digest")
+        outdated = outdated_hosts(args)
+        for host in outdated:
+            _LOG.info("Not provisioned from these inputs: %s", host)
+        sys.exit(1 if outdated else 0)
+
+    if args.reset:
+        args.state.unlink(missing_ok=True)
+
+    incomplete = provision(args)
+    if incomplete:
+        for play, hosts in incomplete.items():
+            _LOG.error("%s: failed on %s", play, ", ".join(hosts))
+        sys.exit("Provisioning incomplete; re-run to retry only the failed hosts")
+    _LOG.info("Provisioned all hosts")
+
+
+if __name__ == "__main__":
+    main()
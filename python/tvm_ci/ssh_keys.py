@@ -0,0 +1,143 @@
+"""Persistent SSH key material for the provisioner and the Jenkins executors.
+
+Keys are generated once, in-process (ed25519), and reused on every later run: regenerating the
+provisioner key replaces the aws_key_pair in Terraform, and regenerating the executor key rewrites
+the CasC credentials and every executor's authorized_keys. Replace a key deliberately with:
+
+    python -m tvm_ci.ssh_keys rotate <private-key-path>
+"""
+
+import argparse
+import datetime
+import logging
+import os
+import pathlib
+import stat
+import typing
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519
+
+from . import outputs
+
+
+_LOG = logging.getLogger(__name__)
+
+
+class UnprotectedKeyError(Exception):
+    """Raised when a private key on disk is readable by users other than its owner."""
+
+
+def _public_key_path(private_key_path : pathlib.Path) -> pathlib.Path:
+    return pathlib.Path(f"{private_key_path}.pub")
+
+
+def generate_key(comment : str = "") -> typing.Tuple[str, str]:
+    """Generate an ed25519 key. Returns (private_key, public_key) in OpenSSH format."""
+    key = ed25519.Ed25519PrivateKey.generate()
+    private_key = str(key.private_bytes(serialization.Encoding.PEM,
+                                        serialization.PrivateFormat.OpenSSH,
+                                        serialization.NoEncryption()), "utf-8")
+    public_key = str(key.public_key().public_bytes(serialization.Encoding.OpenSSH,
+                                                   serialization.PublicFormat.OpenSSH), "utf-8")
+    if comment:
+        public_key = f"{public_key} {comment}"
+    return private_key, public_key + "\n"
+
+
+def _derive_public_key(private_key : str, comment : str) -> str:
+    key = serialization.load_ssh_private_key(bytes(private_key, "utf-8"), password=None)
+    public_key = str(key.public_key().public_bytes(serialization.Encoding.OpenSSH,
+                                                   serialization.PublicFormat.OpenSSH), "utf-8")
+    return f"{public_key} {comment}\n" if comment else f"{public_key}\n"
+
+
+def _check_protected(private_key_path : pathlib.Path):
+    mode = stat.S_IMODE(private_key_path.stat().st_mode)
+    if (mode & ~0o600) != 0:
+        raise UnprotectedKeyError(
+            f"Private key is not well-enough protected (mode {mode:o}): {private_key_path}")
+
+
+def ensure_key(private_key_path : pathlib.Path,
+               public_key_path : typing.Optional[pathlib.Path] = None) -> str:
+    """Return the private key at `private_key_path`, generating it only if it does not exist.
+
+    The public key is kept next to the private key as <private_key_path>.pub. When
+    `public_key_path` is given, the public key is also copied there.
+
+    Returns
+    -------
+    str :
+        The private key, in OpenSSH format.
+    """
+    comment = private_key_path.name
+    if private_key_path.exists():
+        _check_protected(private_key_path)
+        private_key = private_key_path.read_text()
+        _LOG.info("Reusing SSH key: %s", private_key_path)
+    else:
+        private_key, public_key = generate_key(comment)
+        outputs.write_if_changed(private_key_path, private_key, 0o600)
+        outputs.write_if_changed(_public_key_path(private_key_path), public_key, 0o644)
+        _LOG.info("Generated SSH key: %s", private_key_path)
+
+    pub_path = _public_key_path(private_key_path)
+    if not pub_path.exists():
+        outputs.write_if_changed(pub_path, _derive_public_key(private_key, comment), 0o644)
+
+    if public_key_path is not None:
+        outputs.write_if_changed(public_key_path, pub_path.read_text(), 0o644)
+
+    return private_key
+
+
+def rotate_key(private_key_path : pathlib.Path) -> pathlib.Path:
+    """Replace the key at `private_key_path` with a new one.
+
+    The previous key pair is kept alongside, suffixed with the rotation time, so that hosts which
+    still trust it can be reached until they are re-provisioned.
+
+    Returns
+    -------
+    pathlib.Path :
+        Path to the retired private key.
+    """
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    retired_path = private_key_path.with_name(f"{private_key_path.name}.{stamp}.old")
+    if private_key_path.exists():
+        os.replace(private_key_path, retired_path)
+        pub_path = _public_key_path(private_key_path)
+        if pub_path.exists():
+            os.replace(pub_path, _public_key_path(retired_path))
+
+    ensure_key(private_key_path)
+    return retired_path
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ensure_parser = subparsers.add_parser("ensure", help="Generate the key if it does not exist")
+    ensure_parser.add_argument("private_key", type=pathlib.Path, help="Path to the private key")
+    rotate_parser = subparsers.add_parser(
+        "rotate", help=("Replace the key. Re-run 1-create-plan (provisioner key) or "
+                        "2-apply-plan and 3-provision (executor key) afterwards."))
+    rotate_parser.add_argument("private_key", type=pathlib.Path, help="Path to the private key")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level="INFO")
+
+    if args.command == "ensure":
+        ensure_key(args.private_key)
+    elif args.command == "rotate":
+        _LOG.info("Retired previous key to %s", rotate_key(args.private_key))
+
+    _LOG.info("Public key: %s", _public_key_path(args.private_key).read_text().strip())
+
+
+if __name__ == "__main__":
+    main()
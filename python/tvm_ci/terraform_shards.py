@@ -0,0 +1,408 @@
+"""Plan and apply the cluster's Terraform state shards, each only when its inputs changed.
+
+By default the whole cluster is one Terraform state, so resizing one node type refreshes and plans
+every resource in the account. With cluster.terraform_state_sharding set in the CI config:
+
+    cluster:
+        terraform_state_sharding: true
+        nodes:
+            cpu:
+                num_nodes: 4
+                ami_id: ami-0db9c72b57c9c81e4       # optional for arm, cpu and gpu
+                instance_type: c5.4xlarge           # optional for arm, cpu and gpu
+                root_block_device_size_gib: 400     # optional for arm, cpu and gpu
+
+the VPC, DNS, key pair, security group and head node stay in infra/ as the "shared" shard, under
+cluster.terraform_state_key. Each node type's executors are an instance of infra/executor-pool,
+the "executor-<type>" shard, with a state key of its own beside it. Executor pools read the shared
+shard's outputs from its state.
+
+`plan` computes a fingerprint of each shard's inputs (see create_backend_config) and plans only
+the shards whose inputs changed since their last plan, or whose plan is older than
+--max-plan-age-min: first the shared shard, then the executor pools in parallel. The shared
+shard's outputs are among the pools' inputs, so pools are planned against its current state, and
+only once it has been applied for the first time. `apply` applies only plans made by `plan`: the
+shared shard's if it has changes, then every executor pool's, in parallel. If applying the shared
+shard changed its outputs, the pools' plans are stale and `apply` fails; run `plan` and `apply`
+again. Shards whose plan has no changes are not applied. The outputs of all shards are merged into
+--terraform-output-json, named as in the unsharded state.
+
+Enabling sharding on an existing cluster sets the shared shard's executor counts to 0. So that its
+plan doesn't destroy the running arm, cpu and gpu executors, `plan` first moves them (with
+`terraform state mv`) from the shared state into their pools' states, where the pools' plans find
+them unchanged. `plan` stops rather than plan the shared shard while it still holds executors.
+
+Without sharding, the same commands plan and apply infra/ alone.
+"""
+
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+
+from . import create_backend_config
+from . import outputs
+from . import trace
+from . import utils
+
+
+_LOG = logging.getLogger(__name__)
+
+
+SHARED_SHARD = "shared"
+
+
+# Module holding a pool's executors in infra/executor-pool.
+EXECUTOR_POOL_MODULE = "module.executor"
+
+
+class Shard:
+    """One Terraform root, and the files and data dir it is planned and applied with."""
+
+    def __init__(self, name : str, root_dir : pathlib.Path, backend_config : pathlib.Path,
+                 var_file : pathlib.Path, plan : pathlib.Path,
+                 data_dir : typing.Optional[pathlib.Path], node_type : typing.Optional[str] = None):
+        self.name = name
+        self.root_dir = root_dir
+        self.backend_config = backend_config
+        self.var_file = var_file
+        self.plan = plan
+        # None to use root_dir/.terraform. Executor pools share one root, so each needs its own.
+        self.data_dir = data_dir
+        self.node_type = node_type
+
+    @property
+    def fingerprint_path(self) -> pathlib.Path:
+        return self.plan.parent / f"{self.plan.name}.fingerprint"
+
+    @property
+    def has_changes_path(self) -> pathlib.Path:
+        return self.plan.parent / f"{self.plan.name}.has-changes"
+
+
+class StalePlanError(Exception):
+    """Raised when a shard's inputs changed since it was planned."""
+
+
+class StateMigrationError(Exception):
+    """Raised when executors can't be moved from the shared state into their pool's."""
+
+
+def _artifact_dir(args : argparse.Namespace) -> pathlib.Path:
+    return pathlib.Path(args.backend_config).parent
+
+
+def shared_output_json(artifact_dir : pathlib.Path) -> pathlib.Path:
+    """Path to the shared shard's outputs as of its last apply, an input to the executor pools."""
+    return artifact_dir / "terraform-shards" / "shared-output.json"
+
+
+def shared_shard(args : argparse.Namespace) -> Shard:
+    return Shard(SHARED_SHARD, utils.get_repo_root() / "infra", pathlib.Path(args.backend_config),
+                 pathlib.Path(args.tf_var_file), pathlib.Path(args.plan), None)
+
+
+def executor_pool_shard(artifact_dir : pathlib.Path, node_type : str) -> Shard:
+    pool_dir = create_backend_config.executor_pool_dir(artifact_dir, node_type)
+    return Shard(pool_dir.name, utils.get_repo_root() / "infra" / "executor-pool",
+                 pool_dir / "backend-config.txt", pool_dir / "vars.txt", pool_dir / "plan.txt",
+                 artifact_dir.parent / "terraform-shards" / pool_dir.name / ".terraform", node_type)
+
+
+def executor_pool_shards(args : argparse.Namespace, tvm_ci_config : dict) -> typing.List[Shard]:
+    if not create_backend_config.sharding_enabled(tvm_ci_config):
+        return []
+    return [executor_pool_shard(_artifact_dir(args), node_type)
+            for node_type in sorted(tvm_ci_config["cluster"]["nodes"])]
+
+
+def fingerprint(shard : Shard, args : argparse.Namespace,
+                tvm_ci_config : dict) -> typing.Optional[str]:
+    """Return the fingerprint of the shard's plan inputs; None if it can't be planned yet."""
+    if shard.node_type is None:
+        provisioner_ssh_key = _artifact_dir(args) / "secret" / "provisioner-id_ed25519"
+        return create_backend_config.compute_plan_fingerprint(create_backend_config.fingerprint_inputs(
+            args.tvm_ci_config, provisioner_ssh_key, args))
+
+    output_json = shared_output_json(_artifact_dir(args))
+    if not output_json.exists():
+        return None
+    return create_backend_config.compute_plan_fingerprint(
+        create_backend_config.executor_pool_fingerprint_inputs(
+            shard.backend_config.parent, pathlib.Path(args.provider_config), output_json))
+
+
+def _terraform(shard : Shard, *terraform_args : str, capture : bool = True) -> subprocess.CompletedProcess:
+    env = dict(os.environ)
+    if shard.data_dir is not None:
+        shard.data_dir.mkdir(parents=True, exist_ok=True)
+        env["TF_DATA_DIR"] = str(shard.data_dir)
+    return subprocess.run(["terraform"] + list(terraform_args), cwd=shard.root_dir, env=env,
+                          stdout=subprocess.PIPE if capture else None,
+                          stderr=subprocess.STDOUT if capture else None, encoding="utf-8")
+
+
+def _check(shard : Shard, proc : subprocess.CompletedProcess, *ok_returncodes : int):
+    if proc.stdout:
+        _LOG.info("%s:\n%s", shard.name, proc.stdout.rstrip("\n"))
+    if proc.returncode not in (ok_returncodes or (0,)):
+        raise subprocess.CalledProcessError(proc.returncode, proc.args)
+
+
+def plan_is_current(shard : Shard, shard_fingerprint : str, max_age_min : float) -> bool:
+    """True when the shard's saved plan was made from these inputs and recently enough to reuse."""
+    data_dir = shard.data_dir if shard.data_dir is not None else shard.root_dir / ".terraform"
+    return (shard.plan.exists() and data_dir.is_dir() and shard.fingerprint_path.exists() and
+            time.time() - shard.plan.stat().st_mtime < max_age_min * 60 and
+            shard.fingerprint_path.read_text().strip() == shard_fingerprint)
+
+
+def has_changes(shard : Shard) -> bool:
+    # Plans saved before this was recorded are assumed to have changes.
+    return (not shard.has_changes_path.exists() or
+            shard.has_changes_path.read_text().strip() == "true")
+
+
+def init(shard : Shard):
+    with trace.span("terraform_shards.init", shard=shard.name):
+        _check(shard, _terraform(shard, "init", "-input=false", "-reconfigure",
+                                 f"-backend-config={shard.backend_config}"))
+
+
+def plan(shard : Shard, shard_fingerprint : str, provider_config : pathlib.Path) -> bool:
+    """Plan the shard, save its plan and fingerprint, and return whether it has changes."""
+    shard.fingerprint_path.unlink(missing_ok=True)
+    init(shard)
+    with trace.span("terraform_shards.plan", shard=shard.name):
+        proc = _terraform(shard, "plan", "-input=false", "-detailed-exitcode",
+                          f"-var-file={provider_config}", f"-var-file={shard.var_file}",
+                          f"-out={shard.plan}")
+        # -detailed-exitcode: 0 when there are no changes, 2 when there are.
+        _check(shard, proc, 0, 2)
+    changes = proc.returncode == 2
+    outputs.write_if_changed(shard.has_changes_path, "true\n" if changes else "false\n")
+    shard.fingerprint_path.write_text(f"{shard_fingerprint}\n")
+    return changes
+
+
+def apply(shard : Shard):
+    """Apply the shard's saved plan, if it has changes. The plan can't be reused afterwards."""
+    shard.fingerprint_path.unlink(missing_ok=True)
+    if not has_changes(shard):
+        _LOG.info("%s: no changes", shard.name)
+        return
+    with trace.span("terraform_shards.apply", shard=shard.name):
+        _check(shard, _terraform(shard, "apply", "-input=false", str(shard.plan)))
+
+
+def output(shard : Shard) -> dict:
+    proc = _terraform(shard, "output", "-json")
+    if proc.returncode != 0:
+        _check(shard, proc)
+    return json.loads(proc.stdout)
+
+
+def state_addresses(shard : Shard) -> typing.List[str]:
+    """Return the addresses of the resources in the shard's state. The shard must be initialized."""
+    proc = _terraform(shard, "state", "list")
+    if proc.returncode != 0:
+        _check(shard, proc)
+    return proc.stdout.split()
+
+
+def unsharded_executor_module(node_type : str) -> str:
+    """Module which held `node_type`'s executors in infra/extra-instances.tf, before sharding."""
+    return f"module.{node_type}_executor"
+
+
+def _in_module(addresses : typing.List[str], module : str) -> bool:
+    return any(a.startswith(f"{module}.") or a.startswith(f"{module}[") for a in addresses)
+
+
+def _pull_state(shard : Shard, path : pathlib.Path):
+    proc = _terraform(shard, "state", "pull")
+    if proc.returncode != 0:
+        _check(shard, proc)
+    path.write_text(proc.stdout)
+
+
+def move_executors(shared : Shard, pool : Shard):
+    """Move the pool's executors from the shared state into the pool's, which must hold none."""
+    module = unsharded_executor_module(pool.node_type)
+    init(pool)
+    if state_addresses(pool):
+        raise StateMigrationError(
+            f"{pool.name}: executors are in both its state and {shared.name}'s ({module}); remove "
+            f"the stale copy with `terraform state rm` before planning")
+
+    with trace.span("terraform_shards.move_executors", shard=pool.name), \
+            tempfile.TemporaryDirectory(prefix="tvm-ci-state-") as tmp_dir:
+        shared_state = pathlib.Path(tmp_dir) / "shared.tfstate"
+        pool_state = pathlib.Path(tmp_dir) / "pool.tfstate"
+        _pull_state(shared, shared_state)
+        # An empty pull means the pool has no state yet; `state mv` creates it.
+        _pull_state(pool, pool_state)
+        if not pool_state.read_text().strip():
+            pool_state.unlink()
+        # Run outside any Terraform root, so that only the local copies are touched.
+        subprocess.check_call(["terraform", "state", "mv", f"-state={shared_state}",
+                               f"-state-out={pool_state}", module, EXECUTOR_POOL_MODULE],
+                              cwd=tmp_dir)
+        # Push the pool's state first: if pushing the shared state then fails, the executors are
+        # in both, and the next plan stops (above) instead of destroying them.
+        _check(pool, _terraform(pool, "state", "push", str(pool_state)))
+        _check(shared, _terraform(shared, "state", "push", str(shared_state)))
+    _LOG.info("%s: moved %s from the %s state to %s", pool.name, module, shared.name,
+              EXECUTOR_POOL_MODULE)
+
+
+def migrate_executors(shared : Shard, pools : typing.List[Shard]):
+    """Move executors created before sharding was enabled into their pools' states.
+
+    Raises
+    ------
+    StateMigrationError :
+        When the shared state holds executors of a node type which has no pool.
+    """
+    init(shared)
+    addresses = state_addresses(shared)
+    for pool in pools:
+        if _in_module(addresses, unsharded_executor_module(pool.node_type)):
+            move_executors(shared, pool)
+
+    pool_types = {pool.node_type for pool in pools}
+    for node_type in create_backend_config.EXECUTOR_POOL_DEFAULTS:
+        if node_type not in pool_types and _in_module(addresses,
+                                                      unsharded_executor_module(node_type)):
+            raise StateMigrationError(
+                f"{shared.name}: holds {node_type} executors, which planning it would destroy; "
+                f"keep {node_type} in cluster.nodes until they are moved to its pool")
+
+
+def _run_parallel(fn : typing.Callable[[Shard], None], shards : typing.List[Shard], jobs : int):
+    failed = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = {executor.submit(fn, shard): shard for shard in shards}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except Exception:
+                _LOG.exception("%s: failed", futures[future].name)
+                failed.append(futures[future].name)
+    if failed:
+        sys.exit(f"Failed: {', '.join(sorted(failed))}")
+
+
+def plan_all(args : argparse.Namespace, tvm_ci_config : dict):
+    def plan_shard(shard):
+        shard_fingerprint = fingerprint(shard, args, tvm_ci_config)
+        if shard_fingerprint is None:
+            _LOG.info("%s: will be planned once the shared shard is applied", shard.name)
+        elif plan_is_current(shard, shard_fingerprint, args.max_plan_age_min):
+            _LOG.info("%s: inputs unchanged since the last plan; reusing %s", shard.name, shard.plan)
+        else:
+            plan(shard, shard_fingerprint, pathlib.Path(args.provider_config))
+
+    shared = shared_shard(args)
+    pools = executor_pool_shards(args, tvm_ci_config)
+    if pools:
+        # The shared shard's plan would destroy any executors still in its state.
+        migrate_executors(shared, pools)
+    _run_parallel(plan_shard, [shared], 1)
+
+    if pools:
+        # Plan the pools against the shared shard's outputs as of its last apply.
+        shared_outputs = output(shared)
+        if shared_outputs:
+            outputs.write_if_changed(shared_output_json(_artifact_dir(args)),
+                                     json.dumps(shared_outputs, indent=2, sort_keys=True))
+        _run_parallel(plan_shard, pools, args.jobs)
+
+
+def stale_shards(shards : typing.List[Shard], args : argparse.Namespace,
+                 tvm_ci_config : dict) -> typing.List[str]:
+    """Return the names of the shards whose saved plan wasn't made from their current inputs."""
+    return [shard.name for shard in shards
+            if not plan_is_current(shard, fingerprint(shard, args, tvm_ci_config), float("inf"))]
+
+
+def apply_all(args : argparse.Namespace, tvm_ci_config : dict):
+    shared = shared_shard(args)
+    pools = executor_pool_shards(args, tvm_ci_config)
+    # Until the shared shard is first applied, the pools can't be planned; they are reported below.
+    first_apply = not shared_output_json(_artifact_dir(args)).exists()
+    stale = stale_shards([shared] + ([] if first_apply else pools), args, tvm_ci_config)
+    if stale:
+        raise StalePlanError(f"{', '.join(stale)}: inputs changed since the last plan, or never "
+                             "planned; re-run stage-scripts/1-create-plan.sh")
+    apply(shared)
+    shared_outputs = output(shared)
+
+    if pools:
+        outputs.write_if_changed(shared_output_json(_artifact_dir(args)),
+                                 json.dumps(shared_outputs, indent=2, sort_keys=True))
+        # The pools were planned against the shared outputs from before this apply.
+        stale = stale_shards(pools, args, tvm_ci_config)
+        if stale:
+            raise StalePlanError(
+                f"{', '.join(stale)}: applying {shared.name} changed the outputs these were "
+                "planned against; re-run stage-scripts/1-create-plan.sh and 2-apply-plan.sh")
+        _run_parallel(apply, pools, args.jobs)
+
+    merged = dict(shared_outputs)
+    for shard in pools:
+        for key, value in output(shard).items():
+            merged[f"{shard.node_type}_{key}"] = value
+    outputs.write_if_changed(args.terraform_output_json, json.dumps(merged, indent=2, sort_keys=True))
+
+
+def parse_args():
+    artifact_dir = utils.get_repo_root() / "build" / "artifact"
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    utils.add_tvm_ci_config_arg(parser)
+    parser.add_argument("--backend-config", type=pathlib.Path,
+                        default=artifact_dir / "terraform-backend-config.txt",
+                        help="Backend config of the shared shard, written by create_backend_config")
+    parser.add_argument("--provider-config", type=pathlib.Path,
+                        default=artifact_dir / "terraform-provider-config.txt",
+                        help="Provider config of every shard, written by create_backend_config")
+    parser.add_argument("--tf-var-file", type=pathlib.Path,
+                        default=artifact_dir / "terraform-vars.txt",
+                        help="Var-file of the shared shard, written by create_backend_config")
+    parser.add_argument("--plan", type=pathlib.Path, default=artifact_dir / "terraform-plan.txt",
+                        help="Path to the shared shard's plan")
+    parser.add_argument("--jobs", type=int, default=8, help="Number of shards run concurrently")
+
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    plan_parser = subparsers.add_parser("plan", help="Plan the shards whose inputs changed")
+    plan_parser.add_argument("--max-plan-age-min", type=float,
+                             default=720,
+                             help=("Re-plan even unchanged shards whose plan is older than this, so "
+                                   "that changes made outside this repo are eventually picked up"))
+    apply_parser = subparsers.add_parser("apply", help="Apply the shards' plans which have changes")
+    apply_parser.add_argument("--terraform-output-json", type=pathlib.Path,
+                              default=artifact_dir / "terraform-output.json",
+                              help="Path to which the merged outputs of all shards are written")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level="INFO")
+
+    tvm_ci_config = utils.parse_tvm_ci_config(args)
+    if args.command == "plan":
+        plan_all(args, tvm_ci_config)
+    elif args.command == "apply":
+        apply_all(args, tvm_ci_config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""Record timing spans in Chrome trace format and report on them.
+
+Spans are appended to the file named by the TVM_CI_TRACE_FILE environment variable, one JSON
+event per line. The file follows the Chrome "JSON Array Format" (the closing bracket is optional),
+so it can be loaded directly into chrome://tracing or https://ui.perfetto.dev. When the environment
+variable is unset, tracing is a no-op.
+
+This module only depends on the standard library so that it can run outside the crane container
+(see crane/make_with_log.sh).
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import logging
+import os
+import pathlib
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import typing
+
+
+_LOG = logging.getLogger(__name__)
+
+
+TRACE_FILE_ENV_VAR = "TVM_CI_TRACE_FILE"
+
+
+def get_trace_path() -> typing.Optional[pathlib.Path]:
+    path = os.environ.get(TRACE_FILE_ENV_VAR)
+    if not path:
+        return None
+
+    return pathlib.Path(path)
+
+
+def now_us() -> int:
+    # Wall-clock time is used (rather than a monotonic clock) so that spans emitted by different
+    # processes line up on the same timeline.
+    return int(time.time() * 1e6)
+
+
+def _append_event(trace_path : pathlib.Path, event : dict):
+    trace_path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        fd = os.open(trace_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644)
+        os.write(fd, b"[\n")
+    except FileExistsError:
+        fd = os.open(trace_path, os.O_WRONLY | os.O_APPEND)
+
+    try:
+        # A single write() per event keeps concurrent writers from interleaving lines.
+        os.write(fd, bytes(json.dumps(event, sort_keys=True) + ",\n", "utf-8"))
+    finally:
+        os.close(fd)
+
+
+def record_span(name : str, start_us : int, end_us : int, category : str = "tvm_ci",
+                args : typing.Optional[dict] = None, tid : typing.Optional[int] = None):
+    """Append a complete ("X") event to the trace file, if tracing is enabled.
+
+    `tid` selects the row the span is drawn on in the trace viewer; by default, the calling thread.
+    """
+    trace_path = get_trace_path()
+    if trace_path is None:
+        return
+
+    _append_event(trace_path, {
+        "name": name,
+        "cat": category,
+        "ph": "X",
+        "ts": start_us,
+        "dur": max(0, end_us - start_us),
+        "pid": os.getpid(),
+        "tid": tid if tid is not None else threading.get_ident() % (1 << 31),
+        "args": args or {},
+    })
+
+
+@contextlib.contextmanager
+def span(name : str, category : str = "tvm_ci", **args):
+    """Context manager which records the time spent inside it as a span named `name`.
+
+    Keyword arguments are attached to the event and shown by the trace viewer. Spans which exit
+    with an exception are recorded with an "error" arg.
+    """
+    start_us = now_us()
+    try:
+        yield
+    except BaseException as e:
+        args["error"] = type(e).__name__
+        raise
+    finally:
+        record_span(name, start_us, now_us(), category=category, args=args)
+
+
+def load_trace(trace_path : pathlib.Path) -> typing.List[dict]:
+    """Load the complete events from a trace file written by this module.
+
+    The file is parsed line-by-line so that traces which are still being written (no closing
+    bracket, trailing comma) can be read.
+    """
+    events = []
+    with open(trace_path) as trace_f:
+        for line in trace_f:
+            line = line.strip().rstrip(",")
+            if line in ("", "[", "]"):
+                continue
+
+            event = json.loads(line)
+            if event.get("ph") == "X":
+                events.append(event)
+
+    return events
+
+
+def _contains(outer : dict, inner : dict) -> bool:
+    return (outer["ts"] <= inner["ts"] and
+            inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"] and
+            outer is not inner)
+
+
+def build_span_tree(events : typing.List[dict]) -> typing.List[dict]:
+    """Nest spans by time containment.
+
+    Spans are nested regardless of the process that emitted them, because each stage step runs
+    its tools as child processes. Returns the root spans; each span gains a "children" list.
+    """
+    # Longest first, so that parents are placed before their children.
+    ordered = sorted(events, key=lambda e: (e["ts"], -e["dur"]))
+    roots = []
+    stack = []
+    for event in ordered:
+        event = dict(event, children=[])
+        while stack and not _contains(stack[-1], event):
+            stack.pop()
+
+        if stack:
+            stack[-1]["children"].append(event)
+        else:
+            roots.append(event)
+        stack.append(event)
+
+    return roots
+
+
+def critical_path(spans : typing.List[dict], depth : int = 0) -> typing.List[typing.Tuple[int, dict]]:
+    """Compute the critical path through a list of sibling spans.
+
+    Walking backwards from the span which finishes last, repeatedly pick the latest-finishing span
+    that ends before the current one starts. Each span on the path is then expanded into the
+    critical path through its own children.
+
+    Returns
+    -------
+    list[tuple[int, dict]] :
+        (depth, span) pairs, in execution order.
+    """
+    if not spans:
+        return []
+
+    chain = [max(spans, key=lambda s: s["ts"] + s["dur"])]
+    while True:
+        predecessors = [s for s in spans if s["ts"] + s["dur"] <= chain[-1]["ts"]]
+        if not predecessors:
+            break
+        chain.append(max(predecessors, key=lambda s: s["ts"] + s["dur"]))
+
+    path = []
+    for s in reversed(chain):
+        path.append((depth, s))
+        path.extend(critical_path(s["children"], depth + 1))
+
+    return path
+
+
+def _history_durations(history_dir : pathlib.Path, limit : int) -> typing.Dict[str, typing.List[int]]:
+    """Return the durations of each named span over the last `limit` archived traces."""
+    durations = {}
+    if not history_dir.is_dir():
+        return durations
+
+    for trace_path in sorted(history_dir.glob("*.json"))[-limit:]:
+        for event in load_trace(trace_path):
+            durations.setdefault(event["name"], []).append(event["dur"])
+
+    return durations
+
+
+def _format_sec(us : float) -> str:
+    return f"{us / 1e6:9.2f}s"
+
+
+def report(trace_path : pathlib.Path, history_dir : pathlib.Path, history_limit : int,
+           out : typing.TextIO = sys.stdout):
+    events = load_trace(trace_path)
+    if not events:
+        out.write(f"No spans recorded in {trace_path}\n")
+        return
+
+    roots = build_span_tree(events)
+    start_us = min(e["ts"] for e in events)
+    end_us = max(e["ts"] + e["dur"] for e in events)
+    history = _history_durations(history_dir, history_limit)
+
+    out.write(f"Trace: {trace_path}\n")
+    out.write(f"Wall time: {_format_sec(end_us - start_us).strip()}, {len(events)} spans\n")
+    if history:
+        out.write(f"Comparing against median of last {history_limit} runs in {history_dir}\n")
+    out.write("\nCritical path:\n")
+    for depth, s in critical_path(roots):
+        line = f"  {_format_sec(s['dur'])}  {'  ' * depth}{s['name']}"
+        previous = history.get(s["name"])
+        if previous:
+            median = statistics.median(previous)
+            delta = s["dur"] - median
+            pct = f" ({100.0 * delta / median:+.0f}%)" if median else ""
+            line += f"   [median {_format_sec(median).strip()}, {delta / 1e6:+.2f}s{pct}]"
+        out.write(line + "\n")
+
+
+def archive(trace_path : pathlib.Path, history_dir : pathlib.Path) -> pathlib.Path:
+    """Move a finished trace into the history directory so later reports compare against it."""
+    history_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    dest = history_dir / f"{stamp}.json"
+    shutil.move(str(trace_path), dest)
+    return dest
+
+
+def run_command(name : str, cmd : typing.List[str]) -> int:
+    """Run `cmd`, recording its runtime as a span. Returns the exit code."""
+    with span(name, category="step", cmd=" ".join(cmd)):
+        proc = subprocess.Popen(cmd)
+        # Pass SIGTERM on, so that killing this wrapper (e.g. from a stage script's EXIT trap)
+        # stops the command too.
+        previous = signal.signal(signal.SIGTERM, lambda signum, frame: proc.send_signal(signum))
+        try:
+            proc.wait()
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+
+    return proc.returncode
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser(
+        "run", help="Run a command, recording its runtime as a span in $TVM_CI_TRACE_FILE")
+    run_parser.add_argument("--name", required=True, help="Name of the span")
+    run_parser.add_argument("cmd", nargs=argparse.REMAINDER,
+                            help="Command to run. Separate from options with --.")
+
+    report_parser = subparsers.add_parser(
+        "report", help="Print the critical path of a trace and compare it with previous runs")
+    report_parser.add_argument("--trace", type=pathlib.Path, default=get_trace_path(),
+                               help="Trace file to report on. Defaults to $TVM_CI_TRACE_FILE.")
+    report_parser.add_argument("--history-dir", type=pathlib.Path,
+                               help=("Directory containing traces from previous runs. Defaults to "
+                                     "the history/ directory next to --trace."))
+    report_parser.add_argument("--history-limit", type=int, default=5,
+                               help="Number of previous runs to compare against")
+    report_parser.add_argument("--archive", action="store_true",
+                               help="After reporting, move the trace into --history-dir")
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level="INFO")
+
+    if args.command == "run":
+        cmd = args.cmd[1:] if args.cmd[:1] == ["--"] else args.cmd
+        if not cmd:
+            sys.exit("run: no command given")
+        sys.exit(run_command(args.name, cmd))
+
+    if args.trace is None:
+        sys.exit(f"report: pass --trace or set {TRACE_FILE_ENV_VAR}")
+
+    history_dir = args.history_dir or args.trace.parent / "history"
+    report(args.trace, history_dir, args.history_limit)
+    if args.archive:
+        _LOG.info("Archived trace to %s", archive(args.trace, history_dir))
+
+
+if __name__ == "__main__":
+    main()
@@ -84,11 +84,3 @@ def parse_tvm_ci_config(args : argparse.Namespace):
     with open(args.tvm_ci_config) as ci_config_f:
         return yaml.safe_load(ci_config_f)
 
-
-def generate_ssh_key(private_key_path, public_key_path=None):
-    private_key_path.parent.mkdir(parents=True, exist_ok=True)
-    private_key_path.unlink(missing_ok=True)
-    subprocess.check_call(["ssh-keygen", "-t", "rsa", "-b", "2048", "-N", "", "-f",
-                           str(private_key_path)])
-    if public_key_path is not None:
-        pathlib.Path(str(private_key_path) + ".pub").rename(public_key_path)
@@ -11,7 +11,8 @@ CONFIG_FILE="$1"
 #        "--tvm-ci-config=${CONFIG_FILE}" \
 #        --required-plugins=config/plugins.txt \
 #        "--installed-plugins=${ARTIFACT_DIR}/installed-plugins.txt" \
-#        "--container-filename=${ARTIFACT_DIR}/container-tag.txt"
+#        "--container-filename=${ARTIFACT_DIR}/container-tag.txt" \
+#        "--artifact-store=${ARTIFACT_STORE_DIR}"
 
 poetry run python -m tvm_ci.create_backend_config \
        "--tvm-ci-config=${CONFIG_FILE}" \
@@ -20,9 +21,14 @@ poetry run python -m tvm_ci.create_backend_config \
        "--tf-var-file=${TERRAFORM_CONFIG_VARS_PATH}" \
        "--container-tag=$(cat "${JENKINS_CONTAINER_TAG_PATH}")"
 
-cd infra
-terraform init "-backend-config=${TERRAFORM_BACKEND_CONFIG_PATH}"
-terraform plan \
-          "-var-file=${TERRAFORM_PROVIDER_CONFIG_PATH}" \
-          "-var-file=${TERRAFORM_CONFIG_VARS_PATH}" \
-          "-out=${TERRAFORM_PLAN_PATH}"
+# Plans only the Terraform state shards (just infra/, unless cluster.terraform_state_sharding is
+# set) whose inputs changed since their saved plan. A plan is only valid until it is applied
+# (2-apply-plan consumes it) or until it is older than TERRAFORM_PLAN_MAX_AGE_MIN, so that changes
+# made outside this repo are eventually picked up.
+trace_run terraform-plan poetry run python -m tvm_ci.terraform_shards \
+          "--tvm-ci-config=${CONFIG_FILE}" \
+          "--backend-config=${TERRAFORM_BACKEND_CONFIG_PATH}" \
+          "--provider-config=${TERRAFORM_PROVIDER_CONFIG_PATH}" \
+          "--tf-var-file=${TERRAFORM_CONFIG_VARS_PATH}" \
+          "--plan=${TERRAFORM_PLAN_PATH}" \
+          plan "--max-plan-age-min=${TERRAFORM_PLAN_MAX_AGE_MIN}"
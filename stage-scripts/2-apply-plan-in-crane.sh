@@ -9,7 +9,7 @@ cd "$(get_repo_root)"
 
 CONFIG_FILE="${1}"
 
-rm -rf build/jenkins-homedir
+rm -rf build/jenkins-homedir build/controllers/*/jenkins-homedir
 poetry run python -m tvm_ci.jenkins_builder.configure_jenkins \
        --base-casc-config=config/base-jenkins.yaml \
        "--tvm-ci-config=${CONFIG_FILE}" \
@@ -21,9 +21,16 @@ poetry run python -m tvm_ci.jenkins_builder.configure_jenkins \
        --jenkins-homedir=${BUILD_DIR}/jenkins-homedir \
        --jenkins-homedir-tar-gz=${BUILD_DIR}/jenkins-homedir.tar.gz \
        --jenkins-jobs-config-ini=config/jenkins-jobs/jenkins_jobs.ini \
-       --jenkins-jobs-files=config/jenkins-jobs
+       --jenkins-jobs-files=config/jenkins-jobs \
+       "--casc-snapshot=${ARTIFACT_DIR}/secret/jenkins-casc.yaml" \
+       "--artifact-store=${ARTIFACT_STORE_DIR}"
 
-cd infra
-
-terraform apply "${TERRAFORM_PLAN_PATH}"
-terraform output -json >"${ARTIFACT_DIR}/terraform-output.json"
+# Applying consumes the plans: state changes, so they can't be reused by the next 1-create-plan.
+# Shards whose plan has no changes are skipped; executor pools are applied in parallel.
+trace_run terraform-apply poetry run python -m tvm_ci.terraform_shards \
+          "--tvm-ci-config=${CONFIG_FILE}" \
+          "--backend-config=${TERRAFORM_BACKEND_CONFIG_PATH}" \
+          "--provider-config=${TERRAFORM_PROVIDER_CONFIG_PATH}" \
+          "--tf-var-file=${TERRAFORM_CONFIG_VARS_PATH}" \
+          "--plan=${TERRAFORM_PLAN_PATH}" \
+          apply "--terraform-output-json=${ARTIFACT_DIR}/terraform-output.json"
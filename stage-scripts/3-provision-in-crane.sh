@@ -7,16 +7,59 @@ source "./util.sh" || exit 2
 
 cd "$(get_repo_root)"
 
+CONFIG_FILE="${1}"
+
 eval $(ssh-agent)
 
-ssh-add "${ARTIFACT_DIR}/secret/provisioner-id_rsa"
+ssh-add "${PROVISIONER_SSH_KEY_PATH}"
+
+# Ansible connects to nodes by IP, so provisioning needn't wait for the DNS records terraform apply
+# just created. Jenkins reaches its agents by name, though; check the records concurrently with
+# provisioning and fail the step if they don't resolve.
+trace_run dns_check poetry run python -m tvm_ci.dns_check \
+          "--terraform-output-json=${ARTIFACT_DIR}/terraform-output.json" &
+dns_check_pid=$!
+# Don't leave it running if a step below fails and set -e exits early.
+trap 'kill ${dns_check_pid} 2>/dev/null || true' EXIT
 
 poetry run python -m tvm_ci.configure_ansible \
+       "--tvm-ci-config=${CONFIG_FILE}" \
        --executor-ssh-public-key=${ARTIFACT_DIR}/executor-ssh-key.pub \
        "--jenkins-master-container-tag=$(cat "${JENKINS_CONTAINER_TAG_PATH}")" \
        "--terraform-output-json=${ARTIFACT_DIR}/terraform-output.json" \
        --jenkins-homedir-tar-gz=${BUILD_DIR}/jenkins-homedir.tar.gz \
        --ansible-inventory-path=${BUILD_DIR}/ansible-inventory.yml
 
-cd ansible
-ansible-playbook -i ${BUILD_DIR}/ansible-inventory.yml playbook.yml
+# Everything the playbook reads. The playbook is skipped when none of it changed since the last
+# successful run and every host confirms it was provisioned from it. Set FORCE_PROVISION=1 to run
+# it regardless, e.g. to repair a host that drifted.
+PROVISION_INPUTS=(
+    "${BUILD_DIR}/ansible-inventory.yml"
+    "${ARTIFACT_DIR}/executor-ssh-key.pub"
+    "${BUILD_DIR}/jenkins-homedir.tar.gz"
+    $(find "${BUILD_DIR}/controllers" -name jenkins-homedir.tar.gz 2>/dev/null | sort)
+    $(find ansible -type f -not -name '*.pyc' | sort)
+)
+PROVISION_INPUTS_DIGEST="$(artifacts_digest "${PROVISION_INPUTS[@]}")"
+if [ "${FORCE_PROVISION:-0}" != "1" ] && ! artifacts_changed provision "${PROVISION_INPUTS[@]}" && \
+       trace_run provision_check poetry run python -m tvm_ci.provision --check \
+                 --ansible-inventory-path=${BUILD_DIR}/ansible-inventory.yml \
+                 "--inputs-digest=${PROVISION_INPUTS_DIGEST}"; then
+    echo "Every host is provisioned from the current inputs; skipping the playbook."
+else
+    # Runs the playbook a play at a time, retrying only hosts which fail and resuming from
+    # ${BUILD_DIR}/provision-state.json when re-run after a failure.
+    trace_run provision poetry run python -m tvm_ci.provision \
+        --ansible-inventory-path=${BUILD_DIR}/ansible-inventory.yml \
+        "--inputs-digest=${PROVISION_INPUTS_DIGEST}"
+    stamp_artifacts provision "${PROVISION_INPUTS[@]}"
+fi
+
+wait ${dns_check_pid}
+trap - EXIT
+
+# The CasC config now running on each controller; 3-reconfigure diffs against it. Controllers
+# other than the head node's keep theirs under secret/controllers/<name>.
+find "${ARTIFACT_DIR}/secret" -name jenkins-casc.yaml | while read -r casc; do
+    install -m 600 "${casc}" "$(dirname "${casc}")/deployed-jenkins.yaml"
+done
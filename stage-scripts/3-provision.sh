@@ -5,4 +5,4 @@ source "./util.sh" || exit 2
 
 cd "$(get_repo_root)"
 
-crane/run.sh stage-scripts/3-provision-in-crane.sh
+trace_run 3-provision crane/run.sh stage-scripts/3-provision-in-crane.sh "${CONFIG_FILE:-config/dev.yaml}"
@@ -0,0 +1,29 @@
+#!/bin/bash -ex
+
+set -xe
+
+cd "$(dirname "$0")"
+source "./util.sh" || exit 2
+
+cd "$(get_repo_root)"
+
+CONFIG_FILE="${1}"
+
+eval $(ssh-agent)
+
+ssh-add "${PROVISIONER_SSH_KEY_PATH}"
+
+auth_args=( )
+if [ -n "${RECONFIGURE_JENKINS_USER}" ]; then
+    auth_args=( "--jenkins-user=${RECONFIGURE_JENKINS_USER}"
+                "--jenkins-api-token-file=config/secrets/jenkins-api-token" )
+fi
+
+poetry run python -m tvm_ci.jenkins_builder.reconfigure \
+       --base-casc-config=config/base-jenkins.yaml \
+       "--tvm-ci-config=${CONFIG_FILE}" \
+       --github-personal-access-token=config/secrets/github-personal-access-token \
+       --jenkins-executor-private-key=${BUILD_DIR}/executor-ssh-key \
+       "--deployed-casc=${ARTIFACT_DIR}/secret/deployed-jenkins.yaml" \
+       --ansible-inventory-path=${BUILD_DIR}/ansible-inventory.yml \
+       "${auth_args[@]}"
@@ -0,0 +1,8 @@
+#!/bin/bash -e
+
+cd "$(dirname "$0")"
+source "./util.sh" || exit 2
+
+cd "$(get_repo_root)"
+
+trace_run 3-reconfigure crane/run.sh stage-scripts/3-reconfigure-in-crane.sh "${CONFIG_FILE:-config/dev.yaml}"
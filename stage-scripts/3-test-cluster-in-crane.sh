@@ -0,0 +1,67 @@
+#!/bin/bash -ex
+
+set -xe
+
+cd "$(dirname "$0")"
+source "./util.sh" || exit 2
+
+cd "$(get_repo_root)"
+
+CONFIG_FILE="${1}"
+
+# Jenkins only listens on localhost on each controller's host; reach it through an SSH tunnel.
+LOAD_TEST_LOCAL_PORT="${LOAD_TEST_LOCAL_PORT:-18080}"
+tunnel_hosts=( )
+function close_tunnels() {
+    for i in "${!tunnel_hosts[@]}"; do
+        ssh -S "${BUILD_DIR}/load-test-tunnel-${i}.sock" -O exit "ubuntu@${tunnel_hosts[${i}]}"
+    done
+}
+trap close_tunnels EXIT
+
+auth_args=( )
+if [ -n "${LOAD_TEST_JENKINS_USER}" ]; then
+    auth_args=( "--jenkins-user=${LOAD_TEST_JENKINS_USER}"
+                "--jenkins-api-token-file=config/secrets/jenkins-api-token" )
+fi
+
+# Usage: load_test <controller host FQDN> <report path> [load_test args...]
+function load_test() {
+    local fqdn="$1"
+    local report="$2"
+    shift 2
+    local i="${#tunnel_hosts[@]}"
+    local port=$((LOAD_TEST_LOCAL_PORT + i))
+    ssh -i "${PROVISIONER_SSH_KEY_PATH}" \
+        -o "UserKnownHostsFile=/dev/null" \
+        -o "StrictHostKeyChecking=no" \
+        -o "ExitOnForwardFailure=yes" \
+        -M -S "${BUILD_DIR}/load-test-tunnel-${i}.sock" -f -N \
+        -L "${port}:localhost:8080" \
+        "ubuntu@${fqdn}"
+    tunnel_hosts+=( "${fqdn}" )
+
+    poetry run python -m tvm_ci.load_test \
+           "--tvm-ci-config=${CONFIG_FILE}" \
+           "--jenkins-url=http://localhost:${port}" \
+           "${auth_args[@]}" \
+           "--builds-per-label=${LOAD_TEST_BUILDS_PER_LABEL:-4}" \
+           --max-p95-queue-wait-sec=60 \
+           --max-p95-pickup-sec=300 \
+           --max-p95-checkout-sec=600 \
+           "--report=${report}" \
+           "$@"
+}
+
+head_node_fqdn=$(python3 -c 'import json, sys; print(json.load(open(sys.argv[1]))["jenkins_head_node_fqdn"]["value"])' \
+                         "${ARTIFACT_DIR}/terraform-output.json")
+load_test "${head_node_fqdn}" "${ARTIFACT_DIR}/load-test-report.json"
+
+# With jenkins.controllers set, every other controller's node types are tested on that controller.
+controller_fqdns=$(python3 -c 'import json, sys; [print(n, f) for n, f in json.load(open(sys.argv[1])).get("jenkins_controller_fqdn", {}).get("value", {}).items()]' \
+                           "${ARTIFACT_DIR}/terraform-output.json")
+while read -r -u 3 controller controller_fqdn; do
+    [ -n "${controller}" ] || continue
+    load_test "${controller_fqdn}" "${ARTIFACT_DIR}/controllers/${controller}/load-test-report.json" \
+              "--controller=${controller}"
+done 3<<< "${controller_fqdns}"
@@ -5,6 +5,17 @@ source "./util.sh" || exit 2
 
 cd "$(get_repo_root)"
 
+# Executor pools first (when the state is sharded; see python/tvm_ci/terraform_shards.py), since
+# they use the shared shard's network.
+for pool_dir in "${ARTIFACT_DIR}"/terraform-shards/executor-*/; do
+    [ -d "${pool_dir}" ] || continue
+    (cd infra/executor-pool && \
+         TF_DATA_DIR="${BUILD_DIR}/terraform-shards/$(basename "${pool_dir}")/.terraform" \
+         terraform destroy \
+         -var-file "${TERRAFORM_PROVIDER_CONFIG_PATH}" \
+         -var-file "${pool_dir}vars.txt")
+done
+
 cd infra
 terraform destroy \
           -var-file ../build/artifact/terraform-provider-config.txt \
@@ -0,0 +1,88 @@
+#!/bin/bash -ex
+
+set -xe
+
+cd "$(dirname "$0")"
+source "./util.sh" || exit 2
+
+cd "$(get_repo_root)"
+
+CONFIG_FILE="${1}"
+ACTION="${2}"
+
+# Kept apart from build/, so a local cluster doesn't disturb the AWS cluster's artifacts.
+LOCAL_CLUSTER_DIR="${BUILD_DIR}/local-cluster"
+
+if [ "${ACTION}" == "down" ]; then
+    poetry run python -m tvm_ci.local_cluster "--tvm-ci-config=${CONFIG_FILE}" down
+    rm -f "${LOCAL_CLUSTER_DIR}/provision-state.json"
+    exit 0
+elif [ "${ACTION}" != "up" ]; then
+    echo "${ACTION}: unrecognized command; use up or down"
+    exit 2
+fi
+
+rm -rf "${LOCAL_CLUSTER_DIR}/jenkins-homedir" "${LOCAL_CLUSTER_DIR}"/controllers/*/jenkins-homedir
+poetry run python -m tvm_ci.jenkins_builder.configure_jenkins \
+       --base-casc-config=config/base-jenkins.yaml \
+       "--tvm-ci-config=${CONFIG_FILE}" \
+       --github-personal-access-token=config/secrets/github-personal-access-token \
+       "--jenkins-container=$(cat "${JENKINS_CONTAINER_TAG_PATH}")" \
+       --jenkins-container-network-id=$(cat "${BUILD_DIR}/crane/network-id.txt") \
+       --jenkins-executor-private-key=${BUILD_DIR}/executor-ssh-key \
+       --jenkins-executor-public-key=${ARTIFACT_DIR}/executor-ssh-key.pub \
+       --jenkins-homedir=${LOCAL_CLUSTER_DIR}/jenkins-homedir \
+       --jenkins-homedir-tar-gz=${LOCAL_CLUSTER_DIR}/jenkins-homedir.tar.gz \
+       --jenkins-jobs-config-ini=config/jenkins-jobs/jenkins_jobs.ini \
+       --jenkins-jobs-files=config/jenkins-jobs \
+       "--artifact-store=${ARTIFACT_STORE_DIR}"
+
+# Takes the place of 2-apply-plan: starts a container per node and records their addresses.
+trace_run local-cluster-up poetry run python -m tvm_ci.local_cluster \
+          "--tvm-ci-config=${CONFIG_FILE}" \
+          up \
+          "--network-id-file=${BUILD_DIR}/crane/network-id.txt" \
+          "--provisioner-ssh-key=${PROVISIONER_SSH_KEY_PATH}" \
+          "--jenkins-container-tag=$(cat "${JENKINS_CONTAINER_TAG_PATH}")" \
+          "--terraform-output-json=${LOCAL_CLUSTER_DIR}/terraform-output.json"
+
+poetry run python -m tvm_ci.configure_ansible \
+       "--tvm-ci-config=${CONFIG_FILE}" \
+       --executor-ssh-public-key=${ARTIFACT_DIR}/executor-ssh-key.pub \
+       "--jenkins-master-container-tag=$(cat "${JENKINS_CONTAINER_TAG_PATH}")" \
+       "--terraform-output-json=${LOCAL_CLUSTER_DIR}/terraform-output.json" \
+       --jenkins-homedir-tar-gz=${LOCAL_CLUSTER_DIR}/jenkins-homedir.tar.gz \
+       --ansible-inventory-path=${LOCAL_CLUSTER_DIR}/ansible-inventory.yml \
+       --add-jenkins-hosts
+
+eval $(ssh-agent)
+ssh-add "${PROVISIONER_SSH_KEY_PATH}"
+
+trace_run local-cluster-provision poetry run python -m tvm_ci.provision \
+          --ansible-inventory-path=${LOCAL_CLUSTER_DIR}/ansible-inventory.yml \
+          --state=${LOCAL_CLUSTER_DIR}/provision-state.json
+
+# Smoke build: one synthetic build per node type, on the controller whose executors run it. Crane
+# is on the nodes' network, so each controller is reached directly rather than through an SSH
+# tunnel.
+head_node_ip=$(python3 -c 'import json, sys; print(json.load(open(sys.argv[1]))["jenkins_head_node_public_ip"]["value"])' \
+                       "${LOCAL_CLUSTER_DIR}/terraform-output.json")
+trace_run local-cluster-smoke-build poetry run python -m tvm_ci.load_test \
+          "--tvm-ci-config=${CONFIG_FILE}" \
+          "--jenkins-url=http://${head_node_ip}:8080" \
+          --builds-per-label=1 \
+          --timeout-sec=600 \
+          "--report=${LOCAL_CLUSTER_DIR}/smoke-build-report.json"
+
+controller_ips=$(python3 -c 'import json, sys; [print(n, ip) for n, ip in json.load(open(sys.argv[1])).get("jenkins_controller_public_ip", {}).get("value", {}).items()]' \
+                         "${LOCAL_CLUSTER_DIR}/terraform-output.json")
+while read -r -u 3 controller controller_ip; do
+    [ -n "${controller}" ] || continue
+    trace_run "local-cluster-smoke-build-${controller}" poetry run python -m tvm_ci.load_test \
+              "--tvm-ci-config=${CONFIG_FILE}" \
+              "--controller=${controller}" \
+              "--jenkins-url=http://${controller_ip}:8080" \
+              --builds-per-label=1 \
+              --timeout-sec=600 \
+              "--report=${LOCAL_CLUSTER_DIR}/controllers/${controller}/smoke-build-report.json"
+done 3<<< "${controller_ips}"
@@ -0,0 +1,12 @@
+#!/bin/bash -e
+
+# Bring up the cluster described by the CI config as containers on this machine, without AWS:
+#   stage-scripts/local-cluster.sh [up|down]
+# See python/tvm_ci/local_cluster.py.
+
+cd "$(dirname "$0")"
+source "./util.sh" || exit 2
+
+cd "$(get_repo_root)"
+
+trace_run local-cluster crane/run.sh stage-scripts/local-cluster-in-crane.sh "${CONFIG_FILE:-config/dev.yaml}" "${1:-up}"
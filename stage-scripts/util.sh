@@ -13,7 +13,55 @@ ARTIFACT_DIR="${BUILD_DIR}/artifact"
 
 JENKINS_CONTAINER_TAG_PATH="${ARTIFACT_DIR}/container-tag.txt"
 
+# Kept across runs; see python/tvm_ci/ssh_keys.py to rotate.
+PROVISIONER_SSH_KEY_PATH="${ARTIFACT_DIR}/secret/provisioner-id_ed25519"
+
 TERRAFORM_CONFIG_VARS_PATH="${ARTIFACT_DIR}/terraform-vars.txt"
 TERRAFORM_BACKEND_CONFIG_PATH="${ARTIFACT_DIR}/terraform-backend-config.txt"
 TERRAFORM_PROVIDER_CONFIG_PATH="${ARTIFACT_DIR}/terraform-provider-config.txt"
 TERRAFORM_PLAN_PATH="${ARTIFACT_DIR}/terraform-plan.txt"
+# Unchanged Terraform inputs are re-planned anyway once their plan is this old, so that changes
+# made outside this repo are eventually picked up.
+TERRAFORM_PLAN_MAX_AGE_MIN="${TERRAFORM_PLAN_MAX_AGE_MIN:-720}"
+
+# Content-addressed store of artifacts keyed by their inputs; see python/tvm_ci/artifact_store.py.
+ARTIFACT_STORE_DIR="${BUILD_DIR}/cas"
+
+# Timing spans from every step, and from the Python tools each step runs, are appended to this
+# file in Chrome trace format. Print the critical path with:
+#   PYTHONPATH=python python3 -m tvm_ci.trace report [--archive]
+export TVM_CI_TRACE_FILE="${TVM_CI_TRACE_FILE:-${BUILD_DIR}/trace/trace.json}"
+
+# Run a command, recording its runtime as a span named $1 in ${TVM_CI_TRACE_FILE}.
+function trace_run() {
+    local name="$1"
+    shift
+    PYTHONPATH="$(get_repo_root)/python" python3 -m tvm_ci.trace run "--name=${name}" -- "$@"
+}
+
+# Generated artifacts are only rewritten when their contents change (python/tvm_ci/outputs.py);
+# every write is recorded here. Steps use the helpers below to skip themselves when none of their
+# inputs changed since they last succeeded.
+export TVM_CI_CHANGED_ARTIFACTS_FILE="${TVM_CI_CHANGED_ARTIFACTS_FILE:-${BUILD_DIR}/changed-artifacts.jsonl}"
+STAMP_DIR="${BUILD_DIR}/stamp"
+
+# Succeed if any of the files $2... changed since `stamp_artifacts $1` last recorded them.
+function artifacts_changed() {
+    local step="$1"
+    shift
+    PYTHONPATH="$(get_repo_root)/python" python3 -m tvm_ci.outputs changed \
+              "--stamp=${STAMP_DIR}/${step}.json" "$@"
+}
+
+# Record the files $2... as consumed by step $1.
+function stamp_artifacts() {
+    local step="$1"
+    shift
+    PYTHONPATH="$(get_repo_root)/python" python3 -m tvm_ci.outputs stamp \
+              "--stamp=${STAMP_DIR}/${step}.json" "$@"
+}
+
+# Print one digest identifying the contents of all the files $1....
+function artifacts_digest() {
+    PYTHONPATH="$(get_repo_root)/python" python3 -m tvm_ci.outputs digest "$@"
+}
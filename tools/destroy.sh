@@ -1,6 +1,4 @@
 #!/bin/bash -e
 
-cd $(dirname $0)/../infra
-terraform destroy \
-          -var-file ../build/artifact/terraform-provider-config.txt \
-          -var-file ../build/artifact/terraform-vars.txt
+# Destroys every Terraform state shard; see stage-scripts/4-teardown-cluster.sh.
+exec "$(dirname "$0")/../stage-scripts/4-teardown-cluster.sh"
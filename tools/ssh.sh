@@ -27,7 +27,7 @@ esac
 
 echo "ssh ubuntu@${fqdn}"
 ssh \
-    -i $(dirname $0)/../build/artifact/secret/provisioner-id_rsa \
+    -i $(dirname $0)/../build/artifact/secret/provisioner-id_ed25519 \
     -o "UserKnownHostsFile=/dev/null" \
     -o "StrictHostKeyChecking=no" \
     -L 8080:localhost:8080 \